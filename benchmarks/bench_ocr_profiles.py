@@ -0,0 +1,113 @@
+"""
+Benchmark the speed/accuracy trade-off of the OCR profiles on a synthetic
+scanned corpus, and the rasterisation time saved by the page image cache.
+
+Requires the tesseract and pdftoppm (poppler) binaries.
+
+Usage:
+    python benchmarks/bench_ocr_profiles.py [--documents 5] [--pages 2]
+"""
+import argparse
+import difflib
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.ocr import OCR_PROFILES, PageImageCache, render_pages
+
+SCAN_DPI = 300
+PAGE_SIZE = (int(8.27 * SCAN_DPI), int(11.69 * SCAN_DPI))
+
+
+def page_lines(rng: random.Random) -> list:
+    """Invoice-like text lines for one page"""
+    lines = ["ACME Supplies GmbH", "Musterstrasse 12, 10115 Berlin",
+             f"Invoice No INV-{rng.randint(10000, 99999)}  Date {rng.randint(1, 28):02d}.03.2024"]
+    for _ in range(25):
+        lines.append(f"{rng.choice(['Widget', 'Gadget', 'Service fee', 'Licence'])} "
+                     f"{rng.randint(100, 999)}   {rng.randint(1, 9)} x {rng.randint(1, 500)}.00 EUR")
+    lines.append(f"Gross Amount incl. VAT {rng.randint(1000, 9999)}.{rng.randint(0, 99):02d} EUR")
+    return lines
+
+
+def scanned_image(lines: list, rng: random.Random) -> Image.Image:
+    """Render lines like a slightly skewed, noisy office scan"""
+    image = Image.new('L', PAGE_SIZE, 235)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=34)
+    for index, line in enumerate(lines):
+        draw.text((180, 200 + index * 90), line, fill=30, font=font)
+    image = image.rotate(rng.uniform(-0.8, 0.8), fillcolor=235).filter(ImageFilter.GaussianBlur(1.2))
+    noise = np.random.RandomState(rng.randint(0, 2 ** 31)).normal(0, 18, size=image.size[::-1])
+    return Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8), 'L')
+
+
+def build_corpus(directory: Path, documents: int, pages: int) -> list:
+    """Image-only PDFs with their ground-truth text"""
+    rng = random.Random(42)
+    corpus = []
+    for index in range(documents):
+        page_texts = [page_lines(rng) for _ in range(pages)]
+        images = [scanned_image(lines, rng) for lines in page_texts]
+        path = directory / f"scan_{index}.pdf"
+        images[0].save(path, save_all=True, append_images=images[1:], resolution=SCAN_DPI)
+        corpus.append((path, "\n".join("\n".join(lines) for lines in page_texts)))
+    return corpus
+
+
+def accuracy(recognised: str, expected: str) -> float:
+    """Word-level similarity of OCR output and ground truth"""
+    return difflib.SequenceMatcher(None, recognised.split(), expected.split()).ratio()
+
+
+def run(documents: int, pages: int) -> None:
+    if not shutil.which('tesseract') or not shutil.which('pdftoppm'):
+        sys.exit("tesseract and pdftoppm are required for this benchmark")
+
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        corpus = build_corpus(work_dir, documents, pages)
+        print(f"{'profile':>10} {'render (s/page)':>16} {'ocr (s/page)':>13} "
+              f"{'cached render':>14} {'accuracy':>9}")
+        for name, profile in OCR_PROFILES.items():
+            cache = PageImageCache(work_dir / f"cache_{name}")
+            render_time = ocr_time = cached_time = 0.0
+            scores = []
+            for path, expected in corpus:
+                start = time.perf_counter()
+                images = render_pages(str(path), 0, pages, profile, cache)
+                render_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                text = "\n".join(pytesseract.image_to_string(image, lang=profile.lang,
+                                                             config=profile.tesseract_config)
+                                 for image in images)
+                ocr_time += time.perf_counter() - start
+                scores.append(accuracy(text, expected))
+
+                start = time.perf_counter()
+                render_pages(str(path), 0, pages, profile, cache)
+                cached_time += time.perf_counter() - start
+
+            page_count = documents * pages
+            print(f"{name:>10} {render_time / page_count:>16.3f} {ocr_time / page_count:>13.3f} "
+                  f"{cached_time / page_count:>14.3f} {sum(scores) / len(scores):>9.3f}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=2)
+    args = parser.parse_args()
+    run(args.documents, args.pages)
@@ -0,0 +1,91 @@
+"""
+Benchmark RecordIndex queries over a synthetic set of processing records.
+
+Usage:
+    python benchmarks/bench_record_index.py [--records 1000000] [--repeat 20]
+"""
+import argparse
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.record_index import RecordIndex
+
+VENDORS = [f"Vendor {index} GmbH" for index in range(2000)]
+WORDS = ["consulting", "licence", "hardware", "maintenance", "travel", "hosting", "support", "training"]
+
+
+def records(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for number in range(count):
+        yield {
+            'timestamp': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00",
+            'categories': [rng.choice(['invoice', 'invoice', 'invoice', 'receipt'])],
+            'status': 'processed',
+            'final_path': f"processed_documents/invoice/scan_{number}.pdf",
+            'extracted_data': {
+                'invoice_number': f"INV-{number}",
+                'vendor': rng.choice(VENDORS),
+                'date': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                'total_amount': f"{rng.uniform(1, 20000):.2f}",
+                'line_items': [{'description': f"{rng.choice(WORDS)} {rng.choice(WORDS)}"}]
+            }
+        }
+
+
+def timed(index: RecordIndex, repeat: int, **query) -> float:
+    """Median milliseconds of a query"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index.query(**query)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def run(count: int, repeat: int) -> None:
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        index = RecordIndex(work_dir / "records.sqlite3")
+        start = time.perf_counter()
+        batch = []
+        for record in records(count):
+            batch.append(record)
+            if len(batch) == 10000:
+                index.add_processing_records(batch)
+                batch = []
+        index.add_processing_records(batch)
+        print(f"indexed {count} records in {time.perf_counter() - start:.1f}s")
+
+        deep_cursor = index.query(limit=500)['next_cursor']
+        for _ in range(20):
+            deep_cursor = index.query(limit=500, cursor=deep_cursor)['next_cursor']
+
+        queries = {
+            'vendor, one month': dict(vendor='vendor 17 gmbh', date_from='2024-03-01', date_to='2024-03-31'),
+            'amount range': dict(min_amount=5000, max_amount=5010),
+            'category + date': dict(category='receipt', date_from='2024-06-01', date_to='2024-06-30'),
+            'full text': dict(text='hosting training'),
+            'vendor + full text': dict(vendor='vendor 17 gmbh', text='hosting'),
+            'invoice number': dict(invoice_number=f"INV-{count // 2}"),
+            'page 21 (cursor)': dict(limit=500, cursor=deep_cursor),
+        }
+        for name, query in queries.items():
+            print(f"{name:>20}: {timed(index, repeat, **query):8.2f} ms")
+        index.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    run(args.records, args.repeat)
@@ -0,0 +1,72 @@
+"""
+Benchmark InvoiceValidator.validate per record against validate_batch
+on a DataFrame of the same invoices.
+
+Usage:
+    python benchmarks/bench_validate_batch.py [--invoices 50000] [--items 10]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.validators.invoice_validator import InvoiceValidator
+
+
+def build_invoices(count: int, items: int) -> list:
+    """Synthetic extracted invoices, a few of them with inconsistent totals"""
+    rng = random.Random(42)
+    invoices = []
+    for index in range(count):
+        line_items = []
+        for number in range(items):
+            quantity = rng.randint(1, 5)
+            unit_price = rng.randint(100, 9999)
+            line_items.append({
+                'description': f"Item {number}",
+                'quantity': quantity,
+                'unit_price': f"{unit_price / 100:.2f}",
+                'total': f"{quantity * unit_price / 100:.2f}"
+            })
+        total = sum(int(item['total'].replace('.', '')) for item in line_items)
+        if rng.random() < 0.05:
+            total += 1000
+        invoices.append({
+            'invoice_number': f"INV-2024-{index:06d}",
+            'vendor': 'ACME Supplies GmbH',
+            'date': f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+            'total_amount': f"${total // 100:,}.{total % 100:02d}",
+            'line_items': line_items
+        })
+    return invoices
+
+
+def run(count: int, items: int) -> None:
+    validator = InvoiceValidator()
+    invoices = build_invoices(count, items)
+    frame = pd.DataFrame(invoices)
+
+    start = time.perf_counter()
+    baseline = [validator.validate(invoice) for invoice in invoices]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = validator.validate_batch(frame)
+    batch_time = time.perf_counter() - start
+
+    assert results == baseline, "validate_batch differs from validate"
+    print(f"{'invoices':>9} {'items':>6} {'validate (s)':>13} {'validate_batch (s)':>19} {'speedup':>8}")
+    print(f"{count:>9} {items:>6} {scalar_time:>13.3f} {batch_time:>19.3f} {scalar_time / batch_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=50000)
+    parser.add_argument("--items", type=int, default=10)
+    args = parser.parse_args()
+    run(args.invoices, args.items)
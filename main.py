@@ -0,0 +1,234 @@
+import sys
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from pathlib import Path
+
+from src.document_processor import DocumentProcessor
+from src.watcher import FolderWatcher
+from src.mail_ingest import MailIngestPipeline, processor_delivery, queue_delivery
+from src.supervisor import SupervisedExtractor
+from src.task_queue import Broker, Worker, document_dead_letter, document_handlers, enqueue_document
+
+
+def watch(args: argparse.Namespace) -> None:
+    """Process documents as they are dropped into the input folder"""
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    # Finish documents interrupted by the previous run before taking new ones
+    processor.recover()
+    broker = Broker.from_config(processor.config)
+    if broker is not None:
+        # Hand documents to the workers instead of processing them here
+        # The watch folder is where mailed documents land
+        process = lambda path: enqueue_document(broker, processor.config, path, priority='email')
+    else:
+        process = processor.process_document
+    watcher = FolderWatcher.from_config(processor.config, process, args.directory)
+    if args.workers:
+        watcher.workers = args.workers
+    if args.settle_seconds is not None:
+        watcher.settle_seconds = args.settle_seconds
+    if args.poll:
+        watcher.use_inotify = False
+    try:
+        watcher.run_forever()
+    finally:
+        processor.close()
+
+
+def mail(args: argparse.Namespace) -> None:
+    """Ingest the attachments of incoming email"""
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    processor.recover()
+    broker = Broker.from_config(processor.config)
+    if broker is not None:
+        deliver = queue_delivery(broker, processor.config)
+    else:
+        deliver = processor_delivery(processor)
+    pipeline = MailIngestPipeline.from_config(processor.config, deliver)
+    if pipeline is None:
+        processor.close()
+        sys.exit("Email ingestion is disabled in the configuration")
+    try:
+        asyncio.run(pipeline.run(once=args.once))
+    except KeyboardInterrupt:
+        logging.getLogger(__name__).info("Stopping email ingestion")
+    finally:
+        pipeline.fetcher.disconnect()
+        processor.close()
+    print(f"Delivered {pipeline.delivered} attachment(s)")
+    if pipeline.attachment_filter is not None:
+        skipped = {reason: count for reason, count in pipeline.attachment_filter.counts().items() if count}
+        print(f"Skipped: {skipped or 'none'}")
+
+
+def recover(args: argparse.Namespace) -> None:
+    """Finish the document moves interrupted by a crash"""
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    try:
+        print(f"Recovered {processor.recover()} interrupted document(s)")
+    finally:
+        processor.close()
+
+
+def index(args: argparse.Namespace) -> None:
+    """Backfill the record index from processing record and batch result files"""
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    try:
+        if processor.record_index is None:
+            sys.exit("Record index is disabled in the configuration")
+        count = processor.record_index.ingest_files(
+            Path(processor.config['processing_records_path']), args.results_dir
+        )
+        print(f"Indexed {count} record(s)")
+    finally:
+        processor.close()
+
+
+def enqueue(args: argparse.Namespace) -> None:
+    """Queue the documents of a folder for the workers"""
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    try:
+        broker = Broker.from_config(processor.config)
+        if broker is None:
+            sys.exit("Task queue is disabled in the configuration")
+        extensions = {ext.lower() for ext in processor.config['supported_extensions']}
+        files = [path for path in sorted(args.directory.iterdir())
+                 if path.is_file() and path.suffix.lower() in extensions]
+        for path in files:
+            enqueue_document(broker, processor.config, path)
+        print(f"Queued {len(files)} document(s)")
+    finally:
+        processor.close()
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    """Run queued tasks until interrupted"""
+    # Imported here: the API module builds the PDF processor from the configuration
+    from src.api.main import create_pdf_processor
+
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    broker = Broker.from_config(processor.config)
+    if broker is None:
+        processor.close()
+        sys.exit("Task queue is disabled in the configuration")
+    spool_dir = Path((processor.config.get('task_queue') or {}).get('spool_directory', 'data/queue/spool'))
+    # Invoice extraction runs in supervised processes when configured
+    extractor = SupervisedExtractor.from_config(processor.config, create_pdf_processor)
+    worker = Worker.from_config(
+        processor.config,
+        broker,
+        document_handlers(processor, spool_dir, extractor or create_pdf_processor()),
+        on_dead_letter=document_dead_letter(processor, spool_dir)
+    )
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        logging.getLogger(__name__).info("Stopping worker")
+    finally:
+        if extractor is not None:
+            extractor.close()
+        processor.close()
+
+
+def worker(args: argparse.Namespace) -> None:
+    """Run one or more worker processes"""
+    # Replays this node's interrupted moves (each node needs its own intent_log_path)
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    try:
+        processor.recover()
+    finally:
+        processor.close()
+    if args.processes <= 1:
+        run_worker(args)
+        return
+    processes = [multiprocessing.Process(target=run_worker, args=(args,), name=f"worker-{n}")
+                 for n in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+def export(args: argparse.Namespace) -> None:
+    """Export processing records and batch results to Parquet"""
+    processor = DocumentProcessor(config_path=args.config, base_dir=args.base_dir)
+    try:
+        if processor.parquet_exporter is None:
+            sys.exit("Parquet export is disabled in the configuration")
+        if not args.compact_only:
+            count = processor.parquet_exporter.export_files(
+                Path(processor.config['processing_records_path']), args.results_dir
+            )
+            print(f"Exported {count} row(s)")
+        compacted = processor.parquet_exporter.compact(min_files=2)
+        print(f"Compacted {compacted} partition(s)")
+    finally:
+        processor.close()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Invoice scraping system")
+    parser.add_argument("--config", type=Path, default=None,
+                        help="Processor configuration (default: config/processor_config.json)")
+    parser.add_argument("--base-dir", type=Path, default=None,
+                        help="Directory for processed documents (default: current directory)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    watch_parser = commands.add_parser("watch", help="Ingest documents dropped into a folder")
+    watch_parser.add_argument("directory", type=Path, nargs="?", default=None,
+                              help="Folder to watch (default: watch.input_directory)")
+    watch_parser.add_argument("--workers", type=int, default=None, help="Documents processed in parallel")
+    watch_parser.add_argument("--settle-seconds", type=float, default=None,
+                              help="Time a file must stay unchanged before it is processed")
+    watch_parser.add_argument("--poll", action="store_true", help="Poll instead of using inotify")
+    watch_parser.set_defaults(handler=watch)
+
+    mail_parser = commands.add_parser("mail", help="Ingest the attachments of incoming email")
+    mail_parser.add_argument("--once", action="store_true", help="Poll the mailbox once and exit")
+    mail_parser.set_defaults(handler=mail)
+
+    recover_parser = commands.add_parser("recover", help="Finish document moves interrupted by a crash")
+    recover_parser.set_defaults(handler=recover)
+
+    index_parser = commands.add_parser("index", help="Backfill the record index from existing files")
+    index_parser.add_argument("--results-dir", type=Path, default=Path("results"),
+                              help="Directory of API batch results (default: results)")
+    index_parser.set_defaults(handler=index)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Queue the documents of a folder for the workers")
+    enqueue_parser.add_argument("directory", type=Path, help="Folder of documents to queue")
+    enqueue_parser.set_defaults(handler=enqueue)
+
+    worker_parser = commands.add_parser("worker", help="Process queued documents")
+    worker_parser.add_argument("--processes", type=int, default=1, help="Worker processes to run (default: 1)")
+    worker_parser.set_defaults(handler=worker)
+
+    export_parser = commands.add_parser("export", help="Export records to Parquet and compact the dataset")
+    export_parser.add_argument("--results-dir", type=Path, default=Path("results"),
+                               help="Directory of API batch results (default: results)")
+    export_parser.add_argument("--compact-only", action="store_true",
+                               help="Only merge small files of the existing dataset")
+    export_parser.set_defaults(handler=export)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args.handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,5 +6,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
+        # One process: the extraction scheduler sizes its own worker pools
+        # (see "scheduler.autoscale" in config/processor_config.json)
         workers=1
     )
\ No newline at end of file
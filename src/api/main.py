@@ -1,20 +1,48 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Query, Header
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 import shutil
 import uuid
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List
+import threading
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
 import json
 
 from src.pdf_processor import PDFProcessor
+from src.invoice_splitter import InvoiceSplitter
+from src.line_items import LineItemExtractor
 from src.document_processor import DocumentProcessor
+from src.near_duplicates import NearDuplicateIndex
+from src.record_index import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, RecordIndex
+from src.parquet_export import ParquetExporter
+from src.task_queue import Broker, enqueue_document, release_spooled
+from src.scheduler import ExtractionScheduler
+from src.supervisor import SupervisedExtractor
+from src.exceptions import ExtractionCancelled, ExtractionKilled, ProcessingError
+from src.ocr import (
+    OCREngine,
+    PageImageCache,
+    RegionOfInterestOCR,
+    engine_from_config,
+    profile_from_config
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the document processor's intent log and indexes on shutdown"""
+    yield
+    if get_document_processor.cache_info().currsize:
+        get_document_processor().close()
+        get_document_processor.cache_clear()
 
 app = FastAPI(
     title="Invoice Processing API",
     description="API for processing and extracting data from invoices",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -29,72 +57,254 @@ app.add_middleware(
 # Store batch processing status
 batch_jobs: Dict[str, Dict] = {}
 
-async def process_single_file(file_path: Path, job_id: str, file_index: int, total_files: int) -> dict:
+# Set to cancel a running batch job
+job_cancellations: Dict[str, threading.Event] = {}
+
+@lru_cache(maxsize=None)
+def load_processor_config() -> Dict:
+    """Processor configuration from config/processor_config.json, empty if unavailable"""
+    try:
+        with open("config/processor_config.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@lru_cache(maxsize=None)
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """Near-duplicate index shared by all requests"""
+    return NearDuplicateIndex.from_config(load_processor_config())
+
+@lru_cache(maxsize=None)
+def get_page_cache() -> Optional[PageImageCache]:
+    """OCR page image cache shared by all requests"""
+    return PageImageCache.from_config(load_processor_config())
+
+@lru_cache(maxsize=None)
+def get_ocr_engine() -> OCREngine:
+    """Pool of persistent OCR engines shared by all requests"""
+    return engine_from_config(load_processor_config())
+
+@lru_cache(maxsize=None)
+def get_roi_ocr() -> Optional[RegionOfInterestOCR]:
+    """Vendor-template OCR shared by all requests"""
+    config = load_processor_config()
+    return RegionOfInterestOCR.from_config(config, get_ocr_engine(), profile_from_config(config))
+
+@lru_cache(maxsize=None)
+def get_record_index() -> Optional[RecordIndex]:
+    """Index of processing records and batch results shared by all requests"""
+    return RecordIndex.from_config(load_processor_config())
+
+@lru_cache(maxsize=None)
+def get_parquet_exporter() -> Optional[ParquetExporter]:
+    """Parquet export of batch results shared by all requests"""
+    return ParquetExporter.from_config(load_processor_config())
+
+@lru_cache(maxsize=None)
+def get_task_broker() -> Optional[Broker]:
+    """Task queue batch jobs are handed to, None to process them in this process"""
+    return Broker.from_config(load_processor_config())
+
+@lru_cache(maxsize=None)
+def get_scheduler() -> ExtractionScheduler:
+    """Scheduler running the extractions of all requests by priority"""
+    return ExtractionScheduler.from_config(load_processor_config())
+
+def create_pdf_processor() -> PDFProcessor:
+    """PDFProcessor configured from config/processor_config.json"""
+    return PDFProcessor(
+        near_duplicate_index=get_near_duplicate_index(),
+        ocr_profile=profile_from_config(load_processor_config()),
+        page_cache=get_page_cache(),
+        ocr_engine=get_ocr_engine(),
+        roi_ocr=get_roi_ocr(),
+        splitter=InvoiceSplitter.from_config(load_processor_config()),
+        line_item_extractor=LineItemExtractor.from_config(load_processor_config())
+    )
+
+@lru_cache(maxsize=None)
+def get_supervisor() -> Optional[SupervisedExtractor]:
+    """Extraction processes with timeouts and memory limits shared by all requests"""
+    return SupervisedExtractor.from_config(load_processor_config(), create_pdf_processor)
+
+@lru_cache(maxsize=None)
+def get_document_processor() -> DocumentProcessor:
+    """Document processor whose error flow receives documents whose extraction was killed"""
+    return DocumentProcessor()
+
+def extract_document(file_path: str, cancel: Optional[threading.Event] = None) -> Union[Dict, List[Dict]]:
+    """
+    Extract a document, in a supervised process when configured
+
+    With invoice splitting configured the result is a list with one entry
+    per invoice found in the file.
+    """
+    supervisor = get_supervisor()
+    if supervisor is not None:
+        return supervisor.extract(file_path, cancel=cancel)
+    if cancel is not None and cancel.is_set():
+        raise ExtractionCancelled(f"Extraction of {file_path} was cancelled", file_path)
+    processor = create_pdf_processor()
+    if processor.splitter is not None:
+        return processor.extract_invoices(file_path)
+    return processor.extract_invoice_data(file_path)
+
+async def submit_document(fn, file_path: str, **kwargs):
+    """Queue a document with the scheduler and wait for its result"""
+    # The scheduler opens the document to cost it by page count; keep that off the event loop
+    future = await asyncio.to_thread(get_scheduler().submit_document, fn, file_path, **kwargs)
+    return await asyncio.wrap_future(future)
+
+async def process_single_file(file_path: Path, job_id: str, file_index: int, total_files: int,
+                              flow: Optional[str] = None) -> dict:
     """Process a single file and update progress"""
     try:
-        processor = PDFProcessor()
-        result = processor.extract_invoice_data(str(file_path))
+        # Bulk work shares the workers fairly between tenants (or jobs)
+        result = await submit_document(
+            extract_document, str(file_path), priority="bulk", flow=flow or job_id,
+            cancel=job_cancellations.get(job_id)
+        )
         
         # Update progress
         batch_jobs[job_id]["processed"] += 1
         batch_jobs[job_id]["progress"] = (batch_jobs[job_id]["processed"] / total_files) * 100
-        batch_jobs[job_id]["results"].append({
-            "file_name": file_path.name,
-            "status": "success",
-            "data": result
-        })
+        # A file holding several invoices gives one result per invoice
+        for data in (result if isinstance(result, list) else [result]):
+            entry = {
+                "file_name": file_path.name,
+                "status": "success",
+                "data": data
+            }
+            if isinstance(result, list):
+                entry["pages"] = data.get("pages")
+            batch_jobs[job_id]["results"].append(entry)
         
         return result
     except Exception as e:
         batch_jobs[job_id]["errors"].append({
             "file_name": file_path.name,
-            "error": str(e)
+            "error": str(e),
+            "error_type": type(e).__name__
         })
+        if isinstance(e, ExtractionKilled) and not isinstance(e, ExtractionCancelled):
+            # Keep documents that time out or exhaust memory for inspection
+            await asyncio.to_thread(get_document_processor().reject_document, file_path, str(e))
         return {"error": str(e)}
     finally:
         # Cleanup temp file
         file_path.unlink(missing_ok=True)
 
-async def process_batch(job_id: str, files: List[Path], parallel: bool):
+async def process_batch(job_id: str, files: List[Path], parallel: bool, flow: Optional[str] = None):
     """Process batch of files with progress tracking"""
     total_files = len(files)
     
     if parallel:
-        # Process files in parallel using ThreadPoolExecutor
-        with ThreadPoolExecutor() as executor:
-            tasks = []
-            for idx, file_path in enumerate(files):
-                task = asyncio.create_task(
-                    process_single_file(file_path, job_id, idx, total_files)
-                )
-                tasks.append(task)
-            await asyncio.gather(*tasks)
+        # Queue all files; the scheduler's workers process them in parallel
+        tasks = []
+        for idx, file_path in enumerate(files):
+            task = asyncio.create_task(
+                process_single_file(file_path, job_id, idx, total_files, flow)
+            )
+            tasks.append(task)
+        await asyncio.gather(*tasks)
     else:
         # Process files sequentially
         for idx, file_path in enumerate(files):
-            await process_single_file(file_path, job_id, idx, total_files)
+            await process_single_file(file_path, job_id, idx, total_files, flow)
     
     # Mark job as completed
-    batch_jobs[job_id]["status"] = "completed"
+    cancel = job_cancellations.pop(job_id, None)
+    batch_jobs[job_id]["status"] = "cancelled" if cancel is not None and cancel.is_set() else "completed"
     
     # Save results to persistent storage
     results_file = Path(f"results/{job_id}.json")
     results_file.parent.mkdir(exist_ok=True)
     with results_file.open("w") as f:
         json.dump(batch_jobs[job_id], f)
+    
+    await asyncio.to_thread(index_batch_results, job_id, batch_jobs[job_id])
+
+def index_batch_results(job_id: str, job: Dict):
+    """Add the results of a completed batch job to the record index and export"""
+    record_index = get_record_index()
+    if record_index is not None:
+        record_index.add_batch_results(job_id, job)
+    
+    parquet_exporter = get_parquet_exporter()
+    if parquet_exporter is not None:
+        parquet_exporter.append_batch(job_id, job)
+
+def queued_job_status(job_id: str) -> Optional[Dict]:
+    """
+    Status of a batch job handed to the task queue, built from its tasks
+
+    The first request to see the job completed saves and indexes its
+    results, as done for jobs processed in this process.
+    """
+    broker = get_task_broker()
+    tasks = broker.tasks(job_id) if broker is not None else []
+    if not tasks:
+        return None
+    results = []
+    for task in tasks:
+        if task.status != "done":
+            continue
+        # Split files give one result per invoice
+        for data in (task.result if isinstance(task.result, list) else [task.result]):
+            entry = {"file_name": task.payload.get("file_name"), "status": "success", "data": data}
+            if isinstance(task.result, list):
+                entry["pages"] = data.get("pages")
+            results.append(entry)
+    errors = [{"file_name": task.payload.get("file_name"), "error": task.error}
+              for task in tasks if task.status == "dead"]
+    processed = sum(1 for task in tasks if task.status in ("done", "dead"))
+    job = {
+        "status": "completed" if processed == len(tasks) else "processing",
+        "total_files": len(tasks),
+        "processed": processed,
+        "progress": processed / len(tasks) * 100,
+        "results": results,
+        "errors": errors
+    }
+    if job["status"] == "completed":
+        results_file = Path(f"results/{job_id}.json")
+        results_file.parent.mkdir(exist_ok=True)
+        try:
+            # Exclusive creation: only one API process saves the results
+            with results_file.open("x") as f:
+                json.dump(job, f)
+        except FileExistsError:
+            pass
+        else:
+            index_batch_results(job_id, job)
+    return job
+
+def get_job(job_id: str) -> Dict:
+    """Batch job processed here or by the task queue workers"""
+    if job_id in batch_jobs:
+        return batch_jobs[job_id]
+    job = queued_job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.post("/api/v1/process-invoice/")
 async def process_invoice(
     file: UploadFile = File(...),
     validate: bool = True,
-    extract_metadata: bool = True
+    extract_metadata: bool = True,
+    x_tenant_id: Optional[str] = Header(None)
 ):
     """
     Process a single invoice file and extract its data
+    
+    Interactive uploads run ahead of email and bulk work. With invoice
+    splitting configured, 'invoices' lists every invoice found in the file
+    and 'data' is the first of them.
     """
+    # Generate unique filename
+    temp_file = Path(f"temp/{uuid.uuid4()}{Path(file.filename).suffix}")
     try:
-        # Generate unique filename
-        temp_file = Path(f"temp/{uuid.uuid4()}{Path(file.filename).suffix}")
         temp_file.parent.mkdir(exist_ok=True)
         
         # Save uploaded file
@@ -102,25 +312,36 @@ async def process_invoice(
             shutil.copyfileobj(file.file, buffer)
         
         # Process invoice
-        processor = PDFProcessor()
-        result = processor.extract_invoice_data(str(temp_file))
-        
-        # Cleanup
-        temp_file.unlink()
+        result = await submit_document(
+            extract_document, str(temp_file), priority="interactive", flow=x_tenant_id or "default"
+        )
         
+        if isinstance(result, list):
+            return {
+                "status": "success",
+                "data": result[0] if result else None,
+                "invoices": result
+            }
         return {
             "status": "success",
             "data": result
         }
         
     except Exception as e:
+        if isinstance(e, ExtractionKilled) and not isinstance(e, ExtractionCancelled):
+            # Keep documents that time out or exhaust memory for inspection
+            await asyncio.to_thread(get_document_processor().reject_document, temp_file, str(e))
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Cleanup temp file
+        temp_file.unlink(missing_ok=True)
 
 @app.post("/api/v1/batch-process/")
 async def batch_process_invoices(
     background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
-    parallel: bool = True
+    parallel: bool = True,
+    x_tenant_id: Optional[str] = Header(None)
 ):
     """
     Process multiple invoice files with progress tracking
@@ -128,6 +349,7 @@ async def batch_process_invoices(
     Args:
         files: List of invoice files to process
         parallel: Whether to process files in parallel (default: True)
+        x_tenant_id: Optional tenant; bulk work is shared fairly between tenants
     
     Returns:
         dict: Job ID and initial status
@@ -136,7 +358,25 @@ async def batch_process_invoices(
         # Generate unique job ID
         job_id = str(uuid.uuid4())
         
+        broker = get_task_broker()
+        if broker is not None:
+            # Workers on any node pick the files up from the spool directory
+            for file in files:
+                temp_file = Path(f"temp/{uuid.uuid4()}") / Path(file.filename).name
+                temp_file.parent.mkdir(parents=True)
+                with temp_file.open("wb") as buffer:
+                    shutil.copyfileobj(file.file, buffer)
+                enqueue_document(broker, load_processor_config(), temp_file,
+                                 task_type="extract_invoice", group=job_id, priority="bulk")
+                temp_file.parent.rmdir()
+            return {
+                "job_id": job_id,
+                "status": "queued",
+                "message": f"Queued {len(files)} files"
+            }
+        
         # Initialize job status
+        job_cancellations[job_id] = threading.Event()
         batch_jobs[job_id] = {
             "status": "processing",
             "total_files": len(files),
@@ -157,7 +397,7 @@ async def batch_process_invoices(
             temp_files.append(temp_file)
         
         # Start background processing
-        background_tasks.add_task(process_batch, job_id, temp_files, parallel)
+        background_tasks.add_task(process_batch, job_id, temp_files, parallel, x_tenant_id)
         
         return {
             "job_id": job_id,
@@ -173,20 +413,16 @@ async def get_batch_status(job_id: str):
     """
     Get the status of a batch processing job
     """
-    if job_id not in batch_jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    return batch_jobs[job_id]
+    # Queued jobs are read from SQLite, and completing one indexes it
+    return await asyncio.to_thread(get_job, job_id)
 
 @app.get("/api/v1/batch-results/{job_id}")
 async def get_batch_results(job_id: str):
     """
     Get the results of a completed batch processing job
     """
-    if job_id not in batch_jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    if batch_jobs[job_id]["status"] != "completed":
+    job = await asyncio.to_thread(get_job, job_id)
+    if job["status"] not in ("completed", "cancelled"):
         raise HTTPException(status_code=400, detail="Job still processing")
     
     # Load results from persistent storage
@@ -196,3 +432,87 @@ async def get_batch_results(job_id: str):
     
     with results_file.open() as f:
         return json.load(f)
+
+@app.delete("/api/v1/batch/{job_id}")
+async def cancel_batch(job_id: str):
+    """
+    Cancel a batch processing job
+    
+    Files not yet started are skipped and extractions in progress are
+    stopped; results of files already processed are kept.
+    """
+    if job_id in batch_jobs:
+        if job_id not in job_cancellations:
+            raise HTTPException(status_code=400, detail="Job is not running")
+        job_cancellations[job_id].set()
+        batch_jobs[job_id]["status"] = "cancelling"
+        return {"job_id": job_id, "status": "cancelling"}
+    
+    broker = get_task_broker()
+    if broker is not None and broker.tasks(job_id):
+        # Queued files are dropped; files a worker already took finish normally
+        cancelled = broker.cancel(job_id)
+        spool_dir = Path((load_processor_config().get("task_queue") or {}).get("spool_directory", "data/queue/spool"))
+        for task in cancelled:
+            release_spooled(Path(task.payload["file_path"]), spool_dir)
+        return {"job_id": job_id, "status": "cancelled", "cancelled_files": len(cancelled)}
+    
+    raise HTTPException(status_code=404, detail="Job not found")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Scheduler metrics in the Prometheus text format, including the queue
+    wait per priority class, and the attachment filter's skip counters
+    """
+    text = get_scheduler().prometheus()
+    # The first call opens the processor's intent log and indexes
+    attachment_filter = (await asyncio.to_thread(get_document_processor)).attachment_filter
+    if attachment_filter is not None:
+        text += attachment_filter.prometheus()
+    return text
+
+@app.get("/api/v1/records")
+async def search_records(
+    vendor: Optional[str] = None,
+    category: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    invoice_number: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Search processing records and batch results, newest first
+    
+    Args:
+        vendor: Vendor name (case-insensitive)
+        category: Document category
+        date_from: Earliest invoice date
+        date_to: Latest invoice date
+        min_amount: Smallest total amount
+        max_amount: Largest total amount
+        invoice_number: Exact invoice number
+        q: Words to search for in the extracted fields and document text
+        limit: Page size
+        cursor: next_cursor of the previous page
+    
+    Returns:
+        dict: Matching records and the cursor of the next page
+    """
+    record_index = get_record_index()
+    if record_index is None:
+        raise HTTPException(status_code=503, detail="Record index is disabled")
+    try:
+        # SQLite blocks, so the query runs off the event loop
+        return await asyncio.to_thread(
+            record_index.query,
+            vendor=vendor, category=category, date_from=date_from, date_to=date_to,
+            min_amount=min_amount, max_amount=max_amount, invoice_number=invoice_number,
+            text=q, limit=limit, cursor=cursor
+        )
+    except ProcessingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
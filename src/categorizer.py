@@ -1,4 +1,3 @@
-import re
 import logging
 from pathlib import Path
 from typing import Dict, List, Optional
@@ -10,12 +9,41 @@ from .exceptions import CategoryError
 from .text_extractor import TextExtractor
 from .metadata_extractor import MetadataExtractor
 from .document_classifier import DocumentClassifier
+from .extraction_rules import CompiledExtractionRules, compile_extraction_rules
+from .normalization import normalize_amount
+
+# Bounds for the text read to classify a document; the full text is only
+# extracted afterwards when field extraction needs it.
+CLASSIFICATION_MAX_PAGES = 2
+CLASSIFICATION_MAX_CHARS = 8000
 
 class DocumentCategorizer:
-    def __init__(self):
+    def __init__(self, classification_max_pages: Optional[int] = CLASSIFICATION_MAX_PAGES,
+                 classification_max_chars: Optional[int] = CLASSIFICATION_MAX_CHARS):
         self.classifier = DocumentClassifier()
         self.text_extractor = TextExtractor()
+        self.classification_max_pages = classification_max_pages
+        self.classification_max_chars = classification_max_chars
+        # Return the text read under 'text', e.g. for full-text indexing
+        self.keep_text = False
         self.logger = logging.getLogger(__name__)
+        self._extraction_rules: Optional[CompiledExtractionRules] = None
+        self._extraction_rules_source: Optional[Dict] = None
+        self._category_extractors = {
+            'invoice': self._extract_invoice_data,
+            'receipt': self._extract_receipt_data,
+            'contract': self._extract_contract_data,
+            'report': self._extract_report_data
+        }
+
+    @property
+    def extraction_rules(self) -> CompiledExtractionRules:
+        """Compiled extraction patterns for the classifier's current rules"""
+        rules = self.classifier.rules
+        if self._extraction_rules is None or self._extraction_rules_source is not rules:
+            self._extraction_rules = compile_extraction_rules(rules)
+            self._extraction_rules_source = rules
+        return self._extraction_rules
 
     def categorize(self, file_path: Path, metadata: Optional[Dict] = None) -> Dict:
         """
@@ -29,9 +57,20 @@ class DocumentCategorizer:
             Dict containing categorization results and extracted data
         """
         try:
-            # Extract text content
-            text_content = (metadata.get('text') if metadata 
-                          else self.text_extractor.extract(file_path))
+            # Extract text content, bounded to what classification needs
+            pages: List[str] = []
+            truncated = False
+            if metadata and 'text' in metadata:
+                text_content = metadata['text']
+            else:
+                pages, truncated = self.text_extractor.extract_pages(
+                    file_path,
+                    max_pages=self.classification_max_pages,
+                    max_chars=self.classification_max_chars
+                )
+                text_content = ''.join(pages)
+                if self.classification_max_chars:
+                    text_content = text_content[:self.classification_max_chars]
             
             if not text_content:
                 return {
@@ -52,9 +91,18 @@ class DocumentCategorizer:
                 'status': 'processed'
             }
 
-            # Extract additional data if document is an invoice
-            if classification['category'] == 'invoice' and classification['confidence'] > 0.5:
-                result['extracted_data'] = self._extract_invoice_data(text_content)
+            # Extract category-specific data for confidently classified documents
+            extractor = self._category_extractors.get(classification['category'])
+            if extractor and classification['confidence'] > 0.5:
+                if pages:
+                    # Read on from where the bounded read stopped
+                    if truncated:
+                        remaining, _ = self.text_extractor.extract_pages(file_path, first_page=len(pages))
+                        pages.extend(remaining)
+                    text_content = ''.join(pages)
+                result['extracted_data'] = extractor(text_content)
+            if self.keep_text:
+                result['text'] = text_content
 
             return result
 
@@ -91,9 +139,6 @@ class DocumentCategorizer:
         Returns:
             Dict containing extracted invoice fields
         """
-        # Load extraction patterns from rules
-        patterns = self.classifier.rules.get('invoice', {}).get('data_extraction', {})
-        
         extracted_data = {
             'invoice_number': None,
             'date': None,
@@ -101,11 +146,8 @@ class DocumentCategorizer:
             'vendor': None
         }
         
-        # Extract data using patterns
-        for field, pattern in patterns.items():
-            match = re.search(pattern, text_content, re.IGNORECASE)
-            if match:
-                extracted_data[field] = match.group(1).strip()
+        # Extract data using the compiled invoice patterns
+        extracted_data.update(self.extraction_rules.extract('invoice', text_content))
         
         # Clean and validate extracted data
         if extracted_data['total_amount']:
@@ -117,41 +159,40 @@ class DocumentCategorizer:
 
     def _clean_amount(self, amount: str) -> str:
         """Clean and standardize amount strings"""
-        amount = re.sub(r'[^\d.,]', '', amount)
-        if ',' in amount and '.' in amount:
-            if amount.find(',') > amount.find('.'):
-                amount = amount.replace('.', '')
-                amount = amount.replace(',', '.')
-            else:
-                amount = amount.replace(',', '')
-        elif ',' in amount:
-            amount = amount.replace(',', '.')
-        return amount
+        return normalize_amount(amount) or ''
 
     def _extract_receipt_data(self, text_content: str) -> Dict:
         """Extract receipt-specific data"""
-        return {
+        extracted_data = {
             'transaction_date': None,
             'total_amount': None,
             'merchant': None,
             'payment_method': None,
             'items': []
         }
+        extracted_data.update(self.extraction_rules.extract('receipt', text_content))
+        if extracted_data['total_amount']:
+            extracted_data['total_amount'] = self._clean_amount(extracted_data['total_amount'])
+        return extracted_data
 
     def _extract_contract_data(self, text_content: str) -> Dict:
         """Extract contract-specific data"""
-        return {
+        extracted_data = {
             'contract_date': None,
             'parties_involved': [],
             'contract_type': None,
             'expiration_date': None
         }
+        extracted_data.update(self.extraction_rules.extract('contract', text_content))
+        return extracted_data
 
     def _extract_report_data(self, text_content: str) -> Dict:
         """Extract report-specific data"""
-        return {
+        extracted_data = {
             'report_date': None,
             'report_type': None,
             'author': None,
             'key_findings': []
         }
+        extracted_data.update(self.extraction_rules.extract('report', text_content))
+        return extracted_data
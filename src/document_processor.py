@@ -5,15 +5,35 @@ import logging
 from datetime import datetime
 import json
 from pathlib import Path
-import shutil
+import filecmp
+import hashlib
+import itertools
 import logging
+import threading
+import os
 from typing import Dict, Optional, List
 from datetime import datetime
 import json
 from copy import deepcopy
 
 from .categorizer import DocumentCategorizer
-from .exceptions import ProcessingError
+from .duplicate_index import DuplicateIndex
+from .intent_log import IntentLog, atomic_move, atomic_write_json
+from .document_store import DocumentStore, file_digest
+from .record_index import RecordIndex
+from .parquet_export import ParquetExporter
+from .attachment_filter import AttachmentFilter
+from .exceptions import DuplicateDocumentError, ProcessingError, ValidationError
+
+# What process_document does with an invoice that is already indexed:
+# 'flag' processes it and marks the result, 'skip' moves the file to the
+# duplicates directory without filing or recording it, 'reject' handles it
+# as a processing error
+DUPLICATE_POLICIES = ('flag', 'skip', 'reject')
+
+# Process-wide sequence of output names; with the process id it keeps names
+# unique across threads, processor instances and concurrent processes
+_output_sequence = itertools.count()
 
 class DocumentProcessor:
     def __init__(self, config: Optional[Dict] = None, config_path: Optional[Path] = None, base_dir: Optional[Path] = None):
@@ -40,6 +60,47 @@ class DocumentProcessor:
         # Create necessary directories
         self.processed_dir.mkdir(parents=True, exist_ok=True)
         self.error_dir.mkdir(parents=True, exist_ok=True)
+        self.duplicate_policy, self.duplicate_index = self._create_duplicate_index()
+        # Output directories are spread over this many subdirectories (0: none)
+        self.output_shards = self.config.get('output_shards', 0)
+        # Directories known to exist, so filing a document needs no mkdir
+        self._created_dirs = set()
+        # Optional deduplicated storage; processed_documents then holds links
+        self.document_store = DocumentStore.from_config(self.config)
+        # Optional queryable index of the processing records
+        self.record_index = RecordIndex.from_config(self.config)
+        # The index searches the document text, which the records leave out
+        self.categorizer.keep_text = self.record_index is not None
+        # Optional columnar export of the records for analytics
+        self.parquet_exporter = ParquetExporter.from_config(self.config)
+        # Optional content checks that keep junk files away from extraction
+        self.attachment_filter = AttachmentFilter.from_config(self.config)
+        # Guards the daily record file when documents are processed in parallel
+        self._record_lock = threading.Lock()
+        # Moves in flight, replayed by recover() after a crash
+        self.intent_log = IntentLog(
+            Path(self.config.get('intent_log_path') or self.base_dir / 'data' / 'intent_log.sqlite3')
+        )
+
+    def _create_duplicate_index(self):
+        """Open the duplicate index configured under 'duplicate_detection', if enabled"""
+        settings = self.config.get('duplicate_detection') or {}
+        # Skipped duplicates leave the input folder so they are not picked up again
+        self.duplicate_dir = Path(settings.get('duplicate_directory') or self.base_dir / 'duplicates')
+        if not settings.get('enabled', False):
+            return None, None
+
+        policy = settings.get('policy', 'flag')
+        if policy not in DUPLICATE_POLICIES:
+            raise ProcessingError(
+                f"Invalid duplicate policy '{policy}', expected one of {', '.join(DUPLICATE_POLICIES)}"
+            )
+        index = DuplicateIndex(
+            Path(settings.get('index_path', 'data/duplicate_index.sqlite3')),
+            expected_items=settings.get('expected_items', 100000),
+            false_positive_rate=settings.get('false_positive_rate', 0.001)
+        )
+        return policy, index
 
     def _setup_logging(self):
         """Setup logging configuration"""
@@ -64,53 +125,230 @@ class DocumentProcessor:
         except Exception as e:
             raise ProcessingError(f"Failed to load processor configuration: {str(e)}")
 
-    def process_document(self, file_path: Path, metadata: Optional[Dict] = None) -> Dict:
+    def process_document(self, file_path: Path, metadata: Optional[Dict] = None,
+                         handle_errors: bool = True) -> Dict:
         """
         Process a single document
         
         Args:
             file_path: Path to the document file
             metadata: Optional metadata from email or other sources
+            handle_errors: Move documents that fail to the error directory;
+                otherwise they stay in place for a retry
             
         Returns:
             Dictionary containing processing results
         """
+        intent_id = None
+        moved = False
+        claimed_path = None
         try:
             self.logger.info(f"Processing document: {file_path}")
             
             # Validate file
             if not self._validate_file(file_path):
                 raise ProcessingError(f"Invalid file: {file_path}")
+            if self.attachment_filter is not None:
+                reason = self.attachment_filter.check_file(file_path)
+                if reason is not None:
+                    raise ValidationError(f"Skipped {file_path}: {reason}")
 
             # Categorize document
             categorization_result = self.categorizer.categorize(file_path, metadata)
+            text = categorization_result.pop('text', None)
+            if metadata:
+                # Keep where the document came from (e.g. the email) with its record
+                categorization_result['source_metadata'] = {
+                    key: value for key, value in metadata.items() if key != 'text'
+                }
+            
+            # Short-circuit invoices that were already processed
+            duplicate_of = self._find_duplicate(categorization_result)
+            if duplicate_of and self._handle_duplicate(file_path, categorization_result, duplicate_of):
+                return categorization_result
             
             # Determine target location
             target_path = self.get_target_path(categorization_result)
             
-            # Create target directory if it doesn't exist
-            target_path.parent.mkdir(parents=True, exist_ok=True)
-            
             # Generate unique filename
             final_path = self._generate_unique_path(target_path, file_path)
-            
-            # Move file to target location
-            self._move_file(file_path, final_path)
-            
-            # Update result with final path
+            extracted_data = categorization_result.get('extracted_data')
+            if not duplicate_of and self.duplicate_index is not None and extracted_data:
+                # Another process may have filed the same invoice since the lookup
+                duplicate_of = self.duplicate_index.claim(extracted_data, str(final_path))
+                if not duplicate_of:
+                    claimed_path = str(final_path)
+                elif self._handle_duplicate(file_path, categorization_result, duplicate_of):
+                    return categorization_result
             categorization_result['final_path'] = str(final_path)
-            
-            # Save processing record
-            self._save_processing_record(categorization_result)
+            if self.document_store is not None:
+                categorization_result['sha256'] = file_digest(file_path)
+                # Kept in the result so a replayed intent catalogues it too
+                categorization_result['original_name'] = file_path.name
+            
+            # Log the intent, then move, record and index the document
+            intent_id = self.intent_log.begin(
+                'file', file_path, final_path,
+                {'result': categorization_result, 'duplicate_of': duplicate_of, 'text': text}
+            )
+            self._file_document(file_path, final_path, categorization_result.get('sha256'))
+            moved = True
+            self._finish_filing(categorization_result, duplicate_of, text)
+            self.intent_log.commit(intent_id)
             
             self.logger.info(f"Document processed successfully: {final_path}")
             return categorization_result
 
         except Exception as e:
             self.logger.error(f"Error processing document {file_path}: {str(e)}")
-            self._handle_processing_error(file_path, str(e))
+            if moved:
+                # The document is filed; the next recover() writes what is missing
+                self.intent_log.release(intent_id)
+                raise
+            if claimed_path is not None:
+                # Not filed after all, so a retry is not a duplicate of itself
+                self.duplicate_index.release(categorization_result['extracted_data'], claimed_path)
+            if intent_id is not None:
+                # The error handling below (or the caller's retry) takes over the document
+                self.intent_log.commit(intent_id)
+            if handle_errors:
+                self._handle_processing_error(file_path, str(e))
             raise
 
+    def _file_document(self, source: Path, destination: Path, digest: Optional[str] = None):
+        """Move a document to its final path, or into the store with a link at that path"""
+        if self.document_store is None:
+            self._move_file(source, destination)
+            return
+        try:
+            self._ensure_directory(destination.parent)
+            try:
+                self.document_store.store(source, destination, digest)
+            except FileNotFoundError:
+                # The directory may have been removed since it was cached
+                stored = not source.exists() and digest is not None and digest in self.document_store.blobs
+                if destination.parent.exists() or not (source.exists() or stored):
+                    raise
+                self._created_dirs.discard(destination.parent)
+                self._ensure_directory(destination.parent)
+                if stored:
+                    # Only the link failed
+                    self.document_store.link_view(digest, destination)
+                else:
+                    self.document_store.store(source, destination, digest)
+        except Exception as e:
+            raise ProcessingError(f"Failed to store document at {destination}: {str(e)}")
+
+    def _handle_duplicate(self, file_path: Path, result: Dict, duplicate_of: Dict) -> bool:
+        """
+        Apply the duplicate policy to a document
+
+        Returns:
+            True if the document was skipped, False if it is filed anyway
+
+        Raises:
+            DuplicateDocumentError: If the policy rejects duplicates
+        """
+        result['duplicate_of'] = duplicate_of
+        if self.duplicate_policy == 'reject':
+            raise DuplicateDocumentError(
+                f"Duplicate of already processed invoice {duplicate_of['document_path']}",
+                document_id=str(file_path),
+                duplicate_of=duplicate_of
+            )
+        if self.duplicate_policy == 'skip':
+            self.logger.info(f"Skipping duplicate document {file_path} of {duplicate_of['document_path']}")
+            result['status'] = 'duplicate'
+            self._move_duplicate(file_path, result)
+            return True
+        return False
+
+    def _move_duplicate(self, file_path: Path, result: Dict):
+        """Move a skipped duplicate out of the input folder, through the intent log"""
+        duplicate_path = self._generate_unique_path(self.duplicate_dir, file_path)
+        intent_id = self.intent_log.begin('duplicate', file_path, duplicate_path, {'result': result})
+        try:
+            self._move_file(file_path, duplicate_path)
+        finally:
+            self.intent_log.commit(intent_id)
+        result['duplicate_path'] = str(duplicate_path)
+
+    def _finish_filing(self, result: Dict, duplicate_of: Optional[Dict], text: Optional[str] = None):
+        """Record and index a document that was moved to its final path"""
+        self._save_processing_record(result, text)
+        if self.duplicate_index is not None and not duplicate_of and result.get('extracted_data'):
+            self.duplicate_index.add(result['extracted_data'], result['final_path'])
+        if self.document_store is not None and result.get('sha256'):
+            final_path = Path(result['final_path'])
+            # processed_documents/<category>/<date>/...
+            date = final_path.relative_to(self.processed_dir).parts[1]
+            self.document_store.add_record(final_path.name, result, date, result.get('original_name'))
+
+    def recover(self) -> int:
+        """
+        Finish the moves interrupted by a crash
+
+        Each intent left by a process that is gone, or released after a
+        failure, is replayed from where it stopped: the move is completed if
+        the source is still there, and the record, index entry or error log
+        line is written. Records are not duplicated. Intents of processes
+        still running are theirs to finish.
+
+        Returns:
+            Number of intents replayed
+        """
+        intents = self.intent_log.claim_orphaned()
+        for intent in intents:
+            source, destination = intent['source'], intent['destination']
+            try:
+                if (source.exists() and destination.exists() and
+                        filecmp.cmp(str(source), str(destination), shallow=False)):
+                    # Copied across filesystems but the source was not removed yet
+                    source.unlink()
+                elif source.exists():
+                    if intent['action'] == 'file':
+                        self._file_document(source, destination, intent['payload']['result'].get('sha256'))
+                    else:
+                        destination.parent.mkdir(parents=True, exist_ok=True)
+                        atomic_move(source, destination)
+                elif intent['action'] == 'file' and self._stored_without_link(intent['payload']['result']):
+                    # Stored before the crash, only the link is missing
+                    self.document_store.link_view(intent['payload']['result']['sha256'], destination)
+                elif not os.path.lexists(destination):
+                    self.logger.warning(f"Neither {source} nor {destination} exists, dropping intent {intent['id']}")
+                    self.intent_log.commit(intent['id'])
+                    continue
+
+                if intent['action'] == 'file':
+                    self._finish_filing(intent['payload']['result'], intent['payload'].get('duplicate_of'),
+                                        intent['payload'].get('text'))
+                elif intent['action'] == 'error':
+                    self._log_error(source, intent['payload']['error'])
+                self.intent_log.commit(intent['id'])
+                self.logger.info(f"Recovered interrupted move of {source} to {destination}")
+            except Exception as e:
+                self.logger.error(f"Failed to recover move of {source} to {destination}: {str(e)}")
+        return len(intents)
+
+    def close(self):
+        """Close the intent log and the optional indexes, writing buffered export rows"""
+        self.intent_log.close()
+        for component in (self.duplicate_index, self.record_index, self.document_store, self.parquet_exporter):
+            if component is not None:
+                component.close()
+    
+    def _stored_without_link(self, result: Dict) -> bool:
+        digest = result.get('sha256')
+        return (self.document_store is not None and digest is not None and
+                digest in self.document_store.blobs and not os.path.lexists(result['final_path']))
+
+    def _find_duplicate(self, categorization_result: Dict) -> Optional[Dict]:
+        """Look up the extracted invoice data in the duplicate index"""
+        extracted_data = categorization_result.get('extracted_data')
+        if self.duplicate_index is None or not extracted_data:
+            return None
+        return self.duplicate_index.find_duplicate(extracted_data)
+
     def process_batch(self, directory: Path) -> List[Dict]:
         """Process all documents in a directory"""
         results = []
@@ -152,47 +390,85 @@ class DocumentProcessor:
     def _generate_unique_path(self, target_dir: Path, original_file: Path) -> Path:
         """Generate unique file path in target directory"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        new_filename = f"{original_file.stem}_{timestamp}{original_file.suffix}"
+        new_filename = (f"{original_file.stem}_{timestamp}_{os.getpid():x}_{next(_output_sequence):06d}"
+                        f"{original_file.suffix}")
+        if self.output_shards:
+            # Spread files evenly so no directory grows without bound
+            digest = int.from_bytes(hashlib.blake2b(new_filename.encode('utf-8'), digest_size=4).digest(), 'big')
+            width = len(f"{self.output_shards - 1:x}")
+            target_dir = target_dir / f"{digest % self.output_shards:0{width}x}"
         return target_dir / new_filename
 
+    def _ensure_directory(self, directory: Path):
+        """Create a directory unless this processor already created or found it"""
+        if directory not in self._created_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(directory)
+
     def _move_file(self, source: Path, destination: Path):
         """Move file to target location"""
         try:
             # Ensure destination directory exists
-            destination.parent.mkdir(parents=True, exist_ok=True)
-            shutil.move(str(source), str(destination))
+            self._ensure_directory(destination.parent)
+            try:
+                atomic_move(source, destination)
+            except FileNotFoundError:
+                # The directory may have been removed since it was cached
+                if not source.exists():
+                    raise
+                self._created_dirs.discard(destination.parent)
+                self._ensure_directory(destination.parent)
+                atomic_move(source, destination)
         except Exception as e:
             raise ProcessingError(f"Failed to move file to {destination}: {str(e)}")
 
-    def _save_processing_record(self, result: Dict):
-        """Save processing record to database or file"""
+    def _save_processing_record(self, result: Dict, text: Optional[str] = None):
+        """Save processing record to database or file, indexing it with the document text"""
         record_path = Path(self.config['processing_records_path'])
-        record_path.mkdir(parents=True, exist_ok=True)
+        self._ensure_directory(record_path)
         
         timestamp = datetime.now().strftime("%Y%m%d")
         record_file = record_path / f"processing_record_{timestamp}.json"
         
         try:
-            # Load existing records
-            if record_file.exists():
-                with open(record_file) as f:
-                    records = json.load(f)
-            else:
-                records = []
-            
-            # Add new record
-            records.append({
-                'timestamp': datetime.now().isoformat(),
-                **result
-            })
-            
-            # Save updated records
-            with open(record_file, 'w') as f:
-                json.dump(records, f, indent=2)
+            with self._record_lock:
+                # Load existing records
+                if record_file.exists():
+                    with open(record_file) as f:
+                        records = json.load(f)
+                else:
+                    records = []
+                
+                # A replayed intent may already have its record
+                final_path = result.get('final_path')
+                new_record = False
+                record = next((record for record in records
+                               if final_path and record.get('final_path') == final_path), None)
+                if record is None:
+                    # Add new record
+                    record = {
+                        'timestamp': datetime.now().isoformat(),
+                        **result
+                    }
+                    records.append(record)
+                    new_record = True
+                    
+                    # Save updated records
+                    atomic_write_json(record_file, records)
+            
+            if self.record_index is not None:
+                self.record_index.add_processing_records([record], [text])
+            # The export is append-only, so replayed records are not exported again
+            if self.parquet_exporter is not None and new_record:
+                self.parquet_exporter.append(record)
                 
         except Exception as e:
             self.logger.error(f"Failed to save processing record: {str(e)}")
 
+    def reject_document(self, file_path: Path, error_message: str):
+        """Move a document that cannot be processed to the error directory"""
+        self._handle_processing_error(file_path, error_message)
+
     def _handle_processing_error(self, file_path: Path, error_message: str):
         """Handle processing errors"""
         error_dir = Path(self.config['error_directory'])
@@ -200,13 +476,23 @@ class DocumentProcessor:
         
         # Move file to error directory
         error_path = error_dir / file_path.name
-        try:
-            shutil.move(str(file_path), str(error_path))
-        except Exception as e:
-            self.logger.error(f"Failed to move file to error directory: {str(e)}")
+        intent_id = None
+        if file_path.exists():
+            intent_id = self.intent_log.begin('error', file_path, error_path, {'error': error_message})
+            try:
+                atomic_move(file_path, error_path)
+            except Exception as e:
+                self.logger.error(f"Failed to move file to error directory: {str(e)}")
+        else:
+            self.logger.warning(f"{file_path} is no longer there, not moving it to the error directory")
         
-        # Log error details
-        error_log = error_dir / 'processing_errors.log'
+        self._log_error(file_path, error_message)
+        if intent_id is not None:
+            self.intent_log.commit(intent_id)
+
+    def _log_error(self, file_path: Path, error_message: str):
+        """Append error details to the error log"""
+        error_log = Path(self.config['error_directory']) / 'processing_errors.log'
         try:
             with open(error_log, 'a') as f:
                 f.write(f"{datetime.now().isoformat()}: {file_path} - {error_message}\n")
@@ -0,0 +1,366 @@
+import os
+import json
+import stat
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .exceptions import ProcessingError
+from .intent_log import atomic_move, fsync_directory
+
+# Linux ioctl cloning a file's extents (btrfs, XFS, ...), see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+# Ways processed_documents/ shows stored documents
+VIEW_MODES = ('symlink', 'hardlink')
+
+# Catalogue columns that find() can filter on; all are indexed
+CATALOGUE_FIELDS = ('sha256', 'category', 'date', 'vendor', 'invoice_number', 'invoice_date', 'total_amount')
+
+
+def file_digest(file_path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content as a hex string"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(source: Path, destination: Path) -> bool:
+    """Clone a file without copying its data, where the filesystem supports it"""
+    try:
+        import fcntl
+    except ImportError:  # not available on Windows
+        return False
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        Path(destination).unlink(missing_ok=True)
+        return False
+
+
+class ContentStore:
+    """
+    Blob store addressing files by the SHA-256 of their content
+
+    Blobs live at <root>/ab/cd/<sha256>, so identical documents are
+    stored once and no directory holds more than a fraction of them.
+    Blobs are made read-only, as views may hardlink them.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._created_dirs = set()
+
+    def path(self, digest: str) -> Path:
+        """Path of the blob with a given digest"""
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def __contains__(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def put(self, file_path: Path, digest: Optional[str] = None, move: bool = True) -> str:
+        """
+        Add a file to the store
+
+        Args:
+            file_path: File to store
+            digest: Optional precomputed SHA-256 of the file
+            move: Move the file into the store; otherwise it is cloned
+                (reflink) or copied and left in place
+
+        Returns:
+            Digest of the stored content
+        """
+        digest = digest or file_digest(file_path)
+        blob = self.path(digest)
+        if blob.exists():
+            # Already stored; the new copy is not needed
+            if move:
+                Path(file_path).unlink()
+            return digest
+
+        self._ensure_directory(blob.parent)
+        try:
+            self._write_blob(Path(file_path), blob, move)
+        except FileNotFoundError:
+            # The directory may have been removed since it was cached
+            if not Path(file_path).exists():
+                raise
+            self._created_dirs.discard(blob.parent)
+            self._ensure_directory(blob.parent)
+            self._write_blob(Path(file_path), blob, move)
+        os.chmod(blob, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        return digest
+
+    def _ensure_directory(self, directory: Path) -> None:
+        if directory not in self._created_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(directory)
+
+    @staticmethod
+    def _write_blob(file_path: Path, blob: Path, move: bool) -> None:
+        """Move or copy a file to its blob path; the blob's directory must exist"""
+        if move:
+            atomic_move(file_path, blob)
+            return
+        fd, temp_path = tempfile.mkstemp(dir=str(blob.parent), prefix='.', suffix='.part')
+        os.close(fd)
+        try:
+            if not _reflink(file_path, Path(temp_path)):
+                shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, blob)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        fsync_directory(blob.parent)
+
+    def link(self, digest: str, destination: Path, mode: str = 'symlink') -> None:
+        """
+        Make a stored blob visible at another path
+
+        Args:
+            digest: Digest of the blob
+            destination: Path of the link; its directory must exist
+            mode: 'symlink', or 'hardlink'; symlinks fall back to hardlinks
+                where they cannot be created (e.g. Windows without privileges)
+        """
+        blob = self.path(digest)
+        if mode == 'symlink':
+            try:
+                os.symlink(os.path.relpath(blob, destination.parent), destination)
+                return
+            except (OSError, NotImplementedError):
+                pass
+        os.link(blob, destination)
+
+
+class DocumentCatalogue:
+    """SQLite catalogue of stored documents with indexed lookups by field"""
+
+    def __init__(self, db_path: Path):
+        """
+        Open or create a catalogue
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                sha256 TEXT,
+                original_name TEXT,
+                category TEXT,
+                date TEXT,
+                vendor TEXT,
+                invoice_number TEXT,
+                invoice_date TEXT,
+                total_amount TEXT,
+                view_path TEXT,
+                extracted_data TEXT,
+                added TEXT
+            )
+            """
+        )
+        for field in CATALOGUE_FIELDS:
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS documents_{field} ON documents ({field})")
+        self._connection.commit()
+
+    def add(self, document_id: str, sha256: str, category: str, date: str,
+            original_name: Optional[str] = None, extracted_data: Optional[Dict] = None,
+            view_path: Optional[str] = None) -> None:
+        """
+        Add or replace a document entry
+
+        Args:
+            document_id: Unique document id
+            sha256: Digest of the stored content
+            category: Document category
+            date: Processing date (YYYY-MM-DD)
+            original_name: Name the document arrived with
+            extracted_data: Extracted fields
+            view_path: Where the document appears under processed_documents
+        """
+        data = extracted_data or {}
+        row = (
+            document_id, sha256, original_name, category, date,
+            _text(data.get('vendor')), _text(data.get('invoice_number')),
+            _text(data.get('date')), _text(data.get('total_amount')),
+            view_path, json.dumps(data, default=str), datetime.now().isoformat()
+        )
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+            )
+            self._connection.commit()
+
+    def _rows(self, where: str, parameters: tuple) -> List[Dict]:
+        with self._lock:
+            cursor = self._connection.execute(f"SELECT * FROM documents {where}", parameters)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(zip(columns, row))
+            entry['extracted_data'] = json.loads(entry['extracted_data'] or '{}')
+            entries.append(entry)
+        return entries
+
+    def get(self, document_id: str) -> Optional[Dict]:
+        """Entry of a document, or None"""
+        rows = self._rows("WHERE document_id = ?", (document_id,))
+        return rows[0] if rows else None
+
+    def find(self, **fields) -> List[Dict]:
+        """
+        Find documents by field values, e.g. find(vendor='ACME', date='2024-03-15')
+
+        Args:
+            **fields: Values of CATALOGUE_FIELDS that must all match
+
+        Returns:
+            Matching entries, oldest first
+        """
+        unknown = set(fields) - set(CATALOGUE_FIELDS)
+        if unknown:
+            raise ProcessingError(f"Cannot search documents by {', '.join(sorted(unknown))}")
+        where = ' AND '.join(f"{field} = ?" for field in fields)
+        return self._rows(f"WHERE {where} ORDER BY added" if where else "ORDER BY added",
+                          tuple(_text(value) for value in fields.values()))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        with self._lock:
+            self._connection.close()
+
+
+def _text(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class DocumentStore:
+    """
+    Deduplicated storage of processed documents
+
+    Content goes into a ContentStore and metadata into a DocumentCatalogue;
+    processed_documents/<category>/<date>/ holds links to the blobs, which
+    rebuild_view() can regenerate from the catalogue.
+    """
+
+    def __init__(self, root: Path, catalogue_path: Optional[Path] = None, view: str = 'symlink'):
+        """
+        Args:
+            root: Directory of the blob store
+            catalogue_path: SQLite catalogue (default: <root>/catalogue.sqlite3)
+            view: How documents appear under processed_documents, one of VIEW_MODES
+        """
+        if view not in VIEW_MODES:
+            raise ProcessingError(f"Invalid document view '{view}', expected one of {', '.join(VIEW_MODES)}")
+        self.logger = logging.getLogger(__name__)
+        self.blobs = ContentStore(Path(root) / 'blobs')
+        self.catalogue = DocumentCatalogue(Path(catalogue_path or Path(root) / 'catalogue.sqlite3'))
+        self.view = view
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['DocumentStore']:
+        """
+        Create the store configured under 'document_store'
+
+        Args:
+            config: Processor configuration
+
+        Returns:
+            DocumentStore, or None if the store is disabled
+        """
+        settings = config.get('document_store') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(
+            Path(settings.get('root', 'data/store')),
+            settings.get('catalogue_path'),
+            settings.get('view', 'symlink')
+        )
+
+    def store(self, file_path: Path, view_path: Path, digest: Optional[str] = None) -> str:
+        """
+        Move a document into the store and link it at its view path
+
+        Args:
+            file_path: Document to store
+            view_path: Link to create; its directory must exist
+            digest: Optional precomputed SHA-256
+
+        Returns:
+            Digest of the document
+        """
+        digest = self.blobs.put(file_path, digest)
+        self.link_view(digest, view_path)
+        return digest
+
+    def link_view(self, digest: str, view_path: Path) -> None:
+        """Link a stored blob at its view path unless the link exists"""
+        if not os.path.lexists(view_path):
+            self.blobs.link(digest, view_path, self.view)
+
+    def add_record(self, document_id: str, result: Dict, date: str, original_name: Optional[str] = None) -> None:
+        """
+        Catalogue a stored document
+
+        Args:
+            document_id: Unique document id
+            result: Processing result with 'sha256', 'categories' and 'final_path'
+            date: Processing date (YYYY-MM-DD)
+            original_name: Name the document arrived with
+        """
+        self.catalogue.add(
+            document_id,
+            result['sha256'],
+            result['categories'][0],
+            date,
+            original_name=original_name,
+            extracted_data=result.get('extracted_data'),
+            view_path=result['final_path']
+        )
+
+    def rebuild_view(self) -> int:
+        """
+        Recreate missing view links from the catalogue
+
+        Returns:
+            Number of links created
+        """
+        created = 0
+        for entry in self.catalogue.find():
+            view_path = Path(entry['view_path'])
+            if os.path.lexists(view_path) or entry['sha256'] not in self.blobs:
+                continue
+            view_path.parent.mkdir(parents=True, exist_ok=True)
+            self.blobs.link(entry['sha256'], view_path, self.view)
+            created += 1
+        return created
+
+    def close(self) -> None:
+        self.catalogue.close()
+
+
+__all__ = ['CATALOGUE_FIELDS', 'VIEW_MODES', 'ContentStore', 'DocumentCatalogue', 'DocumentStore',
+           'file_digest']
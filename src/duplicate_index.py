@@ -0,0 +1,284 @@
+import re
+import math
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from .normalization import parse_amount, parse_date
+
+# Fields identifying an invoice, in key order
+DUPLICATE_KEY_FIELDS = ('vendor', 'invoice_number', 'total_amount', 'date')
+
+_NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+
+
+def normalize_key_fields(data: Dict) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Normalise the fields identifying an invoice
+
+    Vendor and invoice number are case-folded with punctuation and
+    whitespace removed, the amount is reduced to its numeric value and the
+    date to ISO format, so a re-scanned copy of an invoice yields the same
+    fields even if OCR or formatting differ slightly.
+
+    Args:
+        data: Extracted invoice data
+
+    Returns:
+        Tuple of (vendor, invoice_number, total_amount, date), or None if
+        the invoice number is missing
+    """
+    invoice_number = _NON_ALPHANUMERIC.sub('', str(data.get('invoice_number') or '')).casefold()
+    if not invoice_number:
+        return None
+
+    vendor = _NON_ALPHANUMERIC.sub('', str(data.get('vendor') or '')).casefold()
+
+    amount = parse_amount(data.get('total_amount'))
+    total_amount = format(amount.normalize(), 'f') if amount is not None else ''
+
+    date = data.get('date')
+    date = (parse_date(date) or str(date).strip()) if date else ''
+
+    return vendor, invoice_number, total_amount, date
+
+
+def duplicate_key(data: Dict) -> Optional[str]:
+    """
+    Compute the duplicate-detection key of extracted invoice data
+
+    Args:
+        data: Extracted invoice data
+
+    Returns:
+        Hex digest of the normalised key fields, or None if the invoice
+        cannot be identified
+    """
+    fields = normalize_key_fields(data)
+    if fields is None:
+        return None
+    return hashlib.sha256('\x1f'.join(fields).encode('utf-8')).hexdigest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys"""
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing: position_i = h1 + i * h2
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        """Add a key to the filter"""
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DuplicateIndex:
+    """
+    Persistent index of processed invoices for duplicate detection
+
+    Entries are stored in SQLite; a Bloom filter over all stored keys is
+    kept in memory so that lookups of new invoices, the common case, do
+    not touch the database. Several processes may share the database: a
+    filter miss is only trusted once the keys other processes added since
+    the last check (seen through PRAGMA data_version) are in the filter.
+    Whether an invoice is new is decided by claim(), a single INSERT OR
+    IGNORE, so two processes handling the same invoice never both file it.
+    """
+
+    def __init__(self, db_path: Path, expected_items: int = 100000,
+                 false_positive_rate: float = 0.001):
+        """
+        Open or create a duplicate index
+
+        Args:
+            db_path: Path to the SQLite database file
+            expected_items: Number of invoices the Bloom filter is sized for;
+                it is rebuilt with twice the size when exceeded
+            false_positive_rate: Target false positive rate of the Bloom filter
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.false_positive_rate = false_positive_rate
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS invoice_index (
+                key TEXT PRIMARY KEY,
+                vendor TEXT,
+                invoice_number TEXT,
+                total_amount TEXT,
+                invoice_date TEXT,
+                document_path TEXT,
+                first_seen TEXT
+            )
+            """
+        )
+        self._connection.commit()
+        self._build_filter(expected_items)
+
+    def _build_filter(self, capacity: int) -> None:
+        """(Re)build the Bloom filter from the stored keys"""
+        self._data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        stored = self._connection.execute("SELECT COUNT(*) FROM invoice_index").fetchone()[0]
+        self._filter = BloomFilter(max(capacity, stored * 2), self.false_positive_rate)
+        self._max_rowid = 0
+        for rowid, key in self._connection.execute("SELECT rowid, key FROM invoice_index"):
+            self._filter.add(key)
+            self._max_rowid = max(self._max_rowid, rowid)
+
+    def _refresh_filter(self) -> None:
+        """Fold keys added by other connections since the last check into the filter"""
+        data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        for rowid, key in self._connection.execute(
+                "SELECT rowid, key FROM invoice_index WHERE rowid > ?", (self._max_rowid,)):
+            if key not in self._filter:
+                self._filter.add(key)
+            self._max_rowid = max(self._max_rowid, rowid)
+        if self._filter.count > self._filter.capacity:
+            self._build_filter(self._filter.capacity * 2)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM invoice_index").fetchone()[0]
+
+    def _entry(self, key: str) -> Optional[Dict]:
+        row = self._connection.execute(
+            "SELECT vendor, invoice_number, total_amount, invoice_date, document_path, first_seen "
+            "FROM invoice_index WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('vendor', 'invoice_number', 'total_amount', 'date',
+                         'document_path', 'first_seen'), row))
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """
+        Find the indexed invoice with a given key
+
+        Args:
+            key: Key as returned by duplicate_key()
+
+        Returns:
+            Stored entry of the earlier invoice, or None if the key is new
+        """
+        with self._lock:
+            if key not in self._filter:
+                # Other processes may have added it since the filter was updated
+                self._refresh_filter()
+                if key not in self._filter:
+                    return None
+            return self._entry(key)
+
+    def find_duplicate(self, data: Dict) -> Optional[Dict]:
+        """
+        Find an earlier invoice with the same identifying fields
+
+        Args:
+            data: Extracted invoice data
+
+        Returns:
+            Stored entry of the earlier invoice, or None
+        """
+        key = duplicate_key(data)
+        return self.lookup(key) if key else None
+
+    def add(self, data: Dict, document_path: Optional[str] = None) -> bool:
+        """
+        Record a processed invoice
+
+        Args:
+            data: Extracted invoice data
+            document_path: Where the processed document was filed
+
+        Returns:
+            True if the invoice was added, False if it cannot be identified
+            or is already indexed
+        """
+        return self._insert(data, document_path)[0]
+
+    def claim(self, data: Dict, document_path: Optional[str] = None) -> Optional[Dict]:
+        """
+        Record an invoice about to be filed unless it is already indexed
+
+        Checking and recording are one statement, so of several processes
+        filing the same invoice exactly one claims it.
+
+        Args:
+            data: Extracted invoice data
+            document_path: Where the document will be filed
+
+        Returns:
+            Stored entry of the earlier invoice if the invoice is a
+            duplicate, otherwise None (also for invoices that cannot be
+            identified, which are not recorded)
+        """
+        added, key = self._insert(data, document_path)
+        if added or key is None:
+            return None
+        with self._lock:
+            return self._entry(key)
+
+    def release(self, data: Dict, document_path: Optional[str] = None) -> None:
+        """Remove an invoice claimed for document_path that was not filed after all"""
+        key = duplicate_key(data)
+        if key is None:
+            return
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM invoice_index WHERE key = ? AND document_path IS ?", (key, document_path)
+            )
+            self._connection.commit()
+
+    def _insert(self, data: Dict, document_path: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Insert an invoice unless its key is stored; returns whether it was added and its key"""
+        fields = normalize_key_fields(data)
+        if fields is None:
+            return False, None
+        key = duplicate_key(data)
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO invoice_index VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, *fields, document_path, datetime.now().isoformat())
+            )
+            self._connection.commit()
+            if not cursor.rowcount:
+                return False, key
+            self._filter.add(key)
+            if self._filter.count > self._filter.capacity:
+                self._build_filter(self._filter.capacity * 2)
+        return True, key
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        with self._lock:
+            self._connection.close()
+
+
+__all__ = ['DUPLICATE_KEY_FIELDS', 'BloomFilter', 'DuplicateIndex', 'duplicate_key',
+           'normalize_key_fields']
@@ -1,14 +1,228 @@
 import email
+import email.policy
 import imaplib
-from typing import List, Dict
+import base64
+import hashlib
+import logging
+import binascii
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from urllib.parse import unquote
 import os
 from pathlib import Path
 
+from .exceptions import ProcessingError
+
+# Bytes of an attachment fetched per IMAP request
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+_ATOM_END = b' ()"{\r\n'
+
+
+class MessagePart:
+    """A leaf of a message's MIME structure, as described by IMAP BODYSTRUCTURE"""
+
+    def __init__(self, section: str, content_type: str, encoding: str, size: int,
+                 file_name: Optional[str] = None, disposition: Optional[str] = None):
+        self.section = section
+        self.content_type = content_type
+        self.encoding = encoding
+        self.size = size
+        self.file_name = file_name
+        self.disposition = disposition
+
+    @property
+    def is_attachment(self) -> bool:
+        return self.disposition is not None and bool(self.file_name)
+
+
+def _tokenize(data: bytes, tokens: list) -> None:
+    index = 0
+    while index < len(data):
+        char = data[index:index + 1]
+        if char in (b' ', b'\r', b'\n'):
+            index += 1
+        elif char in (b'(', b')'):
+            tokens.append(char.decode())
+            index += 1
+        elif char == b'"':
+            value = bytearray()
+            index += 1
+            while index < len(data) and data[index:index + 1] != b'"':
+                if data[index:index + 1] == b'\\':
+                    index += 1
+                value += data[index:index + 1]
+                index += 1
+            tokens.append(bytes(value))
+            index += 1
+        elif char == b'{':
+            # Literal size; imaplib delivers the literal as the next item
+            index = data.index(b'}', index) + 1
+        else:
+            end = index
+            while end < len(data) and data[end:end + 1] not in _ATOM_END:
+                end += 1
+            atom = data[index:end].decode('ascii', 'replace')
+            tokens.append(None if atom.upper() == 'NIL' else atom)
+            index = end
+
+
+def _fetch_items(data: list) -> Dict[str, object]:
+    """Parse FETCH response data into data item name -> value"""
+    tokens: list = []
+    for item in data:
+        if isinstance(item, tuple):
+            _tokenize(item[0], tokens)
+            tokens.append(item[1])
+        elif isinstance(item, bytes):
+            _tokenize(item, tokens)
+    stack: List[list] = [[]]
+    for token in tokens:
+        if token == '(':
+            stack.append([])
+        elif token == ')' and len(stack) > 1:
+            completed = stack.pop()
+            stack[-1].append(completed)
+        else:
+            stack[-1].append(token)
+    items = {}
+    for response in stack[0]:
+        if isinstance(response, list):
+            for name, value in zip(response[::2], response[1::2]):
+                if isinstance(name, str):
+                    items[name.upper()] = value
+    return items
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+def _parameters(values) -> Dict[str, str]:
+    if not isinstance(values, list):
+        return {}
+    return {_text(name).lower(): _text(value) or '' for name, value in zip(values[::2], values[1::2])}
+
+
+def _file_name(parameters: Dict[str, str], key: str) -> Optional[str]:
+    """Parameter value, decoding RFC 2231 continuations and RFC 2047 encoded words"""
+    value = parameters.get(key)
+    if value is None:
+        # key*=charset'language'value, or continuations key*0*=..., key*1=...
+        sections = []
+        for name, section in parameters.items():
+            number = name[len(key) + 1:].rstrip('*')
+            if name.startswith(key + '*') and (not number or number.isdigit()):
+                sections.append((int(number or 0), name.endswith('*'), section))
+        if not sections:
+            return None
+        sections.sort()
+        value = ''.join(section for _, _, section in sections)
+        if sections[0][1]:
+            charset, _, encoded = value.split("'", 2) if value.count("'") >= 2 else ('', '', value)
+            value = unquote(encoded, encoding=charset or 'utf-8', errors='replace')
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def parse_bodystructure(structure: list, section: str = '') -> List[MessagePart]:
+    """
+    List the leaf parts of a parsed BODYSTRUCTURE
+
+    Args:
+        structure: BODYSTRUCTURE value as nested lists
+        section: Section number of the structure ('' for the message)
+
+    Returns:
+        Parts in message order; embedded messages are not descended into
+    """
+    if structure and isinstance(structure[0], list):
+        # Subparts, followed by the subtype and extension data
+        parts = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            parts += parse_bodystructure(child, f"{section}.{index + 1}" if section else str(index + 1))
+        return parts
+    maintype, subtype = (_text(structure[0]) or 'text').lower(), (_text(structure[1]) or 'plain').lower()
+    # Extension data follows the type specific fields
+    extension = {'text': 8}.get(maintype, 10 if (maintype, subtype) == ('message', 'rfc822') else 7)
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    disposition_type, disposition_parameters = None, {}
+    if isinstance(disposition, list) and disposition:
+        disposition_type = (_text(disposition[0]) or '').lower()
+        disposition_parameters = _parameters(disposition[1] if len(disposition) > 1 else None)
+    return [MessagePart(
+        section or '1',
+        f"{maintype}/{subtype}",
+        (_text(structure[5]) or '7bit').lower(),
+        int(structure[6] or 0),
+        _file_name(disposition_parameters, 'filename') or _file_name(_parameters(structure[2]), 'name'),
+        disposition_type
+    )]
+
+
+class _Base64Decoder:
+    def __init__(self):
+        self._pending = b''
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._pending + chunk.translate(None, b' \t\r\n')
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return base64.b64decode(data[:usable])
+
+    def flush(self) -> bytes:
+        data, self._pending = self._pending, b''
+        return base64.b64decode(data + b'=' * (-len(data) % 4)) if data else b''
+
+
+class _QuotedPrintableDecoder:
+    def __init__(self):
+        self._pending = b''
+
+    def feed(self, chunk: bytes) -> bytes:
+        # Decode whole lines only, so soft breaks and escapes are never split
+        data = self._pending + chunk
+        end = data.rfind(b'\n') + 1
+        self._pending = data[end:]
+        return binascii.a2b_qp(data[:end])
+
+    def flush(self) -> bytes:
+        data, self._pending = self._pending, b''
+        return binascii.a2b_qp(data)
+
+
+class _IdentityDecoder:
+    def feed(self, chunk: bytes) -> bytes:
+        return chunk
+
+    def flush(self) -> bytes:
+        return b''
+
+
+def _decoder(encoding: str):
+    if encoding == 'base64':
+        return _Base64Decoder()
+    if encoding == 'quoted-printable':
+        return _QuotedPrintableDecoder()
+    return _IdentityDecoder()
+
+
 class EmailFetcher:
-    def __init__(self, host: str, username: str, password: str):
+    def __init__(self, host: str, username: str, password: str, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.logger = logging.getLogger(__name__)
         self.host = host
         self.username = username
         self.password = password
+        self.buffer_size = buffer_size
         self.mail = None
 
     def connect(self):
@@ -23,47 +237,119 @@ class EmailFetcher:
 
         save_path = Path(save_dir)
         save_path.mkdir(exist_ok=True)
-        
+
         results = []
         self.mail.select(folder)
-        
+
         # Search for emails with attachments
         _, messages = self.mail.search(None, 'ALL')
-        
+
         for msg_num in messages[0].split():
             try:
-                _, msg_data = self.mail.fetch(msg_num, '(RFC822)')
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
-                
-                if email_message.get_content_maintype() != 'multipart':
-                    continue
-                    
-                for part in email_message.walk():
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    if part.get('Content-Disposition') is None:
+                headers, parts = self.fetch_structure(msg_num, uid=False)
+                email_message = BytesParser(policy=email.policy.default).parsebytes(headers, headersonly=True)
+
+                for part in parts:
+                    if not part.is_attachment:
                         continue
-                        
-                    filename = part.get_filename()
-                    if filename:
-                        filepath = save_path / filename
-                        with open(filepath, 'wb') as f:
-                            f.write(part.get_payload(decode=True))
-                        results.append({
-                            'filename': filename,
-                            'path': str(filepath),
-                            'subject': email_message['subject'],
-                            'from': email_message['from']
-                        })
-                        
+                    filename = Path(part.file_name).name
+                    filepath = save_path / filename
+                    with open(filepath, 'wb') as f:
+                        self.stream_part(msg_num, part, f, uid=False)
+                    results.append({
+                        'filename': filename,
+                        'path': str(filepath),
+                        'subject': email_message['subject'],
+                        'from': email_message['from']
+                    })
+
             except Exception as e:
-                print(f"Error processing email {msg_num}: {str(e)}")
-                
+                self.logger.error(f"Error processing email {msg_num}: {str(e)}")
+
         return results
 
+    def search_unseen(self, folder: str = "INBOX") -> List[bytes]:
+        """
+        List the messages not yet marked as seen
+
+        Args:
+            folder: Mailbox to search
+
+        Returns:
+            UIDs of the unseen messages, oldest first
+        """
+        if not self.mail:
+            self.connect()
+        self.mail.select(folder)
+        _, data = self.mail.uid('SEARCH', None, 'UNSEEN')
+        return data[0].split() if data and data[0] else []
+
+    def _fetch(self, message_id: bytes, items: str, uid: bool) -> list:
+        if uid:
+            status, data = self.mail.uid('FETCH', message_id, items)
+        else:
+            status, data = self.mail.fetch(message_id, items)
+        if status != 'OK':
+            raise ProcessingError(f"Fetching {items} of message {message_id!r} failed: {data!r}")
+        return data
+
+    def fetch_structure(self, message_id: bytes, uid: bool = True) -> Tuple[bytes, List[MessagePart]]:
+        """
+        Fetch the header and MIME structure of a message, but no body
+
+        Args:
+            message_id: UID (or sequence number if uid is False)
+            uid: Whether message_id is a UID
+
+        Returns:
+            Tuple of (raw header, leaf parts)
+        """
+        items = _fetch_items(self._fetch(message_id, '(BODYSTRUCTURE BODY.PEEK[HEADER])', uid))
+        if not isinstance(items.get('BODYSTRUCTURE'), list):
+            raise ProcessingError(f"Message {message_id!r} not found")
+        return items.get('BODY[HEADER]') or b'', parse_bodystructure(items['BODYSTRUCTURE'])
+
+    def stream_part(self, message_id: bytes, part: MessagePart, output: BinaryIO, uid: bool = True) -> str:
+        """
+        Decode a part into a file, fetching buffer_size bytes at a time
+
+        Memory use is bounded by buffer_size whatever the part's size.
+        The message is not marked as seen.
+
+        Args:
+            message_id: UID (or sequence number if uid is False)
+            part: Part to fetch
+            output: Binary file the decoded content is written to
+            uid: Whether message_id is a UID
+
+        Returns:
+            SHA-256 hex digest of the decoded content
+        """
+        decoder = _decoder(part.encoding)
+        digest = hashlib.sha256()
+        offset = 0
+        while True:
+            items = _fetch_items(self._fetch(
+                message_id, f'(BODY.PEEK[{part.section}]<{offset}.{self.buffer_size}>)', uid
+            ))
+            chunk = next((value for name, value in items.items() if name.startswith(f'BODY[{part.section}]')), None)
+            chunk = chunk or b''
+            decoded = decoder.feed(chunk)
+            output.write(decoded)
+            digest.update(decoded)
+            offset += len(chunk)
+            if len(chunk) < self.buffer_size:
+                break
+        decoded = decoder.flush()
+        output.write(decoded)
+        digest.update(decoded)
+        return digest.hexdigest()
+
+    def mark_seen(self, uid: bytes) -> None:
+        """Flag a message as seen, so it is not fetched again"""
+        self.mail.uid('STORE', uid, '+FLAGS', '(\\Seen)')
+
     def disconnect(self):
         """Close email connection"""
         if self.mail:
             self.mail.close()
-
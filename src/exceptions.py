@@ -33,7 +33,32 @@ class PDFProcessingError(ProcessingError):
     """Raised when there's an error processing PDF documents"""
     pass
 
+class DuplicateDocumentError(ProcessingError):
+    """Raised when a document duplicates an already processed invoice"""
+    def __init__(self, message: str, document_id: str = None, duplicate_of: dict = None):
+        self.duplicate_of = duplicate_of or {}
+        super().__init__(message, document_id)
+
+class ExtractionKilled(ExtractionError):
+    """Raised when supervised extraction of a document was stopped"""
+    def __init__(self, message: str, document_id: str = None, stage: str = None):
+        self.stage = stage
+        super().__init__(message, document_id)
+
+class ExtractionTimeout(ExtractionKilled):
+    """Raised when a document or one of its extraction stages ran out of time"""
+    pass
+
+class ExtractionMemoryError(ExtractionKilled):
+    """Raised when extraction of a document exceeded the worker memory limit"""
+    pass
+
+class ExtractionCancelled(ExtractionKilled):
+    """Raised when extraction of a document was cancelled"""
+    pass
+
 __all__ = ['ProcessingError', 'ValidationError', 'ExtractionError', 
            'ClassificationError', 'CategoryError', 'ConfigurationError',
-           'EmailFetchError', 'PDFProcessingError']
+           'EmailFetchError', 'PDFProcessingError', 'DuplicateDocumentError', 'ExtractionKilled',
+           'ExtractionTimeout', 'ExtractionMemoryError', 'ExtractionCancelled']
 
@@ -0,0 +1,237 @@
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on literal prefixes tracked per pattern before giving up
+_MAX_PREFIXES = 32
+
+# Characters whose case-insensitive matching is not mirrored by str.lower()
+_CASE_FOLD_SPECIALS = frozenset('ſKİı')
+
+
+def rules_version(rules: Dict) -> str:
+    """
+    Compute a stable version identifier for a rules dictionary
+
+    Args:
+        rules: Classification/extraction rules as loaded from configuration
+
+    Returns:
+        Hex digest identifying the rules content
+    """
+    serialized = json.dumps(rules, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def collect_extraction_patterns(rules: Dict) -> Dict[str, Dict[str, str]]:
+    """
+    Collect field extraction patterns per category
+
+    Supports both the per-category layout (``rules[category]['data_extraction']``)
+    and the top-level layout of ``config/categorization_rules.json``
+    (``rules['data_extraction'][category]``).
+
+    Args:
+        rules: Classification/extraction rules
+
+    Returns:
+        Mapping of category -> {field: pattern}
+    """
+    patterns: Dict[str, Dict[str, str]] = {}
+    for category, category_rules in (rules.get('data_extraction') or {}).items():
+        if isinstance(category_rules, dict):
+            patterns.setdefault(category, {}).update(category_rules)
+    for category, category_rules in rules.items():
+        if isinstance(category_rules, dict) and isinstance(category_rules.get('data_extraction'), dict):
+            patterns.setdefault(category, {}).update(category_rules['data_extraction'])
+    return patterns
+
+
+def _literal_prefixes(items) -> Tuple[Set[str], bool]:
+    """
+    Collect the literal strings every match of a parsed pattern starts with
+
+    Returns:
+        Tuple of (prefixes, whether the whole sequence was literal)
+    """
+    prefixes = {''}
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            prefixes = {prefix + chr(av) for prefix in prefixes}
+            continue
+        if op is sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            if add_flags or del_flags:
+                return prefixes, False
+            branch_prefixes, complete = _literal_prefixes(sub)
+        elif op is sre_constants.BRANCH:
+            branch_prefixes, complete = set(), True
+            for branch in av[1]:
+                sub_prefixes, sub_complete = _literal_prefixes(branch)
+                branch_prefixes |= sub_prefixes
+                complete = complete and sub_complete
+        else:
+            return prefixes, False
+        prefixes = {prefix + suffix for prefix in prefixes for suffix in branch_prefixes}
+        if len(prefixes) > _MAX_PREFIXES or not complete:
+            return prefixes, False
+    return prefixes, True
+
+
+def required_keywords(pattern: str, flags: int = 0) -> Optional[Tuple[FrozenSet[str], bool]]:
+    """
+    Find literal keywords one of which must occur wherever the pattern matches
+
+    Args:
+        pattern: Regular expression source
+        flags: Flags the pattern is compiled with
+
+    Returns:
+        Tuple of (keywords, case-insensitive) or None if no keyword is required
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+    prefixes, _ = _literal_prefixes(parsed)
+    if not prefixes or '' in prefixes or len(prefixes) > _MAX_PREFIXES:
+        return None
+    ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+    if ignore_case:
+        if not all(prefix.isascii() for prefix in prefixes):
+            return None
+        prefixes = {prefix.lower() for prefix in prefixes}
+    return frozenset(prefixes), ignore_case
+
+
+class CategoryPatternSet:
+    """Compiled field patterns of one category with a keyword pre-filter"""
+
+    def __init__(self, category: str, field_patterns: Dict[str, str], flags: int = re.IGNORECASE):
+        self.category = category
+        self.fields: List[str] = []
+        self._patterns: Dict[str, re.Pattern] = {}
+        # Fields that can only match if one of their keywords occurs
+        self._keywords: Dict[str, Tuple[FrozenSet[str], bool]] = {}
+
+        for field, pattern in field_patterns.items():
+            try:
+                self._patterns[field] = re.compile(pattern, flags)
+            except re.error as e:
+                logger.warning(f"Skipping invalid {category}.{field} pattern: {e}")
+                continue
+            self.fields.append(field)
+            keywords = required_keywords(pattern, flags)
+            if keywords:
+                self._keywords[field] = keywords
+
+        self._all_keywords = {
+            ignore_case: frozenset().union(*(kw for kw, ic in self._keywords.values() if ic == ignore_case))
+            for ignore_case in (True, False)
+        }
+
+    def extract(self, text: str) -> Dict[str, str]:
+        """
+        Extract the first match of every field from text
+
+        Each field receives the value of its leftmost match, exactly as a
+        separate ``re.search`` per field would. Fields whose required
+        keywords do not occur in the text are skipped without a scan.
+
+        Args:
+            text: Document text
+
+        Returns:
+            Mapping of field -> stripped matched value for fields that matched
+        """
+        present = self._present_keywords(text)
+        found: Dict[str, str] = {}
+        for field in self.fields:
+            keywords = self._keywords.get(field)
+            if keywords is not None and present is not None and keywords[0].isdisjoint(present):
+                continue
+            match = self._patterns[field].search(text)
+            if match:
+                value = match.group(1) if match.re.groups else match.group(0)
+                found[field] = (value or '').strip()
+        return found
+
+    def _present_keywords(self, text: str) -> Optional[Set[str]]:
+        """Keywords of this pattern set occurring in text, None to disable filtering"""
+        if not self._keywords:
+            return None
+        present = {keyword for keyword in self._all_keywords[False] if keyword in text}
+        if self._all_keywords[True]:
+            if not text.isascii() and not _CASE_FOLD_SPECIALS.isdisjoint(text):
+                return None
+            lowered = text.lower()
+            present.update(keyword for keyword in self._all_keywords[True] if keyword in lowered)
+        return present
+
+
+class CompiledExtractionRules:
+    """Extraction patterns of every category, compiled once per rules version"""
+
+    def __init__(self, rules: Dict, version: Optional[str] = None):
+        self.version = version or rules_version(rules)
+        self.categories: Dict[str, CategoryPatternSet] = {
+            category: CategoryPatternSet(category, field_patterns)
+            for category, field_patterns in collect_extraction_patterns(rules).items()
+        }
+
+    def extract(self, category: str, text: str) -> Dict[str, str]:
+        """
+        Extract all configured fields for a category
+
+        Args:
+            category: Document category, e.g. 'invoice' or 'receipt'
+            text: Document text
+
+        Returns:
+            Mapping of field -> matched value; empty if the category has no rules
+        """
+        pattern_set = self.categories.get(category)
+        if pattern_set is None or not text:
+            return {}
+        return pattern_set.extract(text)
+
+
+_cache: Dict[str, CompiledExtractionRules] = {}
+_cache_lock = threading.Lock()
+
+
+def compile_extraction_rules(rules: Dict) -> CompiledExtractionRules:
+    """
+    Get the compiled extraction rules for a rules dictionary
+
+    Compiled rule sets are cached by content version, so identical rules
+    loaded by different classifiers share one compiled object.
+
+    Args:
+        rules: Classification/extraction rules
+
+    Returns:
+        CompiledExtractionRules for the given rules
+    """
+    version = rules_version(rules)
+    with _cache_lock:
+        compiled = _cache.get(version)
+        if compiled is None:
+            compiled = CompiledExtractionRules(rules, version)
+            _cache[version] = compiled
+        return compiled
+
+
+__all__ = ['CompiledExtractionRules', 'CategoryPatternSet', 'compile_extraction_rules',
+           'collect_extraction_patterns', 'required_keywords', 'rules_version']
@@ -10,17 +10,33 @@ class TextExtractor:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
     
-    def extract(self, file_path: Path) -> str:
-        """Extract text from document"""
+    def extract(self, file_path: Path, max_pages: Optional[int] = None,
+                max_chars: Optional[int] = None) -> str:
+        """
+        Extract text from document
+        
+        Args:
+            file_path: Path to document file
+            max_pages: Optional maximum number of pages to read
+            max_chars: Optional number of characters to return at most
+            
+        Returns:
+            Extracted text, truncated to the given bounds
+        """
         try:
-            # Replace the placeholder with actual PDF text extraction
+            parts = []
+            char_count = 0
             with open(file_path, 'rb') as file:
                 reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text()
-                return text.strip()
+                for index, page in enumerate(reader.pages):
+                    if ((max_pages is not None and index >= max_pages) or
+                            (max_chars is not None and char_count >= max_chars)):
+                        break
+                    page_text = page.extract_text()
+                    parts.append(page_text)
+                    char_count += len(page_text)
+            text = ''.join(parts).strip()
+            return text[:max_chars] if max_chars is not None else text
         except Exception as e:
             self.logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
             raise CategoryError(f"Text extraction failed: {str(e)}")
-
@@ -0,0 +1,318 @@
+import os
+import json
+import errno
+import uuid
+import shutil
+import socket
+import sqlite3
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .exceptions import ProcessingError
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+    import msvcrt
+
+# Intent actions: filing a processed document, moving a failed one aside,
+# or moving a skipped duplicate aside
+INTENT_ACTIONS = ('file', 'error', 'duplicate')
+
+
+def fsync_directory(directory: Path) -> None:
+    """Persist the entries of a directory, where the platform supports it"""
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:  # directories cannot be opened on Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_move(source: Path, destination: Path) -> None:
+    """
+    Move a file so that the destination either is complete or does not exist
+
+    Within a filesystem this is a single rename. Across filesystems the
+    file is copied to a temporary name next to the destination, synced and
+    renamed into place before the source is removed; a crash in between
+    leaves both copies, which recovery resolves by removing the source.
+
+    Args:
+        source: File to move
+        destination: Target path; its directory must exist
+    """
+    try:
+        os.rename(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        fd, temp_path = tempfile.mkstemp(dir=str(destination.parent), prefix='.', suffix='.part')
+        try:
+            with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copystat(str(source), temp_path)
+            os.replace(temp_path, destination)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        fsync_directory(destination.parent)
+        os.unlink(source)
+    else:
+        fsync_directory(destination.parent)
+
+
+def lock_file(path: Path, blocking: bool = True):
+    """
+    Open a lock file and take an exclusive lock on it
+
+    The lock is held by the open file, across threads and processes, and
+    released when the file is closed or its process exits.
+
+    Args:
+        path: Lock file, created if missing
+        blocking: Wait for the lock instead of giving up if it is held
+
+    Returns:
+        The open lock file, or None if blocking is False and the lock is held
+    """
+    f = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        raise
+    except OSError:
+        f.close()
+        if blocking:
+            raise
+        return None
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def atomic_write_json(path: Path, data) -> None:
+    """Replace a JSON file with new content without ever leaving a partial file"""
+    fd, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix='.' + path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    fsync_directory(path.parent)
+
+
+class IntentLog:
+    """
+    Write-ahead log of document moves
+
+    An intent is written before a document is moved and deleted once
+    everything that follows the move (record, index entry, error log) is
+    written. After a crash only the remaining intents need replaying.
+
+    Several processes may share one log, so each intent names the log
+    instance that owns it. An owner holds a lock on its file in the
+    owners directory next to the database while it is open; an owner
+    whose lock can be taken has exited or crashed, and only its intents,
+    or released ones, are handed to recovery.
+    """
+
+    def __init__(self, db_path: Path):
+        """
+        Open or create an intent log
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Unique per instance: the process id alone may be reused
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.owners_dir = self.db_path.parent / f"{self.db_path.name}.owners"
+        self.owners_dir.mkdir(parents=True, exist_ok=True)
+        self._owner_lock = self._lock_owner_file()
+        self._connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        # Each intent must be on disk before its move starts
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS intents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                action TEXT,
+                source TEXT,
+                destination TEXT,
+                payload TEXT,
+                created TEXT,
+                owner TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(intents)")}
+        if 'owner' not in columns:
+            # Logs written before intents had owners; their intents count as released
+            self._connection.execute("ALTER TABLE intents ADD COLUMN owner TEXT")
+        self._connection.commit()
+
+    def _owner_path(self, owner: str) -> Path:
+        return self.owners_dir / f"{owner}.lock"
+
+    def _lock_owner_file(self):
+        """Lock this log's owner file, again if a sweep removed it before the lock was taken"""
+        path = self._owner_path(self.owner)
+        while True:
+            f = lock_file(path)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def begin(self, action: str, source: Path, destination: Path, payload: Optional[Dict] = None) -> int:
+        """
+        Record a move about to start
+
+        Args:
+            action: One of INTENT_ACTIONS
+            source: File being moved
+            destination: Where it is moved to
+            payload: JSON-serialisable data needed to finish the work after the move
+
+        Returns:
+            Intent id, passed to commit() once the work is done
+        """
+        if action not in INTENT_ACTIONS:
+            raise ProcessingError(f"Unknown intent action '{action}'")
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO intents (action, source, destination, payload, created, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (action, str(source), str(destination), json.dumps(payload or {}, default=str),
+                 datetime.now().isoformat(), self.owner)
+            )
+            self._connection.commit()
+            return cursor.lastrowid
+
+    def commit(self, intent_id: int) -> None:
+        """Mark an intent as completed"""
+        with self._lock:
+            self._connection.execute("DELETE FROM intents WHERE id = ?", (intent_id,))
+            self._connection.commit()
+
+    def release(self, intent_id: int) -> None:
+        """Give up an intent this log owns, leaving it to the next recovery"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE intents SET owner = NULL WHERE id = ? AND owner = ?", (intent_id, self.owner)
+            )
+            self._connection.commit()
+
+    def pending(self) -> List[Dict]:
+        """
+        Intents that were begun but not committed, oldest first
+
+        Returns:
+            Intents with 'id', 'action', 'source', 'destination', 'payload',
+            'created' and 'owner'
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, action, source, destination, payload, created, owner FROM intents ORDER BY id"
+            ).fetchall()
+        return [
+            {'id': intent_id, 'action': action, 'source': Path(source), 'destination': Path(destination),
+             'payload': json.loads(payload), 'created': created, 'owner': owner}
+            for intent_id, action, source, destination, payload, created, owner in rows
+        ]
+
+    def claim_orphaned(self) -> List[Dict]:
+        """
+        Take over the intents of owners that are gone
+
+        Intents of live owners, this log included, are still in flight and
+        left alone. Claimed intents belong to this log, so concurrent
+        recoveries never replay the same intent. The lock files of owners
+        that exited without closing their log are removed as well.
+
+        Returns:
+            Claimed intents as returned by pending(), oldest first
+        """
+        claimed = []
+        owner_locks = {}
+        try:
+            for intent in self.pending():
+                owner = intent['owner']
+                if owner is not None and owner not in owner_locks:
+                    # None while the owner is alive; taking its lock proves it is gone
+                    owner_locks[owner] = (None if owner == self.owner else
+                                          lock_file(self._owner_path(owner), blocking=False))
+                if owner is not None and owner_locks[owner] is None:
+                    continue
+                with self._lock:
+                    cursor = self._connection.execute(
+                        "UPDATE intents SET owner = ? WHERE id = ? AND owner IS ?", (self.owner, intent['id'], owner)
+                    )
+                    self._connection.commit()
+                if cursor.rowcount:
+                    claimed.append({**intent, 'owner': self.owner})
+            self._sweep_owner_files(owner_locks)
+        finally:
+            for owner, lock in owner_locks.items():
+                if lock is not None:
+                    lock.close()
+                    self._owner_path(owner).unlink(missing_ok=True)
+        return claimed
+
+    def _sweep_owner_files(self, checked: Dict) -> None:
+        """Remove the lock files of owners that exited without closing their log"""
+        for path in self.owners_dir.glob('*.lock'):
+            owner = path.name[:-len('.lock')]
+            if owner == self.owner or owner in checked:
+                continue
+            lock = lock_file(path, blocking=False)
+            if lock is not None:
+                path.unlink(missing_ok=True)
+                lock.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM intents").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database and give up ownership of open intents"""
+        with self._lock:
+            self._connection.close()
+            if not self._owner_lock.closed:
+                self._owner_lock.close()
+                self._owner_path(self.owner).unlink(missing_ok=True)
+
+
+__all__ = ['INTENT_ACTIONS', 'IntentLog', 'atomic_move', 'atomic_write_json', 'fsync_directory', 'lock_file']
@@ -0,0 +1,106 @@
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from .classifiers import DocumentClassifier
+
+# Invoice number following its label, e.g. "Invoice No: INV-2024-001"
+INVOICE_NUMBER_PATTERN = re.compile(
+    r'(?i)\binvoice\s*(?:no\.?|number|num\.?|#)\s*[:#.]?\s*([A-Z0-9](?:[A-Z0-9\-/.]*[A-Z0-9])?)'
+)
+
+# Page numbering that marks the first page of a document, e.g. "Page 1 of 3"
+FIRST_PAGE_PATTERN = re.compile(r'(?i)\bpage\s*1\s*(?:of|/)\s*\d+')
+
+
+class InvoiceSplitter:
+    """
+    Finds the invoices in a PDF that holds several of them
+
+    Suppliers often concatenate a month of invoices into one file. Each
+    page is classified on its own; a page starts a new invoice when it
+    reads as an invoice page and either carries an invoice number other
+    than the current invoice's, or is numbered as a first page. Pages
+    without an invoice number (terms, line item continuations) stay with
+    the invoice before them.
+    """
+
+    def __init__(self, classifier: Optional[DocumentClassifier] = None, min_confidence: float = 0.3):
+        """
+        Args:
+            classifier: Page classifier, a DocumentClassifier by default
+            min_confidence: Confidence an invoice page needs to start an invoice
+        """
+        self.logger = logging.getLogger(__name__)
+        self.classifier = classifier or DocumentClassifier()
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['InvoiceSplitter']:
+        """
+        Create the splitter configured under 'invoice_splitting'
+
+        Returns:
+            InvoiceSplitter, or None if splitting is disabled
+        """
+        settings = config.get('invoice_splitting') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(min_confidence=settings.get('min_confidence', 0.3))
+
+    def page_signals(self, text: str) -> Dict:
+        """
+        Boundary signals of a single page
+
+        Args:
+            text: Text of the page
+
+        Returns:
+            Dictionary with 'invoice_number' (or None), 'first_page' and
+            'is_invoice'
+        """
+        match = INVOICE_NUMBER_PATTERN.search(text or '')
+        classification = self.classifier.classify(text)
+        return {
+            'invoice_number': match.group(1).upper() if match else None,
+            'first_page': bool(FIRST_PAGE_PATTERN.search(text or '')),
+            'is_invoice': (classification['category'] == 'invoice' and
+                           classification['confidence'] >= self.min_confidence)
+        }
+
+    def split(self, pages: List[str]) -> List[Tuple[int, int]]:
+        """
+        Split a document into invoices
+
+        Args:
+            pages: Text of each page
+
+        Returns:
+            List of (first page, last page) zero-based inclusive ranges
+            covering all pages; a single range if no boundary was found
+        """
+        if not pages:
+            return []
+        ranges = []
+        start = 0
+        current_number = None
+        for index, text in enumerate(pages):
+            signals = self.page_signals(text)
+            number = signals['invoice_number']
+            starts = index > start and signals['is_invoice'] and (
+                (number is not None and current_number is not None and number != current_number) or
+                (signals['first_page'] and (number is None or number != current_number))
+            )
+            if starts:
+                ranges.append((start, index - 1))
+                start = index
+                current_number = number
+            elif current_number is None:
+                current_number = number
+        ranges.append((start, len(pages) - 1))
+        if len(ranges) > 1:
+            self.logger.info(f"Found {len(ranges)} invoices in {len(pages)} pages")
+        return ranges
+
+
+__all__ = ['FIRST_PAGE_PATTERN', 'INVOICE_NUMBER_PATTERN', 'InvoiceSplitter']
@@ -0,0 +1,299 @@
+import re
+import logging
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import pdfplumber
+
+from .normalization import parse_amount
+
+# Header words naming each line item column, checked in this order so that
+# "Unit Price" is a price and "Line Total" or "Total Price" a total
+HEADER_KEYWORDS = (
+    ('quantity', ('qty', 'quantity', 'units', 'hours', 'pcs')),
+    ('total', ('total', 'amount', 'subtotal', 'sum')),
+    ('unit_price', ('price', 'rate', 'each', 'cost')),
+    ('description', ('description', 'item', 'items', 'product', 'service', 'services', 'article', 'details')),
+)
+
+# Lines ending the table: totals below the last item
+TABLE_END_PATTERN = re.compile(r'(?i)^(?:sub\s*-?\s*total|grand\s+total|total|tax|vat|amount\s+due|balance)\b')
+
+_WORD = re.compile(r'[a-z]+')
+
+
+def _header_field(phrase: str) -> Optional[str]:
+    """Line item field a header phrase names, None for other columns"""
+    tokens = set(_WORD.findall(phrase.lower()))
+    for field, keywords in HEADER_KEYWORDS:
+        if tokens.intersection(keywords):
+            return field
+    return None
+
+
+class ColumnLayout:
+    """
+    Columns of a line item table, told apart by x position
+
+    A word belongs to the column whose range holds the word's horizontal
+    centre. Columns other than the line item fields (SKU, VAT rate) are
+    kept with the name None, so their words do not spill into neighbours.
+    """
+
+    def __init__(self, names: List[Optional[str]], edges: List[float]):
+        """
+        Args:
+            names: Field of each column from left to right, None for others
+            edges: Left edge of every column but the first, ascending
+        """
+        self.names = names
+        self.edges = edges
+
+    @classmethod
+    def from_header(cls, phrases: List[Tuple[str, float, float]],
+                    cells: Optional[List[Tuple[float, float]]] = None) -> Optional['ColumnLayout']:
+        """
+        Build the layout from a table's header row
+
+        Without ruling, column edges lie halfway between neighbouring
+        header phrases, which suits both left-aligned descriptions and
+        right-aligned amounts. Ruled tables give the edges of their cells.
+
+        Args:
+            phrases: Header phrases as (text, x0, x1), left to right
+            cells: Optional (x0, x1) of the header row's ruled cells
+
+        Returns:
+            ColumnLayout, or None unless the header names a description
+            and a total column
+        """
+        if cells:
+            cells = sorted(cells)
+            names = []
+            for x0, x1 in cells:
+                texts = [text for text, left, right in phrases if x0 <= (left + right) / 2 < x1]
+                names.append(_header_field(' '.join(texts)) if texts else None)
+            edges = [x0 for x0, _ in cells[1:]]
+        else:
+            names = [_header_field(text) for text, _, _ in phrases]
+            edges = [(phrases[i - 1][2] + phrases[i][1]) / 2 for i in range(1, len(phrases))]
+        if 'description' not in names or 'total' not in names:
+            return None
+        return cls(names, edges)
+
+    def column(self, x: float) -> Optional[str]:
+        """Field of the column at horizontal position x"""
+        return self.names[bisect_right(self.edges, x)]
+
+
+def _lines(words: List[Dict], tolerance: float) -> List[List[Dict]]:
+    """Group words into lines by their top, each line left to right"""
+    lines: List[List[Dict]] = []
+    top = None
+    for word in sorted(words, key=lambda word: (word['top'], word['x0'])):
+        if top is None or word['top'] - top > tolerance:
+            lines.append([])
+            top = word['top']
+        lines[-1].append(word)
+    for line in lines:
+        line.sort(key=lambda word: word['x0'])
+    return lines
+
+
+def _phrases(line: List[Dict], gap: float) -> List[Tuple[str, float, float]]:
+    """Join the words of a line that are closer than gap into phrases"""
+    phrases: List[List] = []
+    for word in line:
+        if phrases and word['x0'] - phrases[-1][2] < gap:
+            phrases[-1][0] += ' ' + word['text']
+            phrases[-1][2] = word['x1']
+        else:
+            phrases.append([word['text'], word['x0'], word['x1']])
+    return [tuple(phrase) for phrase in phrases]
+
+
+class LineItemExtractor:
+    """
+    Extracts line item tables from the text layer of PDFs
+
+    Each page's words are grouped into lines once. A line naming at least
+    a description and a total column is a table header and fixes the
+    column layout, taken from the ruled cells found by pdfplumber's
+    find_tables where the header sits in a ruled table, or else from the
+    header words' positions. Pages without a header continue the table
+    of the page before with the same layout, as multi-page invoices do.
+    Below the header every line with a total is an item; lines with only
+    description text continue the item above them, and a totals line
+    ends the table. Items are yielded as they are parsed, one page held
+    in memory at a time.
+    """
+
+    def __init__(self, line_tolerance: float = 3.0, phrase_gap: float = 6.0, max_row_gap: float = 8.0,
+                 use_ruling: bool = True):
+        """
+        Args:
+            line_tolerance: Points the tops of words on one line may differ by
+            phrase_gap: Largest gap in points between the words of a header phrase
+            max_row_gap: Largest gap in points between an item and the line
+                continuing its description
+            use_ruling: Take column edges from ruled tables where found
+        """
+        self.logger = logging.getLogger(__name__)
+        self.line_tolerance = line_tolerance
+        self.phrase_gap = phrase_gap
+        self.max_row_gap = max_row_gap
+        self.use_ruling = use_ruling
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['LineItemExtractor']:
+        """
+        Create the extractor configured under 'line_items'
+
+        Returns:
+            LineItemExtractor, or None if line item extraction is disabled
+        """
+        settings = config.get('line_items') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(
+            line_tolerance=settings.get('line_tolerance', 3.0),
+            phrase_gap=settings.get('phrase_gap', 6.0),
+            max_row_gap=settings.get('max_row_gap', 8.0),
+            use_ruling=settings.get('use_ruling', True)
+        )
+
+    def extract(self, file_path: Union[str, Path], first_page: int = 0,
+                max_pages: Optional[int] = None) -> List[Dict]:
+        """
+        Extract all line items of a document
+
+        Args:
+            file_path: Path to PDF file
+            first_page: Zero-based index of the first page to read
+            max_pages: Optional maximum number of pages to read
+
+        Returns:
+            List of items as yielded by iter_items
+        """
+        return list(self.iter_items(file_path, first_page, max_pages))
+
+    def iter_items(self, file_path: Union[str, Path], first_page: int = 0,
+                   max_pages: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Yield the line items of a document as they are parsed
+
+        Args:
+            file_path: Path to PDF file
+            first_page: Zero-based index of the first page to read
+            max_pages: Optional maximum number of pages to read
+
+        Yields:
+            Dictionaries with 'description' and Decimal 'quantity',
+            'unit_price' and 'total', the fields InvoiceValidator checks;
+            a table without a quantity column counts one of each item
+        """
+        layout: Optional[ColumnLayout] = None
+        pending: Optional[Dict] = None
+        with pdfplumber.open(file_path) as pdf:
+            last = len(pdf.pages) if max_pages is None else min(len(pdf.pages), first_page + max_pages)
+            for index in range(first_page, last):
+                page = pdf.pages[index]
+                lines = _lines(page.extract_words(), self.line_tolerance)
+                start = 0
+                for number, line in enumerate(lines):
+                    header = self._header_layout(page, line)
+                    if header is not None:
+                        layout, start = header, number + 1
+                        break
+                bottom = None
+                for line in lines[start:] if layout is not None else ():
+                    cells = self._cells(layout, line)
+                    description = cells.get('description', '')
+                    item = self._item(layout, cells)
+                    # "Tax advice" with a quantity and price is an item, "Tax 19%" ends the table
+                    if TABLE_END_PATTERN.match(description or line[0]['text']) and (
+                            item is None or not self._priced(layout)):
+                        layout = None
+                        break
+                    if item is not None:
+                        if pending is not None:
+                            yield pending
+                        pending = item
+                    elif (pending is not None and bottom is not None and description and
+                          line[0]['top'] - bottom <= self.max_row_gap and set(cells) == {'description'}):
+                        # Description wrapped onto the next line
+                        pending['description'] += ' ' + description
+                    else:
+                        continue
+                    bottom = max(word['bottom'] for word in line)
+                page.flush_cache()
+        if pending is not None:
+            yield pending
+
+    def _header_layout(self, page, line: List[Dict]) -> Optional[ColumnLayout]:
+        """Column layout if a line is a table header, found once per page"""
+        phrases = _phrases(line, self.phrase_gap)
+        fields = {_header_field(text) for text, _, _ in phrases}
+        if 'description' not in fields or 'total' not in fields:
+            return None
+        cells = None
+        if self.use_ruling:
+            top = min(word['top'] for word in line)
+            bottom = max(word['bottom'] for word in line)
+            for table in page.find_tables():
+                x0, table_top, x1, table_bottom = table.bbox
+                if table_top <= top + self.line_tolerance and table_bottom >= bottom:
+                    row = next((row for row in table.rows if row.cells and any(
+                        cell is not None and cell[1] <= top + self.line_tolerance and cell[3] >= bottom
+                        for cell in row.cells)), None)
+                    if row is not None:
+                        cells = [(cell[0], cell[2]) for cell in row.cells if cell is not None]
+                    break
+        return ColumnLayout.from_header(phrases, cells)
+
+    @staticmethod
+    def _cells(layout: ColumnLayout, line: List[Dict]) -> Dict[str, str]:
+        """Text of a line per line item field"""
+        cells: Dict[str, str] = {}
+        for word in line:
+            field = layout.column((word['x0'] + word['x1']) / 2)
+            if field is not None:
+                cells[field] = cells[field] + ' ' + word['text'] if field in cells else word['text']
+        return cells
+
+    @staticmethod
+    def _priced(layout: ColumnLayout) -> bool:
+        """Whether items of a layout show a quantity or unit price besides their total"""
+        return 'quantity' in layout.names or 'unit_price' in layout.names
+
+    @staticmethod
+    def _item(layout: ColumnLayout, cells: Dict[str, str]) -> Optional[Dict]:
+        """Typed line item from a line's cells, None unless the line is an item"""
+        total = parse_amount(cells.get('total'))
+        if total is None or not cells.get('description'):
+            return None
+        quantity = Decimal(1)
+        if 'quantity' in layout.names:
+            quantity = parse_amount(cells.get('quantity'))
+            if quantity is None:
+                return None
+        if 'unit_price' in layout.names:
+            unit_price = parse_amount(cells.get('unit_price'))
+            if unit_price is None:
+                return None
+        else:
+            try:
+                unit_price = total / quantity
+            except (InvalidOperation, ZeroDivisionError):
+                return None
+        return {
+            'description': cells['description'],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total': total
+        }
+
+
+__all__ = ['HEADER_KEYWORDS', 'TABLE_END_PATTERN', 'ColumnLayout', 'LineItemExtractor']
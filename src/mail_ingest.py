@@ -0,0 +1,271 @@
+import os
+import uuid
+import email.policy
+import asyncio
+import logging
+from email.parser import BytesParser
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from .attachment_filter import AttachmentFilter
+from .email_fetcher import DEFAULT_BUFFER_SIZE, EmailFetcher, MessagePart
+from .exceptions import ConfigurationError
+from .task_queue import Broker, enqueue_document, release_spooled
+
+
+class Attachment:
+    """A document attached to an email, staged on disk"""
+
+    def __init__(self, file_name: str, path: Path, metadata: Dict):
+        self.file_name = file_name
+        self.path = path
+        self.metadata = metadata
+
+
+def message_metadata(header: bytes, uid: Optional[bytes] = None) -> Dict:
+    """
+    Metadata passed along with the attachments of a message
+
+    Args:
+        header: Raw message header
+        uid: Optional IMAP UID of the message
+
+    Returns:
+        Dictionary with 'source', 'subject', 'from', 'date', 'message_id'
+        and, if given, 'uid'
+    """
+    message = BytesParser(policy=email.policy.default).parsebytes(header, headersonly=True)
+    metadata = {
+        'source': 'email',
+        'subject': str(message['subject'] or ''),
+        'from': str(message['from'] or ''),
+        'date': str(message['date'] or ''),
+        'message_id': str(message['message-id'] or ''),
+    }
+    if uid is not None:
+        metadata['uid'] = uid.decode() if isinstance(uid, bytes) else str(uid)
+    return metadata
+
+
+def attachment_parts(parts: List[MessagePart], extensions: Optional[Iterable[str]] = None) -> List[MessagePart]:
+    """Parts that are attachments with one of the given suffixes"""
+    suffixes = {suffix.lower() for suffix in extensions} if extensions else None
+    return [
+        part for part in parts
+        if part.is_attachment and (suffixes is None or Path(part.file_name).suffix.lower() in suffixes)
+    ]
+
+
+class _Message:
+    def __init__(self, uid: bytes, remaining: int):
+        self.uid = uid
+        self.remaining = remaining
+        self.failed = False
+
+
+class MailIngestPipeline:
+    """
+    Streams email attachments from IMAP into extraction
+
+    The mailbox is polled for unseen messages every poll_interval seconds.
+    Only the header and MIME structure of a message are fetched whole;
+    each attachment is fetched in pieces of the fetcher's buffer_size and
+    decoded straight into a file in spool_dir, so memory use does not
+    depend on attachment size. Attachments go through a bounded queue to
+    `concurrency` delivery tasks, so fetching stays at most queue_size
+    attachments ahead of extraction. Nothing sets \\Seen until all of a
+    message's attachments were delivered; a message whose delivery failed
+    stays unseen and is fetched again on the next poll.
+    """
+
+    def __init__(self, fetcher: EmailFetcher, deliver: Callable[[Attachment], Awaitable[None]],
+                 spool_dir: Path, folder: str = "INBOX", extensions: Optional[Iterable[str]] = None,
+                 poll_interval: float = 5.0, queue_size: int = 16, concurrency: int = 4,
+                 attachment_filter: Optional[AttachmentFilter] = None):
+        """
+        Args:
+            fetcher: IMAP connection to read from
+            deliver: Coroutine function handing an attachment to extraction; the
+                staged file is removed afterwards unless deliver moved it
+            spool_dir: Directory attachments are staged in
+            folder: Mailbox to poll
+            extensions: Optional suffixes of the attachments to ingest
+            poll_interval: Seconds between polls of the mailbox
+            queue_size: Attachments fetched ahead of delivery
+            concurrency: Attachments delivered at the same time
+            attachment_filter: Optional filter dropping parts before download
+                and staged files before delivery
+        """
+        self.logger = logging.getLogger(__name__)
+        self.fetcher = fetcher
+        self.deliver = deliver
+        self.spool_dir = Path(spool_dir)
+        self.folder = folder
+        self.extensions = list(extensions) if extensions else None
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.attachment_filter = attachment_filter
+        self.delivered = 0
+        # Messages whose attachments are still being delivered
+        self._in_flight: Set[bytes] = set()
+        self._imap_lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_config(cls, config: Dict, deliver: Callable[[Attachment], Awaitable[None]]
+                    ) -> Optional['MailIngestPipeline']:
+        """
+        Create the pipeline configured under 'email_ingest'
+
+        The password is read from the environment variable named by
+        'password_env' (default IMAP_PASSWORD).
+
+        Returns:
+            MailIngestPipeline, or None if email ingestion is disabled
+        """
+        settings = config.get('email_ingest') or {}
+        if not settings.get('enabled', False):
+            return None
+        password_env = settings.get('password_env', 'IMAP_PASSWORD')
+        if not settings.get('host') or not settings.get('username') or password_env not in os.environ:
+            raise ConfigurationError(
+                f"Email ingestion needs 'host', 'username' and the {password_env} environment variable"
+            )
+        return cls(
+            EmailFetcher(settings['host'], settings['username'], os.environ[password_env],
+                         buffer_size=settings.get('buffer_size', DEFAULT_BUFFER_SIZE)),
+            deliver,
+            Path(settings.get('spool_directory', 'data/mail/spool')),
+            folder=settings.get('folder', 'INBOX'),
+            extensions=config.get('supported_extensions'),
+            poll_interval=settings.get('poll_interval', 5.0),
+            queue_size=settings.get('queue_size', 16),
+            concurrency=settings.get('concurrency', 4),
+            attachment_filter=AttachmentFilter.from_config(config)
+        )
+
+    async def _imap(self, method: Callable, *args):
+        # One IMAP connection, used by one command at a time
+        async with self._imap_lock:
+            return await asyncio.to_thread(method, *args)
+
+    async def run(self, once: bool = False) -> None:
+        """
+        Poll the mailbox and deliver attachments until cancelled
+
+        Args:
+            once: Poll a single time and return when its attachments were delivered
+        """
+        self._imap_lock = asyncio.Lock()
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        deliverers = [asyncio.create_task(self._deliver(queue)) for _ in range(self.concurrency)]
+        try:
+            while True:
+                try:
+                    await self._poll(queue)
+                except Exception as e:
+                    self.logger.error(f"Polling {self.folder} failed: {str(e)}")
+                    # Reconnect on the next poll
+                    self.fetcher.mail = None
+                if once:
+                    await queue.join()
+                    return
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            for deliverer in deliverers:
+                deliverer.cancel()
+            await asyncio.gather(*deliverers, return_exceptions=True)
+
+    async def _poll(self, queue: asyncio.Queue) -> None:
+        for uid in await self._imap(self.fetcher.search_unseen, self.folder):
+            if uid in self._in_flight:
+                continue
+            header, parts = await self._imap(self.fetcher.fetch_structure, uid)
+            if self.attachment_filter is not None:
+                parts = [part for part in parts
+                         if part.is_attachment and self.attachment_filter.check_part(part) is None]
+            else:
+                parts = attachment_parts(parts, self.extensions)
+            metadata = message_metadata(header, uid)
+            attachments = []
+            try:
+                for part in parts:
+                    attachment = await self._imap(self._stage, uid, part, metadata)
+                    if attachment is not None:
+                        attachments.append(attachment)
+            except Exception as e:
+                self.logger.error(f"Fetching attachments of message {uid!r} failed: {str(e)}")
+                for attachment in attachments:
+                    release_spooled(attachment.path, self.spool_dir)
+                continue
+            if not attachments:
+                await self._imap(self.fetcher.mark_seen, uid)
+                continue
+            message = _Message(uid, len(attachments))
+            self._in_flight.add(uid)
+            for attachment in attachments:
+                await queue.put((message, attachment))
+
+    def _stage(self, uid: bytes, part: MessagePart, metadata: Dict) -> Optional[Attachment]:
+        file_name = Path(part.file_name).name
+        path = self.spool_dir / uuid.uuid4().hex / file_name
+        path.parent.mkdir(parents=True)
+        try:
+            with open(path, 'wb') as f:
+                digest = self.fetcher.stream_part(uid, part, f)
+        except BaseException:
+            release_spooled(path, self.spool_dir)
+            raise
+        if self.attachment_filter is not None and self.attachment_filter.check_file(path) is not None:
+            release_spooled(path, self.spool_dir)
+            return None
+        return Attachment(file_name, path, {**metadata, 'filename': file_name, 'sha256': digest})
+
+    async def _deliver(self, queue: asyncio.Queue) -> None:
+        while True:
+            message, attachment = await queue.get()
+            try:
+                await self.deliver(attachment)
+                self.delivered += 1
+            except Exception as e:
+                self.logger.error(f"Delivering {attachment.file_name} of message {message.uid!r} failed: {str(e)}")
+                message.failed = True
+            finally:
+                release_spooled(attachment.path, self.spool_dir)
+                message.remaining -= 1
+                if not message.remaining:
+                    await self._finish(message)
+                queue.task_done()
+
+    async def _finish(self, message: _Message) -> None:
+        try:
+            if not message.failed:
+                await self._imap(self.fetcher.mark_seen, message.uid)
+        except Exception as e:
+            self.logger.error(f"Marking message {message.uid!r} as seen failed: {str(e)}")
+        finally:
+            self._in_flight.discard(message.uid)
+
+
+def queue_delivery(broker: Broker, config: Dict, priority: str = 'email') -> Callable[[Attachment], Awaitable[None]]:
+    """Deliver attachments as tasks for the workers"""
+    async def deliver(attachment: Attachment) -> None:
+        await asyncio.to_thread(
+            enqueue_document, broker, config, attachment.path, attachment.metadata, priority=priority
+        )
+    return deliver
+
+
+def processor_delivery(processor) -> Callable[[Attachment], Awaitable[None]]:
+    """Deliver attachments straight to a DocumentProcessor, which files them"""
+    async def deliver(attachment: Attachment) -> None:
+        try:
+            await asyncio.to_thread(processor.process_document, attachment.path, attachment.metadata)
+        except Exception:
+            # Logged and moved to the error directory by the processor
+            pass
+    return deliver
+
+
+__all__ = ['Attachment', 'MailIngestPipeline', 'attachment_parts', 'message_metadata', 'processor_delivery',
+           'queue_delivery']
@@ -0,0 +1,339 @@
+import re
+import json
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .normalization import normalize_amount
+
+# Mersenne prime modulus of the MinHash permutations; keeps a * x + b in uint64
+_PRIME = (1 << 31) - 1
+
+# Shingles permuted at once when computing a signature
+_CHUNK_SIZE = 4096
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# Fields telling apart invoices printed from the same vendor template
+KEY_FIELDS = ('invoice_number', 'total_amount')
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold text and collapse punctuation and whitespace to single spaces"""
+    return _NON_WORD.sub(' ', text.casefold()).strip()
+
+
+def key_fields(data: Optional[Dict]) -> Dict[str, str]:
+    """Normalised invoice number and total of extracted invoice data, where present"""
+    fields = {}
+    if not data:
+        return fields
+    number = str(data.get('invoice_number') or '').strip().upper()
+    if number:
+        fields['invoice_number'] = number
+    total = normalize_amount(str(data['total_amount'])) if data.get('total_amount') not in (None, '') else None
+    if total:
+        fields['total_amount'] = total
+    return fields
+
+
+def same_invoice(first: Optional[Dict], second: Optional[Dict]) -> bool:
+    """
+    Whether two sets of invoice fields confirm a near-duplicate
+
+    Invoices from one vendor template share most of their text, so a
+    similar text alone does not make a copy; the invoice number and total
+    must be known for both and agree.
+    """
+    first, second = key_fields(first), key_fields(second)
+    return all(field in first and first[field] == second.get(field) for field in KEY_FIELDS)
+
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """
+    Hash the character shingles of normalised text
+
+    Character shingles keep most of their overlap when OCR misreads
+    single characters, unlike word shingles.
+
+    Args:
+        text: Document text
+        size: Shingle length in characters
+
+    Returns:
+        Array of distinct 32-bit shingle hashes
+    """
+    normalized = normalize_text(text)
+    if len(normalized) < size:
+        return np.array([zlib.crc32(normalized.encode('utf-8'))] if normalized else [], dtype=np.uint64)
+    encoded = normalized.encode('utf-8')
+    hashes = {zlib.crc32(encoded[i:i + size]) for i in range(len(encoded) - size + 1)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def optimal_bands(threshold: float, num_perm: int, recall: float = 0.99) -> Tuple[int, int]:
+    """
+    Choose the LSH banding for a similarity threshold
+
+    Picks the most rows per band (fewest false candidates) for which a
+    document exactly at the threshold still becomes a candidate with the
+    given probability, 1 - (1 - threshold^rows)^bands.
+
+    Returns:
+        Tuple of (bands, rows per band)
+    """
+    for rows in range(num_perm, 0, -1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class MinHasher:
+    """MinHash signatures from character shingles"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=(num_perm, 1)).astype(np.uint64)
+        self._b = rng.randint(0, _PRIME, size=(num_perm, 1)).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Compute the MinHash signature of a text
+
+        Args:
+            text: Document text
+
+        Returns:
+            Array of num_perm uint32 minimum hash values
+        """
+        hashes = shingles(text, self.shingle_size) % _PRIME
+        signature = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        # Permute in chunks to bound the (num_perm x shingles) working array
+        for start in range(0, len(hashes), _CHUNK_SIZE):
+            chunk = hashes[start:start + _CHUNK_SIZE]
+            np.minimum(signature, ((self._a * chunk + self._b) % _PRIME).min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash LSH index of processed document texts
+
+    Signatures are split into bands; documents sharing any band bucket
+    are candidates, which are then confirmed by their estimated
+    similarity. Bands and signatures are stored in SQLite, so a lookup
+    reads only the candidate rows. Each document may carry its source
+    (e.g. file name) and key fields, used to confirm that a similar text
+    is really the same invoice; see same_invoice().
+    """
+
+    def __init__(self, db_path: Path, threshold: float = 0.85, num_perm: int = 128,
+                 shingle_size: int = 5, seed: int = 1, min_text_length: int = 200):
+        """
+        Open or create a near-duplicate index
+
+        Args:
+            db_path: Path to the SQLite database file
+            threshold: Estimated Jaccard similarity at which texts are near-duplicates
+            num_perm: Number of MinHash permutations
+            shingle_size: Shingle length in characters
+            seed: Seed of the MinHash permutations
+            min_text_length: Texts shorter than this are neither indexed nor looked up
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.min_text_length = min_text_length
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS signatures (
+                document_id TEXT PRIMARY KEY,
+                signature BLOB,
+                added TEXT,
+                source TEXT,
+                fields TEXT
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER,
+                bucket INTEGER,
+                document_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+            CREATE INDEX IF NOT EXISTS buckets_document ON buckets (document_id);
+            """
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(signatures)")}
+        with self._connection:
+            # Indexes created before sources and key fields were stored
+            for column in ('source', 'fields'):
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE signatures ADD COLUMN {column} TEXT")
+        self._check_settings()
+
+    def _check_settings(self) -> None:
+        """Re-band or reset stored signatures if the index parameters changed"""
+        stored = dict(self._connection.execute("SELECT name, value FROM settings"))
+        signature_settings = f"{self.hasher.num_perm}:{self.hasher.shingle_size}:{self.hasher.seed}"
+        band_settings = f"{self.bands}x{self.rows}"
+        with self._connection:
+            if stored.get('signature') not in (None, signature_settings):
+                self.logger.warning("MinHash settings changed, clearing near-duplicate index")
+                self._connection.execute("DELETE FROM signatures")
+                self._connection.execute("DELETE FROM buckets")
+            elif stored.get('bands') not in (None, band_settings):
+                self._connection.execute("DELETE FROM buckets")
+                for document_id, blob in self._connection.execute(
+                        "SELECT document_id, signature FROM signatures").fetchall():
+                    self._insert_buckets(document_id, np.frombuffer(blob, dtype=np.uint32))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                [('signature', signature_settings), ('bands', band_settings)]
+            )
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['NearDuplicateIndex']:
+        """
+        Create the index configured under 'near_duplicate_detection'
+
+        Args:
+            config: Processor configuration
+
+        Returns:
+            NearDuplicateIndex, or None if near-duplicate detection is disabled
+        """
+        settings = config.get('near_duplicate_detection') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(
+            Path(settings.get('index_path', 'data/near_duplicate_index.sqlite3')),
+            threshold=settings.get('similarity_threshold', 0.85),
+            num_perm=settings.get('num_perm', 128),
+            shingle_size=settings.get('shingle_size', 5),
+            min_text_length=settings.get('min_text_length', 200)
+        )
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        """(band, bucket) pairs of a signature"""
+        bands = signature[:self.bands * self.rows].reshape(self.bands, self.rows)
+        return [
+            (band, int.from_bytes(hashlib.blake2b(values.tobytes(), digest_size=8).digest(), 'little', signed=True))
+            for band, values in enumerate(bands)
+        ]
+
+    def _insert_buckets(self, document_id: str, signature: np.ndarray) -> None:
+        self._connection.executemany(
+            "INSERT INTO buckets VALUES (?, ?, ?)",
+            [(band, bucket, document_id) for band, bucket in self._band_keys(signature)]
+        )
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of a text, or None if the text is too short to compare"""
+        if not text or len(text.strip()) < self.min_text_length:
+            return None
+        return self.hasher.signature(text)
+
+    def query(self, text_or_signature: Union[str, np.ndarray]) -> List[Dict]:
+        """
+        Find indexed documents similar to a text
+
+        Args:
+            text_or_signature: Document text or its signature
+
+        Returns:
+            Matches with 'document_id', 'similarity', 'added', 'source' and
+            'fields' (key fields, empty if unknown), most similar first
+        """
+        signature = (self.signature(text_or_signature) if isinstance(text_or_signature, str)
+                     else text_or_signature)
+        if signature is None:
+            return []
+
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            candidates = set()
+            for band, bucket in band_keys:
+                candidates.update(document_id for (document_id,) in self._connection.execute(
+                    "SELECT document_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+                ))
+            rows = [
+                self._connection.execute(
+                    "SELECT document_id, signature, added, source, fields FROM signatures WHERE document_id = ?",
+                    (document_id,)
+                ).fetchone()
+                for document_id in candidates
+            ]
+
+        matches = []
+        for document_id, blob, added, source, fields in filter(None, rows):
+            score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score >= self.threshold:
+                matches.append({
+                    'document_id': document_id,
+                    'similarity': score,
+                    'added': added,
+                    'source': source or document_id,
+                    'fields': json.loads(fields) if fields else {}
+                })
+        return sorted(matches, key=lambda match: match['similarity'], reverse=True)
+
+    def add(self, document_id: str, text_or_signature: Union[str, np.ndarray], source: Optional[str] = None,
+            fields: Optional[Dict] = None) -> bool:
+        """
+        Index a document
+
+        Args:
+            document_id: Stable identifier, e.g. the content hash; a document is
+                never reported as a near-duplicate of itself
+            text_or_signature: Document text or its signature
+            source: Optional name reported in later matches, e.g. the file path
+            fields: Optional extracted fields; their key fields are stored
+
+        Returns:
+            True if the document was indexed, False if its text is too short
+        """
+        signature = (self.signature(text_or_signature) if isinstance(text_or_signature, str)
+                     else text_or_signature)
+        if signature is None:
+            return False
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM buckets WHERE document_id = ?", (document_id,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?)",
+                (document_id, signature.astype(np.uint32).tobytes(), datetime.now().isoformat(), source,
+                 json.dumps(key_fields(fields)))
+            )
+            self._insert_buckets(document_id, signature)
+        return True
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        with self._lock:
+            self._connection.close()
+
+
+__all__ = ['KEY_FIELDS', 'MinHasher', 'NearDuplicateIndex', 'key_fields', 'normalize_text', 'optimal_bands',
+           'same_invoice', 'shingles', 'similarity']
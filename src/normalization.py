@@ -0,0 +1,243 @@
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+# Field components as matched by datetime.strptime for %d, %m and %Y
+_DAY = r'3[01]|[12]\d|0[1-9]|[1-9]| [1-9]'
+_MONTH = r'1[0-2]|0[1-9]|[1-9]'
+_YEAR = r'\d\d\d\d'
+
+# One pattern recognising every supported layout; the matching
+# alternative's named groups identify the format.
+_DATE_PATTERN = re.compile(
+    rf'(?P<iso_y>{_YEAR})-(?P<iso_m>{_MONTH})-(?P<iso_d>{_DAY})'
+    rf'|(?P<slash_a>\d{{1,2}}| [1-9])/(?P<slash_b>\d{{1,2}}| [1-9])/(?P<slash_y>{_YEAR})'
+    rf'|(?P<dash_d>{_DAY})-(?P<dash_m>{_MONTH})-(?P<dash_y>{_YEAR})'
+    rf'|(?P<dot_d>{_DAY})\.(?P<dot_m>{_MONTH})\.(?P<dot_y>{_YEAR})'
+)
+_DAY_PATTERN = re.compile(_DAY)
+_MONTH_PATTERN = re.compile(_MONTH)
+
+# Formats recognised by parse_date, in order of preference
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%d.%m.%Y']
+
+_NON_NUMERIC = re.compile(r'[^\d.,\-]')
+
+# Decimal separator by language, for amounts whose layout is ambiguous
+LOCALE_DECIMAL_SEPARATORS = {
+    'en': '.',
+    'de': ',',
+    'fr': ',',
+    'es': ',',
+    'it': ',',
+    'nl': ',',
+    'pt': ',',
+}
+
+CACHE_SIZE = 8192
+
+
+def _build_date(year: str, month: str, day: str) -> Optional[str]:
+    """Build an ISO date string, or None if the date does not exist"""
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_date(value: str) -> Optional[str]:
+    match = _DATE_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    groups = match.groupdict()
+    if groups['iso_y'] is not None:
+        return _build_date(groups['iso_y'], groups['iso_m'], groups['iso_d'])
+    if groups['dash_y'] is not None:
+        return _build_date(groups['dash_y'], groups['dash_m'], groups['dash_d'])
+    if groups['dot_y'] is not None:
+        return _build_date(groups['dot_y'], groups['dot_m'], groups['dot_d'])
+
+    # Slash dates are day-first, falling back to month-first
+    first, second, year = groups['slash_a'], groups['slash_b'], groups['slash_y']
+    if _DAY_PATTERN.fullmatch(first) and _MONTH_PATTERN.fullmatch(second):
+        parsed = _build_date(year, second, first)
+        if parsed:
+            return parsed
+    if _MONTH_PATTERN.fullmatch(first) and _DAY_PATTERN.fullmatch(second):
+        return _build_date(year, first, second)
+    return None
+
+
+def parse_date(value: Any) -> Optional[str]:
+    """
+    Parse a date in any of DATE_FORMATS into ISO format
+
+    Equivalent to trying ``datetime.strptime`` with each format in turn,
+    but the format is picked by a single precompiled match and results
+    are memoised for repeated strings.
+
+    Args:
+        value: Date string
+
+    Returns:
+        Date as 'YYYY-MM-DD', or None if the value is not a valid date
+    """
+    if not isinstance(value, str):
+        return None
+    return _parse_date(value)
+
+
+def _decimal_separator_for(decimal_separator: Optional[str], locale: Optional[str]) -> Optional[str]:
+    """Resolve the decimal separator requested explicitly or via a locale name"""
+    if decimal_separator or not locale:
+        return decimal_separator
+    language = re.split(r'[_\-.]', locale.lower(), maxsplit=1)[0]
+    return LOCALE_DECIMAL_SEPARATORS.get(language)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_amount(value: str, decimal_separator: Optional[str]) -> Optional[str]:
+    cleaned = _NON_NUMERIC.sub('', value)
+    negative = cleaned.startswith('-') or cleaned.endswith('-')
+    cleaned = cleaned.strip('-')
+    if not cleaned or '-' in cleaned or not any(char.isdigit() for char in cleaned):
+        return None
+
+    if decimal_separator:
+        thousands = '.' if decimal_separator == ',' else ','
+        cleaned = cleaned.replace(thousands, '').replace(decimal_separator, '.')
+    elif ',' in cleaned and '.' in cleaned:
+        # The separator that comes last is the decimal separator
+        if cleaned.rfind(',') > cleaned.rfind('.'):
+            cleaned = cleaned.replace('.', '').replace(',', '.')
+        else:
+            cleaned = cleaned.replace(',', '')
+    elif ',' in cleaned:
+        # A single comma is decimal unless it groups exactly three digits
+        head, _, tail = cleaned.rpartition(',')
+        if cleaned.count(',') > 1 or (len(tail) == 3 and head):
+            cleaned = cleaned.replace(',', '')
+        else:
+            cleaned = f"{head}.{tail}"
+    elif cleaned.count('.') > 1:
+        cleaned = cleaned.replace('.', '')
+
+    if cleaned.count('.') > 1:
+        return None
+    try:
+        amount = Decimal(cleaned)
+    except InvalidOperation:
+        return None
+    return f"-{cleaned}" if negative and amount else cleaned
+
+
+def normalize_amount(value: Any, decimal_separator: Optional[str] = None,
+                     locale: Optional[str] = None) -> Optional[str]:
+    """
+    Normalise an amount string to a plain decimal string
+
+    Currency symbols, whitespace and thousands separators are removed and
+    the decimal separator becomes '.'. Without an explicit separator or
+    locale, the last of mixed separators is the decimal one and a lone
+    comma is decimal unless it groups exactly three digits.
+
+    Args:
+        value: Amount as string or number
+        decimal_separator: Optional decimal separator ('.' or ',')
+        locale: Optional locale name such as 'de_DE', used if no separator is given
+
+    Returns:
+        Normalised amount such as '1234.56', or None if it is not an amount
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        value = str(value)
+    if not isinstance(value, str):
+        return None
+    return _normalize_amount(value, _decimal_separator_for(decimal_separator, locale))
+
+
+def parse_amount(value: Any, decimal_separator: Optional[str] = None,
+                 locale: Optional[str] = None) -> Optional[Decimal]:
+    """
+    Parse an amount into a Decimal
+
+    Args:
+        value: Amount as string or number
+        decimal_separator: Optional decimal separator ('.' or ',')
+        locale: Optional locale name such as 'de_DE', used if no separator is given
+
+    Returns:
+        Decimal amount, or None if the value is not an amount
+    """
+    normalized = normalize_amount(value, decimal_separator, locale)
+    return Decimal(normalized) if normalized is not None else None
+
+
+def map_distinct(values: Iterable, convert: Callable[[Any], Any]) -> Any:
+    """
+    Apply a conversion once per distinct value of a batch
+
+    Values are told apart by type as well as value, so 1, 1.0 and True
+    are converted separately.
+
+    Args:
+        values: Iterable or pandas Series
+        convert: Conversion applied to each value
+
+    Returns:
+        List of converted values, or a Series with the same index for Series input
+    """
+    cache: Dict[Tuple[type, Any], Any] = {}
+
+    def cached(value):
+        key = (type(value), value)
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = convert(value)
+            return result
+        except TypeError:
+            return convert(value)
+
+    if hasattr(values, 'map') and hasattr(values, 'index'):
+        return values.map(cached)
+    return [cached(value) for value in values]
+
+
+def parse_dates(values: Iterable) -> Any:
+    """
+    Parse a batch of dates, parsing each distinct value once
+
+    Args:
+        values: Iterable or pandas Series of date strings
+
+    Returns:
+        List (or Series for Series input) of ISO dates or None
+    """
+    return map_distinct(values, parse_date)
+
+
+def parse_amounts(values: Iterable, decimal_separator: Optional[str] = None,
+                  locale: Optional[str] = None) -> Any:
+    """
+    Parse a batch of amounts, parsing each distinct value once
+
+    Args:
+        values: Iterable or pandas Series of amount strings
+        decimal_separator: Optional decimal separator ('.' or ',')
+        locale: Optional locale name such as 'de_DE'
+
+    Returns:
+        List (or Series for Series input) of Decimals or None
+    """
+    separator = _decimal_separator_for(decimal_separator, locale)
+    return map_distinct(values, lambda value: parse_amount(value, separator))
+
+
+__all__ = ['DATE_FORMATS', 'LOCALE_DECIMAL_SEPARATORS', 'parse_date', 'parse_dates',
+           'normalize_amount', 'parse_amount', 'parse_amounts', 'map_distinct']
@@ -0,0 +1,44 @@
+from .profiles import OCRProfile, OCR_PROFILES, DEFAULT_OCR_PROFILE, get_profile, profile_from_config
+from .preprocessing import preprocess, otsu_threshold
+from .page_cache import PageImageCache, document_hash
+from .raster import render_pages, render_region, page_sizes
+from .images import IMAGE_EXTENSIONS, frame_count, is_image, iter_frames
+from .engines import (
+    OCREngine,
+    OCRWorkerPool,
+    PytesseractEngine,
+    TesserocrEngine,
+    create_engine,
+    engine_from_config,
+    get_default_engine
+)
+from .roi import Region, VendorTemplate, RegionOfInterestOCR
+
+__all__ = [
+    'OCRProfile',
+    'OCR_PROFILES',
+    'DEFAULT_OCR_PROFILE',
+    'get_profile',
+    'profile_from_config',
+    'preprocess',
+    'otsu_threshold',
+    'PageImageCache',
+    'document_hash',
+    'render_pages',
+    'render_region',
+    'page_sizes',
+    'IMAGE_EXTENSIONS',
+    'frame_count',
+    'is_image',
+    'iter_frames',
+    'OCREngine',
+    'OCRWorkerPool',
+    'PytesseractEngine',
+    'TesserocrEngine',
+    'create_engine',
+    'engine_from_config',
+    'get_default_engine',
+    'Region',
+    'VendorTemplate',
+    'RegionOfInterestOCR'
+]
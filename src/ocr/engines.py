@@ -0,0 +1,222 @@
+import os
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pytesseract
+from PIL import Image
+
+from ..exceptions import ConfigurationError
+from .profiles import OCRProfile, get_profile, profile_from_config
+
+try:
+    import tesserocr
+except ImportError:  # optional, pytesseract is used instead
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+ENGINE_KINDS = ('auto', 'tesserocr', 'pytesseract')
+
+
+class OCREngine:
+    """Common interface of OCR engines"""
+
+    def recognize(self, image: Image.Image, profile: OCRProfile) -> str:
+        """
+        Recognise the text of one page image
+
+        Args:
+            image: Preprocessed page image
+            profile: OCR profile with the Tesseract settings
+
+        Returns:
+            Recognised text
+        """
+        raise NotImplementedError
+
+    def recognize_pages(self, images: List[Image.Image], profile: OCRProfile) -> List[str]:
+        """Recognise several page images, returning texts in page order"""
+        return [self.recognize(image, profile) for image in images]
+
+    def recognize_stream(self, images: Iterable[Image.Image], profile: OCRProfile) -> List[str]:
+        """
+        Recognise page images produced lazily, e.g. frames of a TIFF
+
+        Only as many images are taken from the iterable as are being
+        recognised, so they need not all be decoded at once.
+        """
+        return [self.recognize(image, profile) for image in images]
+
+    def close(self) -> None:
+        """Release engine resources"""
+
+
+class PytesseractEngine(OCREngine):
+    """Runs the tesseract command line once per page through pytesseract"""
+
+    def recognize(self, image: Image.Image, profile: OCRProfile) -> str:
+        return pytesseract.image_to_string(image, lang=profile.lang, config=profile.tesseract_config)
+
+
+class TesserocrEngine(OCREngine):
+    """
+    In-process Tesseract through the tesserocr bindings
+
+    One initialised API is kept per (lang, psm, oem), so language data is
+    loaded once and images are passed in memory. Instances are not
+    thread-safe; OCRWorkerPool gives each worker thread its own.
+    """
+
+    def __init__(self, tessdata_path: Optional[str] = None):
+        if tesserocr is None:
+            raise ConfigurationError("tesserocr is not installed")
+        self.tessdata_path = tessdata_path or os.environ.get('TESSDATA_PREFIX')
+        self._apis: Dict[Tuple[str, int, int], 'tesserocr.PyTessBaseAPI'] = {}
+
+    def _api(self, profile: OCRProfile):
+        key = (profile.lang, profile.psm, profile.oem)
+        api = self._apis.get(key)
+        if api is None:
+            options = {'lang': profile.lang, 'psm': profile.psm, 'oem': profile.oem}
+            if self.tessdata_path:
+                options['path'] = self.tessdata_path
+            api = tesserocr.PyTessBaseAPI(**options)
+            self._apis[key] = api
+        return api
+
+    def recognize(self, image: Image.Image, profile: OCRProfile) -> str:
+        api = self._api(profile)
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def close(self) -> None:
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+class OCRWorkerPool(OCREngine):
+    """
+    Pool of worker threads, each with its own long-lived engine
+
+    Tesseract releases the GIL while recognising, so threads run pages in
+    parallel without copying images between processes.
+    """
+
+    def __init__(self, engine_factory: Callable[[], OCREngine], workers: Optional[int] = None):
+        """
+        Args:
+            engine_factory: Creates the engine of a worker on its first page
+            workers: Number of worker threads (default: CPU count)
+        """
+        self.engine_factory = engine_factory
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+        self._local = threading.local()
+        self._engines: List[OCREngine] = []
+        self._lock = threading.Lock()
+
+    def _engine(self) -> OCREngine:
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            engine = self.engine_factory()
+            self._local.engine = engine
+            with self._lock:
+                self._engines.append(engine)
+        return engine
+
+    def recognize(self, image: Image.Image, profile: OCRProfile) -> str:
+        return self._executor.submit(lambda: self._engine().recognize(image, profile)).result()
+
+    def recognize_pages(self, images: List[Image.Image], profile: OCRProfile) -> List[str]:
+        return list(self._executor.map(lambda image: self._engine().recognize(image, profile), images))
+
+    def recognize_stream(self, images: Iterable[Image.Image], profile: OCRProfile) -> List[str]:
+        texts = []
+        running = deque()
+        for image in images:
+            if len(running) >= self.workers:
+                texts.append(running.popleft().result())
+            running.append(self._executor.submit(lambda image=image: self._engine().recognize(image, profile)))
+        texts.extend(future.result() for future in running)
+        return texts
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for engine in self._engines:
+                engine.close()
+            self._engines.clear()
+
+
+def _probe_tesserocr(tessdata_path: Optional[str], profile: OCRProfile) -> None:
+    """Recognise a blank image, raising if tesserocr or its language data is unusable"""
+    engine = TesserocrEngine(tessdata_path)
+    try:
+        engine.recognize(Image.new('L', (32, 32), 255), profile)
+    finally:
+        engine.close()
+
+
+def create_engine(kind: str = 'auto', workers: Optional[int] = None,
+                  tessdata_path: Optional[str] = None, profile: Optional[OCRProfile] = None) -> OCREngine:
+    """
+    Create an OCR engine pool
+
+    Args:
+        kind: 'tesserocr', 'pytesseract', or 'auto' for tesserocr when it
+            is installed and working, pytesseract otherwise
+        workers: Number of worker threads (default: CPU count)
+        tessdata_path: Optional Tesseract language data directory
+        profile: Profile whose languages tesserocr must load (default: built-in default)
+
+    Returns:
+        OCRWorkerPool of the selected engine
+    """
+    if kind not in ENGINE_KINDS:
+        raise ConfigurationError(f"Unknown OCR engine '{kind}', expected one of {', '.join(ENGINE_KINDS)}")
+
+    if kind in ('auto', 'tesserocr'):
+        try:
+            # A missing tessdata directory only shows once a page is recognised
+            _probe_tesserocr(tessdata_path, profile or get_profile())
+            return OCRWorkerPool(lambda: TesserocrEngine(tessdata_path), workers)
+        except Exception as e:
+            if kind == 'tesserocr':
+                raise
+            logger.info(f"tesserocr unavailable ({str(e)}), using pytesseract")
+    return OCRWorkerPool(PytesseractEngine, workers)
+
+
+def engine_from_config(config: Dict) -> OCREngine:
+    """
+    Create the OCR engine configured under 'ocr' in the processor configuration
+
+    Args:
+        config: Processor configuration
+
+    Returns:
+        OCR engine
+    """
+    settings = config.get('ocr') or {}
+    return create_engine(settings.get('engine', 'auto'), settings.get('workers'),
+                         settings.get('tessdata_path'), profile_from_config(config))
+
+
+_default_engine: Optional[OCREngine] = None
+_default_engine_lock = threading.Lock()
+
+
+def get_default_engine() -> OCREngine:
+    """Process-wide engine pool used when no engine is configured explicitly"""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = create_engine()
+        return _default_engine
@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from PIL import Image, ImageOps
+
+from .preprocessing import preprocess
+from .profiles import OCRProfile
+
+# Suffixes of image documents, OCR'd without going through PDF
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.jpg', '.jpeg', '.png')
+
+
+def is_image(file_path: Union[str, Path]) -> bool:
+    """Whether a document is an image rather than a PDF"""
+    return Path(file_path).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def frame_count(file_path: Union[str, Path]) -> int:
+    """Number of pages (frames) of an image, read from its headers only"""
+    with Image.open(file_path) as image:
+        return getattr(image, 'n_frames', 1)
+
+
+def iter_frames(file_path: Union[str, Path], profile: OCRProfile, first_page: int = 0,
+                max_pages: Optional[int] = None) -> Iterator[Image.Image]:
+    """
+    Decode and preprocess the pages of an image one at a time
+
+    Multi-page TIFFs are read frame by frame, so only the current frame is
+    held decoded. Each frame is turned upright as its EXIF orientation
+    says (phone photos) and preprocessed as the profile says.
+
+    Args:
+        file_path: Path to image file
+        profile: OCR profile with the preprocessing settings
+        first_page: Zero-based index of the first frame
+        max_pages: Optional maximum number of frames
+
+    Yields:
+        Preprocessed page images in page order
+    """
+    with Image.open(file_path) as image:
+        frames = getattr(image, 'n_frames', 1)
+        last = frames if max_pages is None else min(frames, first_page + max_pages)
+        for index in range(first_page, last):
+            image.seek(index)
+            frame = ImageOps.exif_transpose(image)
+            if frame.mode not in ('1', 'L', 'RGB'):
+                frame = frame.convert('RGB')
+            yield preprocess(frame, profile)
@@ -0,0 +1,167 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+
+def document_hash(file_path: str) -> str:
+    """SHA-256 of a document's content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageImageCache:
+    """
+    Disk cache of preprocessed page images
+
+    Images are keyed by document content hash, raster settings and page
+    number, so a retried or re-extracted document skips rendering and
+    preprocessing of pages seen before, whatever its file name.
+
+    The cache is bounded: pages not read for max_age seconds are dropped,
+    and once the cache outgrows max_bytes the least recently read pages
+    are evicted until it is back under nine tenths of the limit.
+    """
+
+    def __init__(self, directory: Path, max_bytes: Optional[int] = 1 << 30,
+                 max_age: Optional[float] = 7 * 24 * 3600.0):
+        """
+        Args:
+            directory: Cache directory
+            max_bytes: Largest total size of the cached images, None for no limit
+            max_age: Seconds a page stays cached after it was last read, None for no limit
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._size = 0
+        self._last_eviction = 0.0
+        self.evict()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['PageImageCache']:
+        """
+        Create the cache configured as 'ocr.page_cache_directory'
+
+        Args:
+            config: Processor configuration
+
+        Returns:
+            PageImageCache, or None if no cache directory is configured
+        """
+        settings = config.get('ocr') or {}
+        directory = settings.get('page_cache_directory')
+        if not directory:
+            return None
+        max_mb = settings.get('page_cache_max_mb', 1024)
+        max_age_hours = settings.get('page_cache_max_age_hours', 168)
+        return cls(
+            Path(directory),
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb is not None else None,
+            max_age=max_age_hours * 3600.0 if max_age_hours is not None else None
+        )
+
+    def _path(self, doc_hash: str, raster_key: str, page: int) -> Path:
+        return self.directory / doc_hash[:2] / doc_hash / f"{raster_key}-p{page:04d}.png"
+
+    def get(self, doc_hash: str, raster_key: str, page: int) -> Optional[Image.Image]:
+        """
+        Load a cached page image
+
+        Args:
+            doc_hash: Document hash as returned by document_hash()
+            raster_key: OCRProfile.raster_key of the settings used
+            page: Zero-based page number
+
+        Returns:
+            Page image, or None if not cached
+        """
+        path = self._path(doc_hash, raster_key, page)
+        try:
+            with Image.open(path) as image:
+                image.load()
+            try:
+                # The modification time doubles as last access for eviction
+                os.utime(path)
+            except OSError:
+                pass
+            return image
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self.logger.warning(f"Discarding unreadable cached page {path}: {str(e)}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, doc_hash: str, raster_key: str, page: int, image: Image.Image) -> None:
+        """Store a page image; written atomically so readers never see partial files"""
+        path = self._path(doc_hash, raster_key, page)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, format='PNG')
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self._size += size
+            due = ((self.max_bytes is not None and self._size > self.max_bytes) or
+                   (self.max_age is not None and time.time() - self._last_eviction > self.max_age / 24))
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop expired pages, then the least recently read ones while over max_bytes
+
+        Other processes may share the directory, so the size is re-counted
+        from disk on every pass.
+
+        Returns:
+            Number of pages removed
+        """
+        now = time.time()
+        pages = []
+        for path in self.directory.glob('*/*/*.png'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            pages.append((stat.st_mtime, stat.st_size, path))
+        pages.sort()
+        total = sum(size for _, size, _ in pages)
+        target = self.max_bytes * 9 // 10 if self.max_bytes is not None and total > self.max_bytes else None
+        removed = 0
+        for mtime, size, path in pages:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and (target is None or total <= target):
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+            try:
+                path.parent.rmdir()
+                path.parent.parent.rmdir()
+            except OSError:  # still holds other pages
+                pass
+        with self._lock:
+            self._size = total
+            self._last_eviction = now
+        if removed:
+            self.logger.info(f"Evicted {removed} cached page images, {total} bytes remain")
+        return removed
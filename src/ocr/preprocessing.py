@@ -0,0 +1,47 @@
+import numpy as np
+from PIL import Image
+
+from .profiles import OCRProfile
+
+
+def otsu_threshold(image: Image.Image) -> int:
+    """
+    Compute Otsu's binarisation threshold of a grayscale image
+
+    Args:
+        image: Image in mode 'L'
+
+    Returns:
+        Threshold maximising the between-class variance
+    """
+    histogram = np.asarray(image.histogram()[:256], dtype=np.float64)
+    total = histogram.sum()
+    if not total:
+        return 127
+    levels = np.arange(256)
+    weight_background = np.cumsum(histogram)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(histogram * levels)
+    mean_background = cumulative_mean / np.maximum(weight_background, 1)
+    mean_foreground = (cumulative_mean[-1] - cumulative_mean) / np.maximum(weight_foreground, 1)
+    variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(variance))
+
+
+def preprocess(image: Image.Image, profile: OCRProfile) -> Image.Image:
+    """
+    Prepare a rendered page for OCR as configured by a profile
+
+    Args:
+        image: Rendered page
+        profile: OCR profile
+
+    Returns:
+        Grayscale and/or binarised page image
+    """
+    if profile.grayscale or profile.threshold is not None:
+        image = image.convert('L')
+    if profile.threshold is not None:
+        level = otsu_threshold(image) if profile.threshold == 'otsu' else profile.threshold
+        image = image.point(lambda value: 255 if value > level else 0, mode='1')
+    return image
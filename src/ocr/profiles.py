@@ -0,0 +1,106 @@
+from typing import Dict, Optional, Union
+
+from ..exceptions import ConfigurationError
+
+
+class OCRProfile:
+    """Rasterisation, preprocessing and Tesseract settings used for OCR"""
+
+    def __init__(self, name: str, dpi: int = 300, grayscale: bool = True,
+                 threshold: Optional[Union[str, int]] = 'otsu', psm: int = 3, oem: int = 1,
+                 lang: str = 'eng'):
+        """
+        Args:
+            name: Profile name
+            dpi: Resolution pages are rendered at
+            grayscale: Render pages in grayscale
+            threshold: Binarisation: None, 'otsu' or a fixed 0-255 level
+            psm: Tesseract page segmentation mode
+            oem: Tesseract OCR engine mode
+            lang: Tesseract language(s), e.g. 'eng+deu'
+        """
+        if threshold not in (None, 'otsu') and not (isinstance(threshold, int) and 0 <= threshold <= 255):
+            raise ConfigurationError(f"Invalid threshold for OCR profile '{name}': {threshold!r}")
+        self.name = name
+        self.dpi = dpi
+        self.grayscale = grayscale
+        self.threshold = threshold
+        self.psm = psm
+        self.oem = oem
+        self.lang = lang
+
+    @property
+    def tesseract_config(self) -> str:
+        """Command line options passed to Tesseract"""
+        return f"--psm {self.psm} --oem {self.oem}"
+
+    @property
+    def raster_key(self) -> str:
+        """Identifies the preprocessed page images this profile produces"""
+        mode = 'gray' if self.grayscale else 'rgb'
+        return f"{self.dpi}dpi-{mode}-{self.threshold if self.threshold is not None else 'none'}"
+
+    @classmethod
+    def from_dict(cls, name: str, settings: Dict) -> 'OCRProfile':
+        """Create a profile from configuration, based on the built-in profile of the same name"""
+        base = OCR_PROFILES.get(name)
+        values = dict(vars(base)) if base else {}
+        values.update(settings)
+        values['name'] = name
+        return cls(**values)
+
+    def __repr__(self) -> str:
+        return (f"OCRProfile({self.name!r}, dpi={self.dpi}, grayscale={self.grayscale}, "
+                f"threshold={self.threshold!r}, psm={self.psm}, oem={self.oem}, lang={self.lang!r})")
+
+
+OCR_PROFILES: Dict[str, OCRProfile] = {
+    # Low resolution, no binarisation: clean digital scans
+    'fast': OCRProfile('fast', dpi=150, grayscale=True, threshold=None, psm=6),
+    # Default for office scans and faxes
+    'balanced': OCRProfile('balanced', dpi=300, grayscale=True, threshold='otsu', psm=3),
+    # Small print and poor copies
+    'accurate': OCRProfile('accurate', dpi=400, grayscale=True, threshold='otsu', psm=3),
+}
+
+DEFAULT_OCR_PROFILE = 'balanced'
+
+
+def get_profile(profile: Union[str, OCRProfile, None] = None) -> OCRProfile:
+    """
+    Resolve a profile name or instance
+
+    Args:
+        profile: Profile, name of a built-in profile, or None for the default
+
+    Returns:
+        OCRProfile
+    """
+    if isinstance(profile, OCRProfile):
+        return profile
+    name = profile or DEFAULT_OCR_PROFILE
+    if name not in OCR_PROFILES:
+        raise ConfigurationError(
+            f"Unknown OCR profile '{name}', expected one of {', '.join(OCR_PROFILES)}"
+        )
+    return OCR_PROFILES[name]
+
+
+def profile_from_config(config: Dict) -> OCRProfile:
+    """
+    Resolve the OCR profile selected under 'ocr' in the processor configuration
+
+    Profiles under 'ocr.profiles' override or extend the built-in ones.
+
+    Args:
+        config: Processor configuration
+
+    Returns:
+        OCRProfile
+    """
+    settings = config.get('ocr') or {}
+    name = settings.get('profile', DEFAULT_OCR_PROFILE)
+    custom = (settings.get('profiles') or {}).get(name)
+    if custom is not None:
+        return OCRProfile.from_dict(name, custom)
+    return get_profile(name)
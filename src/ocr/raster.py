@@ -0,0 +1,108 @@
+import io
+import subprocess
+from typing import List, Optional, Sequence, Tuple
+
+import pdfplumber
+from PIL import Image
+from pdf2image import convert_from_path
+
+from .page_cache import PageImageCache, document_hash
+from .preprocessing import preprocess
+from .profiles import OCRProfile
+
+
+def render_pages(file_path: str, first_page: int, page_count: int, profile: OCRProfile,
+                 cache: Optional[PageImageCache] = None) -> List[Image.Image]:
+    """
+    Render and preprocess a contiguous range of PDF pages for OCR
+
+    Pages found in the cache are loaded from it; the remaining pages are
+    rendered in contiguous runs and stored.
+
+    Args:
+        file_path: Path to PDF file
+        first_page: Zero-based index of the first page
+        page_count: Number of pages
+        profile: OCR profile with raster and preprocessing settings
+        cache: Optional page image cache
+
+    Returns:
+        Preprocessed page images in page order
+    """
+    pages = list(range(first_page, first_page + page_count))
+    doc_hash = document_hash(file_path) if cache else None
+    images = {}
+    if cache:
+        for page in pages:
+            image = cache.get(doc_hash, profile.raster_key, page)
+            if image is not None:
+                images[page] = image
+
+    missing = [page for page in pages if page not in images]
+    while missing:
+        # Render the next contiguous run of uncached pages in one call
+        run_end = 0
+        while run_end + 1 < len(missing) and missing[run_end + 1] == missing[run_end] + 1:
+            run_end += 1
+        run = missing[:run_end + 1]
+        missing = missing[run_end + 1:]
+
+        rendered = convert_from_path(
+            file_path,
+            dpi=profile.dpi,
+            first_page=run[0] + 1,
+            last_page=run[-1] + 1,
+            grayscale=profile.grayscale
+        )
+        for page, image in zip(run, rendered):
+            image = preprocess(image, profile)
+            images[page] = image
+            if cache:
+                cache.put(doc_hash, profile.raster_key, page, image)
+
+    return [images[page] for page in pages if page in images]
+
+
+def page_sizes(file_path: str) -> List[Tuple[float, float]]:
+    """Width and height in points of every page of a PDF"""
+    with pdfplumber.open(file_path) as pdf:
+        return [(float(page.width), float(page.height)) for page in pdf.pages]
+
+
+def render_region(file_path: str, page: int, box: Sequence[float], dpi: int,
+                  page_size: Tuple[float, float], grayscale: bool = True,
+                  timeout: Optional[int] = 60) -> Image.Image:
+    """
+    Render only a region of a PDF page
+
+    pdftoppm crops while rendering, so the cost grows with the region's
+    area rather than the page's.
+
+    Args:
+        file_path: Path to PDF file
+        page: Zero-based page number
+        box: Page-relative (left, top, right, bottom), each between 0 and 1
+        dpi: Render resolution
+        page_size: Page (width, height) in points
+        grayscale: Render in grayscale
+        timeout: Optional timeout in seconds
+
+    Returns:
+        Rendered region
+    """
+    left, top, right, bottom = box
+    scale = dpi / 72.0
+    width, height = page_size[0] * scale, page_size[1] * scale
+    command = [
+        'pdftoppm', '-f', str(page + 1), '-l', str(page + 1), '-r', str(dpi),
+        '-x', str(int(left * width)), '-y', str(int(top * height)),
+        '-W', str(max(1, int((right - left) * width))), '-H', str(max(1, int((bottom - top) * height))),
+        '-png'
+    ]
+    if grayscale:
+        command.append('-gray')
+    command.append(str(file_path))
+    completed = subprocess.run(command, capture_output=True, check=True, timeout=timeout)
+    image = Image.open(io.BytesIO(completed.stdout))
+    image.load()
+    return image
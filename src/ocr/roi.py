@@ -0,0 +1,218 @@
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..exceptions import ConfigurationError
+from ..validators.invoice_validator import InvoiceValidator
+from .engines import OCREngine
+from .preprocessing import preprocess
+from .profiles import OCRProfile
+from .raster import page_sizes, render_region
+
+# Top strip of the first page read at low resolution to identify the vendor
+DEFAULT_HEADER_BOX = (0.0, 0.0, 1.0, 0.2)
+DEFAULT_HEADER_DPI = 150
+DEFAULT_ROI_DPI = 400
+
+
+class Region:
+    """A field's page-relative bounding box and the pattern reading its value"""
+
+    def __init__(self, field: str, box: Sequence[float], page: int = 0, pattern: Optional[str] = None):
+        """
+        Args:
+            field: Invoice field, e.g. 'invoice_number'
+            box: (left, top, right, bottom) as fractions of page width/height
+            page: Zero-based page, negative to count from the last page
+            pattern: Optional regex; group 1 (or the match) is the value,
+                otherwise the stripped region text is used
+        """
+        left, top, right, bottom = box
+        if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise ConfigurationError(f"Invalid region for {field}: {box}")
+        self.field = field
+        self.box = (left, top, right, bottom)
+        self.page = page
+        self.pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    def read(self, text: str) -> Optional[str]:
+        """Value of the field in the region's OCR text"""
+        text = ' '.join(text.split())
+        if self.pattern is None:
+            return text or None
+        match = self.pattern.search(text)
+        if not match:
+            return None
+        return (match.group(1) if match.re.groups else match.group(0)).strip() or None
+
+
+class VendorTemplate:
+    """Where a recurring vendor prints the invoice fields"""
+
+    def __init__(self, name: str, regions: List[Region], vendor: Optional[str] = None,
+                 keywords: Sequence[str] = (), sender_domains: Sequence[str] = (),
+                 dpi: int = DEFAULT_ROI_DPI):
+        """
+        Args:
+            name: Template name
+            regions: Field regions
+            vendor: Vendor name reported in the extracted data (default: name)
+            keywords: Header text identifying the vendor
+            sender_domains: Sender e-mail domains identifying the vendor
+            dpi: Resolution the regions are rendered at
+        """
+        self.name = name
+        self.regions = regions
+        self.vendor = vendor or name
+        self.keywords = [keyword.casefold() for keyword in keywords]
+        self.sender_domains = [domain.lower() for domain in sender_domains]
+        self.dpi = dpi
+
+    @classmethod
+    def from_dict(cls, settings: Dict) -> 'VendorTemplate':
+        """Create a template from its JSON representation"""
+        regions = [
+            Region(field, region['box'], region.get('page', 0), region.get('pattern'))
+            for field, region in settings.get('regions', {}).items()
+        ]
+        match = settings.get('match', {})
+        return cls(
+            settings['name'],
+            regions,
+            vendor=settings.get('vendor'),
+            keywords=match.get('keywords', ()),
+            sender_domains=match.get('sender_domains', ()),
+            dpi=settings.get('dpi', DEFAULT_ROI_DPI)
+        )
+
+    def matches_sender(self, sender: str) -> bool:
+        domain = sender.rsplit('@', 1)[-1].strip(' >').lower()
+        return any(domain == d or domain.endswith('.' + d) for d in self.sender_domains)
+
+    def matches_text(self, text: str) -> bool:
+        text = ' '.join(text.casefold().split())
+        return any(keyword in text for keyword in self.keywords)
+
+
+class RegionOfInterestOCR:
+    """
+    OCR of known invoice zones instead of whole pages
+
+    A vendor template is chosen from the sender address or a low-resolution
+    OCR of the header strip. Only the template's regions are then rendered
+    at high resolution and recognised. The result is used only if every
+    region yields a value that passes InvoiceValidator; otherwise the
+    caller falls back to full-page OCR.
+    """
+
+    def __init__(self, templates: List[VendorTemplate], engine: OCREngine, profile: OCRProfile,
+                 header_box: Sequence[float] = DEFAULT_HEADER_BOX, header_dpi: int = DEFAULT_HEADER_DPI):
+        self.logger = logging.getLogger(__name__)
+        self.templates = templates
+        self.engine = engine
+        self.profile = profile
+        self.header_box = tuple(header_box)
+        self.header_dpi = header_dpi
+        self.validator = InvoiceValidator()
+
+    @classmethod
+    def from_config(cls, config: Dict, engine: OCREngine, profile: OCRProfile) -> Optional['RegionOfInterestOCR']:
+        """
+        Create ROI OCR as configured under 'ocr.roi'
+
+        Args:
+            config: Processor configuration
+            engine: OCR engine
+            profile: OCR profile used for preprocessing and Tesseract options
+
+        Returns:
+            RegionOfInterestOCR, or None if ROI OCR is disabled
+        """
+        settings = (config.get('ocr') or {}).get('roi') or {}
+        if not settings.get('enabled', False):
+            return None
+        templates_path = Path(settings.get('templates_path', 'config/vendor_templates.json'))
+        try:
+            with open(templates_path) as f:
+                templates = [VendorTemplate.from_dict(t) for t in json.load(f).get('templates', [])]
+        except (OSError, ValueError, KeyError) as e:
+            raise ConfigurationError(f"Failed to load vendor templates from {templates_path}: {str(e)}")
+        return cls(
+            templates, engine, profile,
+            header_box=settings.get('header_box', DEFAULT_HEADER_BOX),
+            header_dpi=settings.get('header_dpi', DEFAULT_HEADER_DPI)
+        )
+
+    def _ocr_region(self, file_path: str, page: int, box: Sequence[float], dpi: int,
+                    sizes: List[Tuple[float, float]]) -> str:
+        image = render_region(file_path, page, box, dpi, sizes[page], grayscale=self.profile.grayscale)
+        return self.engine.recognize(preprocess(image, self.profile), self.profile)
+
+    def identify(self, file_path: str, metadata: Optional[Dict] = None,
+                 sizes: Optional[List[Tuple[float, float]]] = None) -> Optional[VendorTemplate]:
+        """
+        Find the template of a document's vendor
+
+        Args:
+            file_path: Path to PDF file
+            metadata: Optional metadata; its 'from' or 'sender' address is checked first
+            sizes: Optional page sizes as returned by page_sizes()
+
+        Returns:
+            Matching template, or None
+        """
+        if not self.templates:
+            return None
+        sender = (metadata or {}).get('from') or (metadata or {}).get('sender')
+        if sender:
+            for template in self.templates:
+                if template.matches_sender(sender):
+                    return template
+
+        sizes = sizes or page_sizes(file_path)
+        header = self._ocr_region(file_path, 0, self.header_box, self.header_dpi, sizes)
+        for template in self.templates:
+            if template.matches_text(header):
+                return template
+        return None
+
+    def extract(self, file_path: str, metadata: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Extract invoice fields from the template regions of a scanned PDF
+
+        Args:
+            file_path: Path to PDF file
+            metadata: Optional metadata used to identify the vendor
+
+        Returns:
+            Cleaned invoice data, or None if no template matches or a region
+            fails validation and full-page OCR is needed
+        """
+        sizes = page_sizes(file_path)
+        if not sizes:
+            return None
+        template = self.identify(file_path, metadata, sizes)
+        if template is None:
+            return None
+
+        extracted = {'vendor': template.vendor}
+        for region in template.regions:
+            page = region.page if region.page >= 0 else len(sizes) + region.page
+            if not 0 <= page < len(sizes):
+                self.logger.info(f"Template {template.name}: page {region.page} missing in {file_path}")
+                return None
+            value = region.read(self._ocr_region(file_path, page, region.box, template.dpi, sizes))
+            if value is None:
+                self.logger.info(f"Template {template.name}: no {region.field} found in {file_path}")
+                return None
+            extracted[region.field] = value
+
+        validation = self.validator.validate(extracted)
+        if validation['warnings'] or not validation['is_valid']:
+            self.logger.info(
+                f"Template {template.name} fields failed validation for {file_path}: {validation['warnings']}"
+            )
+            return None
+        return validation['cleaned_data']
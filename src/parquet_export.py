@@ -0,0 +1,377 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from pathlib import Path
+from decimal import Decimal, InvalidOperation
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .exceptions import ConfigurationError
+from .intent_log import lock_file
+from .normalization import parse_amount, parse_date
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed when the export is enabled
+    pa = ds = pq = None
+
+# Amounts keep up to four decimals (unit prices), totals up to 10^16
+AMOUNT_PRECISION, AMOUNT_SCALE = 20, 4
+_AMOUNT_QUANTUM = Decimal(1).scaleb(-AMOUNT_SCALE)
+_AMOUNT_LIMIT = Decimal(10) ** (AMOUNT_PRECISION - AMOUNT_SCALE)
+
+# Partition columns, in directory order: <root>/date=.../category=.../
+PARTITION_COLUMNS = ('date', 'category')
+
+# Marker of a compaction in progress, listing the files it replaces
+_COMPACTION_MARKER = '_compacting.json'
+
+# Held by the process compacting a partition; readers skip '_' names
+_COMPACTION_LOCK = '_compaction.lock'
+
+
+def export_schema() -> 'pa.Schema':
+    """Schema of the exported rows, partition columns excluded"""
+    return pa.schema([
+        ('document_id', pa.string()),
+        ('source', pa.string()),
+        ('file_name', pa.string()),
+        ('document_path', pa.string()),
+        ('status', pa.string()),
+        ('confidence', pa.float64()),
+        ('processed_at', pa.timestamp('us')),
+        ('vendor', pa.string()),
+        ('invoice_number', pa.string()),
+        ('invoice_date', pa.date32()),
+        ('total_amount', pa.decimal128(AMOUNT_PRECISION, AMOUNT_SCALE)),
+        ('line_item_count', pa.int32()),
+        ('sha256', pa.string()),
+    ])
+
+
+def _amount(value) -> Optional[Decimal]:
+    try:
+        amount = parse_amount(value)
+        if amount is None or abs(amount) >= _AMOUNT_LIMIT:
+            return None
+        return amount.quantize(_AMOUNT_QUANTUM)
+    except InvalidOperation:
+        return None
+
+
+def _date(value) -> Optional[date]:
+    parsed = parse_date(value)
+    return date.fromisoformat(parsed) if parsed else None
+
+
+def _timestamp(value) -> datetime:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.now()
+
+
+def record_row(record: Dict) -> Tuple[Tuple[str, str], Dict]:
+    """
+    Convert a processing record into an export row
+
+    Args:
+        record: Record as saved by DocumentProcessor._save_processing_record
+
+    Returns:
+        Tuple of ((date, category) partition, row)
+    """
+    data = record.get('extracted_data') or {}
+    processed_at = _timestamp(record.get('timestamp'))
+    document_path = record.get('final_path') or record.get('file_path')
+    line_items = data.get('line_items')
+    row = {
+        'document_id': Path(document_path).name if document_path else None,
+        'source': 'processing',
+        'file_name': Path(record['file_path']).name if record.get('file_path') else None,
+        'document_path': document_path,
+        'status': record.get('status'),
+        'confidence': record.get('confidence'),
+        'processed_at': processed_at,
+        'vendor': data.get('vendor') if isinstance(data.get('vendor'), str) else None,
+        'invoice_number': None if data.get('invoice_number') is None else str(data.get('invoice_number')),
+        'invoice_date': _date(data.get('date')),
+        'total_amount': _amount(data.get('total_amount')),
+        'line_item_count': len(line_items) if isinstance(line_items, list) else None,
+        'sha256': record.get('sha256'),
+    }
+    category = (record.get('categories') or ['unknown'])[0]
+    return (processed_at.date().isoformat(), category), row
+
+
+def batch_rows(job_id: str, job: Dict, processed_at: Optional[str] = None) -> List[Tuple[Tuple[str, str], Dict]]:
+    """
+    Convert the results of an API batch job into export rows
+
+    Args:
+        job_id: Batch job id
+        job: Job with 'results' and 'errors' lists
+        processed_at: Optional completion time (default: now)
+
+    Returns:
+        List of ((date, category) partition, row)
+    """
+    completed = _timestamp(processed_at)
+    rows = []
+    for index, result in enumerate(job.get('results', [])):
+        data = result.get('data') if isinstance(result.get('data'), dict) else {}
+        fields = data.get('cleaned_data', data)
+        line_items = fields.get('line_items')
+        rows.append(((completed.date().isoformat(), 'invoice'), {
+            'document_id': f"{job_id}:{index}",
+            'source': 'batch',
+            'file_name': result.get('file_name'),
+            'document_path': None,
+            'status': result.get('status'),
+            'confidence': None,
+            'processed_at': completed,
+            'vendor': fields.get('vendor') if isinstance(fields.get('vendor'), str) else None,
+            'invoice_number': None if fields.get('invoice_number') is None else str(fields.get('invoice_number')),
+            'invoice_date': _date(fields.get('date')),
+            'total_amount': _amount(fields.get('total_amount')),
+            'line_item_count': len(line_items) if isinstance(line_items, list) else None,
+            'sha256': None,
+        }))
+    return rows
+
+
+class ParquetExporter:
+    """
+    Incremental export of extraction results to partitioned Parquet
+
+    Rows are buffered per <date>/<category> partition and written as a new
+    file once a partition holds flush_rows rows or its oldest row is
+    flush_seconds old. Small files are merged by compact(), which also
+    runs every compact_interval seconds after a flush. Files are written
+    under a hidden name and renamed, so readers never see partial files.
+    """
+
+    def __init__(self, root: Path, flush_rows: int = 500, flush_seconds: float = 30.0,
+                 compact_interval: Optional[float] = 3600.0, compact_min_files: int = 8,
+                 compression: str = 'zstd'):
+        """
+        Args:
+            root: Dataset directory
+            flush_rows: Rows buffered per partition before a file is written
+            flush_seconds: Longest time a row stays buffered
+            compact_interval: Seconds between automatic compactions, None to disable
+            compact_min_files: Files a partition needs before compact() merges them
+            compression: Parquet compression codec
+        """
+        if pa is None:
+            raise ConfigurationError("pyarrow is required for the Parquet export")
+        self.logger = logging.getLogger(__name__)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.compact_interval = compact_interval
+        self.compact_min_files = compact_min_files
+        self.compression = compression
+        self.schema = export_schema()
+        self._lock = threading.RLock()
+        self._buffers: Dict[Tuple[str, str], List[Dict]] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._last_compaction = datetime.now()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['ParquetExporter']:
+        """
+        Create the exporter configured under 'parquet_export'
+
+        Args:
+            config: Processor configuration
+
+        Returns:
+            ParquetExporter, or None if the export is disabled
+        """
+        settings = config.get('parquet_export') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(
+            Path(settings.get('root', 'data/exports/invoices')),
+            flush_rows=settings.get('flush_rows', 500),
+            flush_seconds=settings.get('flush_seconds', 30.0),
+            compact_interval=settings.get('compact_interval', 3600.0),
+            compact_min_files=settings.get('compact_min_files', 8),
+            compression=settings.get('compression', 'zstd')
+        )
+
+    def partition_path(self, partition: Tuple[str, str]) -> Path:
+        return self.root.joinpath(*(f"{column}={value}" for column, value in zip(PARTITION_COLUMNS, partition)))
+
+    def _add(self, rows: Iterable[Tuple[Tuple[str, str], Dict]]) -> None:
+        with self._lock:
+            for partition, row in rows:
+                buffer = self._buffers.setdefault(partition, [])
+                buffer.append(row)
+                if len(buffer) >= self.flush_rows:
+                    self._write(partition, self._buffers.pop(partition))
+            if self._buffers and self._timer is None:
+                # Bound how long rows wait when documents arrive slowly
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def append(self, record: Dict) -> None:
+        """Export a processing record"""
+        self._add([record_row(record)])
+
+    def append_batch(self, job_id: str, job: Dict, processed_at: Optional[str] = None) -> None:
+        """Export the results of an API batch job"""
+        self._add(batch_rows(job_id, job, processed_at))
+
+    def _write(self, partition: Tuple[str, str], rows: List[Dict]) -> Path:
+        """Write rows as a new file of a partition"""
+        directory = self.partition_path(partition)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"part-{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:12]}.parquet"
+        self._write_table(pa.Table.from_pylist(rows, schema=self.schema), path)
+        return path
+
+    def _write_table(self, table: 'pa.Table', path: Path) -> None:
+        temp_path = path.with_name(f".{path.name}.tmp")
+        pq.write_table(table, temp_path, compression=self.compression)
+        os.replace(temp_path, path)
+
+    def flush(self) -> None:
+        """Write all buffered rows, then compact if a compaction is due"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            buffers, self._buffers = self._buffers, {}
+            for partition, rows in buffers.items():
+                self._write(partition, rows)
+            due = (self.compact_interval is not None and
+                   (datetime.now() - self._last_compaction).total_seconds() >= self.compact_interval)
+        if due:
+            self.compact()
+
+    def compact(self, min_files: Optional[int] = None) -> int:
+        """
+        Merge the files of each partition into one
+
+        A marker listing the merged files is written before the merged
+        file is renamed into place and removed after the originals are
+        deleted, so an interrupted compaction is completed on the next
+        call instead of leaving rows duplicated. Each partition is
+        compacted under a lock file, so exporters in several processes
+        sharing the dataset never merge the same files; a partition
+        locked by another process is skipped. Rows can be appended and
+        flushed while partitions are merged: new files are written under
+        fresh names and only the listed files are removed.
+
+        Args:
+            min_files: Files a partition needs to be compacted (default: compact_min_files)
+
+        Returns:
+            Number of partitions compacted
+        """
+        min_files = self.compact_min_files if min_files is None else min_files
+        compacted = 0
+        with self._lock:
+            self._last_compaction = datetime.now()
+            directories = {marker.parent for marker in self.root.rglob(_COMPACTION_MARKER)}
+            directories.update(path.parent for path in self.root.rglob('part-*.parquet'))
+        for directory in sorted(directories):
+            lock = lock_file(directory / _COMPACTION_LOCK, blocking=False)
+            if lock is None:
+                continue
+            with lock:
+                compacted += self._compact_partition(directory, min_files)
+        return compacted
+
+    def _compact_partition(self, directory: Path, min_files: int) -> bool:
+        """Merge the files of a partition whose lock is held"""
+        marker = directory / _COMPACTION_MARKER
+        if marker.exists():
+            self._finish_compaction(marker)
+        files = sorted(directory.glob('part-*.parquet'))
+        if len(files) < max(min_files, 2):
+            return False
+        table = pa.concat_tables(pq.read_table(path, schema=self.schema) for path in files)
+        target = directory / f"part-{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:12]}.parquet"
+        temp_path = target.with_name(f".{target.name}.tmp")
+        pq.write_table(table.sort_by('processed_at'), temp_path, compression=self.compression)
+        with open(marker, 'w') as f:
+            json.dump({'target': target.name, 'temp': temp_path.name,
+                       'sources': [path.name for path in files]}, f)
+        os.replace(temp_path, target)
+        self._finish_compaction(marker)
+        return True
+
+    def _finish_compaction(self, marker: Path) -> None:
+        with open(marker) as f:
+            state = json.load(f)
+        directory = marker.parent
+        temp_path = directory / state['temp']
+        if temp_path.exists():
+            os.replace(temp_path, directory / state['target'])
+        if (directory / state['target']).exists():
+            for name in state['sources']:
+                (directory / name).unlink(missing_ok=True)
+        marker.unlink()
+
+    def export_files(self, records_path: Optional[Path] = None, results_path: Optional[Path] = None) -> int:
+        """
+        Export existing processing_record_*.json and results/*.json files
+
+        Meant for filling an empty dataset; rows already exported are not
+        detected.
+
+        Returns:
+            Number of rows exported
+        """
+        count = 0
+        if records_path and Path(records_path).is_dir():
+            for record_file in sorted(Path(records_path).glob('processing_record_*.json')):
+                with open(record_file) as f:
+                    rows = [record_row(record) for record in json.load(f)]
+                self._add(rows)
+                count += len(rows)
+        if results_path and Path(results_path).is_dir():
+            for results_file in sorted(Path(results_path).glob('*.json')):
+                with open(results_file) as f:
+                    job = json.load(f)
+                rows = batch_rows(results_file.stem, job,
+                                  datetime.fromtimestamp(results_file.stat().st_mtime).isoformat())
+                self._add(rows)
+                count += len(rows)
+        self.flush()
+        return count
+
+    def dataset(self) -> 'ds.Dataset':
+        """
+        The exported data as a pyarrow dataset
+
+        Filters on the partition columns skip whole directories and only
+        the requested columns are read, e.g.
+        ``exporter.dataset().to_table(columns=['vendor', 'total_amount'],
+        filter=ds.field('category') == 'invoice')``.
+        """
+        partitioning = ds.partitioning(
+            pa.schema([('date', pa.string()), ('category', pa.string())]), flavor='hive'
+        )
+        return ds.dataset(str(self.root), format='parquet', schema=self.schema.append(
+            pa.field('date', pa.string())).append(pa.field('category', pa.string())),
+            partitioning=partitioning)
+
+    def close(self) -> None:
+        """Write buffered rows"""
+        self.flush()
+
+
+__all__ = ['AMOUNT_PRECISION', 'AMOUNT_SCALE', 'PARTITION_COLUMNS', 'ParquetExporter', 'batch_rows',
+           'export_schema', 'record_row']
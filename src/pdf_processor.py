@@ -1,33 +1,81 @@
 import os
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import pdfplumber
-from pdf2image import convert_from_path
 import pytesseract
 import re
 from .validators.invoice_validator import InvoiceValidator
-from .categorizer import DocumentCategorizer as Categorizer
+from .normalization import normalize_amount
+from .near_duplicates import NearDuplicateIndex, same_invoice
+from .invoice_splitter import InvoiceSplitter
+from .line_items import LineItemExtractor
+from .ocr import (
+    OCREngine,
+    OCRProfile,
+    PageImageCache,
+    IMAGE_EXTENSIONS,
+    RegionOfInterestOCR,
+    document_hash,
+    frame_count,
+    get_default_engine,
+    get_profile,
+    is_image,
+    iter_frames,
+    render_pages
+)
+from .categorizer import (
+    DocumentCategorizer as Categorizer,
+    CLASSIFICATION_MAX_PAGES,
+    CLASSIFICATION_MAX_CHARS
+)
 
 class PDFProcessor:
     """Processes PDF invoices and extracts structured data"""
     
-    def __init__(self, tesseract_path: Optional[str] = None):
+    def __init__(self, tesseract_path: Optional[str] = None,
+                 classification_max_pages: Optional[int] = CLASSIFICATION_MAX_PAGES,
+                 classification_max_chars: Optional[int] = CLASSIFICATION_MAX_CHARS,
+                 near_duplicate_index: Optional[NearDuplicateIndex] = None,
+                 ocr_profile: Union[str, OCRProfile, None] = None,
+                 page_cache: Optional[PageImageCache] = None,
+                 ocr_engine: Optional[OCREngine] = None,
+                 roi_ocr: Optional[RegionOfInterestOCR] = None,
+                 splitter: Optional[InvoiceSplitter] = None,
+                 line_item_extractor: Optional[LineItemExtractor] = None):
         self.logger = logging.getLogger(__name__)
         self.validator = InvoiceValidator()
         self.categorizer = Categorizer()
+        self.classification_max_pages = classification_max_pages
+        self.classification_max_chars = classification_max_chars
+        # Optional index of earlier documents; near-duplicates skip extraction
+        self.near_duplicate_index = near_duplicate_index
+        # Rendering/Tesseract settings and optional cache of preprocessed pages
+        self.ocr_profile = get_profile(ocr_profile)
+        self.page_cache = page_cache
+        # Shared pool of persistent engines unless one is given
+        self.ocr_engine = ocr_engine or get_default_engine()
+        # Optional vendor-template OCR tried on scans before full-page OCR
+        self.roi_ocr = roi_ocr
+        # Optional detection of several invoices in one file, see extract_invoices()
+        self.splitter = splitter
+        # Optional reading of the line item table, cross-checked by the validator
+        self.line_item_extractor = line_item_extractor
+        # Optional callback told the name of each extraction stage as it starts
+        self.on_stage: Optional[Callable[[str], None]] = None
         
         # Store tesseract_path as instance variable
         self.tesseract_path = tesseract_path or r'C:\Program Files\Tesseract-OCR\tesseract.exe'
         # Configure tesseract
         pytesseract.pytesseract.tesseract_cmd = self.tesseract_path
 
-    def extract_invoice_data(self, file_path: str) -> Dict:
+    def extract_invoice_data(self, file_path: str, metadata: Optional[Dict] = None) -> Dict:
         """
         Extract and validate data from invoice PDF
         
         Args:
             file_path: Path to PDF file
+            metadata: Optional metadata, e.g. the sender used to pick a vendor template
             
         Returns:
             Dictionary containing validated invoice data or validation results
@@ -36,17 +84,33 @@ class PDFProcessor:
             raise FileNotFoundError(f"PDF file not found: {file_path}")
             
         try:
-            # Extract text from PDF
-            text = self._extract_text(file_path)
-            
-            # Debug: Print raw text
-            print("\nRaw text from PDF:")
-            print("-" * 40)
-            print(text)
-            print("-" * 40)
+            # Extract only the header pages needed for classification
+            self._stage('text')
+            pages, truncated = self._extract_pages(
+                file_path,
+                max_pages=self.classification_max_pages,
+                max_chars=self.classification_max_chars
+            )
+            # Images are OCR'd while their pages are read
+            scanned = bool(pages) and not ''.join(pages).strip() and not is_image(file_path)
+            if scanned and self.roi_ocr is not None:
+                # Known vendor layouts need only their field regions OCR'd
+                self._stage('roi')
+                roi_data = self.roi_ocr.extract(file_path, metadata)
+                if roi_data is not None:
+                    self.logger.info(f"Extracted invoice from template regions: {file_path}")
+                    return roi_data
+            if scanned:
+                self.logger.info(f"No text extracted with pdfplumber, trying OCR: {file_path}")
+                self._stage('ocr')
+                pages = self._ocr_pages(file_path, 0, len(pages))
+            header_text = ''.join(pages)
+            if self.classification_max_chars:
+                header_text = header_text[:self.classification_max_chars]
             
             # Categorize document to ensure it's an invoice
-            categorization = self.categorizer.categorize(Path(file_path), {'text': text})
+            self._stage('classify')
+            categorization = self.categorizer.categorize(Path(file_path), {'text': header_text})
             if categorization['categories'][0] != 'invoice':
                 self.logger.warning(f"Document appears to be {categorization['categories'][0]}, not an invoice")
                 return {
@@ -55,25 +119,194 @@ class PDFProcessor:
                     'categorization': categorization
                 }
             
-            # Extract structured data
-            extracted_data = self._extract_invoice_data(text)
+            # Fetch the rest of the document only now that it is needed
+            if truncated:
+                self._stage('text')
+                remaining, _ = self._extract_pages(file_path, first_page=len(pages))
+                if scanned and not ''.join(remaining).strip():
+                    self._stage('ocr')
+                    remaining = self._ocr_pages(file_path, len(pages), len(remaining))
+                pages.extend(remaining)
+            return self._extract_fields(''.join(pages), str(file_path), categorization, file_path,
+                                        document_id=self._document_id(file_path))
+                
+        except Exception as e:
+            self.logger.error(f"Error processing {file_path}: {str(e)}")
+            raise
+
+    def extract_invoices(self, file_path: str, metadata: Optional[Dict] = None) -> List[Dict]:
+        """
+        Extract every invoice of a file that may hold several
+
+        All pages are read once, split into invoices at the boundaries the
+        splitter finds, and the invoices (page ranges of the same file) are
+        classified, extracted and validated in turn.
+        
+        Args:
+            file_path: Path to PDF or image file
+            metadata: Optional metadata; unused until vendor templates can
+                address page ranges
             
-            # Validate extracted data
-            validation_results = self.validator.validate(extracted_data)
+        Returns:
+            One result per invoice in page order, as extract_invoice_data
+            returns them, each with 'pages': [first, last] (one-based)
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"PDF file not found: {file_path}")
+        splitter = self.splitter or InvoiceSplitter()
             
-            if validation_results['is_valid']:
-                self.logger.info(f"Successfully processed invoice: {file_path}")
-                return validation_results['cleaned_data']
-            else:
-                self.logger.warning(
-                    f"Validation errors in {file_path}: {validation_results['errors']}"
-                )
-                return validation_results
+        try:
+            self._stage('text')
+            pages, _ = self._extract_pages(file_path)
+            if pages and not ''.join(pages).strip() and not is_image(file_path):
+                self.logger.info(f"No text extracted with pdfplumber, trying OCR: {file_path}")
+                self._stage('ocr')
+                pages = self._ocr_pages(file_path, 0, len(pages))
+            
+            self._stage('split')
+            ranges = splitter.split(pages)
+            file_id = self._document_id(file_path)
+            return [self._extract_range(file_path, pages, first, last, file_id) for first, last in ranges]
                 
         except Exception as e:
             self.logger.error(f"Error processing {file_path}: {str(e)}")
             raise
 
+    def _extract_range(self, file_path: str, pages: List[str], first: int, last: int,
+                       file_id: Optional[str] = None) -> Dict:
+        """
+        Classify, extract and validate the invoice on a range of pages
+
+        Args:
+            file_path: Path to the file the pages were read from
+            pages: Text of all pages of the file
+            first: Zero-based index of the invoice's first page
+            last: Zero-based index of the invoice's last page
+            file_id: Optional content hash of the file, see _document_id()
+
+        Returns:
+            Result as extract_invoice_data returns it, with 'pages'
+        """
+        page_range = [first + 1, last + 1]
+        source = f"{file_path}#pages={first + 1}-{last + 1}"
+        text = ''.join(pages[first:last + 1])
+        header_text = text[:self.classification_max_chars] if self.classification_max_chars else text
+        
+        self._stage('classify')
+        categorization = self.categorizer.categorize(Path(file_path), {'text': header_text})
+        if categorization['categories'][0] != 'invoice':
+            self.logger.warning(
+                f"Pages {first + 1}-{last + 1} of {file_path} appear to be "
+                f"{categorization['categories'][0]}, not an invoice"
+            )
+            return {
+                'is_valid': False,
+                'errors': [f"Document type mismatch: expected invoice, got {categorization['categories'][0]}"],
+                'categorization': categorization,
+                'pages': page_range
+            }
+        document_id = f"{file_id}#pages={first + 1}-{last + 1}" if file_id is not None else None
+        result = self._extract_fields(text, source, categorization, file_path, first, last - first + 1, document_id)
+        result['pages'] = page_range
+        return result
+
+    def _document_id(self, file_path: str) -> Optional[str]:
+        """
+        Identifier of a file in the near-duplicate index
+
+        The content hash, so a document re-submitted under another name
+        (uploads get throwaway names) is recognised as itself.
+        """
+        return document_hash(file_path) if self.near_duplicate_index is not None else None
+
+    def _extract_fields(self, text: str, source: str, categorization: Dict,
+                        file_path: Optional[str] = None, first_page: int = 0,
+                        max_pages: Optional[int] = None, document_id: Optional[str] = None) -> Dict:
+        """
+        Extract and validate the fields of an invoice's full text
+
+        Texts similar to an indexed invoice only reject the invoice if its
+        invoice number and total agree with that invoice's; invoices from
+        the same vendor template differ in little else. Unconfirmed
+        matches are returned under 'near_duplicates' for review. Invoices
+        are indexed once they validated.
+
+        Args:
+            text: Text of all pages of the invoice
+            source: Name of the invoice in logs and later matches
+            categorization: Result of classifying the invoice
+            file_path: Optional file the invoice's line items are read from
+            first_page: Zero-based index of the invoice's first page in the file
+            max_pages: Optional number of pages of the invoice
+            document_id: Identifier in the near-duplicate index, source if not given
+
+        Returns:
+            Dictionary containing validated invoice data or validation results
+        """
+        document_id = document_id or source
+        signature = None
+        matches: List[Dict] = []
+        if self.near_duplicate_index is not None:
+            signature = self.near_duplicate_index.signature(text)
+            matches = self.near_duplicate_index.query(signature) if signature is not None else []
+            matches = [match for match in matches if match['document_id'] != document_id]
+
+        # Debug: Print raw text
+        print("\nRaw text from PDF:")
+        print("-" * 40)
+        print(text)
+        print("-" * 40)
+
+        # Extract structured data
+        self._stage('extract')
+        extracted_data = self._extract_invoice_data(text)
+
+        # Stop before line items and validation if this is a copy of an earlier invoice
+        confirmed = [match for match in matches if same_invoice(match['fields'], extracted_data)]
+        if confirmed:
+            self.logger.warning(
+                f"{source} is a near-duplicate of {confirmed[0]['source']} "
+                f"(similarity {confirmed[0]['similarity']:.2f})"
+            )
+            return {
+                'is_valid': False,
+                'errors': [f"Near-duplicate of {confirmed[0]['source']}"],
+                'near_duplicates': confirmed,
+                'categorization': categorization
+            }
+
+        if self.line_item_extractor is not None and file_path is not None and not is_image(file_path):
+            line_items = self.line_item_extractor.extract(file_path, first_page, max_pages)
+            if line_items:
+                extracted_data['line_items'] = line_items
+
+        # Validate extracted data
+        self._stage('validate')
+        validation_results = self.validator.validate(extracted_data)
+
+        if validation_results['is_valid']:
+            self.logger.info(f"Successfully processed invoice: {source}")
+            result = validation_results['cleaned_data']
+            if signature is not None:
+                self.near_duplicate_index.add(document_id, signature, source=source, fields=result)
+        else:
+            self.logger.warning(
+                f"Validation errors in {source}: {validation_results['errors']}"
+            )
+            result = validation_results
+        if matches:
+            self.logger.info(
+                f"{source} resembles {matches[0]['source']} (similarity {matches[0]['similarity']:.2f}) "
+                f"but its invoice number or total differ"
+            )
+            result['near_duplicates'] = matches
+        return result
+
+    def _stage(self, name: str) -> None:
+        """Report the start of an extraction stage"""
+        if self.on_stage is not None:
+            self.on_stage(name)
+
     def _extract_invoice_data(self, text: str) -> Dict:
         """
         Extract structured data from invoice text
@@ -86,12 +319,7 @@ class PDFProcessor:
         """
         def clean_amount(amount_str: str) -> str:
             """Clean and standardize amount strings"""
-            amount = amount_str.strip()
-            for symbol in ['€', '$', '£', ' ']:
-                amount = amount.replace(symbol, '')
-            if ',' in amount:
-                amount = amount.replace('.', '').replace(',', '.')
-            return amount.strip()
+            return normalize_amount(amount_str) or ''
 
         extracted_data = {
             'invoice_number': '',
@@ -185,20 +413,28 @@ class PDFProcessor:
 
     def process_batch(self, directory: str) -> List[Dict]:
         """
-        Process multiple PDFs in a directory
+        Process multiple PDFs and image documents in a directory
         
         Args:
-            directory: Path to directory containing PDF files
+            directory: Path to directory containing PDF or image files
             
         Returns:
-            List of processing results for each PDF
+            List of processing results for each PDF, one per invoice
+            when a splitter is set
         """
         results = []
-        for file in Path(directory).glob('*.pdf'):
+        suffixes = ('.pdf',) + IMAGE_EXTENSIONS
+        for file in sorted(Path(directory).iterdir()):
+            if file.suffix.lower() not in suffixes:
+                continue
             try:
-                result = self.extract_invoice_data(str(file))
-                result['filename'] = file.name
-                results.append(result)
+                if self.splitter is not None:
+                    invoices = self.extract_invoices(str(file))
+                else:
+                    invoices = [self.extract_invoice_data(str(file))]
+                for result in invoices:
+                    result['filename'] = file.name
+                    results.append(result)
             except Exception as e:
                 self.logger.error(f"Error processing {file}: {str(e)}")
                 results.append({
@@ -208,28 +444,97 @@ class PDFProcessor:
                 })
         return results
 
-    def _extract_text(self, file_path: str) -> str:
+    def _extract_text(self, file_path: str, max_pages: Optional[int] = None,
+                      max_chars: Optional[int] = None) -> str:
         """
         Extract text from PDF using both pdfplumber and OCR
         
         Args:
             file_path: Path to PDF file
+            max_pages: Optional maximum number of pages to read
+            max_chars: Optional number of characters after which reading stops
             
         Returns:
             Extracted text content
         """
-        text = ""
-        
         # Try pdfplumber first
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""
+        pages, _ = self._extract_pages(file_path, max_pages=max_pages, max_chars=max_chars)
                 
-        # If no text found, try OCR
-        if not text.strip():
+        # If no text found, try OCR on the same page range
+        if pages and not ''.join(pages).strip():
             self.logger.info(f"No text extracted with pdfplumber, trying OCR: {file_path}")
-            images = convert_from_path(file_path)
-            for image in images:
-                text += pytesseract.image_to_string(image) + "\n"
+            pages = self._ocr_pages(file_path, 0, len(pages))
                 
-        return text
+        return ''.join(pages)
+
+    def _extract_pages(self, file_path: str, first_page: int = 0,
+                       max_pages: Optional[int] = None,
+                       max_chars: Optional[int] = None) -> Tuple[List[str], bool]:
+        """
+        Extract the text layer page by page, stopping once a bound is reached
+
+        Image documents have no text layer; their pages are OCR'd instead.
+        
+        Args:
+            file_path: Path to PDF file
+            first_page: Zero-based index of the first page to read
+            max_pages: Optional maximum number of pages to read
+            max_chars: Optional number of characters after which reading stops
+            
+        Returns:
+            Tuple of (list of page texts, whether pages were left unread)
+        """
+        if is_image(file_path):
+            return self._ocr_image(file_path, first_page, max_pages)
+
+        pages = []
+        char_count = 0
+        
+        with pdfplumber.open(file_path) as pdf:
+            for index in range(first_page, len(pdf.pages)):
+                if ((max_pages is not None and len(pages) >= max_pages) or
+                        (max_chars is not None and char_count >= max_chars)):
+                    return pages, True
+                page_text = pdf.pages[index].extract_text() or ""
+                pages.append(page_text)
+                char_count += len(page_text)
+                
+        return pages, False
+
+    def _ocr_image(self, file_path: str, first_page: int = 0,
+                   max_pages: Optional[int] = None) -> Tuple[List[str], bool]:
+        """
+        OCR the pages of an image document without converting it to PDF
+
+        Frames are decoded one at a time and handed to the OCR engine as
+        they are ready.
+
+        Args:
+            file_path: Path to image file
+            first_page: Zero-based index of the first page to OCR
+            max_pages: Optional maximum number of pages to OCR
+
+        Returns:
+            Tuple of (list of page texts, whether pages were left unread)
+        """
+        self._stage('ocr')
+        frames = frame_count(file_path)
+        texts = self.ocr_engine.recognize_stream(
+            iter_frames(file_path, self.ocr_profile, first_page, max_pages), self.ocr_profile
+        )
+        return [text + "\n" for text in texts], first_page + len(texts) < frames
+
+    def _ocr_pages(self, file_path: str, first_page: int, page_count: int) -> List[str]:
+        """
+        OCR a contiguous range of pages
+        
+        Args:
+            file_path: Path to PDF file
+            first_page: Zero-based index of the first page to OCR
+            page_count: Number of pages to OCR
+            
+        Returns:
+            List of OCR'd page texts
+        """
+        images = render_pages(file_path, first_page, page_count, self.ocr_profile, self.page_cache)
+        return [text + "\n" for text in self.ocr_engine.recognize_pages(images, self.ocr_profile)]
@@ -0,0 +1,336 @@
+import re
+import json
+import itertools
+import base64
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .exceptions import ProcessingError
+from .normalization import parse_amount, parse_date
+
+# Page size limits of query()
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def vendor_key(vendor) -> Optional[str]:
+    """Case- and whitespace-insensitive form of a vendor name used for lookups"""
+    if not isinstance(vendor, str) or not vendor.strip():
+        return None
+    return _WHITESPACE.sub(' ', vendor.casefold()).strip()
+
+
+def _searchable_text(value) -> str:
+    """All strings in an extracted value, for full-text search"""
+    if isinstance(value, dict):
+        return ' '.join(_searchable_text(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(_searchable_text(item) for item in value)
+    return value if isinstance(value, str) else ''
+
+
+def _fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching all of its words as prefixes"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        raise ProcessingError("Search text contains no words")
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class RecordIndex:
+    """
+    SQLite index of processing records and batch results
+
+    Each record becomes a row with B-tree indexes on vendor, invoice date,
+    amount, category and processing time. An FTS5 table holds the
+    extracted text fields and, where given, the document text, so "all invoices from vendor X last month" or a
+    word search is an index lookup instead of a scan of the JSON files.
+    Pages are addressed with a cursor, so deep pages cost the same as the
+    first.
+    """
+
+    def __init__(self, db_path: Path):
+        """
+        Open or create a record index
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_key TEXT UNIQUE,
+                source TEXT,
+                file_name TEXT,
+                document_path TEXT,
+                category TEXT,
+                status TEXT,
+                vendor TEXT,
+                vendor_key TEXT,
+                invoice_number TEXT,
+                invoice_date TEXT,
+                total_amount REAL,
+                processed_at TEXT,
+                data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS records_vendor ON records (vendor_key, invoice_date);
+            CREATE INDEX IF NOT EXISTS records_invoice_date ON records (invoice_date);
+            CREATE INDEX IF NOT EXISTS records_amount ON records (total_amount);
+            CREATE INDEX IF NOT EXISTS records_category ON records (category, invoice_date);
+            CREATE INDEX IF NOT EXISTS records_processed_at ON records (processed_at);
+            CREATE INDEX IF NOT EXISTS records_invoice_number ON records (invoice_number);
+            CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+                file_name, vendor, invoice_number, text, tokenize = 'unicode61 remove_diacritics 2'
+            );
+            """
+        )
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['RecordIndex']:
+        """
+        Create the index configured under 'record_index'
+
+        Args:
+            config: Processor configuration
+
+        Returns:
+            RecordIndex, or None if record indexing is disabled
+        """
+        settings = config.get('record_index') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(Path(settings.get('index_path', 'data/record_index.sqlite3')))
+
+    def _row(self, record_key: str, source: str, file_name: Optional[str], document_path: Optional[str],
+             category: Optional[str], status: Optional[str], data: Dict, processed_at: Optional[str],
+             record: Dict, text: Optional[str] = None) -> Tuple[tuple, str]:
+        """Column values of a record and its full-text entry"""
+        vendor = data.get('vendor') if isinstance(data.get('vendor'), str) else None
+        amount = parse_amount(data.get('total_amount'))
+        row = (
+            record_key, source, file_name, document_path, category, status,
+            vendor, vendor_key(vendor),
+            None if data.get('invoice_number') is None else str(data.get('invoice_number')),
+            parse_date(data.get('date')),
+            float(amount) if amount is not None else None,
+            processed_at or datetime.now().isoformat(),
+            json.dumps(record, default=str)
+        )
+        return row, ' '.join(part for part in (_searchable_text(data), text) if part)
+
+    def _insert(self, rows: List[Tuple[tuple, str]]) -> int:
+        """Insert or replace rows and their full-text entries in one transaction"""
+        with self._lock, self._connection:
+            for row, text in rows:
+                existing = self._connection.execute(
+                    "SELECT id FROM records WHERE record_key = ?", (row[0],)
+                ).fetchone()
+                if existing:
+                    self._connection.execute("DELETE FROM records_fts WHERE rowid = ?", existing)
+                    self._connection.execute("DELETE FROM records WHERE id = ?", existing)
+                cursor = self._connection.execute(
+                    "INSERT INTO records (record_key, source, file_name, document_path, category, status, "
+                    "vendor, vendor_key, invoice_number, invoice_date, total_amount, processed_at, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row
+                )
+                self._connection.execute(
+                    "INSERT INTO records_fts (rowid, file_name, vendor, invoice_number, text) VALUES (?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, row[2] or '', row[6] or '', row[8] or '', text)
+                )
+        return len(rows)
+
+    def add_processing_records(self, records: Iterable[Dict],
+                               texts: Optional[Iterable[Optional[str]]] = None) -> int:
+        """
+        Index records written by DocumentProcessor._save_processing_record
+
+        Records are keyed by their final path, so re-indexing replaces them.
+
+        Args:
+            records: Processing records
+            texts: Optional document text of each record, searched along
+                with the extracted fields
+
+        Returns:
+            Number of records indexed
+        """
+        rows = []
+        for record, text in zip(records, texts if texts is not None else itertools.repeat(None)):
+            document_path = record.get('final_path')
+            key = f"processing:{document_path or record.get('file_path')}"
+            categories = record.get('categories') or [None]
+            rows.append(self._row(
+                key, 'processing', Path(document_path or record.get('file_path') or '').name or None,
+                document_path, categories[0], record.get('status'),
+                record.get('extracted_data') or {}, record.get('timestamp'), record, text
+            ))
+        return self._insert(rows)
+
+    def add_batch_results(self, job_id: str, job: Dict, processed_at: Optional[str] = None) -> int:
+        """
+        Index the results of an API batch job as saved in results/<job_id>.json
+
+        Args:
+            job_id: Batch job id
+            job: Job with 'results' and 'errors' lists
+            processed_at: Optional completion time (default: now)
+
+        Returns:
+            Number of records indexed
+        """
+        rows = []
+        for index, result in enumerate(job.get('results', [])):
+            data = result.get('data') if isinstance(result.get('data'), dict) else {}
+            # Failed validation returns the validation results instead of the fields
+            fields = data.get('cleaned_data', data)
+            rows.append(self._row(
+                f"batch:{job_id}:{index}", 'batch', result.get('file_name'), None, 'invoice',
+                result.get('status'), fields, processed_at, {**result, 'data': fields, 'job_id': job_id}
+            ))
+        for index, error in enumerate(job.get('errors', [])):
+            rows.append(self._row(
+                f"batch:{job_id}:error:{index}", 'batch', error.get('file_name'), None, None, 'error',
+                {}, processed_at, {**error, 'job_id': job_id}
+            ))
+        return self._insert(rows)
+
+    def ingest_files(self, records_path: Optional[Path] = None, results_path: Optional[Path] = None) -> int:
+        """
+        Backfill the index from processing_record_*.json and results/*.json files
+
+        Returns:
+            Number of records indexed
+        """
+        count = 0
+        if records_path and Path(records_path).is_dir():
+            for record_file in sorted(Path(records_path).glob('processing_record_*.json')):
+                with open(record_file) as f:
+                    count += self.add_processing_records(json.load(f))
+        if results_path and Path(results_path).is_dir():
+            for results_file in sorted(Path(results_path).glob('*.json')):
+                with open(results_file) as f:
+                    job = json.load(f)
+                completed = datetime.fromtimestamp(results_file.stat().st_mtime).isoformat()
+                count += self.add_batch_results(results_file.stem, job, completed)
+        return count
+
+    def query(self, vendor: Optional[str] = None, category: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+              invoice_number: Optional[str] = None, text: Optional[str] = None,
+              limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Dict:
+        """
+        Find indexed records, newest first
+
+        Args:
+            vendor: Vendor name, matched ignoring case and spacing
+            category: Document category
+            date_from: Earliest invoice date (inclusive), any supported date format
+            date_to: Latest invoice date (inclusive)
+            min_amount: Smallest total amount (inclusive)
+            max_amount: Largest total amount (inclusive)
+            invoice_number: Exact invoice number
+            text: Words that must all occur in the extracted fields or document text
+            limit: Page size, at most MAX_PAGE_SIZE
+            cursor: 'next_cursor' of the previous page
+
+        Returns:
+            Dictionary with 'items' and 'next_cursor' (None on the last page)
+        """
+        conditions, parameters = [], []
+        if vendor is not None:
+            conditions.append("r.vendor_key = ?")
+            parameters.append(vendor_key(vendor))
+        if category is not None:
+            conditions.append("r.category = ?")
+            parameters.append(category)
+        for value, operator in ((date_from, '>='), (date_to, '<=')):
+            if value is not None:
+                parsed = parse_date(value)
+                if parsed is None:
+                    raise ProcessingError(f"Invalid date: {value}")
+                conditions.append(f"r.invoice_date {operator} ?")
+                parameters.append(parsed)
+        if min_amount is not None:
+            conditions.append("r.total_amount >= ?")
+            parameters.append(min_amount)
+        if max_amount is not None:
+            conditions.append("r.total_amount <= ?")
+            parameters.append(max_amount)
+        if invoice_number is not None:
+            conditions.append("r.invoice_number = ?")
+            parameters.append(invoice_number)
+        if text and conditions:
+            # Other filters narrow the rows first; matches are checked as a set
+            conditions.append("r.id IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)")
+            parameters.append(_fts_query(text))
+            source, order = "records r", "r.id"
+        elif text:
+            # Walk the full-text matches newest first instead of collecting them all
+            conditions.append("records_fts MATCH ?")
+            parameters.append(_fts_query(text))
+            source, order = "records_fts f JOIN records r ON r.id = f.rowid", "f.rowid"
+        else:
+            source, order = "records r", "r.id"
+        if cursor:
+            conditions.append(f"{order} < ?")
+            parameters.append(self._decode_cursor(cursor))
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT r.id, r.source, r.file_name, r.document_path, r.category, r.status, r.vendor, "
+                "r.invoice_number, r.invoice_date, r.total_amount, r.processed_at, r.data "
+                f"FROM {source} {where} ORDER BY {order} DESC LIMIT ?",
+                (*parameters, limit + 1)
+            ).fetchall()
+
+        items = [
+            {
+                'id': row[0], 'source': row[1], 'file_name': row[2], 'document_path': row[3],
+                'category': row[4], 'status': row[5], 'vendor': row[6], 'invoice_number': row[7],
+                'invoice_date': row[8], 'total_amount': row[9], 'processed_at': row[10],
+                'record': json.loads(row[11])
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = self._encode_cursor(items[-1]['id']) if len(rows) > limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _encode_cursor(record_id: int) -> str:
+        return base64.urlsafe_b64encode(str(record_id).encode('ascii')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> int:
+        try:
+            return int(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+        except (ValueError, UnicodeError):
+            raise ProcessingError(f"Invalid cursor: {cursor}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        with self._lock:
+            self._connection.close()
+
+
+__all__ = ['DEFAULT_PAGE_SIZE', 'MAX_PAGE_SIZE', 'RecordIndex', 'vendor_key']
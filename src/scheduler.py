@@ -0,0 +1,557 @@
+import os
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pdfplumber
+
+from .exceptions import ProcessingError
+from .ocr.images import frame_count, is_image
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ('interactive', 'email', 'bulk')
+
+# Worker lanes; scanned documents go to the OCR lane
+LANES = ('cpu', 'ocr')
+
+# Weight of the latest job in the moving average of seconds per unit of cost
+_SERVICE_SMOOTHING = 0.2
+
+# Upper bounds (seconds) of the queue wait histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def probe_document(file_path: Path) -> Tuple[int, bool]:
+    """
+    Cheap look at a document before scheduling it
+
+    Args:
+        file_path: Document to look at
+
+    Returns:
+        Tuple of (page count, whether the first page lacks a text layer);
+        images count as scanned, other files that are not PDFs or cannot
+        be read as (1, False)
+    """
+    if is_image(file_path):
+        try:
+            return frame_count(file_path), True
+        except Exception:
+            return 1, True
+    if Path(file_path).suffix.lower() != '.pdf':
+        return 1, False
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            if not pdf.pages:
+                return 1, False
+            return len(pdf.pages), not pdf.pages[0].chars
+    except Exception:
+        return 1, False
+
+
+class _Job:
+    def __init__(self, future: Future, fn: Callable, args: tuple, kwargs: Dict,
+                 priority: str, cost: float, submitted: float):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.cost = cost
+        self.submitted = submitted
+
+
+class _Flow:
+    """Jobs of one tenant or batch job, smallest first"""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.jobs: List[Tuple[float, int, _Job]] = []
+        # Virtual finish time of the flow's last dispatched job
+        self.finish = 0.0
+
+
+class _PriorityClass:
+    """
+    Weighted fair queue of the flows of one priority class
+
+    Start-time fair queuing: a flow's next job gets the tag
+    max(virtual time, flow's last finish) + cost / weight and the job with
+    the smallest tag runs next, so each flow receives work in proportion
+    to its weight however many jobs it queued.
+    """
+
+    def __init__(self):
+        self.flows: Dict[str, _Flow] = {}
+        self.virtual_time = 0.0
+        self.size = 0
+
+    def push(self, flow_key: str, weight: float, job: _Job, sequence: int) -> None:
+        flow = self.flows.get(flow_key)
+        if flow is None:
+            flow = self.flows[flow_key] = _Flow(weight)
+        flow.weight = weight
+        heapq.heappush(flow.jobs, (job.cost, sequence, job))
+        self.size += 1
+
+    def pop(self) -> _Job:
+        best_key, best_start, best_finish = None, 0.0, None
+        for key, flow in self.flows.items():
+            start = max(self.virtual_time, flow.finish)
+            finish = start + flow.jobs[0][0] / flow.weight
+            if best_finish is None or finish < best_finish:
+                best_key, best_start, best_finish = key, start, finish
+        flow = self.flows[best_key]
+        _, _, job = heapq.heappop(flow.jobs)
+        self.virtual_time = best_start
+        flow.finish = best_finish
+        if not flow.jobs:
+            del self.flows[best_key]
+        self.size -= 1
+        return job
+
+
+class _Lane:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.classes = {priority: _PriorityClass() for priority in PRIORITY_CLASSES}
+        self.running = 0
+        self.threads: List[threading.Thread] = []
+        self.pending_cost = 0.0
+        # Moving average of seconds per unit of cost (page), None until a job finished
+        self.seconds_per_cost: Optional[float] = None
+
+    def pending(self) -> int:
+        return sum(priority_class.size for priority_class in self.classes.values())
+
+    def pop(self) -> _Job:
+        for priority in PRIORITY_CLASSES:
+            if self.classes[priority].size:
+                job = self.classes[priority].pop()
+                self.pending_cost -= job.cost
+                return job
+        raise IndexError("lane is empty")
+
+    def observe(self, cost: float, seconds: float) -> None:
+        sample = seconds / cost
+        if self.seconds_per_cost is None:
+            self.seconds_per_cost = sample
+        else:
+            self.seconds_per_cost += _SERVICE_SMOOTHING * (sample - self.seconds_per_cost)
+
+
+class _WaitHistogram:
+    def __init__(self):
+        self.buckets = [0] * len(WAIT_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        for index, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+
+class ExtractionScheduler:
+    """
+    Runs extraction jobs by priority class, fairly across tenants and jobs
+
+    Each lane has its own worker threads. A lane always runs the highest
+    priority class that has work; within a class, flows (tenants or batch
+    jobs) share the workers in proportion to their weights, with the cost
+    of a job being its page count. Within a flow, small documents run
+    first. Scanned documents use the OCR lane, so OCR never occupies more
+    than its workers and cannot hold up documents with a text layer.
+    """
+
+    def __init__(self, workers: int = 4, ocr_workers: int = 2, weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            workers: Threads of the lane for documents with a text layer
+            ocr_workers: Threads of the OCR lane
+            weights: Optional flow -> weight (default 1.0)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.weights = dict(weights or {})
+        self._lanes = {'cpu': _Lane('cpu', workers), 'ocr': _Lane('ocr', ocr_workers)}
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._waits = {priority: _WaitHistogram() for priority in PRIORITY_CLASSES}
+        self._shutdown = False
+        # Optional Autoscaler resizing the lanes
+        self.autoscaler: Optional['Autoscaler'] = None
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'ExtractionScheduler':
+        """Create a scheduler configured under 'scheduler'"""
+        settings = config.get('scheduler') or {}
+        scheduler = cls(
+            workers=settings.get('workers', 4),
+            ocr_workers=settings.get('ocr_workers', 2),
+            weights=settings.get('weights')
+        )
+        scheduler.autoscaler = Autoscaler.from_config(config, scheduler)
+        if scheduler.autoscaler is not None:
+            scheduler.autoscaler.start()
+        return scheduler
+
+    def submit(self, fn: Callable, *args, priority: str = 'bulk', flow: str = 'default',
+               weight: Optional[float] = None, cost: float = 1.0, lane: str = 'cpu', **kwargs) -> Future:
+        """
+        Queue a call
+
+        Args:
+            fn: Callable to run
+            *args: Positional arguments of fn
+            priority: One of PRIORITY_CLASSES
+            flow: Tenant or job the call belongs to
+            weight: Share of the flow within its class (default: configured weight or 1.0)
+            cost: Estimated work, e.g. page count
+            lane: One of LANES
+            **kwargs: Keyword arguments of fn
+
+        Returns:
+            Future of fn's result
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ProcessingError(f"Unknown priority class '{priority}'")
+        if lane not in LANES:
+            raise ProcessingError(f"Unknown scheduler lane '{lane}'")
+        weight = weight if weight is not None else self.weights.get(flow, 1.0)
+        if weight <= 0:
+            raise ProcessingError(f"Weight of flow '{flow}' must be positive")
+        future = Future()
+        job = _Job(future, fn, args, kwargs, priority, max(cost, 1e-6), time.monotonic())
+        with self._condition:
+            if self._shutdown:
+                raise ProcessingError("Scheduler is shut down")
+            selected = self._lanes[lane]
+            selected.classes[priority].push(flow, weight, job, next(self._sequence))
+            selected.pending_cost += job.cost
+            self._start_workers(selected)
+            self._condition.notify_all()
+        return future
+
+    def submit_document(self, fn: Callable, file_path: Path, *args, priority: str = 'bulk',
+                        flow: str = 'default', weight: Optional[float] = None, **kwargs) -> Future:
+        """
+        Queue the extraction of a document, costed by its page count
+
+        Args:
+            fn: Callable taking the document path (and args) first
+            file_path: Document to extract
+            priority: One of PRIORITY_CLASSES
+            flow: Tenant or job the document belongs to
+            weight: Share of the flow within its class
+
+        Returns:
+            Future of fn's result
+        """
+        pages, scanned = probe_document(file_path)
+        return self.submit(fn, file_path, *args, priority=priority, flow=flow, weight=weight,
+                           cost=pages, lane='ocr' if scanned else 'cpu', **kwargs)
+
+    def _start_workers(self, lane: _Lane) -> None:
+        while len(lane.threads) < lane.workers:
+            thread = threading.Thread(target=self._work, args=(lane,),
+                                      name=f"extract-{lane.name}-{len(lane.threads)}", daemon=True)
+            lane.threads.append(thread)
+            thread.start()
+
+    def _work(self, lane: _Lane) -> None:
+        while True:
+            with self._condition:
+                while not lane.pending() and not self._shutdown and len(lane.threads) <= lane.workers:
+                    self._condition.wait()
+                if len(lane.threads) > lane.workers:
+                    # The lane was shrunk
+                    lane.threads.remove(threading.current_thread())
+                    return
+                if not lane.pending():
+                    return
+                job = lane.pop()
+                started = time.monotonic()
+                self._waits[job.priority].observe(started - job.submitted)
+                lane.running += 1
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._condition:
+                    lane.running -= 1
+                    lane.observe(job.cost, time.monotonic() - started)
+                    self._condition.notify_all()
+
+    def resize(self, lane: str, workers: int) -> None:
+        """
+        Change the number of worker threads of a lane
+
+        Surplus threads exit once their current job is done.
+
+        Args:
+            lane: One of LANES
+            workers: New number of threads (at least 1)
+        """
+        with self._condition:
+            selected = self._lanes[lane]
+            selected.workers = max(1, workers)
+            if selected.threads:
+                self._start_workers(selected)
+            self._condition.notify_all()
+
+    def lane_stats(self, lane: str) -> Dict:
+        """
+        Load of a lane
+
+        Returns:
+            Dictionary with 'workers', 'running', 'pending', 'pending_cost'
+            and 'seconds_per_cost' (None until a job finished)
+        """
+        with self._condition:
+            selected = self._lanes[lane]
+            return {
+                'workers': selected.workers,
+                'running': selected.running,
+                'pending': selected.pending(),
+                'pending_cost': selected.pending_cost,
+                'seconds_per_cost': selected.seconds_per_cost
+            }
+
+    def metrics(self) -> Dict:
+        """
+        Queue lengths and queue wait per priority class
+
+        Returns:
+            Dictionary with 'lanes' (pending and running jobs per lane) and
+            'queue_wait' (count, sum and cumulative buckets per class)
+        """
+        with self._condition:
+            lanes = {
+                name: {
+                    'workers': lane.workers,
+                    'running': lane.running,
+                    'seconds_per_cost': lane.seconds_per_cost,
+                    'pending': {priority: lane.classes[priority].size for priority in PRIORITY_CLASSES}
+                }
+                for name, lane in self._lanes.items()
+            }
+            waits = {
+                priority: {'count': histogram.count, 'sum': histogram.sum,
+                           'buckets': dict(zip(WAIT_BUCKETS, histogram.buckets))}
+                for priority, histogram in self._waits.items()
+            }
+        return {'lanes': lanes, 'queue_wait': waits}
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        metrics = self.metrics()
+        lines = [
+            "# HELP extraction_queue_wait_seconds Time extraction jobs waited for a worker",
+            "# TYPE extraction_queue_wait_seconds histogram"
+        ]
+        for priority, wait in metrics['queue_wait'].items():
+            for bound, count in wait['buckets'].items():
+                lines.append(f'extraction_queue_wait_seconds_bucket{{class="{priority}",le="{bound}"}} {count}')
+            lines.append(f'extraction_queue_wait_seconds_bucket{{class="{priority}",le="+Inf"}} {wait["count"]}')
+            lines.append(f'extraction_queue_wait_seconds_sum{{class="{priority}"}} {wait["sum"]}')
+            lines.append(f'extraction_queue_wait_seconds_count{{class="{priority}"}} {wait["count"]}')
+        lines += [
+            "# HELP extraction_jobs_pending Extraction jobs waiting for a worker",
+            "# TYPE extraction_jobs_pending gauge"
+        ]
+        for name, lane in metrics['lanes'].items():
+            for priority, pending in lane['pending'].items():
+                lines.append(f'extraction_jobs_pending{{lane="{name}",class="{priority}"}} {pending}')
+        lines += [
+            "# HELP extraction_jobs_running Extraction jobs being run",
+            "# TYPE extraction_jobs_running gauge"
+        ]
+        for name, lane in metrics['lanes'].items():
+            lines.append(f'extraction_jobs_running{{lane="{name}"}} {lane["running"]}')
+        lines += [
+            "# HELP extraction_workers Worker threads of each lane",
+            "# TYPE extraction_workers gauge"
+        ]
+        for name, lane in metrics['lanes'].items():
+            lines.append(f'extraction_workers{{lane="{name}"}} {lane["workers"]}')
+        lines += [
+            "# HELP extraction_seconds_per_page Moving average of extraction time per page",
+            "# TYPE extraction_seconds_per_page gauge"
+        ]
+        for name, lane in metrics['lanes'].items():
+            if lane['seconds_per_cost'] is not None:
+                lines.append(f'extraction_seconds_per_page{{lane="{name}"}} {lane["seconds_per_cost"]}')
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers once the queued jobs are done"""
+        if self.autoscaler is not None:
+            self.autoscaler.stop()
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+            threads = [thread for lane in self._lanes.values() for thread in lane.threads]
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+def cpu_load() -> Optional[float]:
+    """One-minute load average per CPU, None where the platform has none"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class Autoscaler:
+    """
+    Resizes the lanes of an ExtractionScheduler between limits
+
+    Every interval each lane's backlog is converted into an expected wait,
+    pending pages times the observed seconds per page divided by the
+    workers. A lane whose expected wait exceeds target_wait grows towards
+    the workers that would clear it in time (at most doubling per step),
+    unless the CPUs are already at max_load; above max_load the OCR lane
+    gives up a worker instead. A lane without backlog shrinks after
+    idle_checks idle evaluations in a row. Changes to a lane are at least
+    cooldown seconds apart, so the pools do not thrash.
+    """
+
+    def __init__(self, scheduler: ExtractionScheduler, limits: Dict[str, Tuple[int, int]],
+                 interval: float = 5.0, cooldown: float = 30.0, target_wait: float = 2.0,
+                 max_load: float = 0.9, idle_checks: int = 3,
+                 load: Callable[[], Optional[float]] = cpu_load):
+        """
+        Args:
+            scheduler: Scheduler whose lanes are resized
+            limits: Lane -> (minimum, maximum) workers
+            interval: Seconds between evaluations
+            cooldown: Seconds between changes to the same lane
+            target_wait: Expected queue wait (seconds) above which a lane grows
+            max_load: Load average per CPU above which no lane grows
+            idle_checks: Idle evaluations in a row before a lane shrinks
+            load: Callable returning the load per CPU, or None if unknown
+        """
+        self.logger = logging.getLogger(__name__)
+        self.scheduler = scheduler
+        self.limits = dict(limits)
+        self.interval = interval
+        self.cooldown = cooldown
+        self.target_wait = target_wait
+        self.max_load = max_load
+        self.idle_checks = idle_checks
+        self.load = load
+        self._last_change: Dict[str, float] = {}
+        self._idle: Dict[str, int] = dict.fromkeys(self.limits, 0)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: Dict, scheduler: ExtractionScheduler) -> Optional['Autoscaler']:
+        """
+        Create the autoscaler configured under 'scheduler.autoscale'
+
+        Returns:
+            Autoscaler, or None if autoscaling is disabled
+        """
+        settings = (config.get('scheduler') or {}).get('autoscale') or {}
+        if not settings.get('enabled', False):
+            return None
+        cpus = os.cpu_count() or 1
+        lanes = settings.get('lanes') or {}
+        limits = {
+            'cpu': (lanes.get('cpu', {}).get('min', 1), lanes.get('cpu', {}).get('max', 4 * cpus)),
+            'ocr': (lanes.get('ocr', {}).get('min', 1), lanes.get('ocr', {}).get('max', cpus))
+        }
+        return cls(
+            scheduler,
+            limits,
+            interval=settings.get('interval', 5.0),
+            cooldown=settings.get('cooldown', 30.0),
+            target_wait=settings.get('target_wait', 2.0),
+            max_load=settings.get('max_load', 0.9),
+            idle_checks=settings.get('idle_checks', 3)
+        )
+
+    def evaluate(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Resize the lanes once
+
+        Args:
+            now: Optional current monotonic time
+
+        Returns:
+            Lane -> number of workers after the evaluation
+        """
+        now = time.monotonic() if now is None else now
+        load = self.load()
+        sizes = {}
+        for lane, (minimum, maximum) in self.limits.items():
+            stats = self.scheduler.lane_stats(lane)
+            workers = stats['workers']
+            target = self._target(lane, stats, load, minimum, maximum)
+            cooling = now - self._last_change.get(lane, -math.inf) < self.cooldown
+            if target != workers and not cooling:
+                self.logger.info(f"Resizing {lane} lane from {workers} to {target} workers")
+                self.scheduler.resize(lane, target)
+                self._last_change[lane] = now
+                self._idle[lane] = 0
+                workers = target
+            sizes[lane] = workers
+        return sizes
+
+    def _target(self, lane: str, stats: Dict, load: Optional[float], minimum: int, maximum: int) -> int:
+        workers = stats['workers']
+        overloaded = load is not None and load >= self.max_load
+        if not stats['pending']:
+            self._idle[lane] = self._idle[lane] + 1 if stats['running'] < workers else 0
+            if self._idle[lane] >= self.idle_checks:
+                target = max(stats['running'], workers - max(1, (workers - stats['running']) // 2))
+                return min(max(target, minimum), maximum)
+            return min(max(workers, minimum), maximum)
+        self._idle[lane] = 0
+        if overloaded:
+            # OCR is the heavy work; give its CPU back first
+            return max(minimum, workers - 1) if lane == 'ocr' else min(max(workers, minimum), maximum)
+        seconds_per_cost = stats['seconds_per_cost'] if stats['seconds_per_cost'] is not None else 1.0
+        expected_wait = stats['pending_cost'] * seconds_per_cost / workers
+        if expected_wait <= self.target_wait:
+            return min(max(workers, minimum), maximum)
+        needed = math.ceil(stats['pending_cost'] * seconds_per_cost / self.target_wait)
+        return min(max(workers + 1, min(needed, 2 * workers)), maximum)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.evaluate()
+            except Exception as e:
+                self.logger.error(f"Autoscaling failed: {str(e)}")
+
+    def start(self) -> None:
+        """Evaluate periodically in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='extract-autoscaler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+__all__ = ['LANES', 'PRIORITY_CLASSES', 'WAIT_BUCKETS', 'Autoscaler', 'ExtractionScheduler', 'cpu_load',
+           'probe_document']
@@ -0,0 +1,272 @@
+import os
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from .exceptions import (
+    ExtractionCancelled,
+    ExtractionKilled,
+    ExtractionMemoryError,
+    ExtractionTimeout,
+    ProcessingError
+)
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _serve(connection, factory: Callable, memory_limit: Optional[int]) -> None:
+    """Extraction process: builds a processor, then extracts the documents it is sent"""
+    if hasattr(os, 'setpgrp'):
+        # Own process group, so OCR subprocesses are killed along with it
+        os.setpgrp()
+    processor = factory()
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    send_lock = threading.Lock()
+
+    def send(message) -> None:
+        with send_lock:
+            connection.send(message)
+
+    processor.on_stage = lambda stage: send(('stage', stage))
+    send(('ready', None))
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        file_path, metadata = request
+        try:
+            if getattr(processor, 'splitter', None) is not None:
+                send(('result', processor.extract_invoices(file_path, metadata)))
+            else:
+                send(('result', processor.extract_invoice_data(file_path, metadata)))
+        except MemoryError as e:
+            # The process may be in a bad state; let the supervisor replace it
+            send(('memory', str(e)))
+            return
+        except Exception as e:
+            try:
+                send(('error', e))
+            except Exception:
+                send(('error', ProcessingError(f"{type(e).__name__}: {str(e)}")))
+
+
+class _ExtractionProcess:
+    def __init__(self, context, factory: Callable, memory_limit: Optional[int], startup_timeout: float):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, factory, memory_limit), daemon=True)
+        self.process.start()
+        child.close()
+        # Time spent importing and building the processor is not charged to a document
+        try:
+            ready = self.connection.poll(startup_timeout) and self.connection.recv()[0] == 'ready'
+        except EOFError:
+            ready = False
+        if not ready:
+            self.kill()
+            raise ExtractionKilled(f"Extraction process did not start within {startup_timeout}s")
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.connection.close()
+
+
+class SupervisedExtractor:
+    """
+    Runs PDFProcessor.extract_invoice_data in supervised child processes
+
+    Each document gets a wall-clock budget, and each extraction stage the
+    processor reports ('text', 'roi', 'ocr', 'classify', 'extract',
+    'validate') may get its own. A process that overruns, exceeds its
+    address-space limit (RLIMIT_AS) or whose document is cancelled is
+    killed together with its OCR subprocesses and replaced, so the time
+    spent on a document is bounded by configuration rather than by the
+    input. Processes are reused between documents.
+    """
+
+    def __init__(self, factory: Callable, timeout: Optional[float] = 300.0,
+                 stage_timeouts: Optional[Dict[str, float]] = None, memory_limit_mb: Optional[int] = None,
+                 start_method: Optional[str] = None, poll_interval: float = 0.1,
+                 startup_timeout: float = 120.0):
+        """
+        Args:
+            factory: Picklable callable returning a PDFProcessor, run in each process
+            timeout: Seconds allowed per document, None for no limit
+            stage_timeouts: Optional stage name -> seconds allowed for that stage
+            memory_limit_mb: Optional address-space limit of each process
+            start_method: multiprocessing start method (default: forkserver where available)
+            poll_interval: Seconds between cancellation checks
+            startup_timeout: Seconds a new process may take to build its processor
+        """
+        self.logger = logging.getLogger(__name__)
+        self.factory = factory
+        self.timeout = timeout
+        self.stage_timeouts = dict(stage_timeouts or {})
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(start_method)
+        self.poll_interval = poll_interval
+        self.startup_timeout = startup_timeout
+        self._lock = threading.Lock()
+        self._idle: List[_ExtractionProcess] = []
+
+    @classmethod
+    def from_config(cls, config: Dict, factory: Callable) -> Optional['SupervisedExtractor']:
+        """
+        Create the extractor configured under 'supervisor'
+
+        Args:
+            config: Processor configuration
+            factory: Picklable callable returning a PDFProcessor
+
+        Returns:
+            SupervisedExtractor, or None if supervision is disabled
+        """
+        settings = config.get('supervisor') or {}
+        if not settings.get('enabled', False):
+            return None
+        return cls(
+            factory,
+            timeout=settings.get('document_timeout', 300.0),
+            stage_timeouts=settings.get('stage_timeouts'),
+            memory_limit_mb=settings.get('memory_limit_mb'),
+            start_method=settings.get('start_method'),
+            startup_timeout=settings.get('startup_timeout', 120.0)
+        )
+
+    def _acquire(self) -> _ExtractionProcess:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _ExtractionProcess(self._context, self.factory, self.memory_limit, self.startup_timeout)
+
+    def _release(self, process: _ExtractionProcess) -> None:
+        with self._lock:
+            self._idle.append(process)
+
+    def extract(self, file_path: Union[str, Path], metadata: Optional[Dict] = None,
+                cancel: Optional[threading.Event] = None) -> Union[Dict, List[Dict]]:
+        """
+        Extract a document in a supervised process
+
+        Args:
+            file_path: Path to PDF file
+            metadata: Optional metadata passed to the processor
+            cancel: Optional event; setting it stops the extraction
+
+        Returns:
+            Result of PDFProcessor.extract_invoice_data, or the list of
+            PDFProcessor.extract_invoices if the processor splits files
+
+        Raises:
+            ExtractionCancelled: If cancel was set
+            ExtractionTimeout: If the document or a stage ran out of time
+            ExtractionMemoryError: If the process exceeded its memory limit
+            ExtractionKilled: If the process died
+        """
+        document_id = str(file_path)
+        if cancel is not None and cancel.is_set():
+            raise ExtractionCancelled(f"Extraction of {document_id} was cancelled", document_id)
+        process = self._acquire()
+        started = time.monotonic()
+        stage, stage_started = None, started
+        try:
+            process.connection.send((str(file_path), metadata))
+            while True:
+                now = time.monotonic()
+                if cancel is not None and cancel.is_set():
+                    raise ExtractionCancelled(f"Extraction of {document_id} was cancelled", document_id, stage)
+                deadlines = []
+                if self.timeout is not None:
+                    if now >= started + self.timeout:
+                        raise ExtractionTimeout(
+                            f"Extraction of {document_id} exceeded {self.timeout}s", document_id, stage
+                        )
+                    deadlines.append(started + self.timeout)
+                stage_timeout = self.stage_timeouts.get(stage)
+                if stage_timeout is not None:
+                    if now >= stage_started + stage_timeout:
+                        raise ExtractionTimeout(
+                            f"Stage '{stage}' of {document_id} exceeded {stage_timeout}s", document_id, stage
+                        )
+                    deadlines.append(stage_started + stage_timeout)
+                wait = min([self.poll_interval] + [deadline - now for deadline in deadlines])
+                if not process.connection.poll(max(wait, 0)):
+                    continue
+                try:
+                    kind, value = process.connection.recv()
+                except EOFError:
+                    raise self._died(process, document_id, stage)
+                if kind == 'stage':
+                    stage, stage_started = value, time.monotonic()
+                elif kind == 'memory':
+                    raise ExtractionMemoryError(
+                        f"Extraction of {document_id} exceeded the memory limit: {value}", document_id, stage
+                    )
+                else:
+                    self._release(process)
+                    process = None
+                    if kind == 'error':
+                        raise value
+                    return value
+        except ExtractionKilled as e:
+            if process is not None:
+                process.kill()
+            self.logger.error(f"Stopped extraction of {document_id} in stage {e.stage}: {e.message}")
+            raise
+        except BaseException:
+            if process is not None:
+                process.kill()
+            raise
+
+    def _died(self, process: _ExtractionProcess, document_id: str, stage: Optional[str]) -> ExtractionKilled:
+        process.process.join(1)
+        exitcode = process.process.exitcode
+        if exitcode == -getattr(signal, 'SIGKILL', 9):
+            # Most likely the kernel's OOM killer
+            return ExtractionMemoryError(
+                f"Extraction process of {document_id} was killed", document_id, stage
+            )
+        return ExtractionKilled(
+            f"Extraction process of {document_id} died with exit code {exitcode}", document_id, stage
+        )
+
+    def extract_invoice_data(self, file_path: Union[str, Path], metadata: Optional[Dict] = None) -> Dict:
+        """Same as extract(), so the extractor can stand in for a PDFProcessor"""
+        return self.extract(file_path, metadata)
+
+    def close(self) -> None:
+        """Stop the idle processes"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for process in idle:
+            process.close()
+
+
+__all__ = ['SupervisedExtractor']
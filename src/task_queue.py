@@ -0,0 +1,572 @@
+import json
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from .exceptions import (
+    ConfigurationError,
+    DuplicateDocumentError,
+    ExtractionMemoryError,
+    ExtractionTimeout,
+    ProcessingError,
+    ValidationError
+)
+from .intent_log import atomic_move
+from .scheduler import PRIORITY_CLASSES
+
+# Task states: waiting (possibly delayed), leased by a worker, finished, given up
+TASK_STATES = ('queued', 'running', 'done', 'dead')
+
+DEFAULT_QUEUE = 'documents'
+
+
+class Task:
+    """A unit of work leased from a broker"""
+
+    def __init__(self, task_id: str, queue: str, task_type: str, payload: Dict, group: Optional[str] = None,
+                 status: str = 'queued', attempts: int = 0, max_attempts: int = 5, lease: Optional[str] = None,
+                 result=None, error: Optional[str] = None):
+        self.id = task_id
+        self.queue = queue
+        self.type = task_type
+        self.payload = payload
+        self.group = group
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.result = result
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"Task({self.id!r}, {self.type!r}, status={self.status!r}, attempts={self.attempts})"
+
+
+class Broker:
+    """
+    Interface of the task brokers
+
+    A reserved task stays invisible to other workers until its visibility
+    timeout expires; a worker that dies without acknowledging it thereby
+    hands it back to the queue. Every call that finishes a lease takes the
+    task as reserved and returns False if the lease was lost meanwhile, in
+    which case another worker owns the task.
+    """
+
+    def enqueue(self, task_type: str, payload: Dict, queue: str = DEFAULT_QUEUE, group: Optional[str] = None,
+                max_attempts: int = 5, delay: float = 0, priority: int = 0) -> str:
+        """
+        Add a task
+
+        Args:
+            task_type: Name of the handler that runs the task
+            payload: JSON-serialisable task arguments
+            queue: Queue name
+            group: Optional id of the job the task belongs to
+            max_attempts: Attempts before the task is dead-lettered
+            delay: Seconds before the task becomes available
+            priority: Tasks with lower values are reserved first
+
+        Returns:
+            Task id
+        """
+        raise NotImplementedError
+
+    def reserve(self, queue: str = DEFAULT_QUEUE, visibility_timeout: float = 300) -> Optional[Task]:
+        """Lease the next available task of a queue, or return None"""
+        raise NotImplementedError
+
+    def extend(self, task: Task, visibility_timeout: float) -> bool:
+        """Push back the expiry of a lease"""
+        raise NotImplementedError
+
+    def ack(self, task: Task, result=None) -> bool:
+        """Mark a task as done, storing its JSON-serialisable result"""
+        raise NotImplementedError
+
+    def retry(self, task: Task, error: str, delay: float) -> bool:
+        """Return a task to its queue after a failed attempt"""
+        raise NotImplementedError
+
+    def dead_letter(self, task: Task, error: str) -> bool:
+        """Give up on a task"""
+        raise NotImplementedError
+
+    def tasks(self, group: str) -> List[Task]:
+        """Tasks of a job, in the order they were added"""
+        raise NotImplementedError
+
+    def counts(self, queue: str = DEFAULT_QUEUE) -> Dict[str, int]:
+        """Number of tasks of a queue by state"""
+        raise NotImplementedError
+
+    def cancel(self, group: str) -> List[Task]:
+        """Dead-letter the queued tasks of a job; running tasks are not affected"""
+        raise NotImplementedError
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['Broker']:
+        """
+        Create the broker configured under 'task_queue'
+
+        Args:
+            config: Processor configuration
+
+        Returns:
+            Broker, or None if the queue is disabled
+        """
+        settings = config.get('task_queue') or {}
+        if not settings.get('enabled', False):
+            return None
+        broker = settings.get('broker', 'sqlite')
+        if broker != 'sqlite':
+            raise ConfigurationError(f"Unknown task broker '{broker}'")
+        return SQLiteBroker(Path(settings.get('db_path', 'data/queue/tasks.sqlite3')))
+
+
+class SQLiteBroker(Broker):
+    """
+    Reference broker keeping tasks in a SQLite database
+
+    Workers on one host, or on hosts sharing a filesystem with working
+    locks, coordinate through the database: a task is leased inside an
+    IMMEDIATE transaction, so exactly one worker gets it. Needs no
+    service, which makes it the broker for tests and single-host setups.
+    """
+
+    def __init__(self, db_path: Path, busy_timeout: float = 30.0):
+        """
+        Open or create a task database
+
+        Args:
+            db_path: Path to the SQLite database file
+            busy_timeout: Seconds to wait for other processes' transactions
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Transactions are managed explicitly (isolation_level=None)
+        self._connection = sqlite3.connect(str(self.db_path), timeout=busy_timeout,
+                                           check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                queue TEXT,
+                type TEXT,
+                grp TEXT,
+                payload TEXT,
+                status TEXT,
+                attempts INTEGER,
+                max_attempts INTEGER,
+                available_at REAL,
+                lease TEXT,
+                result TEXT,
+                error TEXT,
+                created REAL,
+                priority INTEGER DEFAULT 0
+            )
+            """
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(tasks)")}
+        if 'priority' not in columns:
+            self._connection.execute("ALTER TABLE tasks ADD COLUMN priority INTEGER DEFAULT 0")
+            self._connection.execute("DROP INDEX IF EXISTS tasks_available")
+        # available_at is when a queued task may run, or when a lease expires
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (queue, priority, available_at) "
+            "WHERE status IN ('queued', 'running')"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS tasks_group ON tasks (grp)")
+
+    def enqueue(self, task_type: str, payload: Dict, queue: str = DEFAULT_QUEUE, group: Optional[str] = None,
+                max_attempts: int = 5, delay: float = 0, priority: int = 0) -> str:
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO tasks (id, queue, type, grp, payload, status, attempts, max_attempts, "
+                "available_at, created, priority) VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)",
+                (task_id, queue, task_type, group, json.dumps(payload, default=str), max_attempts, now + delay, now,
+                 priority)
+            )
+        return task_id
+
+    def reserve(self, queue: str = DEFAULT_QUEUE, visibility_timeout: float = 300) -> Optional[Task]:
+        now = time.time()
+        lease = uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT id FROM tasks WHERE queue = ? AND status IN ('queued', 'running') "
+                    "AND available_at <= ? ORDER BY priority, available_at LIMIT 1",
+                    (queue, now)
+                ).fetchone()
+                if row is None:
+                    self._connection.execute("COMMIT")
+                    return None
+                # A running task found here lost its worker; leasing it again counts as an attempt
+                self._connection.execute(
+                    "UPDATE tasks SET status = 'running', attempts = attempts + 1, lease = ?, available_at = ? "
+                    "WHERE id = ?",
+                    (lease, now + visibility_timeout, row[0])
+                )
+                task = self._task(row[0])
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return task
+
+    def _task(self, task_id: str) -> Task:
+        return self._from_row(self._connection.execute(
+            "SELECT id, queue, type, payload, grp, status, attempts, max_attempts, lease, result, error "
+            "FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone())
+
+    @staticmethod
+    def _from_row(row: Tuple) -> Task:
+        task_id, queue, task_type, payload, group, status, attempts, max_attempts, lease, result, error = row
+        return Task(task_id, queue, task_type, json.loads(payload), group, status, attempts, max_attempts,
+                    lease, json.loads(result) if result is not None else None, error)
+
+    def _finish(self, task: Task, assignments: str, parameters: Tuple) -> bool:
+        with self._lock:
+            cursor = self._connection.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = ? AND lease = ? AND status = 'running'",
+                parameters + (task.id, task.lease)
+            )
+        if cursor.rowcount != 1:
+            self.logger.warning(f"Lease of task {task.id} was lost")
+            return False
+        return True
+
+    def extend(self, task: Task, visibility_timeout: float) -> bool:
+        return self._finish(task, "available_at = ?", (time.time() + visibility_timeout,))
+
+    def ack(self, task: Task, result=None) -> bool:
+        return self._finish(task, "status = 'done', lease = NULL, result = ?",
+                            (json.dumps(result, default=str),))
+
+    def retry(self, task: Task, error: str, delay: float) -> bool:
+        return self._finish(task, "status = 'queued', lease = NULL, error = ?, available_at = ?",
+                            (error, time.time() + delay))
+
+    def dead_letter(self, task: Task, error: str) -> bool:
+        return self._finish(task, "status = 'dead', lease = NULL, error = ?", (error,))
+
+    def tasks(self, group: str) -> List[Task]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, queue, type, payload, grp, status, attempts, max_attempts, lease, result, error "
+                "FROM tasks WHERE grp = ? ORDER BY rowid", (group,)
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def counts(self, queue: str = DEFAULT_QUEUE) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE queue = ? GROUP BY status", (queue,)
+            ).fetchall()
+        counts = dict.fromkeys(TASK_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def cancel(self, group: str) -> List[Task]:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT id, queue, type, payload, grp, status, attempts, max_attempts, lease, result, error "
+                    "FROM tasks WHERE grp = ? AND status = 'queued' ORDER BY rowid", (group,)
+                ).fetchall()
+                self._connection.execute(
+                    "UPDATE tasks SET status = 'dead', error = 'Cancelled' WHERE grp = ? AND status = 'queued'",
+                    (group,)
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return [self._from_row(row) for row in rows]
+
+    def purge(self, older_than: float) -> int:
+        """
+        Delete finished tasks
+
+        Args:
+            older_than: Age in seconds of the oldest finished tasks kept
+
+        Returns:
+            Number of tasks deleted
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM tasks WHERE status IN ('done', 'dead') AND created < ?", (time.time() - older_than,)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        with self._lock:
+            self._connection.close()
+
+
+def spool_file(file_path: Path, spool_dir: Path) -> Path:
+    """
+    Move a file into the spool directory shared by the workers
+
+    Each file gets its own subdirectory, so it keeps its name.
+
+    Args:
+        file_path: File to hand over
+        spool_dir: Spool directory, on storage all workers can reach
+
+    Returns:
+        Path of the spooled file
+    """
+    destination = Path(spool_dir) / uuid.uuid4().hex / Path(file_path).name
+    destination.parent.mkdir(parents=True)
+    atomic_move(Path(file_path), destination)
+    return destination
+
+
+def release_spooled(file_path: Path, spool_dir: Path) -> None:
+    """Remove a spooled file, if still there, and its subdirectory"""
+    file_path = Path(file_path)
+    file_path.unlink(missing_ok=True)
+    if file_path.parent.parent == Path(spool_dir):
+        try:
+            file_path.parent.rmdir()
+        except OSError:
+            pass
+
+
+def enqueue_document(broker: Broker, config: Dict, file_path: Path, metadata: Optional[Dict] = None,
+                     task_type: str = 'process_document', group: Optional[str] = None,
+                     priority: str = 'bulk') -> str:
+    """
+    Spool a document and add a task for it, as configured under 'task_queue'
+
+    Args:
+        broker: Broker to add the task to
+        config: Processor configuration
+        file_path: Document, moved into the spool directory
+        metadata: Optional metadata from email or other sources
+        task_type: 'process_document' or 'extract_invoice'
+        group: Optional id of the job the task belongs to
+        priority: One of PRIORITY_CLASSES
+
+    Returns:
+        Task id
+    """
+    if priority not in PRIORITY_CLASSES:
+        raise ProcessingError(f"Unknown priority class '{priority}'")
+    settings = config.get('task_queue') or {}
+    spooled = spool_file(file_path, Path(settings.get('spool_directory', 'data/queue/spool')))
+    return broker.enqueue(
+        task_type,
+        {'file_path': str(spooled), 'file_name': Path(file_path).name, 'metadata': metadata},
+        queue=settings.get('queue', DEFAULT_QUEUE),
+        group=group,
+        max_attempts=settings.get('max_attempts', 5),
+        priority=PRIORITY_CLASSES.index(priority)
+    )
+
+
+class Worker:
+    """
+    Runs the tasks of a queue
+
+    Each task is leased for visibility_timeout seconds and the lease is
+    renewed while its handler runs. A failed task is retried with
+    exponential backoff until max_attempts; errors in permanent_errors
+    are not retried. A task that exhausts its attempts is dead-lettered
+    and passed to on_dead_letter.
+    """
+
+    def __init__(self, broker: Broker, handlers: Dict[str, Callable[[Dict], object]],
+                 queue: str = DEFAULT_QUEUE, visibility_timeout: float = 300, poll_interval: float = 1.0,
+                 backoff_base: float = 5.0, backoff_max: float = 600.0,
+                 permanent_errors: Tuple[Type[BaseException], ...] = (ValidationError, DuplicateDocumentError,
+                                                                      ExtractionTimeout, ExtractionMemoryError),
+                 on_dead_letter: Optional[Callable[[Task, str], None]] = None):
+        """
+        Args:
+            broker: Broker to take tasks from
+            handlers: Task type -> callable taking the payload and returning the result
+            queue: Queue to work on
+            visibility_timeout: Seconds a lease lasts without renewal
+            poll_interval: Seconds to wait when the queue is empty
+            backoff_base: Delay before the first retry
+            backoff_max: Longest delay before a retry
+            permanent_errors: Exceptions that dead-letter a task at once
+            on_dead_letter: Called with a task and its error once it is dead-lettered
+        """
+        self.logger = logging.getLogger(__name__)
+        self.broker = broker
+        self.handlers = handlers
+        self.queue = queue
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.permanent_errors = permanent_errors
+        self.on_dead_letter = on_dead_letter
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: Dict, broker: Broker, handlers: Dict[str, Callable[[Dict], object]],
+                    on_dead_letter: Optional[Callable[[Task, str], None]] = None) -> 'Worker':
+        """Create a worker configured under 'task_queue'"""
+        settings = config.get('task_queue') or {}
+        return cls(
+            broker,
+            handlers,
+            queue=settings.get('queue', DEFAULT_QUEUE),
+            visibility_timeout=settings.get('visibility_timeout', 300),
+            poll_interval=settings.get('poll_interval', 1.0),
+            backoff_base=settings.get('backoff_base', 5.0),
+            backoff_max=settings.get('backoff_max', 600.0),
+            on_dead_letter=on_dead_letter
+        )
+
+    def backoff(self, attempts: int) -> float:
+        """Delay before retrying a task that failed attempts times, with jitter"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def run_once(self) -> bool:
+        """
+        Run the next available task
+
+        Returns:
+            False if the queue had no available task
+        """
+        task = self.broker.reserve(self.queue, self.visibility_timeout)
+        if task is None:
+            return False
+        if task.attempts > task.max_attempts:
+            # Earlier attempts never finished, e.g. the task kills its worker
+            self._dead_letter(task, task.error or f"Lease expired {task.max_attempts} times")
+            return True
+        handler = self.handlers.get(task.type)
+        if handler is None:
+            self._dead_letter(task, f"No handler for task type '{task.type}'")
+            return True
+
+        heartbeat = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(task, heartbeat), daemon=True)
+        renewer.start()
+        try:
+            result = handler(task.payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            heartbeat.set()
+            renewer.join()
+            if isinstance(e, self.permanent_errors) or task.attempts >= task.max_attempts:
+                self._dead_letter(task, error)
+            else:
+                delay = self.backoff(task.attempts)
+                self.logger.warning(f"Task {task.id} failed (attempt {task.attempts}), retrying in {delay:.0f}s: {error}")
+                self.broker.retry(task, error, delay)
+            return True
+        heartbeat.set()
+        renewer.join()
+        self.broker.ack(task, result)
+        return True
+
+    def _renew(self, task: Task, done: threading.Event) -> None:
+        while not done.wait(self.visibility_timeout / 3):
+            if not self.broker.extend(task, self.visibility_timeout):
+                return
+
+    def _dead_letter(self, task: Task, error: str) -> None:
+        self.logger.error(f"Task {task.id} dead-lettered after {task.attempts} attempt(s): {error}")
+        if self.broker.dead_letter(task, error) and self.on_dead_letter is not None:
+            try:
+                self.on_dead_letter(task, error)
+            except Exception as e:
+                self.logger.error(f"Dead-letter handling of task {task.id} failed: {str(e)}")
+
+    def run(self, max_tasks: Optional[int] = None) -> int:
+        """
+        Run tasks until stop() is called
+
+        Args:
+            max_tasks: Optional number of tasks after which to return
+
+        Returns:
+            Number of tasks run
+        """
+        count = 0
+        self._stop.clear()
+        while not self._stop.is_set() and (max_tasks is None or count < max_tasks):
+            if self.run_once():
+                count += 1
+            else:
+                self._stop.wait(self.poll_interval)
+        return count
+
+    def stop(self) -> None:
+        """Make run() return after the current task"""
+        self._stop.set()
+
+
+def document_handlers(processor, spool_dir: Path, pdf_processor=None) -> Dict[str, Callable[[Dict], object]]:
+    """
+    Task handlers running the extraction pipeline
+
+    'process_document' files a spooled document with DocumentProcessor;
+    'extract_invoice' extracts the fields of a spooled API upload.
+    Failures leave the file in the spool for the next attempt.
+
+    Args:
+        processor: DocumentProcessor
+        spool_dir: Spool directory the tasks' files are in
+        pdf_processor: PDFProcessor (or SupervisedExtractor) for 'extract_invoice' tasks
+
+    Returns:
+        Task type -> handler
+    """
+    def process_document(payload: Dict) -> Dict:
+        file_path = Path(payload['file_path'])
+        result = processor.process_document(file_path, payload.get('metadata'), handle_errors=False)
+        release_spooled(file_path, spool_dir)
+        return result
+
+    def extract_invoice(payload: Dict) -> Dict:
+        if pdf_processor is None:
+            raise ProcessingError("Worker has no PDF processor for invoice extraction")
+        file_path = Path(payload['file_path'])
+        if getattr(pdf_processor, 'splitter', None) is not None:
+            # One result per invoice when the file holds several
+            result = pdf_processor.extract_invoices(str(file_path))
+        else:
+            result = pdf_processor.extract_invoice_data(str(file_path))
+        release_spooled(file_path, spool_dir)
+        return result
+
+    return {'process_document': process_document, 'extract_invoice': extract_invoice}
+
+
+def document_dead_letter(processor, spool_dir: Path) -> Callable[[Task, str], None]:
+    """Dead-letter handler moving a task's file to the error directory"""
+    def dead_letter(task: Task, error: str) -> None:
+        file_path = Path(task.payload.get('file_path', ''))
+        processor.reject_document(file_path, error)
+        release_spooled(file_path, spool_dir)
+
+    return dead_letter
+
+
+__all__ = ['DEFAULT_QUEUE', 'TASK_STATES', 'Broker', 'SQLiteBroker', 'Task', 'Worker', 'document_dead_letter',
+           'document_handlers', 'enqueue_document', 'release_spooled', 'spool_file']
@@ -1,19 +1,99 @@
 from pathlib import Path
+from typing import List, Optional, Tuple, Union
 import PyPDF2
 
+from .ocr import OCREngine, OCRProfile, frame_count, get_default_engine, get_profile, is_image, iter_frames
+
 class TextExtractor:
-    def extract(self, file_path: Path) -> str:
-        """Extract text content from a document"""
+    def __init__(self, ocr_engine: Optional[OCREngine] = None, ocr_profile: Union[str, OCRProfile, None] = None):
+        """
+        Args:
+            ocr_engine: Optional engine for image documents (default: shared pool)
+            ocr_profile: Optional OCR profile or profile name for image documents
+        """
+        self.ocr_engine = ocr_engine
+        self.ocr_profile = get_profile(ocr_profile)
+
+    def extract(self, file_path: Path, max_pages: Optional[int] = None,
+                max_chars: Optional[int] = None) -> str:
+        """
+        Extract text content from a document
+        
+        Args:
+            file_path: Path to document file
+            max_pages: Optional maximum number of pages to read
+            max_chars: Optional number of characters to return at most
+            
+        Returns:
+            Extracted text, truncated to the given bounds
+        """
+        text, _ = self.extract_head(file_path, max_pages, max_chars)
+        return text
+
+    def extract_head(self, file_path: Path, max_pages: Optional[int] = None,
+                     max_chars: Optional[int] = None) -> Tuple[str, bool]:
+        """
+        Extract the leading part of a document
+        
+        Args:
+            file_path: Path to document file
+            max_pages: Optional maximum number of pages to read
+            max_chars: Optional number of characters to return at most
+            
+        Returns:
+            Tuple of (extracted text, whether the document was truncated)
+        """
+        pages, truncated = self.extract_pages(file_path, max_pages=max_pages, max_chars=max_chars)
+        text = ''.join(pages)
+        if max_chars is not None and len(text) > max_chars:
+            text = text[:max_chars]
+            truncated = True
+        return text, truncated
+
+    def extract_pages(self, file_path: Path, first_page: int = 0, max_pages: Optional[int] = None,
+                      max_chars: Optional[int] = None) -> Tuple[List[str], bool]:
+        """
+        Extract text page by page, stopping once a bound is reached
+
+        Pages are returned whole, so reading can continue from
+        first_page=len(pages) when more text is needed.
+        
+        Args:
+            file_path: Path to document file
+            first_page: Zero-based index of the first page to read
+            max_pages: Optional maximum number of pages to read
+            max_chars: Optional number of characters after which reading stops
+            
+        Returns:
+            Tuple of (list of page texts, whether pages were left unread)
+        """
         if file_path.suffix.lower() == '.pdf':
-            return self._extract_from_pdf(file_path)
+            return self._extract_from_pdf(file_path, first_page, max_pages, max_chars)
+        elif is_image(file_path):
+            return self._extract_from_image(file_path, first_page, max_pages, max_chars)
         else:
             raise ValueError(f"Unsupported file type: {file_path.suffix}")
 
-    def _extract_from_pdf(self, file_path: Path) -> str:
+    def _extract_from_pdf(self, file_path: Path, first_page: int = 0, max_pages: Optional[int] = None,
+                          max_chars: Optional[int] = None) -> Tuple[List[str], bool]:
         """Extract text from PDF file"""
+        pages: List[str] = []
+        char_count = 0
         with open(file_path, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-        return text
+            for index in range(first_page, len(reader.pages)):
+                if ((max_pages is not None and len(pages) >= max_pages) or
+                        (max_chars is not None and char_count >= max_chars)):
+                    return pages, True
+                page_text = reader.pages[index].extract_text()
+                pages.append(page_text)
+                char_count += len(page_text)
+        return pages, False
+
+    def _extract_from_image(self, file_path: Path, first_page: int = 0, max_pages: Optional[int] = None,
+                            max_chars: Optional[int] = None) -> Tuple[List[str], bool]:
+        """OCR an image file, decoding its pages one at a time"""
+        engine = self.ocr_engine or get_default_engine()
+        frames = iter_frames(file_path, self.ocr_profile, first_page, max_pages)
+        pages = [text + "\n" for text in engine.recognize_stream(frames, self.ocr_profile)]
+        return pages, first_page + len(pages) < frame_count(file_path)
@@ -1,8 +1,20 @@
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from decimal import Decimal, InvalidOperation
-from datetime import datetime
 import re
 
+import numpy as np
+import pandas as pd
+
+from ..normalization import parse_amount, parse_amounts, parse_date, parse_dates
+
+INVOICE_NUMBER_PATTERN = r'^[\w\-/]+$'
+LINE_ITEM_FIELDS = ['description', 'quantity', 'unit_price', 'total']
+LINE_ITEM_TOLERANCE = Decimal('0.005')
+TOTAL_AMOUNT_TOLERANCE = Decimal('0.01')
+
+ColumnResult = Tuple[List[Any], List[Optional[str]]]
+
+
 class InvoiceValidator:
     """Validates extracted invoice data"""
     
@@ -13,6 +25,12 @@ class InvoiceValidator:
             'total_amount': self._validate_amount,
             'line_items': self._validate_line_items
         }
+        # Column-wise counterparts of the scalar field rules used by validate_batch
+        self.column_rules = {
+            'invoice_number': self._validate_invoice_number_column,
+            'date': self._validate_date_column,
+            'total_amount': self._validate_amount_column
+        }
     
     def validate(self, invoice_data: Dict) -> Dict:
         """
@@ -34,13 +52,10 @@ class InvoiceValidator:
         # First pass: validate and clean individual fields
         for field, value in invoice_data.items():
             if field in self.validation_rules:
-                try:
-                    cleaned_value = self.validation_rules[field](value)
-                    validation_results['cleaned_data'][field] = cleaned_value
-                except ValueError as e:
-                    # For missing or invalid fields, add a warning instead of failing
-                    validation_results['warnings'].append(f"{field}: {str(e)}")
-                    validation_results['cleaned_data'][field] = value
+                cleaned_value, warning = self._apply_rule(field, value)
+                validation_results['cleaned_data'][field] = cleaned_value
+                if warning:
+                    validation_results['warnings'].append(warning)
             else:
                 # Copy non-validated fields as-is
                 validation_results['cleaned_data'][field] = value
@@ -56,12 +71,134 @@ class InvoiceValidator:
         
         return validation_results
     
+    def validate_batch(self, invoices: pd.DataFrame) -> List[Dict]:
+        """
+        Validate a batch of invoices given as columns
+        
+        Invoice numbers, dates and amounts are validated a column at a
+        time, parsing each distinct value once; line items and the amount
+        cross-check run per record. Results are identical to calling
+        validate() on every row; missing cells (NaN) count as absent fields.
+        
+        Args:
+            invoices: DataFrame with one row per invoice and one column per field
+            
+        Returns:
+            List of validation results, one per row, as returned by validate()
+        """
+        columns = list(invoices.columns)
+        cleaned: List[List[Any]] = []
+        warnings: List[List[Optional[str]]] = []
+        absent: List[np.ndarray] = []
+        for field in columns:
+            series = invoices[field].astype(object)
+            missing = self._absent_cells(series)
+            column_cleaned, column_warnings = series.tolist(), [None] * len(series)
+            if field in self.column_rules:
+                # Only present cells are validated; absent ones are dropped below
+                rows = np.flatnonzero(~missing)
+                field_cleaned, field_warnings = self.column_rules[field](series.iloc[rows])
+                for row, value, warning in zip(rows, field_cleaned, field_warnings):
+                    column_cleaned[row], column_warnings[row] = value, warning
+            absent.append(missing)
+            cleaned.append(column_cleaned)
+            warnings.append(column_warnings)
+        
+        results = []
+        for row in range(len(invoices)):
+            validation_results = {
+                'is_valid': True,
+                'errors': [],
+                'warnings': [],
+                'cleaned_data': {}
+            }
+            for field, column_cleaned, column_warnings, missing in zip(columns, cleaned, warnings, absent):
+                if missing[row]:
+                    continue
+                value, warning = column_cleaned[row], column_warnings[row]
+                if field in self.validation_rules and field not in self.column_rules:
+                    value, warning = self._apply_rule(field, value)
+                validation_results['cleaned_data'][field] = value
+                if warning:
+                    validation_results['warnings'].append(warning)
+            
+            try:
+                self._validate_amounts(validation_results['cleaned_data'], validation_results)
+            except ValueError as e:
+                validation_results['warnings'].append(str(e))
+            
+            validation_results['is_valid'] = len(validation_results['errors']) == 0
+            results.append(validation_results)
+        
+        return results
+    
+    def _apply_rule(self, field: str, value: Any) -> Tuple[Any, Optional[str]]:
+        """Apply one field rule, returning the cleaned value and an optional warning"""
+        try:
+            return self.validation_rules[field](value), None
+        except ValueError as e:
+            # For missing or invalid fields, add a warning instead of failing
+            return value, f"{field}: {str(e)}"
+    
+    @staticmethod
+    def _absent_cells(series: pd.Series) -> np.ndarray:
+        """Cells holding NaN; explicit None values count as present"""
+        absent = series.isna().to_numpy(copy=True)
+        if absent.any():
+            absent[absent] = [value is not None for value in series[absent]]
+        return absent
+    
+    def _validate_text_column(self, field: str, values: pd.Series,
+                              parse: Callable[[pd.Series], List[Any]],
+                              required_message: str, invalid_message: str) -> ColumnResult:
+        """Validate the string cells of a column at once; other cells use the scalar rule"""
+        is_text = values.map(type).eq(str).to_numpy()
+        text = values[is_text]
+        parsed = parse(text) if len(text) else []
+        
+        cleaned = values.tolist()
+        warnings: List[Optional[str]] = [None] * len(cleaned)
+        for row, value, parsed_value in zip(np.flatnonzero(is_text), text, parsed):
+            if not value:
+                warnings[row] = f"{field}: {required_message}"
+            elif parsed_value is None:
+                warnings[row] = f"{field}: {invalid_message}"
+            else:
+                cleaned[row] = parsed_value
+        for row in np.flatnonzero(~is_text):
+            cleaned[row], warnings[row] = self._apply_rule(field, cleaned[row])
+        return cleaned, warnings
+    
+    def _validate_invoice_number_column(self, values: pd.Series) -> ColumnResult:
+        """Column-wise _validate_invoice_number"""
+        def match(text: pd.Series) -> List[Optional[str]]:
+            matched = text.str.match(INVOICE_NUMBER_PATTERN)
+            return [value if is_match else None for value, is_match in zip(text, matched)]
+        return self._validate_text_column(
+            'invoice_number', values, match,
+            "Invoice number is required", "Invalid invoice number format"
+        )
+    
+    def _validate_date_column(self, values: pd.Series) -> ColumnResult:
+        """Column-wise _validate_date"""
+        return self._validate_text_column(
+            'date', values, lambda text: parse_dates(text.tolist()),
+            "Date is required", "Invalid date"
+        )
+    
+    def _validate_amount_column(self, values: pd.Series) -> ColumnResult:
+        """Column-wise _validate_amount"""
+        return self._validate_text_column(
+            'total_amount', values, lambda text: parse_amounts(text.tolist()),
+            "Amount is required", "Invalid amount format"
+        )
+    
     def _validate_invoice_number(self, value: str) -> str:
         """Validate invoice number format"""
         if not value:
             raise ValueError("Invoice number is required")
         # Allow alphanumeric characters, dashes, and slashes
-        if not re.match(r'^[\w\-/]+$', value):
+        if not re.match(INVOICE_NUMBER_PATTERN, value):
             raise ValueError("Invalid invoice number format")
         return value
     
@@ -69,29 +206,21 @@ class InvoiceValidator:
         """Validate and standardize date format"""
         if not value:
             raise ValueError("Date is required")
-        try:
-            # Try multiple date formats
-            for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y']:
-                try:
-                    date_obj = datetime.strptime(value, fmt)
-                    return date_obj.strftime('%Y-%m-%d')
-                except ValueError:
-                    continue
-            raise ValueError("Invalid date format")
-        except Exception:
+        # Recognises %Y-%m-%d, %d/%m/%Y, %m/%d/%Y, %d-%m-%Y and %d.%m.%Y in one match
+        parsed = parse_date(value)
+        if parsed is None:
             raise ValueError("Invalid date")
+        return parsed
     
     def _validate_amount(self, value: str) -> Decimal:
         """Validate and standardize amount format"""
         if not value:
             raise ValueError("Amount is required")
-        try:
-            # Remove currency symbols and whitespace
-            cleaned = re.sub(r'[^\d.,\-]', '', value)
-            # Convert to Decimal
-            return Decimal(cleaned)
-        except (InvalidOperation, ValueError):
+        # Currency symbols, whitespace and thousands separators are dropped
+        amount = parse_amount(value)
+        if amount is None:
             raise ValueError("Invalid amount format")
+        return amount
     
     def _validate_line_items(self, items: List[Dict]) -> List[Dict]:
         """Validate line items with more lenient rules"""
@@ -102,8 +231,7 @@ class InvoiceValidator:
         for item in items:
             try:
                 # Ensure required fields exist
-                required_fields = ['description', 'quantity', 'unit_price', 'total']
-                missing_fields = [f for f in required_fields if f not in item]
+                missing_fields = [f for f in LINE_ITEM_FIELDS if f not in item]
                 if missing_fields:
                     raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
                 
@@ -115,7 +243,7 @@ class InvoiceValidator:
                 # Allow for small discrepancies (0.5% tolerance)
                 calculated_total = quantity * unit_price
                 difference = abs(calculated_total - total)
-                tolerance = total * Decimal('0.005')  # 0.5% tolerance
+                tolerance = total * LINE_ITEM_TOLERANCE  # 0.5% tolerance
                 
                 if difference > tolerance:
                     raise ValueError(
@@ -144,11 +272,11 @@ class InvoiceValidator:
             try:
                 line_items_total = sum(Decimal(str(item['total'])) for item in line_items)
                 difference = abs(total_amount - line_items_total)
-                tolerance = total_amount * Decimal('0.01')  # 1% tolerance
+                tolerance = total_amount * TOTAL_AMOUNT_TOLERANCE  # 1% tolerance
                 
                 if difference > tolerance:
                     results['warnings'].append(
                         f"Total amount ({total_amount}) differs from sum of line items ({line_items_total})"
                     )
-            except (TypeError, InvalidOperation):
+            except (KeyError, TypeError, InvalidOperation):
                 results['warnings'].append("Could not validate total amounts")
@@ -0,0 +1,270 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional, the directory is polled instead
+    FileSystemEventHandler = object
+    Observer = None
+
+# A directory modified more recently than this is listed again, since a
+# coarse timestamp may not change when another file arrives in the same tick
+_MTIME_GRANULARITY_NS = 2_000_000_000
+
+# Suffixes of partial downloads and editor/copy temporaries
+TEMPORARY_SUFFIXES = ('.part', '.partial', '.tmp', '.crdownload', '.download')
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forwards watchdog events of files to the watcher"""
+
+    def __init__(self, watcher: 'FolderWatcher'):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(Path(event.src_path))
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(Path(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(Path(event.dest_path))
+
+    def on_closed(self, event):
+        # inotify IN_CLOSE_WRITE: the writer is done with the file
+        if not event.is_directory:
+            self.watcher.notify(Path(event.src_path), closed=True)
+
+
+class FolderWatcher:
+    """
+    Long-running ingest of documents dropped into a folder
+
+    New files are detected through inotify (watchdog) when available, or
+    by polling the directory's modification time otherwise, which only
+    lists the directory after an entry was added. A file is handed to the
+    worker pool once its size and modification time have stayed the same
+    for settle_seconds, or once its writer closed it.
+    """
+
+    def __init__(self, directory: Path, process: Callable[[Path], Dict],
+                 extensions: Optional[Iterable[str]] = None, workers: int = 4,
+                 settle_seconds: float = 2.0, poll_interval: float = 0.5,
+                 use_inotify: bool = True):
+        """
+        Args:
+            directory: Folder to watch
+            process: Called with the path of each settled file, e.g.
+                DocumentProcessor.process_document
+            extensions: Optional accepted file extensions, e.g. ['.pdf']
+            workers: Number of files processed in parallel
+            settle_seconds: Time a file must stay unchanged before processing
+            poll_interval: Seconds between checks of pending files (and of
+                the directory when polling)
+            use_inotify: Use watchdog when it is installed
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.process = process
+        self.extensions = {ext.lower() for ext in extensions} if extensions else None
+        self.workers = workers
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and Observer is not None
+
+        self._lock = threading.Lock()
+        # path -> (size, mtime_ns, time the file was last seen changing)
+        self._pending: Dict[Path, Tuple[int, int, float]] = {}
+        self._in_progress: Set[Path] = set()
+        self._directory_mtime: Optional[int] = None
+        self._stop = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._observer = None
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: Dict, process: Callable[[Path], Dict],
+                    directory: Optional[Path] = None) -> 'FolderWatcher':
+        """
+        Create a watcher as configured under 'watch'
+
+        Args:
+            config: Processor configuration
+            process: Called with the path of each settled file
+            directory: Optional folder overriding 'watch.input_directory'
+
+        Returns:
+            FolderWatcher
+        """
+        settings = config.get('watch') or {}
+        return cls(
+            Path(directory or settings.get('input_directory', 'documents/incoming')),
+            process,
+            extensions=config.get('supported_extensions'),
+            workers=settings.get('workers', 4),
+            settle_seconds=settings.get('settle_seconds', 2.0),
+            poll_interval=settings.get('poll_interval', 0.5),
+            use_inotify=settings.get('use_inotify', True)
+        )
+
+    def _accepts(self, path: Path) -> bool:
+        name = path.name
+        if name.startswith('.') or name.lower().endswith(TEMPORARY_SUFFIXES):
+            return False
+        return self.extensions is None or path.suffix.lower() in self.extensions
+
+    def notify(self, path: Path, closed: bool = False) -> None:
+        """
+        Record that a file was created or changed
+
+        Args:
+            path: File path
+            closed: The writer closed the file, so it need not settle
+        """
+        if path.parent != self.directory or not self._accepts(path):
+            return
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if path in self._in_progress:
+                return
+            previous = self._pending.get(path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if closed:
+                # Due on the next check unless it is written to again
+                self._pending[path] = signature + (now - self.settle_seconds,)
+            elif previous is None or previous[:2] != signature:
+                self._pending[path] = signature + (now,)
+
+    def _scan_directory(self) -> None:
+        """List the directory if an entry was added or removed since the last listing"""
+        try:
+            mtime = self.directory.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._directory_mtime and time.time_ns() - mtime > _MTIME_GRANULARITY_NS:
+            return
+        self._directory_mtime = mtime
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and Path(entry.path) not in self._pending:
+                    self.notify(Path(entry.path))
+
+    def check_pending(self, now: Optional[float] = None) -> int:
+        """
+        Submit pending files that have settled
+
+        Args:
+            now: Optional monotonic time of the check
+
+        Returns:
+            Number of files submitted
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        with self._lock:
+            for path, (size, mtime_ns, changed_at) in list(self._pending.items()):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    del self._pending[path]
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                    self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                elif now - changed_at >= self.settle_seconds:
+                    del self._pending[path]
+                    self._in_progress.add(path)
+                    ready.append(path)
+        for path in ready:
+            self._executor.submit(self._process, path)
+        return len(ready)
+
+    def _process(self, path: Path) -> None:
+        try:
+            self.process(path)
+        except Exception as e:
+            self.logger.error(f"Failed to process {path}: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_progress.discard(path)
+                self._idle.notify_all()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            if self._observer is None:
+                self._scan_directory()
+            self.check_pending()
+
+    def start(self) -> None:
+        """Start watching in background threads"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest')
+        if self.use_inotify:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), str(self.directory), recursive=False)
+            self._observer.start()
+        # Files dropped while the service was down
+        self._directory_mtime = None
+        self._scan_directory()
+        self._thread = threading.Thread(target=self._run, name='ingest-watcher', daemon=True)
+        self._thread.start()
+        self.logger.info(
+            f"Watching {self.directory} ({'inotify' if self._observer else 'polling'}, {self.workers} workers)"
+        )
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until no file is pending or being processed
+
+        Returns:
+            True if idle, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending or self._in_progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Pending files settle without notification, so re-check periodically
+                self._idle.wait(min(self.poll_interval, remaining) if remaining is not None else self.poll_interval)
+        return True
+
+    def stop(self) -> None:
+        """Stop watching and wait for files being processed"""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def run_forever(self) -> None:
+        """Watch until interrupted"""
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.logger.info("Stopping watcher")
+        finally:
+            self.stop()
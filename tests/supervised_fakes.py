@@ -0,0 +1,50 @@
+"""Processor stand-ins for the supervised extraction tests
+
+Kept apart from the tests so extraction processes start without
+importing the API.
+"""
+import os
+import time
+from pathlib import Path
+
+from src.exceptions import ValidationError
+
+
+class FakeProcessor:
+    """Behaves according to the document content, or its name if it does not exist"""
+
+    on_stage = None
+
+    def extract_invoice_data(self, file_path, metadata=None):
+        path = Path(file_path)
+        name = path.read_text() if path.exists() else path.stem
+        self.on_stage('text')
+        if name == 'slow_ocr':
+            self.on_stage('ocr')
+            time.sleep(60)
+        if name == 'hang':
+            time.sleep(60)
+        if name == 'invalid':
+            raise ValidationError("Invalid invoice")
+        if name == 'huge':
+            return len(bytearray(2048 * 1024 * 1024))
+        if name == 'crash':
+            os._exit(3)
+        return {'invoice_number': name, 'pid': os.getpid(), 'metadata': metadata}
+
+
+def fake_processor():
+    return FakeProcessor()
+
+
+class FakeSplittingProcessor(FakeProcessor):
+    """Splits every document into two invoices"""
+
+    splitter = object()
+
+    def extract_invoices(self, file_path, metadata=None):
+        return [{**self.extract_invoice_data(file_path, metadata), 'pages': [page, page]} for page in (1, 2)]
+
+
+def fake_splitting_processor():
+    return FakeSplittingProcessor()
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import tempfile
+import shutil
+
+from fastapi.testclient import TestClient
+from reportlab.pdfgen import canvas
+
+from src.api import main as api
+
+from src.attachment_filter import AttachmentFilter
+from src.document_processor import DocumentProcessor
+from src.email_fetcher import MessagePart
+from src.exceptions import ValidationError
+from src.scheduler import ExtractionScheduler
+
+
+def part(file_name, content_type='application/pdf', size=40000, encoding='base64', disposition='attachment'):
+    return MessagePart('2', content_type, encoding, size, file_name, disposition)
+
+
+class TestAttachmentFilter(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.filter = AttachmentFilter(['.pdf', '.png'], max_size=100000, min_size=1024)
+        self.pdf = self.test_dir / "invoice.pdf"
+        pdf = canvas.Canvas(str(self.pdf))
+        pdf.drawString(100, 750, "INVOICE INV-1 Total: $100.00 " * 3)
+        pdf.showPage()
+        pdf.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_parts_checked_before_download(self):
+        self.assertIsNone(self.filter.check_part(part("invoice.pdf")))
+        self.assertIsNone(self.filter.check_part(part("invoice.pdf", 'application/octet-stream')))
+        self.assertEqual(self.filter.check_part(part("notes.docx")), 'extension')
+        self.assertEqual(self.filter.check_part(part("invoice.pdf", 'text/html')), 'mime_type')
+        self.assertEqual(self.filter.check_part(part("logo.png", 'image/png', disposition='inline')), 'inline_image')
+        # 1300 base64 bytes decode to 975 bytes
+        self.assertEqual(self.filter.check_part(part("invoice.pdf", size=1300)), 'too_small')
+        self.assertIsNone(self.filter.check_part(part("invoice.pdf", size=1300, encoding='7bit')))
+        self.assertEqual(self.filter.check_part(part("invoice.pdf", size=200000)), 'too_large')
+
+    def test_files_checked_before_extraction(self):
+        self.assertIsNone(self.filter.check_file(self.pdf))
+
+        truncated = self.test_dir / "truncated.pdf"
+        truncated.write_bytes(self.pdf.read_bytes()[:-200])
+        self.assertEqual(self.filter.check_file(truncated), 'pdf_structure')
+
+        mislabeled = self.test_dir / "scan.pdf"
+        mislabeled.write_bytes(b'\x89PNG\r\n\x1a\n' + b'\x00' * 2000)
+        self.assertIn(self.filter.check_file(mislabeled), ('content_type', 'pdf_structure'))
+
+        tiny = self.test_dir / "tiny.pdf"
+        tiny.write_bytes(b'%PDF-1.4\n%%EOF')
+        self.assertEqual(self.filter.check_file(tiny), 'too_small')
+
+        counts = self.filter.counts()
+        self.assertEqual(sum(counts.values()), 3)
+        self.assertEqual(counts['too_small'], 1)
+        self.assertIn('attachments_skipped_total{reason="too_small"} 1', self.filter.prometheus())
+
+    def test_processor_rejects_dropped_files(self):
+        config = {
+            "supported_extensions": [".pdf"],
+            "error_directory": str(self.test_dir / "errors"),
+            "processing_records_path": str(self.test_dir / "records"),
+            "max_file_size_mb": 10,
+            "attachment_filter": {"enabled": True}
+        }
+        processor = DocumentProcessor(config, base_dir=self.test_dir)
+        truncated = self.test_dir / "truncated.pdf"
+        truncated.write_bytes(self.pdf.read_bytes()[:-200])
+        with self.assertRaises(ValidationError):
+            processor.process_document(truncated)
+        self.assertFalse(truncated.exists())
+        self.assertEqual(processor.attachment_filter.counts()['pdf_structure'], 1)
+
+    def test_disabled_without_configuration(self):
+        self.assertIsNone(AttachmentFilter.from_config({}))
+
+    def test_skip_counters_in_api_metrics(self):
+        tiny = self.test_dir / "tiny.pdf"
+        tiny.write_bytes(b'%PDF-1.4')
+        self.filter.check_file(tiny)
+        processor = MagicMock(attachment_filter=self.filter)
+        scheduler = ExtractionScheduler(workers=1)
+        try:
+            with patch.object(api, 'get_document_processor', return_value=processor), \
+                    patch.object(api, 'get_scheduler', return_value=scheduler):
+                text = TestClient(api.app).get("/metrics").text
+        finally:
+            scheduler.shutdown()
+        self.assertIn("extraction_jobs_pending", text)
+        self.assertIn('attachments_skipped_total{reason="too_small"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
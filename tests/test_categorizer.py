@@ -87,6 +87,30 @@ class TestDocumentCategorizer(unittest.TestCase):
         with self.assertRaises(CategoryError):
             self.categorizer.categorize(test_file, {'text': ''})
 
+    def test_truncated_read_continues_after_header_pages(self):
+        """Field extraction reads only the pages the bounded read skipped"""
+        from reportlab.pdfgen import canvas
+        long_file = self.test_dir / "long_invoice.pdf"
+        c = canvas.Canvas(str(long_file))
+        for index in range(5):
+            c.drawString(100, 750, f"INVOICE page {index + 1}")
+            c.showPage()
+        c.save()
+        categorizer = DocumentCategorizer(classification_max_pages=2)
+        categorizer.classifier = MagicMock()
+        categorizer.classifier.classify.return_value = {'category': 'invoice', 'confidence': 0.9, 'indicators': []}
+        extractor = MagicMock(return_value={})
+        categorizer._category_extractors = {'invoice': extractor}
+
+        with patch.object(categorizer.text_extractor, 'extract_pages',
+                          wraps=categorizer.text_extractor.extract_pages) as extract_pages:
+            categorizer.categorize(long_file)
+
+        self.assertEqual([call.kwargs.get('first_page', 0) for call in extract_pages.call_args_list], [0, 2])
+        text = extractor.call_args[0][0]
+        self.assertIn("page 1", text)
+        self.assertIn("page 5", text)
+
 if __name__ == '__main__':
     unittest.main()
 
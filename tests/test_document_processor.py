@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 import shutil
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 
@@ -148,32 +149,62 @@ class TestDocumentProcessor(unittest.TestCase):
             self.assertIn(error_message, log_content)
             self.assertIn(str(self.test_file), log_content)
 
-if __name__ == '__main__':
-    unittest.main()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+class TestOutputNaming(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.config = {
+            "supported_extensions": [".pdf"],
+            "error_directory": str(self.test_dir / "errors"),
+            "processing_records_path": str(self.test_dir / "records"),
+            "max_file_size_mb": 10,
+            "output_shards": 16
+        }
+        self.processor = DocumentProcessor(self.config, base_dir=self.test_dir)
 
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
 
+    def test_same_stem_in_same_second_is_unique(self):
+        target_dir = self.test_dir / "processed_documents" / "invoice"
+        other = DocumentProcessor(self.config, base_dir=self.test_dir)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            paths = list(executor.map(
+                lambda i: (self.processor if i % 2 else other)._generate_unique_path(target_dir, Path("scan.pdf")),
+                range(2000)
+            ))
+        self.assertEqual(len(set(paths)), len(paths))
+        # Sharded into 16 single-hex-digit subdirectories
+        shards = {path.parent.name for path in paths}
+        self.assertEqual(shards, {f"{i:x}" for i in range(16)})
+        self.assertTrue(all(path.parent.parent == target_dir for path in paths))
+
+    def test_directories_created_once(self):
+        self.processor.output_shards = 0
+        self.processor.categorizer = MagicMock()
+        self.processor.categorizer.categorize.side_effect = lambda *args: {'categories': ['invoice']}
+        results = []
+        with patch.object(Path, 'mkdir', autospec=True, side_effect=Path.mkdir) as mkdir:
+            for index in range(5):
+                if index == 1:
+                    mkdir.reset_mock()
+                source = self.test_dir / "invoice.pdf"
+                source.write_bytes(b'%PDF-1.4')
+                results.append(self.processor.process_document(source))
+        # Only the first document created directories
+        mkdir.assert_not_called()
+        self.assertEqual(len({result['final_path'] for result in results}), 5)
+        self.assertTrue(all(Path(result['final_path']).exists() for result in results))
+
+    def test_removed_directory_is_recreated(self):
+        target_dir = self.test_dir / "processed_documents" / "invoice"
+        destination = self.processor._generate_unique_path(target_dir, Path("scan.pdf"))
+        source = self.test_dir / "scan.pdf"
+        source.write_bytes(b'%PDF-1.4')
+        self.processor._move_file(source, destination)
+        shutil.rmtree(target_dir)
+        source.write_bytes(b'%PDF-1.4')
+        self.processor._move_file(source, destination)
+        self.assertTrue(destination.exists())
 
+if __name__ == '__main__':
+    unittest.main()
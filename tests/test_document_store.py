@@ -0,0 +1,162 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import tempfile
+import shutil
+
+from src.document_processor import DocumentProcessor
+from src.document_store import DocumentCatalogue, DocumentStore, file_digest
+from src.exceptions import ProcessingError
+from src.intent_log import IntentLog
+
+INVOICE = {
+    'invoice_number': 'INV-2024-001',
+    'vendor': 'ACME Supplies Ltd.',
+    'total_amount': '1000.00',
+    'date': '2024-03-15'
+}
+
+
+class TestDocumentStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.store = DocumentStore(self.test_dir / "store")
+        self.view_dir = self.test_dir / "view"
+        self.view_dir.mkdir()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.test_dir)
+
+    def create_file(self, name, content=b'%PDF-1.4 invoice'):
+        path = self.test_dir / name
+        path.write_bytes(content)
+        return path
+
+    def test_identical_documents_stored_once(self):
+        first = self.store.store(self.create_file("a.pdf"), self.view_dir / "a.pdf")
+        second = self.store.store(self.create_file("b.pdf"), self.view_dir / "b.pdf")
+        self.assertEqual(first, second)
+        blob = self.store.blobs.path(first)
+        self.assertEqual(blob.relative_to(self.store.blobs.root).parts, (first[:2], first[2:4], first))
+        self.assertEqual([p for p in self.store.blobs.root.rglob('*') if p.is_file()], [blob])
+        for name in ("a.pdf", "b.pdf"):
+            view = self.view_dir / name
+            self.assertTrue(view.is_symlink())
+            self.assertEqual(view.read_bytes(), b'%PDF-1.4 invoice')
+        self.assertFalse((self.test_dir / "a.pdf").exists())
+
+    def test_copy_keeps_source(self):
+        source = self.create_file("a.pdf")
+        digest = self.store.blobs.put(source, move=False)
+        self.assertTrue(source.exists())
+        self.assertEqual(file_digest(self.store.blobs.path(digest)), digest)
+
+    def test_hardlink_view(self):
+        store = DocumentStore(self.test_dir / "hard", view='hardlink')
+        digest = store.store(self.create_file("a.pdf"), self.view_dir / "a.pdf")
+        self.assertEqual(os.stat(self.view_dir / "a.pdf").st_ino, os.stat(store.blobs.path(digest)).st_ino)
+        store.close()
+
+    def test_rebuild_view(self):
+        digest = self.store.store(self.create_file("a.pdf"), self.view_dir / "a.pdf")
+        self.store.add_record("a.pdf", {'sha256': digest, 'categories': ['invoice'],
+                                        'final_path': str(self.view_dir / "a.pdf")}, '2024-03-15')
+        shutil.rmtree(self.view_dir)
+        self.assertEqual(self.store.rebuild_view(), 1)
+        self.assertEqual((self.view_dir / "a.pdf").read_bytes(), b'%PDF-1.4 invoice')
+
+
+class TestDocumentCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.catalogue = DocumentCatalogue(self.test_dir / "catalogue.sqlite3")
+
+    def tearDown(self):
+        self.catalogue.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_find_by_fields(self):
+        self.catalogue.add("doc-1", "aa" * 32, "invoice", "2024-03-16", extracted_data=INVOICE)
+        self.catalogue.add("doc-2", "bb" * 32, "invoice", "2024-03-16",
+                           extracted_data={**INVOICE, 'vendor': 'Other GmbH'})
+        self.catalogue.add("doc-3", "cc" * 32, "receipt", "2024-03-17")
+        self.assertEqual([e['document_id'] for e in self.catalogue.find(vendor='ACME Supplies Ltd.')], ["doc-1"])
+        self.assertEqual(len(self.catalogue.find(category='invoice', date='2024-03-16')), 2)
+        self.assertEqual(self.catalogue.get("doc-1")['extracted_data'], INVOICE)
+        with self.assertRaises(ProcessingError):
+            self.catalogue.find(description='x')
+
+    def test_lookups_use_indexes(self):
+        plan = self.catalogue._connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM documents WHERE invoice_number = ?", ('INV',)
+        ).fetchall()
+        self.assertIn('documents_invoice_number', str(plan))
+
+
+class TestProcessorWithStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        config = {
+            "supported_extensions": [".pdf"],
+            "error_directory": str(self.test_dir / "errors"),
+            "processing_records_path": str(self.test_dir / "records"),
+            "max_file_size_mb": 10,
+            "document_store": {"enabled": True, "root": str(self.test_dir / "store")}
+        }
+        self.processor = DocumentProcessor(config, base_dir=self.test_dir)
+        self.processor.categorizer = MagicMock()
+        self.processor.categorizer.categorize.side_effect = lambda *args: {
+            'categories': ['invoice'], 'extracted_data': dict(INVOICE)
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_processed_documents_are_links_into_store(self):
+        results = []
+        for name in ("scan.pdf", "rescan.pdf"):
+            source = self.test_dir / name
+            source.write_bytes(b'%PDF-1.4 same content')
+            results.append(self.processor.process_document(source))
+        self.assertEqual(results[0]['sha256'], results[1]['sha256'])
+        for result in results:
+            self.assertTrue(Path(result['final_path']).is_symlink())
+            self.assertEqual(Path(result['final_path']).read_bytes(), b'%PDF-1.4 same content')
+        entries = self.processor.document_store.catalogue.find(invoice_number='INV-2024-001')
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]['date'], Path(results[0]['final_path']).parent.name)
+        self.assertEqual(sorted(entry['original_name'] for entry in entries), ["rescan.pdf", "scan.pdf"])
+
+    def test_removed_directories_are_recreated(self):
+        first = self.test_dir / "scan.pdf"
+        first.write_bytes(b'%PDF-1.4 first')
+        result = self.processor.process_document(first)
+        shutil.rmtree(Path(result['final_path']).parent)
+        shutil.rmtree(self.processor.document_store.blobs.root)
+
+        second = self.test_dir / "rescan.pdf"
+        second.write_bytes(b'%PDF-1.4 second')
+        result = self.processor.process_document(second)
+        self.assertFalse(second.exists())
+        self.assertEqual(Path(result['final_path']).read_bytes(), b'%PDF-1.4 second')
+
+    def test_recover_after_store_before_link(self):
+        source = self.test_dir / "scan.pdf"
+        source.write_bytes(b'%PDF-1.4')
+        with patch.object(self.processor.document_store, 'link_view', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self.processor.process_document(source)
+        self.assertFalse(source.exists())
+        # Restart with a new intent log, as after a crash
+        self.processor.intent_log.close()
+        self.processor.intent_log = IntentLog(self.processor.intent_log.db_path)
+        self.assertEqual(self.processor.recover(), 1)
+        entry = self.processor.document_store.catalogue.find(invoice_number='INV-2024-001')[0]
+        self.assertTrue(Path(entry['view_path']).exists())
+        self.assertEqual(entry['original_name'], "scan.pdf")
+        self.assertEqual(len(self.processor.intent_log), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import tempfile
+import shutil
+
+from reportlab.pdfgen import canvas
+
+from src.document_processor import DocumentProcessor
+from src.duplicate_index import BloomFilter, DuplicateIndex, duplicate_key
+from src.exceptions import DuplicateDocumentError, ProcessingError
+from src.intent_log import IntentLog
+
+INVOICE = {
+    'invoice_number': 'INV-2024-001',
+    'vendor': 'ACME Supplies Ltd.',
+    'total_amount': '1000.00',
+    'date': '2024-03-15'
+}
+
+
+class TestDuplicateKey(unittest.TestCase):
+    def test_rescanned_copy_has_same_key(self):
+        """Formatting differences do not change the key"""
+        rescanned = {
+            'invoice_number': 'inv 2024 001',
+            'vendor': 'Acme  Supplies LTD',
+            'total_amount': '$1,000',
+            'date': '15/03/2024'
+        }
+        self.assertEqual(duplicate_key(rescanned), duplicate_key(INVOICE))
+
+    def test_fields_distinguish_invoices(self):
+        """Any differing identifying field gives a different key"""
+        for field, value in [('invoice_number', 'INV-2024-002'), ('vendor', 'Other GmbH'),
+                             ('total_amount', '1000.01'), ('date', '2024-03-16')]:
+            self.assertNotEqual(duplicate_key({**INVOICE, field: value}), duplicate_key(INVOICE), field)
+
+    def test_invoice_number_required(self):
+        self.assertIsNone(duplicate_key({**INVOICE, 'invoice_number': None}))
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f"key-{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.db_path = self.test_dir / 'index.sqlite3'
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_persists_across_instances(self):
+        index = DuplicateIndex(self.db_path)
+        self.assertIsNone(index.find_duplicate(INVOICE))
+        self.assertTrue(index.add(INVOICE, 'processed/invoice.pdf'))
+        self.assertFalse(index.add(INVOICE, 'processed/copy.pdf'))
+        index.close()
+
+        reopened = DuplicateIndex(self.db_path)
+        entry = reopened.find_duplicate({**INVOICE, 'total_amount': '1,000.00'})
+        self.assertEqual(entry['document_path'], 'processed/invoice.pdf')
+        self.assertEqual(len(reopened), 1)
+        reopened.close()
+
+    def test_sees_invoices_added_by_other_processes(self):
+        first = DuplicateIndex(self.db_path)
+        second = DuplicateIndex(self.db_path)
+        self.assertIsNone(second.find_duplicate(INVOICE))
+        first.add(INVOICE, 'processed/invoice.pdf')
+        self.assertEqual(second.find_duplicate(INVOICE)['document_path'], 'processed/invoice.pdf')
+        self.assertIsNone(second.find_duplicate({**INVOICE, 'invoice_number': 'INV-2024-002'}))
+        first.close()
+        second.close()
+
+    def test_only_one_claim_wins(self):
+        first = DuplicateIndex(self.db_path)
+        second = DuplicateIndex(self.db_path)
+        # Both looked the invoice up before either filed it
+        self.assertIsNone(first.find_duplicate(INVOICE))
+        self.assertIsNone(second.find_duplicate(INVOICE))
+        self.assertIsNone(first.claim(INVOICE, 'processed/first.pdf'))
+        self.assertEqual(second.claim(INVOICE, 'processed/second.pdf')['document_path'], 'processed/first.pdf')
+
+        # A released claim frees the invoice again
+        first.release(INVOICE, 'processed/first.pdf')
+        self.assertIsNone(second.claim(INVOICE, 'processed/second.pdf'))
+        self.assertEqual(len(first), 1)
+        first.close()
+        second.close()
+
+    def test_filter_grows(self):
+        index = DuplicateIndex(self.db_path, expected_items=4)
+        for number in range(20):
+            index.add({**INVOICE, 'invoice_number': f"INV-{number}"})
+        self.assertTrue(all(index.find_duplicate({**INVOICE, 'invoice_number': f"INV-{number}"})
+                            for number in range(20)))
+        self.assertIsNone(index.find_duplicate({**INVOICE, 'invoice_number': 'INV-99'}))
+        index.close()
+
+
+class TestDuplicatePolicies(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.records_dir = self.test_dir / "records"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def create_processor(self, policy):
+        config = {
+            "supported_extensions": [".pdf"],
+            "error_directory": str(self.test_dir / "errors"),
+            "processing_records_path": str(self.records_dir),
+            "max_file_size_mb": 10,
+            "duplicate_detection": {
+                "enabled": True,
+                "index_path": str(self.test_dir / "index.sqlite3"),
+                "policy": policy
+            }
+        }
+        processor = DocumentProcessor(config, base_dir=self.test_dir)
+        processor.categorizer = MagicMock()
+        processor.categorizer.categorize.side_effect = lambda *args: {
+            'categories': ['invoice'],
+            'confidence': 0.9,
+            'status': 'processed',
+            'extracted_data': dict(INVOICE)
+        }
+        return processor
+
+    def create_document(self, name):
+        path = self.test_dir / name
+        c = canvas.Canvas(str(path))
+        c.drawString(100, 750, "Invoice #: INV-2024-001")
+        c.save()
+        return path
+
+    def test_skip(self):
+        processor = self.create_processor('skip')
+        first = processor.process_document(self.create_document("original.pdf"))
+        self.assertNotIn('duplicate_of', first)
+
+        copy = self.create_document("rescan.pdf")
+        result = processor.process_document(copy)
+        self.assertEqual(result['status'], 'duplicate')
+        self.assertEqual(result['duplicate_of']['document_path'], first['final_path'])
+        self.assertNotIn('final_path', result)
+        # Moved out of the input folder, so it is not picked up again
+        self.assertFalse(copy.exists())
+        duplicate_path = Path(result['duplicate_path'])
+        self.assertEqual(duplicate_path.parent, self.test_dir / "duplicates")
+        self.assertTrue(duplicate_path.exists())
+        self.assertEqual(len(processor.intent_log), 0)
+
+    def test_skip_recovers_interrupted_move(self):
+        processor = self.create_processor('skip')
+        copy = self.create_document("rescan.pdf")
+        destination = self.test_dir / "duplicates" / "rescan.pdf"
+        crashed = IntentLog(processor.intent_log.db_path)
+        crashed.begin('duplicate', copy, destination, {'result': {'status': 'duplicate'}})
+        crashed.close()
+
+        self.assertEqual(processor.recover(), 1)
+        self.assertFalse(copy.exists())
+        self.assertTrue(destination.exists())
+        self.assertFalse((self.test_dir / "errors" / "processing_errors.log").exists())
+
+    def test_flag(self):
+        processor = self.create_processor('flag')
+        processor.process_document(self.create_document("original.pdf"))
+        result = processor.process_document(self.create_document("rescan.pdf"))
+        self.assertIn('duplicate_of', result)
+        self.assertTrue(Path(result['final_path']).exists())
+
+    def test_filing_failure_releases_claim(self):
+        processor = self.create_processor('skip')
+        with patch.object(processor, '_file_document', side_effect=ProcessingError("disk full")):
+            with self.assertRaises(ProcessingError):
+                processor.process_document(self.create_document("original.pdf"), handle_errors=False)
+        self.assertEqual(len(processor.duplicate_index), 0)
+        result = processor.process_document(self.create_document("original.pdf"))
+        self.assertNotIn('duplicate_of', result)
+
+    def test_reject(self):
+        processor = self.create_processor('reject')
+        processor.process_document(self.create_document("original.pdf"))
+        copy = self.create_document("rescan.pdf")
+        with self.assertRaises(DuplicateDocumentError):
+            processor.process_document(copy)
+        self.assertTrue((self.test_dir / "errors" / "rescan.pdf").exists())
+
+if __name__ == '__main__':
+    unittest.main()
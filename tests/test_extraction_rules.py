@@ -0,0 +1,84 @@
+import re
+import unittest
+
+from src.extraction_rules import (
+    CategoryPatternSet,
+    CompiledExtractionRules,
+    compile_extraction_rules,
+    required_keywords,
+    collect_extraction_patterns
+)
+
+INVOICE_PATTERNS = {
+    "invoice_number": r"(?:invoice|document)\s*(?:#|number|num|no)?[:\s]*(\w+[-\d]+)",
+    "date": r"(?:date|issued)\s*:?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+    "total_amount": r"(?:total|amount due|balance due)\s*:?\s*[$€£]\s*(\d+(?:[.,]\d{2})?)",
+    "due_date": r"(?:due|payment due|pay by)\s*:?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})"
+}
+
+SAMPLE_TEXTS = [
+    "ACME Corp\nInvoice #: INV-2024-001\nDate: 15/03/2024\nDue: 14/04/2024\nTotal: $1000.00",
+    "Document no 77-12 issued 1/2/24 balance due €12,50 pay by 3/3/24",
+    "Payment due 01-05-2024\nTotal: £5\nInvoice number AB-9",
+    "nothing to see here",
+    ""
+]
+
+
+class TestExtractionRules(unittest.TestCase):
+    def _expected(self, patterns, text):
+        """Reference result: one re.search per field"""
+        expected = {}
+        for field, pattern in patterns.items():
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                expected[field] = match.group(1).strip()
+        return expected
+
+    def test_matches_per_field_search(self):
+        """Keyword-filtered extraction finds the same values as a re.search per field"""
+        compiled = CompiledExtractionRules({'invoice': {'data_extraction': INVOICE_PATTERNS}})
+        for text in SAMPLE_TEXTS:
+            self.assertEqual(compiled.extract('invoice', text),
+                             self._expected(INVOICE_PATTERNS, text), text)
+
+    def test_required_keywords(self):
+        """Leading literals and literal alternations become keywords"""
+        self.assertEqual(required_keywords(INVOICE_PATTERNS['invoice_number'], re.IGNORECASE),
+                         (frozenset({'invoice', 'document'}), True))
+        self.assertEqual(required_keywords(r'Total:\s*(\d+)'), (frozenset({'Total:'}), False))
+        self.assertIsNone(required_keywords(r'(\w+)\s*total'))
+        self.assertIsNone(required_keywords(r'(?:ref|)\d+'))
+
+    def test_case_sensitive_keywords(self):
+        """Keywords of case-sensitive patterns are matched case-sensitively"""
+        compiled = CategoryPatternSet('invoice', {'total': r'Total:\s*(\d+)'}, flags=0)
+        self.assertEqual(compiled.extract("TOTAL: 5 Total: 7"), {'total': '7'})
+        self.assertEqual(compiled.extract("TOTAL: 5"), {})
+
+    def test_patterns_without_keywords(self):
+        """Backreferences and inline flags still extract correctly"""
+        patterns = {'repeat': r'(\w)\1', 'flagged': r'(?i)(ref-\d+)', 'plain': r'(no\.\s*\d+)'}
+        compiled = CompiledExtractionRules({'receipt': {'data_extraction': patterns}})
+        text = "Ref-12 book no. 5"
+        self.assertEqual(compiled.extract('receipt', text),
+                         {'repeat': 'o', 'flagged': 'Ref-12', 'plain': 'no. 5'})
+
+    def test_collects_both_rule_layouts(self):
+        """Top-level and per-category data_extraction sections are merged"""
+        rules = {
+            'data_extraction': {'receipt': {'total_amount': r'total\s*(\d+)'}},
+            'contract': {'data_extraction': {'contract_date': r'signed\s*(\S+)'}}
+        }
+        self.assertEqual(set(collect_extraction_patterns(rules)), {'receipt', 'contract'})
+
+    def test_compiled_once_per_rules_version(self):
+        """Equal rules share a compiled object, changed rules do not"""
+        rules = {'invoice': {'data_extraction': dict(INVOICE_PATTERNS)}}
+        first = compile_extraction_rules(rules)
+        self.assertIs(compile_extraction_rules({'invoice': {'data_extraction': dict(INVOICE_PATTERNS)}}), first)
+        rules['invoice']['data_extraction']['vendor'] = r'vendor:\s*(.+)'
+        self.assertIsNot(compile_extraction_rules(rules), first)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import errno
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import tempfile
+import shutil
+
+from src.document_processor import DocumentProcessor
+from src.intent_log import IntentLog, atomic_move
+
+RESULT = {
+    'categories': ['invoice'],
+    'confidence': 0.9,
+    'extracted_data': {'invoice_number': 'INV-2024-001'}
+}
+
+
+class TestAtomicMove(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.source = self.test_dir / "invoice.pdf"
+        self.source.write_bytes(b'%PDF-1.4 content')
+        (self.test_dir / "target").mkdir()
+        self.destination = self.test_dir / "target" / "invoice.pdf"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_rename(self):
+        atomic_move(self.source, self.destination)
+        self.assertFalse(self.source.exists())
+        self.assertEqual(self.destination.read_bytes(), b'%PDF-1.4 content')
+
+    def test_copy_across_filesystems(self):
+        with patch('src.intent_log.os.rename', side_effect=OSError(errno.EXDEV, 'cross-device')):
+            atomic_move(self.source, self.destination)
+        self.assertFalse(self.source.exists())
+        self.assertEqual(self.destination.read_bytes(), b'%PDF-1.4 content')
+        self.assertEqual([p.name for p in self.destination.parent.iterdir()], ["invoice.pdf"])
+
+
+class TestRecovery(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.records_dir = self.test_dir / "records"
+        self.config = {
+            "supported_extensions": [".pdf"],
+            "error_directory": str(self.test_dir / "errors"),
+            "processing_records_path": str(self.records_dir),
+            "max_file_size_mb": 10
+        }
+        self.source = self.test_dir / "invoice.pdf"
+        self.source.write_bytes(b'%PDF-1.4')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def create_processor(self):
+        processor = DocumentProcessor(self.config, base_dir=self.test_dir)
+        processor.categorizer = MagicMock()
+        processor.categorizer.categorize.side_effect = lambda *args: dict(RESULT)
+        return processor
+
+    def records(self):
+        records = []
+        for record_file in self.records_dir.glob("*.json"):
+            records.extend(json.loads(record_file.read_text()))
+        return records
+
+    def test_completed_document_leaves_no_intent(self):
+        processor = self.create_processor()
+        result = processor.process_document(self.source)
+        self.assertEqual(len(processor.intent_log), 0)
+        self.assertEqual(processor.recover(), 0)
+        self.assertEqual([record['final_path'] for record in self.records()], [result['final_path']])
+
+    def test_crash_before_move(self):
+        processor = self.create_processor()
+        with patch.object(processor, '_move_file', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                processor.process_document(self.source)
+        self.assertTrue(self.source.exists())
+        processor.intent_log.close()
+
+        restarted = self.create_processor()
+        self.assertEqual(restarted.recover(), 1)
+        self.assertFalse(self.source.exists())
+        records = self.records()
+        self.assertEqual(len(records), 1)
+        self.assertTrue(Path(records[0]['final_path']).exists())
+        self.assertEqual(len(restarted.intent_log), 0)
+
+    def test_crash_after_record_does_not_duplicate_it(self):
+        processor = self.create_processor()
+        with patch.object(processor.intent_log, 'commit', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                processor.process_document(self.source)
+        self.assertEqual(len(self.records()), 1)
+        processor.intent_log.close()
+
+        restarted = self.create_processor()
+        self.assertEqual(restarted.recover(), 1)
+        self.assertEqual(len(self.records()), 1)
+        self.assertEqual(restarted.recover(), 0)
+
+    def test_intents_of_running_processes_are_left_alone(self):
+        processor = self.create_processor()
+        with patch.object(processor, '_move_file', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                processor.process_document(self.source)
+
+        other = self.create_processor()
+        self.assertEqual(other.recover(), 0)
+        self.assertTrue(self.source.exists())
+        self.assertEqual(self.records(), [])
+        self.assertEqual(processor.recover(), 0)
+
+        processor.intent_log.close()
+        self.assertEqual(other.recover(), 1)
+        self.assertEqual(len(self.records()), 1)
+
+    def test_failure_after_move_is_left_to_recovery(self):
+        processor = self.create_processor()
+        with patch.object(processor, '_finish_filing', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                processor.process_document(self.source)
+        self.assertFalse(self.source.exists())
+        self.assertFalse((self.test_dir / "errors" / "invoice.pdf").exists())
+
+        self.assertEqual(processor.recover(), 1)
+        records = self.records()
+        self.assertEqual(len(records), 1)
+        self.assertTrue(Path(records[0]['final_path']).exists())
+        self.assertEqual(len(processor.intent_log), 0)
+
+    def test_interrupted_error_move(self):
+        processor = self.create_processor()
+        crashed = IntentLog(processor.intent_log.db_path)
+        crashed.begin('error', self.source, self.test_dir / "errors" / "invoice.pdf", {'error': 'unreadable'})
+        crashed.close()
+        self.assertEqual(processor.recover(), 1)
+        self.assertTrue((self.test_dir / "errors" / "invoice.pdf").exists())
+        self.assertIn('unreadable', (self.test_dir / "errors" / "processing_errors.log").read_text())
+
+    def test_close_gives_up_ownership(self):
+        processor = self.create_processor()
+        owners_dir = processor.intent_log.owners_dir
+        self.assertEqual(len(list(owners_dir.iterdir())), 1)
+        processor.close()
+        self.assertEqual(list(owners_dir.iterdir()), [])
+
+    def test_owner_files_left_by_exited_processes_are_removed(self):
+        processor = self.create_processor()
+        live = IntentLog(processor.intent_log.db_path)
+        # An owner that exited without closing its log and had nothing in flight
+        stale = processor.intent_log.owners_dir / "host-1234-deadbeef.lock"
+        stale.touch()
+        self.assertEqual(processor.recover(), 0)
+        self.assertFalse(stale.exists())
+        self.assertEqual(sorted(path.name for path in processor.intent_log.owners_dir.iterdir()),
+                         sorted(f"{log.owner}.lock" for log in (processor.intent_log, live)))
+        live.close()
+        processor.close()
+
+    def test_intents_persist(self):
+        log = IntentLog(self.test_dir / "intents.sqlite3")
+        intent_id = log.begin('file', self.source, self.test_dir / "out.pdf", {'result': RESULT})
+        log.close()
+        reopened = IntentLog(self.test_dir / "intents.sqlite3")
+        pending = reopened.pending()
+        self.assertEqual([intent['id'] for intent in pending], [intent_id])
+        self.assertEqual(pending[0]['payload']['result'], RESULT)
+        reopened.commit(intent_id)
+        self.assertEqual(len(reopened), 0)
+        reopened.close()
+
+if __name__ == '__main__':
+    unittest.main()
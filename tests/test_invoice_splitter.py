@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+import tempfile
+import shutil
+
+from reportlab.pdfgen import canvas
+
+from src.invoice_splitter import InvoiceSplitter
+from src.pdf_processor import PDFProcessor
+
+
+def invoice_page(number, total=None, page=None):
+    lines = ["ACME Supplies", f"Invoice No: {number}", "Invoice Date: 01/03/2024"]
+    if page is not None:
+        lines.append(f"Page {page[0]} of {page[1]}")
+    if total is not None:
+        lines.append(f"Total Amount Due: ${total}")
+    return "\n".join(lines) + "\n"
+
+
+class TestInvoiceSplitter(unittest.TestCase):
+    def setUp(self):
+        self.splitter = InvoiceSplitter()
+
+    def test_invoice_number_changes_start_invoices(self):
+        pages = [
+            invoice_page("INV-1", page=(1, 2)),
+            "Line items continued\nWidget 2 x 10.00\nTotal: $20.00\n",
+            invoice_page("INV-2", total="5.00"),
+            invoice_page("INV-3", page=(1, 2)),
+            invoice_page("INV-3", total="7.00", page=(2, 2))
+        ]
+        self.assertEqual(self.splitter.split(pages), [(0, 1), (2, 2), (3, 4)])
+
+    def test_first_page_marker_starts_invoice_without_number(self):
+        pages = [
+            invoice_page("INV-1", total="5.00"),
+            "Invoice\nBilling statement Page 1 of 1\nAmount due: $8.00\nDue date 01/04/2024\n"
+        ]
+        self.assertEqual(self.splitter.split(pages), [(0, 0), (1, 1)])
+
+    def test_single_invoice_is_one_range(self):
+        pages = [invoice_page("INV-1", page=(1, 2)), "Terms and conditions\n"]
+        self.assertEqual(self.splitter.split(pages), [(0, 1)])
+        self.assertEqual(self.splitter.split([]), [])
+
+    def test_disabled_without_configuration(self):
+        self.assertIsNone(InvoiceSplitter.from_config({}))
+        splitter = InvoiceSplitter.from_config({"invoice_splitting": {"enabled": True, "min_confidence": 0.5}})
+        self.assertEqual(splitter.min_confidence, 0.5)
+
+
+class TestExtractInvoices(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.test_dir / "march.pdf"
+        pdf = canvas.Canvas(str(self.pdf_path))
+        for number in ("INV-1", "INV-2", "INV-3"):
+            for line, text in enumerate(invoice_page(number, total="10.00").splitlines()):
+                pdf.drawString(100, 750 - 20 * line, text)
+            pdf.showPage()
+        pdf.drawString(100, 750, "Line items continued")
+        pdf.showPage()
+        pdf.save()
+        self.processor = PDFProcessor(splitter=InvoiceSplitter())
+        self.processor.categorizer = MagicMock()
+        self.processor.categorizer.categorize.return_value = {'categories': ['invoice']}
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_one_result_per_invoice(self):
+        results = self.processor.extract_invoices(str(self.pdf_path))
+        self.assertEqual([result['pages'] for result in results], [[1, 1], [2, 2], [3, 4]])
+        texts = [call[0][1]['text'] for call in self.processor.categorizer.categorize.call_args_list]
+        self.assertEqual(sorted(text.count("Invoice No") for text in texts), [1, 1, 1])
+
+    def test_batch_lists_every_invoice(self):
+        results = self.processor.process_batch(str(self.test_dir))
+        self.assertEqual(len(results), 3)
+        self.assertEqual({result['filename'] for result in results}, {"march.pdf"})
+
+
+if __name__ == '__main__':
+    unittest.main()
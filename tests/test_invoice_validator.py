@@ -0,0 +1,96 @@
+import itertools
+import random
+import unittest
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from src.validators.invoice_validator import InvoiceValidator
+
+FIELDS = ['invoice_number', 'vendor', 'date', 'total_amount', 'line_items']
+
+INVOICE_NUMBERS = ['INV-001', 'INV/2024/7', '', 'bad number!', None]
+DATES = ['2024-03-15', '15/03/2024', '03/25/2024', '31-12-2023', '2024-02-30', '', 'soon', None, 20240315]
+AMOUNTS = ['$1,000.00', '€1.234,56', '30.00', '0', '', 'N/A', None, 12.5]
+LINE_ITEMS = [
+    [],
+    None,
+    'not a list',
+    [{'description': 'Widget', 'quantity': 2, 'unit_price': '10.00', 'total': '20.00'},
+     {'description': 'Gadget', 'quantity': '1', 'unit_price': 10, 'total': 10}],
+    [{'description': 'Widget', 'quantity': 2, 'unit_price': '10.00', 'total': '25.00'}],
+    [{'description': 'Widget', 'quantity': 1, 'unit_price': 5, 'total': 5},
+     {'description': 'Gadget', 'quantity': 3, 'unit_price': 5, 'total': 1}],
+    [{'description': 'Widget', 'quantity': 2, 'unit_price': '10.00'}],
+    [{'description': 'Widget', 'quantity': 'two', 'unit_price': 1, 'total': 2}],
+    [{'description': 'Widget', 'quantity': 'Infinity', 'unit_price': 1, 'total': 'Infinity'}],
+    [{'description': 'Widget', 'quantity': 1, 'unit_price': 30, 'total': 30}],
+    ['not an item'],
+]
+
+
+class TestValidateBatch(unittest.TestCase):
+    def setUp(self):
+        self.validator = InvoiceValidator()
+
+    def assert_parity(self, records):
+        frame = pd.DataFrame(records, columns=FIELDS)
+        batch = self.validator.validate_batch(frame)
+        self.assertEqual(len(batch), len(records))
+        for record, result in zip(records, batch):
+            self.assertEqual(result, self.validator.validate(record), repr(record))
+
+    def test_matches_scalar_validation(self):
+        """Every combination of field values validates as with validate()"""
+        records = [
+            {'invoice_number': number, 'vendor': 'ACME', 'date': date,
+             'total_amount': amount, 'line_items': items}
+            for number, date, amount, items in itertools.product(
+                INVOICE_NUMBERS[:3], DATES, AMOUNTS, LINE_ITEMS)
+        ]
+        records += [
+            {'invoice_number': number, 'vendor': None, 'date': '2024-03-15',
+             'total_amount': '30.00', 'line_items': LINE_ITEMS[3]}
+            for number in INVOICE_NUMBERS
+        ]
+        self.assert_parity(records)
+
+    def test_missing_fields(self):
+        """Missing cells behave like records without the field"""
+        rng = random.Random(7)
+        records = []
+        for _ in range(200):
+            record = {
+                'invoice_number': rng.choice(INVOICE_NUMBERS),
+                'vendor': 'ACME',
+                'date': rng.choice(DATES),
+                'total_amount': rng.choice(AMOUNTS),
+                'line_items': rng.choice(LINE_ITEMS),
+            }
+            for field in FIELDS:
+                if rng.random() < 0.3:
+                    del record[field]
+            records.append(record)
+        self.assert_parity(records)
+
+    def test_total_cross_check(self):
+        """The total is compared against the sum of clean line items"""
+        frame = pd.DataFrame([
+            {'total_amount': '30.00', 'line_items': LINE_ITEMS[3]},
+            {'total_amount': '99.00', 'line_items': LINE_ITEMS[3]},
+        ])
+        first, second = self.validator.validate_batch(frame)
+        self.assertEqual(first['warnings'], [])
+        self.assertEqual(second['warnings'],
+                         ['Total amount (99.00) differs from sum of line items (30.00)'])
+        self.assertEqual(first['cleaned_data']['total_amount'], Decimal('30.00'))
+
+    def test_empty_frame(self):
+        """An empty batch gives no results"""
+        self.assertEqual(self.validator.validate_batch(pd.DataFrame(columns=FIELDS)), [])
+        frame = pd.DataFrame({'date': [np.nan, np.nan]})
+        self.assertEqual([r['cleaned_data'] for r in self.validator.validate_batch(frame)], [{}, {}])
+
+if __name__ == '__main__':
+    unittest.main()
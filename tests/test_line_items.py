@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from decimal import Decimal
+from pathlib import Path
+import tempfile
+import shutil
+
+from reportlab.pdfgen import canvas
+
+from src.line_items import ColumnLayout, LineItemExtractor
+from src.pdf_processor import PDFProcessor
+from src.validators.invoice_validator import InvoiceValidator
+
+COLUMNS = ((50, "Description"), (300, "Qty"), (360, "Unit Price"), (470, "Total"))
+
+
+def draw_items(pdf, items, y, header=COLUMNS):
+    for x, text in header:
+        pdf.drawString(x, y, text)
+    y -= 16
+    for description, quantity, price, total in items:
+        pdf.drawString(50, y, description)
+        pdf.drawRightString(320, y, quantity)
+        pdf.drawRightString(410, y, price)
+        pdf.drawRightString(500, y, total)
+        y -= 14
+    return y
+
+
+class TestLineItemExtractor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.extractor = LineItemExtractor()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_table_continues_across_pages(self):
+        path = self.test_dir / "invoice.pdf"
+        pdf = canvas.Canvas(str(path))
+        pdf.drawString(50, 800, "ACME Supplies Invoice No: INV-1")
+        y = draw_items(pdf, [("Widget", "2", "1,250.50", "2,501.00"), ("Tax consulting", "1", "80.00", "80.00")], 750)
+        pdf.drawString(50, y, "for the March audit")
+        pdf.showPage()
+        # No header on the second page: the first page's columns are reused
+        pdf.drawString(50, 800, "Page 2 of 2")
+        y = 760
+        for description, quantity, price, total in (("Gadget", "3", "10.00", "30.00"),):
+            pdf.drawString(50, y, description)
+            pdf.drawRightString(320, y, quantity)
+            pdf.drawRightString(410, y, price)
+            pdf.drawRightString(500, y, total)
+        pdf.drawString(50, y - 30, "Subtotal")
+        pdf.drawRightString(500, y - 30, "2,611.00")
+        pdf.drawString(50, y - 44, "Returns 1 5.00 5.00")
+        pdf.showPage()
+        pdf.save()
+
+        items = self.extractor.extract(path)
+        self.assertEqual([item['description'] for item in items],
+                         ["Widget", "Tax consulting for the March audit", "Gadget"])
+        self.assertEqual(items[0], {'description': "Widget", 'quantity': Decimal('2'),
+                                    'unit_price': Decimal('1250.50'), 'total': Decimal('2501.00')})
+        self.assertEqual(len(self.extractor.extract(path, first_page=1)), 0)
+
+        validator = InvoiceValidator()
+        self.assertEqual(validator.validate({'total_amount': "2,611.00", 'line_items': items})['warnings'], [])
+        warnings = validator.validate({'total_amount': "3,000.00", 'line_items': items})['warnings']
+        self.assertIn("differs from sum of line items", warnings[0])
+
+    def test_ruled_cells_give_column_edges(self):
+        path = self.test_dir / "ruled.pdf"
+        pdf = canvas.Canvas(str(path))
+        edges, rows = [40, 280, 330, 420, 520], [760, 740, 725]
+        for x in edges:
+            pdf.line(x, rows[0], x, rows[-1])
+        for y in rows:
+            pdf.line(edges[0], y, edges[-1], y)
+        # "Qty" sits far left in its cell, beyond where header midpoints would cut
+        for x, text in ((45, "Item"), (285, "Qty"), (335, "Unit price"), (470, "Amount")):
+            pdf.drawString(x, 745, text)
+        pdf.drawString(45, 730, "Toner")
+        pdf.drawRightString(325, 730, "4")
+        pdf.drawRightString(415, 730, "25.00")
+        pdf.drawRightString(515, 730, "100.00")
+        pdf.showPage()
+        pdf.save()
+
+        items = self.extractor.extract(path)
+        self.assertEqual([(item['description'], item['quantity'], item['total']) for item in items],
+                         [("Toner", Decimal('4'), Decimal('100.00'))])
+
+    def test_items_without_quantity_count_once(self):
+        layout = ColumnLayout.from_header([("Description", 50, 110), ("Amount", 470, 510)])
+        self.assertEqual(layout.names, ['description', 'total'])
+        self.assertEqual(layout.column(500), 'total')
+        item = self.extractor._item(layout, {'description': "Hosting", 'total': "49.90"})
+        self.assertEqual((item['quantity'], item['unit_price']), (Decimal(1), Decimal('49.90')))
+        self.assertIsNone(ColumnLayout.from_header([("Qty", 300, 320), ("Total", 470, 500)]))
+
+    def test_disabled_without_configuration(self):
+        self.assertIsNone(LineItemExtractor.from_config({}))
+
+
+class TestProcessorLineItems(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_line_items_reach_the_validator(self):
+        path = self.test_dir / "invoice.pdf"
+        pdf = canvas.Canvas(str(path))
+        pdf.drawString(50, 800, "ACME Supplies")
+        draw_items(pdf, [("Widget", "2", "10.00", "20.00"), ("Gadget", "1", "5.00", "7.00")], 750)
+        pdf.showPage()
+        pdf.save()
+        processor = PDFProcessor(line_item_extractor=LineItemExtractor())
+        processor.categorizer = MagicMock()
+        processor.categorizer.categorize.return_value = {'categories': ['invoice']}
+
+        with patch.object(processor.validator, 'validate', wraps=processor.validator.validate) as validate:
+            processor.extract_invoice_data(str(path))
+        line_items = validate.call_args[0][0]['line_items']
+        self.assertEqual([item['total'] for item in line_items], [Decimal('20.00'), Decimal('7.00')])
+        warnings = processor.validator.validate({'line_items': line_items})['warnings']
+        self.assertIn("line_items: Invalid line item: Line item total (7.00) differs significantly "
+                      "from calculated total (5.00)", warnings)
+
+if __name__ == '__main__':
+    unittest.main()
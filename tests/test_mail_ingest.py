@@ -0,0 +1,222 @@
+import unittest
+from unittest.mock import MagicMock
+from email.message import EmailMessage
+from email import message_from_bytes, policy
+from pathlib import Path
+import asyncio
+import hashlib
+import tempfile
+import shutil
+import os
+import re
+
+from src.attachment_filter import AttachmentFilter
+from src.email_fetcher import EmailFetcher, _fetch_items, parse_bodystructure
+from src.mail_ingest import (
+    Attachment,
+    MailIngestPipeline,
+    message_metadata,
+    processor_delivery,
+    queue_delivery
+)
+from src.task_queue import SQLiteBroker
+
+
+def make_message(subject, attachments, encoding='base64'):
+    message = EmailMessage()
+    message['Subject'] = subject
+    message['From'] = 'Billing <billing@vendor.example>'
+    message['Message-ID'] = '<1@vendor.example>'
+    message.set_content("Please find attached.")
+    for file_name, data in attachments:
+        message.add_attachment(data, maintype='application', subtype='octet-stream', filename=file_name,
+                               cte=encoding)
+    return message.as_bytes()
+
+
+class FakeIMAP:
+    """Serves BODYSTRUCTURE and partial BODY[n] fetches of real messages"""
+
+    def __init__(self, messages):
+        self.messages = {uid: message_from_bytes(raw, policy=policy.default) for uid, raw in messages.items()}
+        self.seen = []
+        self.largest_fetch = 0
+        self.fetched_sections = []
+
+    def select(self, folder):
+        return 'OK', [b'1']
+
+    def _leaves(self, part, section=''):
+        if part.is_multipart():
+            leaves = []
+            for index, child in enumerate(part.iter_parts()):
+                leaves += self._leaves(child, f"{section}.{index + 1}" if section else str(index + 1))
+            return leaves
+        return [(section or '1', part)]
+
+    def _structure(self, part):
+        if part.is_multipart():
+            return '(' + ''.join(self._structure(child) for child in part.iter_parts()) + \
+                f' "{part.get_content_subtype()}")'
+        body = part.get_payload().encode()
+        encoding = part.get('Content-Transfer-Encoding', '7bit')
+        fields = f'"{part.get_content_maintype()}" "{part.get_content_subtype()}" NIL NIL NIL "{encoding}" {len(body)}'
+        if part.get_content_maintype() == 'text':
+            fields += ' %d' % body.count(b'\n')
+        disposition = 'NIL'
+        if part.get_filename():
+            disposition = f'("attachment" ("filename" "{part.get_filename()}"))'
+        return f'({fields} NIL {disposition} NIL NIL)'
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            return 'OK', [b' '.join(uid for uid in self.messages if uid not in self.seen)]
+        if command == 'STORE':
+            self.seen.append(args[0])
+            return 'OK', [b'']
+        uid, items = args
+        message = self.messages[uid]
+        if items == '(BODYSTRUCTURE BODY.PEEK[HEADER])':
+            header = b''.join(f"{name}: {value}\r\n".encode() for name, value in message.items()) + b'\r\n'
+            prefix = f'1 (UID {uid.decode()} BODYSTRUCTURE {self._structure(message)} BODY[HEADER] {{{len(header)}}}'
+            return 'OK', [(prefix.encode(), header), b')']
+        section, offset, length = re.match(r'\(BODY\.PEEK\[([\d.]+)\]<(\d+)\.(\d+)>\)', items).groups()
+        body = dict(self._leaves(message))[section].get_payload().encode()
+        chunk = body[int(offset):int(offset) + int(length)]
+        self.fetched_sections.append((uid, section))
+        self.largest_fetch = max(self.largest_fetch, len(chunk))
+        prefix = f'1 (UID {uid.decode()} BODY[{section}]<{offset}> {{{len(chunk)}}}'
+        return 'OK', [(prefix.encode(), chunk), b')']
+
+
+class TestStreamingFetch(unittest.TestCase):
+    def setUp(self):
+        self.payload = os.urandom(5000)
+        self.imap = FakeIMAP({
+            b'1': make_message("Invoice", [("inv.pdf", self.payload)]),
+            b'2': make_message("Invoice", [("inv.pdf", self.payload)], encoding='quoted-printable')
+        })
+        self.fetcher = EmailFetcher('imap.example.com', 'user', 'password', buffer_size=333)
+        self.fetcher.mail = self.imap
+        self.test_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_parts_are_decoded_in_bounded_pieces(self):
+        for uid in (b'1', b'2'):
+            header, parts = self.fetcher.fetch_structure(uid)
+            self.assertIn(b'Subject: Invoice', header)
+            attachment = [part for part in parts if part.is_attachment][0]
+            self.assertEqual((attachment.section, attachment.file_name), ('2', 'inv.pdf'))
+            path = self.test_dir / uid.decode()
+            with open(path, 'wb') as f:
+                digest = self.fetcher.stream_part(uid, attachment, f)
+            self.assertEqual(path.read_bytes(), self.payload)
+            self.assertEqual(digest, hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(self.imap.largest_fetch, 333)
+
+    def test_server_bodystructure(self):
+        data = [
+            (b'1 (UID 5 BODYSTRUCTURE ((("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 21 1 NIL NIL NIL NIL)'
+             b'("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 50 2 NIL NIL NIL NIL) "alternative" '
+             b'("boundary" "b2") NIL NIL NIL)("application" "pdf" ("name" "x.pdf") NIL NIL "base64" 1000 NIL '
+             b'("attachment" ("filename*" "utf-8\'\'Rechnung%20M%C3%A4rz.pdf")) NIL NIL)("application" "pdf" NIL '
+             b'NIL NIL "base64" 10 NIL ("attachment" ("filename" {7}', b'odd.pdf'),
+            b')) NIL NIL) "mixed" ("boundary" "b1") NIL NIL NIL))'
+        ]
+        parts = parse_bodystructure(_fetch_items(data)['BODYSTRUCTURE'])
+        self.assertEqual([part.section for part in parts], ['1.1', '1.2', '2', '3'])
+        self.assertEqual([part.file_name for part in parts if part.is_attachment], ['Rechnung März.pdf', 'odd.pdf'])
+        self.assertEqual(parts[1].encoding, 'quoted-printable')
+
+
+class TestMailIngestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.imap = FakeIMAP({
+            b'1': make_message("Invoice 1", [("a.pdf", b"%PDF-a"), ("b.pdf", b"%PDF-b")]),
+            b'2': make_message("No attachment", []),
+            b'3': make_message("=?utf-8?q?Rechnung_M=C3=A4rz?=", [("c.pdf", b"%PDF-c"), ("logo.png", b"PNG")])
+        })
+        fetcher = EmailFetcher('imap.example.com', 'user', 'password', buffer_size=4)
+        fetcher.mail = self.imap
+        self.delivered = []
+        self.failing = {'c.pdf'}
+        self.pipeline = MailIngestPipeline(fetcher, self.deliver, self.test_dir / "spool", extensions=['.pdf'],
+                                           queue_size=1, concurrency=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    async def deliver(self, attachment):
+        if attachment.file_name in self.failing:
+            self.failing.discard(attachment.file_name)
+            raise OSError("spool full")
+        self.delivered.append((attachment.file_name, attachment.path.read_bytes(), attachment.metadata))
+
+    def test_messages_are_marked_seen_after_delivery(self):
+        asyncio.run(self.pipeline.run(once=True))
+        self.assertEqual(sorted((name, data) for name, data, _ in self.delivered),
+                         [('a.pdf', b"%PDF-a"), ('b.pdf', b"%PDF-b")])
+        # The failed message stays unseen and is delivered on the next poll
+        self.assertEqual(sorted(self.imap.seen), [b'1', b'2'])
+
+        asyncio.run(self.pipeline.run(once=True))
+        name, data, metadata = self.delivered[-1]
+        self.assertEqual((name, data), ('c.pdf', b"%PDF-c"))
+        self.assertEqual(metadata['subject'], "Rechnung März")
+        self.assertEqual((metadata['uid'], metadata['filename']), ('3', 'c.pdf'))
+        self.assertEqual(metadata['sha256'], hashlib.sha256(b"%PDF-c").hexdigest())
+        self.assertEqual(sorted(self.imap.seen), [b'1', b'2', b'3'])
+        self.assertEqual(self.pipeline.delivered, 3)
+        # Staged files are gone once delivered
+        self.assertEqual(list((self.test_dir / "spool").iterdir()), [])
+
+    def test_filtered_parts_are_not_downloaded(self):
+        self.failing.clear()
+        self.pipeline.attachment_filter = AttachmentFilter(['.pdf'], max_size=1000, min_size=4)
+        self.imap.messages[b'4'] = message_from_bytes(
+            make_message("Big", [("scan.pdf", b"%PDF-" + b"x" * 2000)]), policy=policy.default
+        )
+        asyncio.run(self.pipeline.run(once=True))
+        # a.pdf and b.pdf lack the PDF trailer once downloaded
+        self.assertEqual(self.delivered, [])
+        self.assertEqual(sorted(self.imap.seen), [b'1', b'2', b'3', b'4'])
+        self.assertNotIn((b'4', '2'), self.imap.fetched_sections)
+        counts = self.pipeline.attachment_filter.counts()
+        self.assertEqual((counts['extension'], counts['too_large'], counts['pdf_structure']), (1, 1, 3))
+
+
+class TestDelivery(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "inv.pdf"
+        self.path.write_bytes(b"%PDF-1.4")
+        header = b"Subject: Invoice\r\nFrom: billing@vendor.example\r\n\r\n"
+        self.attachment = Attachment('inv.pdf', self.path, message_metadata(header, b'9'))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_processor_gets_file_and_metadata(self):
+        processor = MagicMock()
+        asyncio.run(processor_delivery(processor)(self.attachment))
+        processor.process_document.assert_called_once_with(self.path, self.attachment.metadata)
+        self.assertEqual(self.attachment.metadata['subject'], 'Invoice')
+
+    def test_queued_task_keeps_metadata(self):
+        broker = SQLiteBroker(self.test_dir / "tasks.sqlite3")
+        config = {'task_queue': {'spool_directory': str(self.test_dir / "queue")}}
+        try:
+            asyncio.run(queue_delivery(broker, config)(self.attachment))
+            task = broker.reserve()
+            self.assertEqual((task.payload['metadata']['subject'], task.payload['metadata']['uid']), ('Invoice', '9'))
+            self.assertEqual(Path(task.payload['file_path']).read_bytes(), b"%PDF-1.4")
+            self.assertFalse(self.path.exists())
+        finally:
+            broker.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
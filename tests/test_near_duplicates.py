@@ -0,0 +1,108 @@
+import random
+import unittest
+from pathlib import Path
+import tempfile
+import shutil
+
+from src.near_duplicates import MinHasher, NearDuplicateIndex, optimal_bands, same_invoice, similarity
+
+
+def invoice_text(number: int, vendor: str = "ACME Supplies GmbH") -> str:
+    rng = random.Random(number)
+    lines = [vendor, "Musterstrasse 12, 10115 Berlin", f"Invoice No {number:06d}",
+             f"Date {rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2024"]
+    lines += [f"{rng.choice(['Widget', 'Gadget', 'Service', 'Licence'])} {rng.randint(100, 999)} "
+              f"qty {rng.randint(1, 9)} at {rng.randint(1, 500)}.00 EUR" for _ in range(15)]
+    lines.append(f"Gross Amount incl. VAT {rng.randint(1000, 9999)}.00 EUR")
+    return "\n".join(lines)
+
+
+def template_invoice(number: int, total: str) -> str:
+    """Monthly invoice from one vendor template: only number, date and total change"""
+    lines = ["ACME Supplies GmbH", "Musterstrasse 12, 10115 Berlin", f"Invoice No {number:06d}",
+             f"Date 01.{number % 12 + 1:02d}.2024"]
+    lines += [f"Hosting plan {item} qty 1 at 49.00 EUR" for item in range(15)]
+    lines.append(f"Gross Amount incl. VAT {total} EUR")
+    return "\n".join(lines)
+
+
+def ocr_noise(text: str, rate: float, seed: int = 0) -> str:
+    """Substitute a fraction of the letters and digits, as a rescan might"""
+    rng = random.Random(seed)
+    return "".join(rng.choice("il1oO0") if char.isalnum() and rng.random() < rate else char
+                   for char in text)
+
+
+class TestMinHash(unittest.TestCase):
+    def test_similarity_tracks_noise(self):
+        hasher = MinHasher()
+        text = invoice_text(1)
+        self.assertEqual(similarity(hasher.signature(text), hasher.signature(text)), 1.0)
+        noisy = similarity(hasher.signature(text), hasher.signature(ocr_noise(text, 0.01)))
+        other = similarity(hasher.signature(text), hasher.signature(invoice_text(2)))
+        self.assertGreater(noisy, 0.85)
+        self.assertLess(other, 0.5)
+
+    def test_bands_favour_recall_at_threshold(self):
+        bands, rows = optimal_bands(0.85, 128)
+        self.assertEqual(bands * rows, 128)
+        self.assertGreaterEqual(1 - (1 - 0.85 ** rows) ** bands, 0.99)
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.db_path = self.test_dir / "index.sqlite3"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_finds_rescanned_copy(self):
+        index = NearDuplicateIndex(self.db_path)
+        for number in range(50):
+            index.add(f"invoice_{number}.pdf", invoice_text(number))
+
+        matches = index.query(ocr_noise(invoice_text(7), 0.01, seed=3))
+        self.assertEqual([match['document_id'] for match in matches], ["invoice_7.pdf"])
+        self.assertEqual(index.query(invoice_text(99)), [])
+        index.close()
+
+    def test_short_text_ignored(self):
+        index = NearDuplicateIndex(self.db_path)
+        self.assertFalse(index.add("blank.pdf", "Page 1"))
+        self.assertEqual(index.query("Page 1"), [])
+        index.close()
+
+    def test_persists_and_rebands(self):
+        index = NearDuplicateIndex(self.db_path)
+        index.add("invoice.pdf", invoice_text(1))
+        index.close()
+
+        reopened = NearDuplicateIndex(self.db_path, threshold=0.95)
+        self.assertNotEqual((reopened.bands, reopened.rows), (index.bands, index.rows))
+        self.assertEqual(reopened.query(invoice_text(1))[0]['document_id'], "invoice.pdf")
+        reopened.close()
+
+    def test_same_template_needs_matching_key_fields(self):
+        index = NearDuplicateIndex(self.db_path)
+        index.add("sha-1", template_invoice(1, "735.00"), source="march.pdf",
+                  fields={'invoice_number': '000001', 'total_amount': '735.00'})
+
+        matches = index.query(template_invoice(2, "786.50"))
+        self.assertEqual([match['source'] for match in matches], ["march.pdf"])
+        self.assertFalse(same_invoice(matches[0]['fields'], {'invoice_number': '000002', 'total_amount': '786.50'}))
+        self.assertTrue(same_invoice(matches[0]['fields'], {'invoice_number': '000001', 'total_amount': '$735.00'}))
+        # Unknown fields never confirm a match
+        self.assertFalse(same_invoice({}, {}))
+        index.close()
+
+    def test_from_config(self):
+        self.assertIsNone(NearDuplicateIndex.from_config({}))
+        index = NearDuplicateIndex.from_config({'near_duplicate_detection': {
+            'enabled': True, 'index_path': str(self.db_path), 'similarity_threshold': 0.9
+        }})
+        self.assertEqual(index.threshold, 0.9)
+        index.close()
+
+if __name__ == '__main__':
+    unittest.main()
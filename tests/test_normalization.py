@@ -0,0 +1,103 @@
+import itertools
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from src.normalization import (
+    DATE_FORMATS,
+    normalize_amount,
+    parse_amount,
+    parse_amounts,
+    parse_date,
+    parse_dates
+)
+
+
+def strptime_reference(value):
+    """Date parsing as previously done by InvoiceValidator._validate_date"""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+class TestDateParsing(unittest.TestCase):
+    def test_matches_strptime_formats(self):
+        """The single-match recogniser agrees with trying each format"""
+        parts = ['0', '1', '01', '9', '12', '13', '29', '30', '31', '32', ' 5', '2024', '2023']
+        samples = [
+            f"{a}{sep}{b}{sep}{c}"
+            for sep in '/-.'
+            for a, b, c in itertools.product(parts, repeat=3)
+        ]
+        samples += ['', '2024-03-15 ', '15.03.24', '15.03-2024', '2024/03/15', 'March 5, 2024', '1/2/24']
+        for value in samples:
+            self.assertEqual(parse_date(value), strptime_reference(value), repr(value))
+
+    def test_day_first_then_month_first(self):
+        """Slash dates are read day-first unless that is impossible"""
+        self.assertEqual(parse_date('05/03/2024'), '2024-03-05')
+        self.assertEqual(parse_date('03/25/2024'), '2024-03-25')
+
+    def test_non_string(self):
+        """Non-string values are not dates"""
+        self.assertIsNone(parse_date(None))
+        self.assertIsNone(parse_date(20240315))
+
+
+class TestAmountParsing(unittest.TestCase):
+    def test_common_layouts(self):
+        """Currency symbols and thousands separators are handled"""
+        cases = {
+            '$1,000.00': Decimal('1000.00'),
+            '€1.234,56': Decimal('1234.56'),
+            '1 234,56 €': Decimal('1234.56'),
+            "CHF 1'234.50": Decimal('1234.50'),
+            '12,50': Decimal('12.50'),
+            '1,000': Decimal('1000'),
+            '1.234.567': Decimal('1234567'),
+            '1.234': Decimal('1.234'),
+            '-42.10': Decimal('-42.10'),
+            '99': Decimal('99'),
+        }
+        for value, expected in cases.items():
+            self.assertEqual(parse_amount(value), expected, value)
+
+    def test_invalid_amounts(self):
+        """Values without a single valid number are rejected"""
+        for value in ['', 'N/A', '2024-03-15', '1.2.3,4,5', None, True]:
+            self.assertIsNone(parse_amount(value), value)
+
+    def test_locale_decides_ambiguous_separator(self):
+        """An explicit separator or locale overrides the heuristics"""
+        self.assertEqual(parse_amount('1.234', locale='de_DE'), Decimal('1234'))
+        self.assertEqual(parse_amount('1,234', locale='de_DE'), Decimal('1.234'))
+        self.assertEqual(parse_amount('1,234', decimal_separator='.'), Decimal('1234'))
+
+    def test_numbers_and_normalized_string(self):
+        """Numbers are accepted and normalised strings are plain decimals"""
+        self.assertEqual(parse_amount(Decimal('10.5')), Decimal('10.5'))
+        self.assertEqual(parse_amount(7), Decimal('7'))
+        self.assertEqual(normalize_amount('€ 1.234,56'), '1234.56')
+
+
+class TestBulkParsing(unittest.TestCase):
+    def test_lists(self):
+        """Bulk variants return one result per input"""
+        self.assertEqual(parse_dates(['2024-03-15', 'bad', '2024-03-15']),
+                         ['2024-03-15', None, '2024-03-15'])
+        self.assertEqual(parse_amounts(['$5', '$5', 'x']), [Decimal('5'), Decimal('5'), None])
+
+    def test_series(self):
+        """pandas Series keep their index"""
+        series = pd.Series(['1,5', '2.5', '1,5'], index=[10, 11, 12])
+        result = parse_amounts(series, locale='de')
+        self.assertEqual(list(result.index), [10, 11, 12])
+        self.assertEqual(list(result), [Decimal('1.5'), Decimal('25'), Decimal('1.5')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,386 @@
+import os
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import tempfile
+import shutil
+from decimal import Decimal
+
+import numpy as np
+from PIL import Image
+
+from src.exceptions import ConfigurationError
+from src.ocr import (
+    OCREngine,
+    OCRProfile,
+    OCRWorkerPool,
+    PageImageCache,
+    PytesseractEngine,
+    RegionOfInterestOCR,
+    VendorTemplate,
+    create_engine,
+    document_hash,
+    get_profile,
+    otsu_threshold,
+    preprocess,
+    profile_from_config,
+    render_pages,
+    frame_count,
+    iter_frames
+)
+from src.ocr.engines import tesserocr
+from src.pdf_processor import PDFProcessor
+from src.scheduler import probe_document
+from src.text_extractor import TextExtractor
+from reportlab.pdfgen import canvas
+
+
+def scanned_page(width: int = 200, height: int = 100) -> Image.Image:
+    """Dark text-like blocks on a noisy light background"""
+    rng = np.random.RandomState(0)
+    pixels = rng.normal(200, 15, size=(height, width, 3))
+    pixels[40:60, 20:180] = rng.normal(40, 15, size=(20, 160, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+
+
+class TestProfiles(unittest.TestCase):
+    def test_tesseract_options(self):
+        profile = OCRProfile('custom', dpi=200, psm=6, oem=1, lang='deu')
+        self.assertEqual(profile.tesseract_config, '--psm 6 --oem 1')
+        self.assertEqual(profile.raster_key, '200dpi-gray-otsu')
+
+    def test_config_overrides_builtin(self):
+        profile = profile_from_config({'ocr': {'profile': 'fast', 'profiles': {'fast': {'lang': 'deu'}}}})
+        self.assertEqual(profile.lang, 'deu')
+        self.assertEqual(profile.dpi, get_profile('fast').dpi)
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ConfigurationError):
+            get_profile('nonexistent')
+        with self.assertRaises(ConfigurationError):
+            OCRProfile('bad', threshold='adaptive')
+
+
+class TestPreprocessing(unittest.TestCase):
+    def test_otsu_separates_text_from_background(self):
+        image = scanned_page().convert('L')
+        level = otsu_threshold(image)
+        self.assertTrue(60 < level < 180)
+
+    def test_binarised_page(self):
+        image = preprocess(scanned_page(), get_profile('balanced'))
+        values = np.asarray(image.convert('L'))
+        self.assertEqual(set(np.unique(values)), {0, 255})
+        self.assertEqual(values[50, 100], 0)
+        self.assertEqual(values[10, 10], 255)
+
+    def test_grayscale_only(self):
+        image = preprocess(scanned_page(), get_profile('fast'))
+        self.assertEqual(image.mode, 'L')
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.test_dir / 'scan.pdf'
+        self.pdf_path.write_bytes(b'%PDF-1.4 scanned document')
+        self.cache = PageImageCache(self.test_dir / 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_round_trip(self):
+        doc_hash = document_hash(str(self.pdf_path))
+        self.assertIsNone(self.cache.get(doc_hash, 'key', 0))
+        self.cache.put(doc_hash, 'key', 0, scanned_page())
+        self.assertEqual(self.cache.get(doc_hash, 'key', 0).size, (200, 100))
+
+    def test_evicts_least_recently_read_pages_over_size_limit(self):
+        self.cache.put('ab' * 32, 'key', 0, scanned_page())
+        page_size = self.cache._size
+        cache = PageImageCache(self.test_dir / 'cache', max_bytes=int(page_size * 2.5))
+        cache.put('ab' * 32, 'key', 1, scanned_page())
+        # Reading page 0 makes page 1 the least recently used
+        path = cache._path('ab' * 32, 'key', 0)
+        os.utime(path, (0, 0))
+        os.utime(cache._path('ab' * 32, 'key', 1), (1, 1))
+        self.assertIsNotNone(cache.get('ab' * 32, 'key', 0))
+
+        cache.put('ab' * 32, 'key', 2, scanned_page())
+        self.assertIsNotNone(cache.get('ab' * 32, 'key', 0))
+        self.assertIsNone(cache.get('ab' * 32, 'key', 1))
+        self.assertIsNotNone(cache.get('ab' * 32, 'key', 2))
+
+    def test_evicts_expired_pages(self):
+        self.cache.put('cd' * 32, 'key', 0, scanned_page())
+        path = self.cache._path('cd' * 32, 'key', 0)
+        os.utime(path, (0, 0))
+        self.cache.put('ef' * 32, 'key', 0, scanned_page())
+
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertFalse(path.parent.exists())
+        self.assertIsNotNone(self.cache.get('ef' * 32, 'key', 0))
+
+    @patch('src.ocr.raster.convert_from_path')
+    def test_retry_skips_rasterisation(self, convert):
+        convert.side_effect = lambda path, first_page, last_page, **kwargs: [
+            scanned_page() for _ in range(first_page, last_page + 1)
+        ]
+        profile = get_profile('balanced')
+        first = render_pages(str(self.pdf_path), 0, 3, profile, self.cache)
+        convert.assert_called_once()
+        self.assertEqual(convert.call_args.kwargs['dpi'], 300)
+
+        convert.reset_mock()
+        second = render_pages(str(self.pdf_path), 0, 3, profile, self.cache)
+        convert.assert_not_called()
+        self.assertEqual([image.tobytes() for image in first], [image.tobytes() for image in second])
+
+        # Only pages missing from the cache are rendered
+        render_pages(str(self.pdf_path), 2, 3, profile, self.cache)
+        self.assertEqual((convert.call_args.kwargs['first_page'], convert.call_args.kwargs['last_page']), (4, 5))
+
+
+class RecordingEngine(OCREngine):
+    """Engine returning the image width, recording which thread created it"""
+    created = []
+
+    def __init__(self):
+        RecordingEngine.created.append(threading.get_ident())
+
+    def recognize(self, image, profile):
+        return f"{image.size[0]}"
+
+
+class TestEngines(unittest.TestCase):
+    def test_pool_keeps_one_engine_per_worker(self):
+        RecordingEngine.created = []
+        pool = OCRWorkerPool(RecordingEngine, workers=2)
+        images = [Image.new('L', (width, 10)) for width in range(1, 41)]
+        for _ in range(3):
+            texts = pool.recognize_pages(images, get_profile())
+        pool.close()
+        self.assertEqual(texts, [str(width) for width in range(1, 41)])
+        self.assertLessEqual(len(RecordingEngine.created), 2)
+        self.assertEqual(len(set(RecordingEngine.created)), len(RecordingEngine.created))
+
+    @patch('src.ocr.engines.pytesseract.image_to_string', return_value='text')
+    def test_pytesseract_fallback_options(self, image_to_string):
+        profile = OCRProfile('custom', psm=6, lang='deu')
+        self.assertEqual(PytesseractEngine().recognize(Image.new('L', (10, 10)), profile), 'text')
+        self.assertEqual(image_to_string.call_args.kwargs, {'lang': 'deu', 'config': '--psm 6 --oem 1'})
+
+    @unittest.skipIf(tesserocr is not None, "tesserocr is installed")
+    def test_auto_falls_back_without_tesserocr(self):
+        pool = create_engine('auto', workers=1)
+        self.assertIs(pool.engine_factory, PytesseractEngine)
+        pool.close()
+        with self.assertRaises(ConfigurationError):
+            create_engine('tesserocr')
+
+    def test_auto_falls_back_when_tessdata_is_missing(self):
+        fake_tesserocr = MagicMock()
+        fake_tesserocr.PyTessBaseAPI.side_effect = RuntimeError('Failed to init API, possibly an invalid tessdata path')
+        with patch('src.ocr.engines.tesserocr', fake_tesserocr):
+            pool = create_engine('auto', workers=1, tessdata_path='/missing/tessdata')
+            self.assertIs(pool.engine_factory, PytesseractEngine)
+            pool.close()
+            with self.assertRaises(RuntimeError):
+                create_engine('tesserocr', tessdata_path='/missing/tessdata')
+        self.assertEqual(fake_tesserocr.PyTessBaseAPI.call_args.kwargs['path'], '/missing/tessdata')
+
+    def test_pdf_processor_uses_engine(self):
+        engine = MagicMock()
+        engine.recognize_pages.return_value = ['page one', 'page two']
+        processor = PDFProcessor(ocr_engine=engine)
+        with patch('src.pdf_processor.render_pages', return_value=['image 1', 'image 2']):
+            pages = processor._ocr_pages('scan.pdf', 0, 2)
+        self.assertEqual(pages, ['page one\n', 'page two\n'])
+        engine.recognize_pages.assert_called_once_with(['image 1', 'image 2'], processor.ocr_profile)
+
+
+TEMPLATE = {
+    'name': 'acme',
+    'vendor': 'ACME Supplies',
+    'match': {'keywords': ['acme supplies'], 'sender_domains': ['acme.example']},
+    'regions': {
+        'invoice_number': {'box': [0.1, 0.3, 0.4, 0.35], 'pattern': r'No\.?\s*(\S+)'},
+        'total_amount': {'page': -1, 'box': [0.6, 0.8, 0.9, 0.85], 'pattern': r'Total\s*([\d.,]+)'}
+    }
+}
+
+
+class RegionEngine(OCREngine):
+    """Engine returning the text printed in the region a test image was rendered from"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.regions = []
+
+    def recognize(self, image, profile):
+        region = image.info['region']
+        self.regions.append(region)
+        return self.texts.get(region, '')
+
+
+def render_region_stub(file_path, page, box, dpi, page_size, grayscale=True):
+    image = Image.new('L', (int((box[2] - box[0]) * 100), int((box[3] - box[1]) * 100)), 255)
+    image.info['region'] = (page, tuple(box))
+    return image
+
+
+@patch('src.ocr.roi.preprocess', side_effect=lambda image, profile: image)
+@patch('src.ocr.roi.render_region', side_effect=render_region_stub)
+@patch('src.ocr.roi.page_sizes', return_value=[(595.0, 842.0), (595.0, 842.0)])
+class TestRegionOfInterestOCR(unittest.TestCase):
+    def create_roi(self, texts):
+        engine = RegionEngine(texts)
+        return RegionOfInterestOCR([VendorTemplate.from_dict(TEMPLATE)], engine, get_profile()), engine
+
+    def test_fields_from_regions(self, page_sizes, render_region, preprocess):
+        roi, engine = self.create_roi({
+            (0, (0.0, 0.0, 1.0, 0.2)): 'ACME  Supplies Ltd.',
+            (0, (0.1, 0.3, 0.4, 0.35)): 'Invoice No. INV-2024-001',
+            (1, (0.6, 0.8, 0.9, 0.85)): 'Total 1,250.00'
+        })
+        data = roi.extract('scan.pdf')
+        self.assertEqual(data['invoice_number'], 'INV-2024-001')
+        self.assertEqual(data['total_amount'], 1250.0)
+        self.assertEqual(data['vendor'], 'ACME Supplies')
+        # Header strip at low resolution, then only the field regions
+        self.assertEqual([call.args[3] for call in render_region.call_args_list], [150, 400, 400])
+
+    def test_sender_identifies_vendor(self, page_sizes, render_region, preprocess):
+        roi, engine = self.create_roi({
+            (0, (0.1, 0.3, 0.4, 0.35)): 'No. INV-7',
+            (1, (0.6, 0.8, 0.9, 0.85)): 'Total 10.00'
+        })
+        data = roi.extract('scan.pdf', {'from': 'Billing <billing@eu.acme.example>'})
+        self.assertEqual(data['invoice_number'], 'INV-7')
+        self.assertNotIn((0, (0.0, 0.0, 1.0, 0.2)), engine.regions)
+
+    def test_invalid_field_falls_back(self, page_sizes, render_region, preprocess):
+        roi, _ = self.create_roi({
+            (0, (0.1, 0.3, 0.4, 0.35)): 'No. ??',
+            (1, (0.6, 0.8, 0.9, 0.85)): 'Total 10.00'
+        })
+        self.assertIsNone(roi.extract('scan.pdf', {'from': 'billing@acme.example'}))
+        roi, _ = self.create_roi({(0, (0.0, 0.0, 1.0, 0.2)): 'Other Vendor GmbH'})
+        self.assertIsNone(roi.extract('scan.pdf'))
+
+    def test_shipped_template(self, page_sizes, render_region, preprocess):
+        """Fields read with config/vendor_templates.json pass validation, so full-page OCR is skipped"""
+        config = {'ocr': {'roi': {'enabled': True, 'templates_path': 'config/vendor_templates.json'}}}
+        for printed_date, date in (('15.03.2024', '2024-03-15'), ('15/03/2024', '2024-03-15')):
+            engine = RegionEngine({
+                (0, (0.0, 0.0, 1.0, 0.2)): 'WMACCESS GmbH',
+                (0, (0.05, 0.28, 0.35, 0.33)): 'RE-2024/0815',
+                (0, (0.65, 0.28, 0.95, 0.33)): f'Datum {printed_date}',
+                (1, (0.55, 0.60, 0.95, 0.72)): 'Gross Amount incl. VAT 1.190,00'
+            })
+            roi = RegionOfInterestOCR.from_config(config, engine, get_profile())
+            data = roi.extract('scan.pdf')
+            self.assertIsNotNone(data, printed_date)
+            self.assertEqual(data['invoice_number'], 'RE-2024/0815')
+            self.assertEqual(data['date'], date)
+            self.assertEqual(data['total_amount'], Decimal('1190.00'))
+
+    def test_pdf_processor_skips_full_page_ocr(self, page_sizes, render_region, preprocess):
+        test_dir = Path(tempfile.mkdtemp())
+        try:
+            path = test_dir / 'scan.pdf'
+            c = canvas.Canvas(str(path))
+            c.showPage()
+            c.save()
+            roi = MagicMock()
+            roi.extract.return_value = {'invoice_number': 'INV-7', 'total_amount': 10.0}
+            processor = PDFProcessor(ocr_engine=MagicMock(), roi_ocr=roi)
+            with patch('src.pdf_processor.render_pages') as full_page:
+                data = processor.extract_invoice_data(str(path), {'from': 'billing@acme.example'})
+            self.assertEqual(data['invoice_number'], 'INV-7')
+            full_page.assert_not_called()
+            roi.extract.assert_called_once_with(str(path), {'from': 'billing@acme.example'})
+        finally:
+            shutil.rmtree(test_dir)
+
+
+class CountingEngine(OCREngine):
+    """Engine recording how many images were taken from a stream but not yet recognised"""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.most_outstanding = 0
+        self.lock = threading.Lock()
+
+    def frames(self, images):
+        for image in images:
+            with self.lock:
+                self.outstanding += 1
+                self.most_outstanding = max(self.most_outstanding, self.outstanding)
+            yield image
+
+    def recognize(self, image, profile):
+        with self.lock:
+            self.outstanding -= 1
+        return f"{image.size[0]}"
+
+
+class TestImageDocuments(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.tiff = self.test_dir / "scan.tiff"
+        frames = [scanned_page(width=200 + 10 * index) for index in range(3)]
+        frames[0].save(self.tiff, save_all=True, append_images=frames[1:])
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_tiff_frames_read_lazily(self):
+        self.assertEqual(frame_count(self.tiff), 3)
+        frames = iter_frames(self.tiff, get_profile(), first_page=1, max_pages=1)
+        self.assertNotIsInstance(frames, list)
+        images = list(frames)
+        self.assertEqual([image.size[0] for image in images], [210])
+        self.assertEqual(images[0].mode, '1')
+        self.assertEqual(probe_document(self.tiff), (3, True))
+
+    def test_phone_photo_is_turned_upright(self):
+        photo = self.test_dir / "receipt.jpg"
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        scanned_page(width=200, height=100).save(photo, exif=exif)
+        self.assertEqual(next(iter_frames(photo, get_profile())).size, (100, 200))
+
+    def test_pool_takes_images_as_workers_free_up(self):
+        engine = CountingEngine()
+        pool = OCRWorkerPool(lambda: engine, workers=2)
+        images = [Image.new('L', (width, 10)) for width in range(1, 21)]
+        texts = pool.recognize_stream(engine.frames(images), get_profile())
+        pool.close()
+        self.assertEqual(texts, [str(width) for width in range(1, 21)])
+        self.assertLessEqual(engine.most_outstanding, 3)
+
+    def test_pdf_processor_ocrs_images_without_pdf(self):
+        engine = MagicMock()
+        engine.recognize_stream.side_effect = lambda images, profile: [
+            f"INVOICE page {image.size[0]}" for image in images
+        ]
+        processor = PDFProcessor(ocr_engine=engine, classification_max_pages=2)
+        with patch('src.pdf_processor.pdfplumber.open') as pdf_open, \
+                patch('src.pdf_processor.render_pages') as render:
+            pages, truncated = processor._extract_pages(str(self.tiff), max_pages=2)
+            self.assertEqual((pages, truncated), (['INVOICE page 200\n', 'INVOICE page 210\n'], True))
+            rest, truncated = processor._extract_pages(str(self.tiff), first_page=2)
+            self.assertEqual((rest, truncated), (['INVOICE page 220\n'], False))
+        pdf_open.assert_not_called()
+        render.assert_not_called()
+
+    def test_text_extractor_reads_images(self):
+        engine = MagicMock()
+        engine.recognize_stream.side_effect = lambda images, profile: ["Invoice" for _ in images]
+        text, truncated = TextExtractor(ocr_engine=engine).extract_head(self.tiff, max_pages=1)
+        self.assertEqual((text, truncated), ("Invoice\n", True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import threading
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+from decimal import Decimal
+from datetime import date
+import json
+import tempfile
+import shutil
+
+from src.intent_log import lock_file
+from src.parquet_export import ParquetExporter, pa
+
+if pa is not None:
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+
+def processing_record(number, category='invoice', amount='1,234.50', day='2024-03-16'):
+    return {
+        'timestamp': f'{day}T10:00:{number:02d}',
+        'file_path': f'documents/input/invoice_{number}.pdf',
+        'categories': [category],
+        'status': 'processed',
+        'confidence': 0.9,
+        'final_path': f'processed_documents/{category}/{day}/invoice_{number}.pdf',
+        'extracted_data': {
+            'invoice_number': f'INV-{number}',
+            'vendor': 'ACME Supplies Ltd.',
+            'date': '15/03/2024',
+            'total_amount': amount,
+            'line_items': [{'description': 'Consulting', 'total': amount}]
+        }
+    }
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestParquetExporter(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.exporter = ParquetExporter(self.test_dir / "export", flush_rows=2, flush_seconds=60,
+                                        compact_interval=None, compact_min_files=2)
+
+    def tearDown(self):
+        self.exporter.close()
+        shutil.rmtree(self.test_dir)
+
+    def part_files(self):
+        return sorted(self.exporter.root.rglob('part-*.parquet'))
+
+    def test_types_and_partitions(self):
+        self.exporter.append(processing_record(1))
+        self.exporter.append(processing_record(2, category='receipt', amount='12.345'))
+        self.exporter.flush()
+
+        self.assertEqual(
+            sorted(str(path.parent.relative_to(self.exporter.root)) for path in self.part_files()),
+            ['date=2024-03-16/category=invoice', 'date=2024-03-16/category=receipt']
+        )
+        table = self.exporter.dataset().to_table(
+            columns=['invoice_number', 'invoice_date', 'total_amount', 'category'],
+            filter=ds.field('category') == 'invoice'
+        )
+        self.assertEqual(table.schema.field('total_amount').type, pa.decimal128(20, 4))
+        self.assertEqual(table.to_pylist(), [{
+            'invoice_number': 'INV-1',
+            'invoice_date': date(2024, 3, 15),
+            'total_amount': Decimal('1234.5000'),
+            'category': 'invoice'
+        }])
+
+    def test_buffers_until_flush_rows(self):
+        self.exporter.append(processing_record(1))
+        self.assertEqual(self.part_files(), [])
+        self.exporter.append(processing_record(2))
+        self.assertEqual(len(self.part_files()), 1)
+
+    def test_compact_merges_small_files(self):
+        for number in range(6):
+            self.exporter.append(processing_record(number))
+            self.exporter.flush()
+        self.assertEqual(len(self.part_files()), 6)
+
+        self.assertEqual(self.exporter.compact(), 1)
+        files = self.part_files()
+        self.assertEqual(len(files), 1)
+        self.assertEqual(pq.read_table(files[0]).num_rows, 6)
+        self.assertEqual(list(self.exporter.root.rglob('.*')), [])
+
+    def test_compaction_skips_partition_locked_by_another_process(self):
+        for number in range(2):
+            self.exporter.append(processing_record(number))
+            self.exporter.flush()
+        directory = self.part_files()[0].parent
+        with lock_file(directory / '_compaction.lock'):
+            self.assertEqual(self.exporter.compact(), 0)
+            self.assertEqual(len(self.part_files()), 2)
+        self.assertEqual(self.exporter.compact(), 1)
+        self.assertEqual(self.exporter.dataset().count_rows(), 2)
+
+    def test_rows_are_written_during_compaction(self):
+        for number in range(2):
+            self.exporter.append(processing_record(number))
+            self.exporter.flush()
+        compact_partition = self.exporter._compact_partition
+
+        def flush_meanwhile(directory, min_files):
+            writer = threading.Thread(target=lambda: self.exporter.append_batch('job-1', {'results': [
+                {'file_name': 'a.pdf', 'status': 'success', 'data': {'invoice_number': 'INV-9'}}
+            ] * 2}, '2024-03-16T12:00:00'))
+            writer.start()
+            writer.join(timeout=5)
+            self.assertFalse(writer.is_alive())
+            return compact_partition(directory, min_files)
+
+        with patch.object(self.exporter, '_compact_partition', side_effect=flush_meanwhile):
+            self.assertEqual(self.exporter.compact(), 1)
+        self.assertEqual(self.exporter.dataset().count_rows(), 4)
+
+    def test_interrupted_compaction_is_completed(self):
+        for number in range(2):
+            self.exporter.append(processing_record(number))
+            self.exporter.flush()
+        sources = self.part_files()
+        directory = sources[0].parent
+        # Crash after the merged file was written but before the originals were removed
+        merged = directory / 'part-merged.parquet'
+        pq.write_table(pa.concat_tables(pq.read_table(path) for path in sources), merged)
+        with open(directory / '_compacting.json', 'w') as f:
+            json.dump({'target': merged.name, 'temp': '.part-merged.parquet.tmp',
+                       'sources': [path.name for path in sources]}, f)
+
+        self.exporter.compact(min_files=10)
+        self.assertEqual(self.part_files(), [merged])
+        self.assertEqual(self.exporter.dataset().count_rows(), 2)
+
+    def test_export_files(self):
+        records_dir = self.test_dir / "records"
+        results_dir = self.test_dir / "results"
+        records_dir.mkdir()
+        results_dir.mkdir()
+        with open(records_dir / "processing_record_20240316.json", "w") as f:
+            json.dump([processing_record(1), processing_record(2)], f)
+        with open(results_dir / "job-1.json", "w") as f:
+            json.dump({'results': [{'file_name': 'a.pdf', 'status': 'success',
+                                    'data': {'invoice_number': 'B-1', 'total_amount': '5.00'}}]}, f)
+
+        self.assertEqual(self.exporter.export_files(records_dir, results_dir), 3)
+        table = self.exporter.dataset().to_table(columns=['source', 'invoice_number'])
+        self.assertEqual(sorted(table.column('invoice_number').to_pylist()), ['B-1', 'INV-1', 'INV-2'])
+
+    def test_from_config(self):
+        self.assertIsNone(ParquetExporter.from_config({}))
+        exporter = ParquetExporter.from_config({'parquet_export': {
+            'enabled': True, 'root': str(self.test_dir / "configured"), 'flush_rows': 10
+        }})
+        self.assertEqual(exporter.flush_rows, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from pathlib import Path
 import tempfile
 import os
+from unittest.mock import MagicMock, patch
 from src.pdf_processor import PDFProcessor
 
 class TestPDFProcessor(unittest.TestCase):
@@ -50,6 +51,98 @@ class TestPDFProcessor(unittest.TestCase):
         self.assertIn('amount', result)
         self.assertIn('vendor', result)
 
+    def _create_multipage_pdf(self, page_count: int) -> Path:
+        """Create a text PDF with one numbered line per page"""
+        from reportlab.pdfgen import canvas
+        pdf_path = self.test_dir / "statement.pdf"
+        c = canvas.Canvas(str(pdf_path))
+        for index in range(page_count):
+            c.drawString(100, 750, f"Annual statement page {index + 1}")
+            c.showPage()
+        c.save()
+        return pdf_path
+
+    def test_extract_pages_stops_at_page_bound(self):
+        """Bounded extraction reads only the leading pages"""
+        pdf_path = self._create_multipage_pdf(5)
+        pages, truncated = self.processor._extract_pages(str(pdf_path), max_pages=2)
+        self.assertEqual(len(pages), 2)
+        self.assertTrue(truncated)
+        self.assertIn("page 2", pages[1])
+
+        remaining, truncated = self.processor._extract_pages(str(pdf_path), first_page=2)
+        self.assertEqual(len(remaining), 3)
+        self.assertFalse(truncated)
+        self.assertIn("page 5", remaining[-1])
+
+    def test_non_invoice_rejected_from_header_only(self):
+        """Rejecting a long non-invoice never reads past the header pages"""
+        pdf_path = self._create_multipage_pdf(10)
+        self.processor.categorizer = MagicMock()
+        self.processor.categorizer.categorize.return_value = {'categories': ['statement']}
+
+        with patch.object(self.processor, '_extract_pages',
+                          wraps=self.processor._extract_pages) as extract_pages:
+            result = self.processor.extract_invoice_data(str(pdf_path))
+
+        self.assertFalse(result['is_valid'])
+        extract_pages.assert_called_once()
+        text = self.processor.categorizer.categorize.call_args[0][1]['text']
+        self.assertNotIn("page 3", text)
+
+    def _near_duplicate_processor(self):
+        from src.near_duplicates import NearDuplicateIndex
+        index = NearDuplicateIndex(self.test_dir / "near_duplicates.sqlite3", min_text_length=10)
+        self.addCleanup(index.close)
+        processor = PDFProcessor(near_duplicate_index=index)
+        processor.categorizer = MagicMock()
+        processor.categorizer.categorize.return_value = {'categories': ['invoice']}
+        return processor
+
+    def _invoice_file(self, name: str, content: bytes) -> Path:
+        path = self.test_dir / name
+        path.write_bytes(content)
+        return path
+
+    def test_near_duplicate_confirmed_by_key_fields(self):
+        """A rescan with the same invoice number and total is rejected"""
+        processor = self._near_duplicate_processor()
+        text = "ACME Supplies\nInvoice No 4711 Invoice Period March 2024\nGross Amount incl. VAT 119.00\n"
+        fields = {'invoice_number': '4711', 'date': '', 'total_amount': '119.00', 'vendor': 'ACME', 'description': ''}
+        original = self._invoice_file("original.pdf", b"%PDF-original")
+        rescan = self._invoice_file("rescan.pdf", b"%PDF-rescan")
+
+        with patch.object(processor, '_extract_pages', return_value=([text * 5], False)), \
+                patch.object(processor, '_extract_invoice_data', side_effect=lambda _: dict(fields)):
+            processor.extract_invoice_data(str(original))
+            result = processor.extract_invoice_data(str(rescan))
+
+        self.assertFalse(result['is_valid'])
+        self.assertEqual(result['errors'], [f"Near-duplicate of {original}"])
+
+    def test_same_template_invoices_are_extracted(self):
+        """Invoices sharing a vendor template but not their number are kept, and resubmissions pass"""
+        processor = self._near_duplicate_processor()
+        template = ("ACME Supplies\nMusterstrasse 12, 10115 Berlin\nInvoice No {number}\n"
+                    + "Monthly hosting plan 1 x 119.00 EUR\nSupport contract 1 x 40.00 EUR\n" * 3
+                    + "Gross Amount incl. VAT {total} EUR\n")
+        march = self._invoice_file("march.pdf", b"%PDF-march")
+        april = self._invoice_file("april.pdf", b"%PDF-april")
+        retry = self._invoice_file("retry.pdf", b"%PDF-march")
+        results = []
+        for path, number, total in ((march, "4711", "159.00"), (april, "4712", "159.50"), (retry, "4711", "159.00")):
+            fields = {'invoice_number': number, 'date': '', 'total_amount': total, 'vendor': 'ACME',
+                      'description': ''}
+            with patch.object(processor, '_extract_pages',
+                              return_value=([template.format(number=number, total=total)], False)), \
+                    patch.object(processor, '_extract_invoice_data', return_value=fields):
+                results.append(processor.extract_invoice_data(str(path)))
+
+        self.assertEqual([result['invoice_number'] for result in results], ["4711", "4712", "4711"])
+        self.assertEqual(results[1]['near_duplicates'][0]['source'], str(march))
+        # Same content under a new name is the indexed document itself, not a copy of it
+        self.assertEqual([match['source'] for match in results[2]['near_duplicates']], [str(april)])
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,167 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import json
+import tempfile
+import shutil
+
+from fastapi.testclient import TestClient
+
+from src.api.main import app
+from src.document_processor import DocumentProcessor
+from src.exceptions import ProcessingError
+from src.record_index import RecordIndex
+
+
+def processing_record(number, vendor='ACME Supplies Ltd.', date='2024-03-15', amount='1,000.00'):
+    return {
+        'timestamp': f'2024-03-16T10:00:{number:02d}',
+        'categories': ['invoice'],
+        'status': 'processed',
+        'final_path': f'processed_documents/invoice/2024-03-16/invoice_{number}.pdf',
+        'extracted_data': {
+            'invoice_number': f'INV-{number}',
+            'vendor': vendor,
+            'date': date,
+            'total_amount': amount,
+            'line_items': [{'description': 'Consulting services', 'total': amount}]
+        }
+    }
+
+
+class TestRecordIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.index = RecordIndex(self.test_dir / "records.sqlite3")
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_filters(self):
+        self.index.add_processing_records([
+            processing_record(1),
+            processing_record(2, vendor='acme  supplies ltd.', date='15/04/2024', amount='250.00'),
+            processing_record(3, vendor='Other GmbH', date='2024-03-20', amount='99.00')
+        ])
+        numbers = lambda **query: [item['invoice_number'] for item in self.index.query(**query)['items']]
+        self.assertEqual(numbers(vendor='ACME Supplies Ltd.'), ['INV-2', 'INV-1'])
+        self.assertEqual(numbers(date_from='2024-03-01', date_to='31/03/2024'), ['INV-3', 'INV-1'])
+        self.assertEqual(numbers(min_amount=100, max_amount=500), ['INV-2'])
+        self.assertEqual(numbers(text='consult'), ['INV-3', 'INV-2', 'INV-1'])
+        self.assertEqual(numbers(text='other'), ['INV-3'])
+        self.assertEqual(numbers(category='receipt'), [])
+        with self.assertRaises(ProcessingError):
+            self.index.query(date_from='not a date')
+
+    def test_search_document_text(self):
+        self.index.add_processing_records(
+            [processing_record(1), processing_record(2)],
+            ["Payable within 30 days to IBAN DE89 3704", None]
+        )
+        numbers = lambda **query: [item['invoice_number'] for item in self.index.query(**query)['items']]
+        self.assertEqual(numbers(text='iban'), ['INV-1'])
+        self.assertEqual(numbers(text='consulting payable'), ['INV-1'])
+        self.assertNotIn('IBAN', json.dumps(self.index.query(text='iban')['items'][0]['record']))
+
+    def test_reindexing_replaces_records(self):
+        self.index.add_processing_records([processing_record(1)])
+        self.index.add_processing_records([processing_record(1, amount='5.00')])
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.query(text='INV')['items'][0]['total_amount'], 5.0)
+
+    def test_cursor_paging(self):
+        self.index.add_processing_records([processing_record(number) for number in range(25)])
+        seen, cursor = [], None
+        while True:
+            page = self.index.query(vendor='acme supplies ltd.', limit=10, cursor=cursor)
+            seen.extend(item['invoice_number'] for item in page['items'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'INV-{number}' for number in reversed(range(25))])
+
+    def test_ingest_files(self):
+        records_dir = self.test_dir / "records"
+        results_dir = self.test_dir / "results"
+        records_dir.mkdir()
+        results_dir.mkdir()
+        (records_dir / "processing_record_20240316.json").write_text(
+            json.dumps([processing_record(1), processing_record(2)]))
+        (results_dir / "job-1.json").write_text(json.dumps({
+            'status': 'completed',
+            'results': [{'file_name': 'scan.pdf', 'status': 'success',
+                         'data': {'invoice_number': 'INV-9', 'vendor': 'Other GmbH', 'total_amount': '10'}}],
+            'errors': [{'file_name': 'broken.pdf', 'error': 'unreadable'}]
+        }))
+        self.assertEqual(self.index.ingest_files(records_dir, results_dir), 4)
+        self.assertEqual(self.index.ingest_files(records_dir, results_dir), 4)
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual([item['file_name'] for item in self.index.query(vendor='other gmbh')['items']],
+                         ['scan.pdf'])
+
+    def test_filters_use_indexes(self):
+        for column in ('vendor_key', 'invoice_date', 'total_amount', 'category'):
+            plan = str(self.index._connection.execute(
+                f"EXPLAIN QUERY PLAN SELECT id FROM records WHERE {column} = ?", ('x',)
+            ).fetchall())
+            self.assertIn('INDEX records_', plan, column)
+
+
+class TestProcessorIndexing(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        config = {
+            "supported_extensions": [".pdf"],
+            "error_directory": str(self.test_dir / "errors"),
+            "processing_records_path": str(self.test_dir / "records"),
+            "max_file_size_mb": 10,
+            "record_index": {"enabled": True, "index_path": str(self.test_dir / "records.sqlite3")}
+        }
+        self.processor = DocumentProcessor(config, base_dir=self.test_dir)
+
+    def tearDown(self):
+        self.processor.record_index.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_document_text_is_indexed_but_not_recorded(self):
+        self.assertTrue(self.processor.categorizer.keep_text)
+        self.processor.categorizer = MagicMock()
+        self.processor.categorizer.categorize.side_effect = lambda *args: {
+            **processing_record(1), 'text': "Payable within 30 days to IBAN DE89 3704"
+        }
+        source = self.test_dir / "invoice.pdf"
+        source.write_bytes(b'%PDF-1.4')
+        result = self.processor.process_document(source)
+
+        self.assertNotIn('text', result)
+        items = self.processor.record_index.query(text='iban')['items']
+        self.assertEqual([item['document_path'] for item in items], [result['final_path']])
+        self.assertNotIn('text', items[0]['record'])
+
+
+class TestRecordsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.index = RecordIndex(self.test_dir / "records.sqlite3")
+        self.index.add_processing_records([processing_record(number) for number in range(3)])
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_search(self):
+        with patch('src.api.main.get_record_index', return_value=self.index):
+            response = self.client.get("/api/v1/records", params={'vendor': 'ACME Supplies Ltd.', 'limit': 2})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertEqual([item['invoice_number'] for item in page['items']], ['INV-2', 'INV-1'])
+            response = self.client.get("/api/v1/records", params={'cursor': page['next_cursor']})
+            self.assertEqual([item['invoice_number'] for item in response.json()['items']], ['INV-0'])
+            self.assertEqual(self.client.get("/api/v1/records", params={'date_from': 'soon'}).status_code, 400)
+        with patch('src.api.main.get_record_index', return_value=None):
+            self.assertEqual(self.client.get("/api/v1/records").status_code, 503)
+
+if __name__ == '__main__':
+    unittest.main()
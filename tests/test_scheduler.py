@@ -0,0 +1,211 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+import threading
+import time
+import tempfile
+import shutil
+
+from reportlab.pdfgen import canvas
+
+from src.api import main as api
+from src.exceptions import ProcessingError
+from src.scheduler import Autoscaler, ExtractionScheduler, probe_document
+
+
+class TestExtractionScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ExtractionScheduler(workers=1, ocr_workers=1)
+        self.order = []
+        self.gate = threading.Event()
+        self.started = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        self.scheduler.shutdown()
+
+    def block_worker(self, lane='cpu'):
+        """Occupy the lane's only worker until the gate opens"""
+        def blocker():
+            self.started.set()
+            self.gate.wait(5)
+        future = self.scheduler.submit(blocker, priority='interactive', lane=lane)
+        self.started.wait(5)
+        return future
+
+    def run_order(self, submissions):
+        self.block_worker()
+        futures = [self.scheduler.submit(self.order.append, name, **options) for name, options in submissions]
+        self.gate.set()
+        for future in futures:
+            future.result(5)
+        return self.order
+
+    def test_priority_classes(self):
+        order = self.run_order([
+            ('bulk', {'priority': 'bulk'}),
+            ('email', {'priority': 'email'}),
+            ('interactive', {'priority': 'interactive'})
+        ])
+        self.assertEqual(order, ['interactive', 'email', 'bulk'])
+
+    def test_flows_share_fairly(self):
+        order = self.run_order(
+            [(f'big-{n}', {'flow': 'big-job'}) for n in range(6)] +
+            [(f'small-{n}', {'flow': 'small-job'}) for n in range(2)]
+        )
+        self.assertEqual(order[:4], ['big-0', 'small-0', 'big-1', 'small-1'])
+
+    def test_weights(self):
+        self.scheduler.weights = {'gold': 3.0}
+        order = self.run_order(
+            [(f'gold-{n}', {'flow': 'gold'}) for n in range(6)] +
+            [(f'basic-{n}', {'flow': 'basic'}) for n in range(6)]
+        )
+        self.assertEqual(sum(name.startswith('gold') for name in order[:8]), 6)
+
+    def test_small_documents_first(self):
+        order = self.run_order([('scan', {'cost': 200}), ('letter', {'cost': 1})])
+        self.assertEqual(order, ['letter', 'scan'])
+
+    def test_ocr_lane_does_not_block_text_documents(self):
+        self.block_worker(lane='ocr')
+        ocr_job = self.scheduler.submit(lambda: 'ocr', lane='ocr')
+        text_job = self.scheduler.submit(lambda: 'text')
+        self.assertEqual(text_job.result(5), 'text')
+        self.assertFalse(ocr_job.done())
+        self.gate.set()
+        self.assertEqual(ocr_job.result(5), 'ocr')
+
+    def test_exceptions_reach_future(self):
+        future = self.scheduler.submit(lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(5)
+
+    def test_queue_wait_metrics(self):
+        self.run_order([('bulk', {'priority': 'bulk'})])
+        waits = self.scheduler.metrics()['queue_wait']
+        self.assertEqual(waits['bulk']['count'], 1)
+        self.assertEqual(waits['interactive']['count'], 1)
+        text = self.scheduler.prometheus()
+        self.assertIn('extraction_queue_wait_seconds_count{class="bulk"} 1', text)
+        self.assertIn('extraction_jobs_running{lane="ocr"} 0', text)
+
+    def test_rejects_unknown_class(self):
+        with self.assertRaises(ProcessingError):
+            self.scheduler.submit(print, priority='urgent')
+
+
+class TestAutoscaler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ExtractionScheduler(workers=1, ocr_workers=1)
+        self.gate = threading.Event()
+        self.load = 0.2
+        self.autoscaler = Autoscaler(self.scheduler, {'cpu': (1, 8), 'ocr': (1, 4)}, cooldown=10,
+                                     target_wait=2.0, max_load=0.9, idle_checks=2, load=lambda: self.load)
+
+    def tearDown(self):
+        self.gate.set()
+        self.scheduler.shutdown()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def queue(self, count, lane='cpu', cost=1.0):
+        return [self.scheduler.submit(self.gate.wait, 5, lane=lane, cost=cost) for _ in range(count)]
+
+    def test_grows_with_backlog_and_respects_cooldown(self):
+        self.queue(20, cost=2)
+        self.assertEqual(self.autoscaler.evaluate(now=0)['cpu'], 2)
+        self.assertEqual(self.autoscaler.evaluate(now=5)['cpu'], 2)
+        self.assertEqual(self.autoscaler.evaluate(now=10)['cpu'], 4)
+        self.assertEqual(self.autoscaler.evaluate(now=20)['cpu'], 8)
+        self.assertEqual(self.autoscaler.evaluate(now=30)['cpu'], 8)
+        self.assertTrue(self.wait_for(lambda: self.scheduler.lane_stats('cpu')['running'] == 8))
+
+    def test_small_backlog_keeps_size(self):
+        self.queue(2)
+        self.assertEqual(self.autoscaler.evaluate(now=0), {'cpu': 1, 'ocr': 1})
+
+    def test_busy_cpus_shrink_ocr_lane(self):
+        self.scheduler.resize('ocr', 3)
+        self.queue(10, lane='ocr')
+        self.queue(10)
+        self.load = 1.5
+        self.assertEqual(self.autoscaler.evaluate(now=0), {'cpu': 1, 'ocr': 2})
+
+    def test_shrinks_after_idle_checks(self):
+        self.scheduler.resize('cpu', 6)
+        self.assertEqual(self.autoscaler.evaluate(now=0)['cpu'], 6)
+        self.assertEqual(self.autoscaler.evaluate(now=1)['cpu'], 3)
+        self.autoscaler.evaluate(now=2)
+        self.assertEqual(self.autoscaler.evaluate(now=20)['cpu'], 2)
+        self.assertEqual(self.scheduler.submit(lambda: 'done').result(5), 'done')
+
+    def test_shrunk_lane_stops_threads(self):
+        self.scheduler.resize('cpu', 4)
+        self.queue(4)
+        self.scheduler.resize('cpu', 1)
+        self.gate.set()
+        self.assertTrue(self.wait_for(lambda: len(self.scheduler._lanes['cpu'].threads) == 1))
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(Autoscaler.from_config({'scheduler': {}}, self.scheduler))
+
+
+class TestProbeDocument(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_pages_and_text_layer(self):
+        path = self.test_dir / "invoice.pdf"
+        pdf = canvas.Canvas(str(path))
+        pdf.drawString(100, 750, "INVOICE")
+        pdf.showPage()
+        pdf.showPage()
+        pdf.save()
+        self.assertEqual(probe_document(path), (2, False))
+
+        scan = self.test_dir / "scan.pdf"
+        pdf = canvas.Canvas(str(scan))
+        pdf.rect(100, 700, 50, 50)
+        pdf.showPage()
+        pdf.save()
+        self.assertEqual(probe_document(scan), (1, True))
+        self.assertEqual(probe_document(self.test_dir / "notes.txt"), (1, False))
+
+
+class TestSubmitFromAPI(unittest.TestCase):
+    def test_probe_runs_off_the_event_loop(self):
+        scheduler = ExtractionScheduler(workers=1, ocr_workers=1)
+        probed_in = []
+
+        def probe(file_path):
+            probed_in.append(threading.current_thread())
+            return 1, False
+
+        async def submit():
+            return threading.current_thread(), await api.submit_document(str.upper, "invoice.pdf")
+
+        try:
+            with patch('src.scheduler.probe_document', side_effect=probe), \
+                    patch.object(api, 'get_scheduler', return_value=scheduler):
+                loop_thread, result = asyncio.run(submit())
+        finally:
+            scheduler.shutdown()
+        self.assertEqual(result, "INVOICE.PDF")
+        self.assertEqual(len(probed_in), 1)
+        self.assertIsNot(probed_in[0], loop_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
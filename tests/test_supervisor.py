@@ -0,0 +1,158 @@
+import asyncio
+import unittest
+import threading
+import tempfile
+import shutil
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from src.api import main as api
+from src.scheduler import ExtractionScheduler
+from src.exceptions import (
+    ExtractionCancelled,
+    ExtractionKilled,
+    ExtractionMemoryError,
+    ExtractionTimeout,
+    ValidationError
+)
+from src.supervisor import SupervisedExtractor, resource
+from tests.supervised_fakes import fake_processor, fake_splitting_processor
+
+
+class TestSupervisedExtractor(unittest.TestCase):
+    def setUp(self):
+        self.extractor = SupervisedExtractor(fake_processor, timeout=2.0, stage_timeouts={'ocr': 0.5},
+                                             memory_limit_mb=1024, poll_interval=0.05)
+
+    def tearDown(self):
+        self.extractor.close()
+
+    def test_result_and_process_reuse(self):
+        first = self.extractor.extract('INV-1.pdf', {'from': 'billing@acme.com'})
+        second = self.extractor.extract('INV-2.pdf')
+        self.assertEqual((first['invoice_number'], first['metadata']), ('INV-1', {'from': 'billing@acme.com'}))
+        self.assertEqual(first['pid'], second['pid'])
+
+    def test_errors_are_raised_in_the_caller(self):
+        with self.assertRaises(ValidationError):
+            self.extractor.extract('invalid.pdf')
+        # The process survives ordinary errors
+        self.assertEqual(self.extractor.extract('INV-3.pdf')['invoice_number'], 'INV-3')
+
+    def test_split_invoices(self):
+        extractor = SupervisedExtractor(fake_splitting_processor, timeout=2.0, poll_interval=0.05)
+        try:
+            invoices = extractor.extract('INV-5.pdf')
+        finally:
+            extractor.close()
+        self.assertEqual([invoice['pages'] for invoice in invoices], [[1, 1], [2, 2]])
+
+    def test_stage_timeout(self):
+        with self.assertRaises(ExtractionTimeout) as context:
+            self.extractor.extract('slow_ocr.pdf')
+        self.assertEqual(context.exception.stage, 'ocr')
+        self.assertIn("Stage 'ocr'", context.exception.message)
+        self.assertEqual(self.extractor.extract('INV-4.pdf')['invoice_number'], 'INV-4')
+
+    def test_document_timeout(self):
+        with self.assertRaises(ExtractionTimeout) as context:
+            self.extractor.extract('hang.pdf')
+        self.assertEqual(context.exception.stage, 'text')
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        threading.Timer(0.3, cancel.set).start()
+        with self.assertRaises(ExtractionCancelled):
+            self.extractor.extract('hang.pdf', cancel=cancel)
+        with self.assertRaises(ExtractionCancelled):
+            self.extractor.extract('INV-5.pdf', cancel=cancel)
+
+    @unittest.skipIf(resource is None, "resource limits are not supported")
+    def test_memory_limit(self):
+        with self.assertRaises(ExtractionMemoryError):
+            self.extractor.extract('huge.pdf')
+
+    def test_crash(self):
+        with self.assertRaises(ExtractionKilled):
+            self.extractor.extract('crash.pdf')
+        self.assertEqual(self.extractor.extract('INV-6.pdf')['invoice_number'], 'INV-6')
+
+    def test_from_config(self):
+        self.assertIsNone(SupervisedExtractor.from_config({}, fake_processor))
+        extractor = SupervisedExtractor.from_config(
+            {'supervisor': {'enabled': True, 'document_timeout': 30, 'stage_timeouts': {'ocr': 20}}},
+            fake_processor
+        )
+        self.assertEqual((extractor.timeout, extractor.stage_timeouts), (30, {'ocr': 20}))
+
+
+class TestSupervisedAPI(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.extractor = SupervisedExtractor(fake_processor, timeout=0.5, poll_interval=0.05)
+        self.scheduler = ExtractionScheduler(workers=2)
+        self.document_processor = MagicMock()
+        self.patches = [
+            patch.object(api, 'get_supervisor', return_value=self.extractor),
+            patch.object(api, 'get_scheduler', return_value=self.scheduler),
+            patch.object(api, 'get_task_broker', return_value=None),
+            patch.object(api, 'get_document_processor', return_value=self.document_processor),
+            patch.object(api, 'index_batch_results')
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        self.client = TestClient(api.app)
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        self.scheduler.shutdown()
+        self.extractor.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_timed_out_document_goes_to_error_flow(self):
+        response = self.client.post("/api/v1/batch-process/", files=[
+            ("files", ("a.pdf", b"hang", "application/pdf")),
+            ("files", ("b.pdf", b"INV-7", "application/pdf"))
+        ])
+        job_id = response.json()["job_id"]
+        job = self.client.get(f"/api/v1/batch-status/{job_id}").json()
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual([result["data"]["invoice_number"] for result in job["results"]], ["INV-7"])
+        self.assertEqual([error["error_type"] for error in job["errors"]], ["ExtractionTimeout"])
+        self.document_processor.reject_document.assert_called_once()
+        Path(f"results/{job_id}.json").unlink()
+
+    def test_timed_out_upload_goes_to_error_flow(self):
+        temp_files = set(Path("temp").glob("*"))
+        response = self.client.post("/api/v1/process-invoice/", files={
+            "file": ("a.pdf", b"hang", "application/pdf")
+        })
+        self.assertEqual(response.status_code, 500)
+        self.document_processor.reject_document.assert_called_once()
+        self.assertEqual(set(Path("temp").glob("*")), temp_files)
+
+    def test_cancelled_job_skips_remaining_files(self):
+        job_id = "cancelled-job"
+        files = []
+        for name in ("INV-8.pdf", "INV-9.pdf"):
+            files.append(self.test_dir / name)
+            files[-1].write_bytes(b"%PDF-1.4")
+        api.batch_jobs[job_id] = {"status": "processing", "total_files": 2, "processed": 0,
+                                  "progress": 0, "results": [], "errors": []}
+        api.job_cancellations[job_id] = threading.Event()
+        self.assertEqual(self.client.delete(f"/api/v1/batch/{job_id}").json()["status"], "cancelling")
+
+        asyncio.run(api.process_batch(job_id, files, parallel=True))
+        job = api.batch_jobs.pop(job_id)
+        self.assertEqual(job["status"], "cancelled")
+        self.assertEqual([error["error_type"] for error in job["errors"]], ["ExtractionCancelled"] * 2)
+        self.document_processor.reject_document.assert_not_called()
+        self.assertEqual(self.client.delete(f"/api/v1/batch/{job_id}").status_code, 404)
+        Path(f"results/{job_id}.json").unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import time
+import tempfile
+import shutil
+
+from fastapi.testclient import TestClient
+
+from src.api.main import app
+from src.exceptions import ValidationError
+from src.task_queue import (
+    SQLiteBroker,
+    Worker,
+    document_dead_letter,
+    document_handlers,
+    enqueue_document
+)
+
+
+def reserve_all(db_path):
+    """Reserve tasks from another process until the queue is empty"""
+    broker = SQLiteBroker(db_path)
+    reserved = []
+    while True:
+        task = broker.reserve(visibility_timeout=60)
+        if task is None:
+            return reserved
+        reserved.append(task.id)
+
+
+class TestSQLiteBroker(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.broker = SQLiteBroker(self.test_dir / "tasks.sqlite3")
+
+    def tearDown(self):
+        self.broker.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_reserve_hides_task_until_lease_expires(self):
+        task_id = self.broker.enqueue('process_document', {'file_path': 'a.pdf'})
+        task = self.broker.reserve(visibility_timeout=0.2)
+        self.assertEqual((task.id, task.attempts, task.payload), (task_id, 1, {'file_path': 'a.pdf'}))
+        self.assertIsNone(self.broker.reserve())
+
+        time.sleep(0.25)
+        again = self.broker.reserve(visibility_timeout=60)
+        self.assertEqual((again.id, again.attempts), (task_id, 2))
+        # The first worker lost its lease and can no longer finish the task
+        self.assertFalse(self.broker.ack(task))
+        self.assertTrue(self.broker.ack(again, {'ok': True}))
+        self.assertEqual(self.broker.counts()['done'], 1)
+
+    def test_delayed_task(self):
+        self.broker.enqueue('process_document', {}, delay=60)
+        self.assertIsNone(self.broker.reserve())
+        self.assertEqual(self.broker.counts()['queued'], 1)
+
+    def test_priority_before_age(self):
+        self.broker.enqueue('process_document', {'n': 'bulk'}, priority=2)
+        self.broker.enqueue('process_document', {'n': 'email'}, priority=1)
+        self.assertEqual(self.broker.reserve().payload, {'n': 'email'})
+
+    def test_group_tasks_in_order(self):
+        ids = [self.broker.enqueue('extract_invoice', {'n': n}, group='job-1') for n in range(3)]
+        self.broker.enqueue('extract_invoice', {}, group='job-2')
+        self.assertEqual([task.id for task in self.broker.tasks('job-1')], ids)
+
+    def test_cancel_queued_tasks(self):
+        self.broker.enqueue('extract_invoice', {'n': 1}, group='job')
+        self.broker.enqueue('extract_invoice', {'n': 2}, group='job')
+        running = self.broker.reserve()
+        self.assertEqual([task.payload for task in self.broker.cancel('job')], [{'n': 2}])
+        self.assertEqual([task.status for task in self.broker.tasks('job')], ['running', 'dead'])
+        self.assertTrue(self.broker.ack(running))
+
+    def test_processes_reserve_each_task_once(self):
+        ids = {self.broker.enqueue('process_document', {'n': n}) for n in range(200)}
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            reserved = [task_id for result in pool.map(reserve_all, [self.broker.db_path] * 4) for task_id in result]
+        self.assertEqual(len(reserved), len(ids))
+        self.assertEqual(set(reserved), ids)
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.broker = SQLiteBroker(self.test_dir / "tasks.sqlite3")
+        self.dead = []
+        self.handler = MagicMock(return_value={'status': 'processed'})
+        self.worker = Worker(self.broker, {'process_document': self.handler}, backoff_base=0, backoff_max=0,
+                             on_dead_letter=lambda task, error: self.dead.append((task.id, error)))
+
+    def tearDown(self):
+        self.broker.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_runs_and_acks(self):
+        task_id = self.broker.enqueue('process_document', {'file_path': 'a.pdf'}, group='job')
+        self.assertTrue(self.worker.run_once())
+        self.assertFalse(self.worker.run_once())
+        self.handler.assert_called_once_with({'file_path': 'a.pdf'})
+        task = self.broker.tasks('job')[0]
+        self.assertEqual((task.id, task.status, task.result), (task_id, 'done', {'status': 'processed'}))
+
+    def test_retries_then_dead_letters(self):
+        self.handler.side_effect = OSError("disk busy")
+        task_id = self.broker.enqueue('process_document', {}, group='job', max_attempts=3)
+        self.assertEqual(self.worker.run(max_tasks=3), 3)
+        self.assertEqual(self.handler.call_count, 3)
+        task = self.broker.tasks('job')[0]
+        self.assertEqual((task.status, task.attempts), ('dead', 3))
+        self.assertEqual(self.dead, [(task_id, "OSError: disk busy")])
+
+    def test_permanent_error_is_not_retried(self):
+        self.handler.side_effect = ValidationError("Invalid file")
+        self.broker.enqueue('process_document', {}, group='job')
+        self.worker.run_once()
+        self.assertEqual(self.handler.call_count, 1)
+        self.assertEqual(self.broker.tasks('job')[0].status, 'dead')
+
+    def test_backoff_grows_and_is_capped(self):
+        worker = Worker(self.broker, {}, backoff_base=5, backoff_max=60)
+        for attempts, delay in [(1, 5), (3, 20), (10, 60)]:
+            self.assertTrue(delay / 2 <= worker.backoff(attempts) <= delay)
+
+    def test_lease_is_renewed_while_running(self):
+        worker = Worker(self.broker, {'process_document': lambda payload: time.sleep(0.5)},
+                        visibility_timeout=0.3)
+        self.broker.enqueue('process_document', {}, group='job')
+        worker.run_once()
+        task = self.broker.tasks('job')[0]
+        self.assertEqual((task.status, task.attempts), ('done', 1))
+
+
+class TestDocumentTasks(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.config = {'task_queue': {'spool_directory': str(self.test_dir / "spool"), 'max_attempts': 1}}
+        self.spool_dir = self.test_dir / "spool"
+        self.broker = SQLiteBroker(self.test_dir / "tasks.sqlite3")
+        self.processor = MagicMock()
+        self.worker = Worker(self.broker, document_handlers(self.processor, self.spool_dir),
+                             on_dead_letter=document_dead_letter(self.processor, self.spool_dir))
+        self.document = self.test_dir / "invoice.pdf"
+        self.document.write_bytes(b"%PDF-1.4")
+
+    def tearDown(self):
+        self.broker.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_spooled_document_is_processed(self):
+        enqueue_document(self.broker, self.config, self.document, {'subject': 'Invoice'}, group='job')
+        self.assertFalse(self.document.exists())
+        self.processor.process_document.side_effect = lambda path, metadata, handle_errors: path.unlink()
+
+        self.worker.run_once()
+        path, metadata = self.processor.process_document.call_args[0]
+        self.assertEqual((path.name, metadata), ('invoice.pdf', {'subject': 'Invoice'}))
+        self.assertFalse(self.processor.process_document.call_args[1]['handle_errors'])
+        self.assertEqual(list(self.spool_dir.iterdir()), [])
+
+    def test_dead_letter_goes_to_error_directory(self):
+        enqueue_document(self.broker, self.config, self.document, group='job')
+        self.processor.process_document.side_effect = OSError("unreadable")
+        self.worker.run_once()
+        path, error = self.processor.reject_document.call_args[0]
+        self.assertEqual((path.name, error), ('invoice.pdf', "OSError: unreadable"))
+
+
+class TestQueuedBatchAPI(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.broker = SQLiteBroker(self.test_dir / "tasks.sqlite3")
+        self.config = {'task_queue': {'spool_directory': str(self.test_dir / "spool")}}
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.broker.close()
+        shutil.rmtree(self.test_dir)
+
+    @patch('src.api.main.index_batch_results')
+    def test_batch_is_queued_and_reported_from_tasks(self, index_batch_results):
+        with patch('src.api.main.get_task_broker', return_value=self.broker), \
+                patch('src.api.main.load_processor_config', return_value=self.config):
+            response = self.client.post("/api/v1/batch-process/", files=[
+                ("files", ("a.pdf", b"%PDF-1.4", "application/pdf")),
+                ("files", ("b.pdf", b"%PDF-1.4", "application/pdf"))
+            ])
+            self.assertEqual(response.status_code, 200)
+            job_id = response.json()["job_id"]
+            self.assertEqual(self.client.get(f"/api/v1/batch-status/{job_id}").json()["status"], "processing")
+
+            worker = Worker(self.broker, {'extract_invoice': lambda payload: {'invoice_number': 'INV-1'}})
+            self.assertEqual(worker.run(max_tasks=2), 2)
+
+            status = self.client.get(f"/api/v1/batch-status/{job_id}").json()
+            self.assertEqual((status["status"], status["processed"]), ("completed", 2))
+            self.assertEqual([result["file_name"] for result in status["results"]], ["a.pdf", "b.pdf"])
+            index_batch_results.assert_called_once()
+            Path(f"results/{job_id}.json").unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
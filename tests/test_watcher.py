@@ -0,0 +1,110 @@
+import time
+import threading
+import unittest
+from pathlib import Path
+import tempfile
+import shutil
+
+from src.watcher import FolderWatcher
+
+
+class RecordingExecutor:
+    """Executor recording submitted paths instead of running them"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, path):
+        self.submitted.append(path)
+
+
+class TestFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "incoming"
+        self.inbox.mkdir()
+        self.processed = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def process(self, path):
+        with self.lock:
+            self.processed.append(path.name)
+        path.unlink()
+        return {}
+
+    def create_watcher(self, **options):
+        options.setdefault('settle_seconds', 0.2)
+        return FolderWatcher(self.inbox, self.process, extensions=['.pdf'], workers=2,
+                             poll_interval=0.05, use_inotify=False, **options)
+
+    def test_debounces_file_being_written(self):
+        watcher = self.create_watcher(settle_seconds=1.0)
+        watcher._executor = RecordingExecutor()
+        path = self.inbox / "invoice.pdf"
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4')
+            f.flush()
+            start = time.monotonic()
+            watcher.notify(path)
+            self.assertEqual(watcher.check_pending(start + 0.5), 0)
+            # Still growing at the next check, so the settle time restarts
+            f.write(b'more')
+            f.flush()
+            self.assertEqual(watcher.check_pending(start + 1.2), 0)
+        self.assertEqual(watcher.check_pending(start + 2.0), 0)
+        self.assertEqual(watcher.check_pending(start + 2.3), 1)
+        self.assertEqual(watcher._executor.submitted, [path])
+        # Not submitted again while being processed
+        watcher.notify(path)
+        self.assertEqual(watcher.check_pending(start + 10), 0)
+
+    def test_ingests_new_and_existing_files(self):
+        (self.inbox / "waiting.pdf").write_bytes(b'%PDF')
+        watcher = self.create_watcher()
+        watcher.start()
+        try:
+            for index in range(5):
+                (self.inbox / f"invoice_{index}.pdf").write_bytes(b'%PDF')
+            (self.inbox / "notes.txt").write_bytes(b'text')
+            (self.inbox / "upload.pdf.part").write_bytes(b'%PDF')
+            time.sleep(0.1)
+            self.assertTrue(watcher.wait_idle(5))
+        finally:
+            watcher.stop()
+        self.assertEqual(sorted(self.processed), ["invoice_0.pdf", "invoice_1.pdf", "invoice_2.pdf",
+                                                  "invoice_3.pdf", "invoice_4.pdf", "waiting.pdf"])
+
+    def test_closed_file_skips_settle_time(self):
+        watcher = self.create_watcher(settle_seconds=60)
+        watcher._executor = RecordingExecutor()
+        path = self.inbox / "invoice.pdf"
+        path.write_bytes(b'%PDF')
+        watcher.notify(path, closed=True)
+        self.assertEqual(watcher.check_pending(), 1)
+        self.assertEqual(watcher._executor.submitted, [path])
+
+    def test_failures_do_not_stop_workers(self):
+        def process(path):
+            path.unlink()
+            if path.name == "broken.pdf":
+                raise ValueError("unreadable")
+            self.processed.append(path.name)
+
+        watcher = FolderWatcher(self.inbox, process, workers=1, settle_seconds=0.1,
+                                poll_interval=0.05, use_inotify=False)
+        watcher.start()
+        try:
+            (self.inbox / "broken.pdf").write_bytes(b'%PDF')
+            time.sleep(0.1)
+            (self.inbox / "invoice.pdf").write_bytes(b'%PDF')
+            time.sleep(0.1)
+            self.assertTrue(watcher.wait_idle(5))
+        finally:
+            watcher.stop()
+        self.assertEqual(self.processed, ["invoice.pdf"])
+
+if __name__ == '__main__':
+    unittest.main()